@@ -230,9 +230,6 @@ struct cmd_node {
 #define CMD_NOT_MY_INSTANCE	14
 #define CMD_NO_LEVEL_UP 15
 
-/* Argc max counts. */
-#define CMD_ARGC_MAX   256
-
 /* Turn off these macros when uisng cpp with extract.pl */
 #ifndef VTYSH_EXTRACT_PL
 
@@ -112,6 +112,9 @@ struct cmd_element {
 /* text for <cr> command */
 #define CMD_CR_TEXT "<cr>"
 
+/* Argc max counts. */
+#define CMD_ARGC_MAX   256
+
 /* memory management for cmd_token */
 extern struct cmd_token *cmd_token_new(enum cmd_token_type, uint8_t attr,
 				       const char *text, const char *desc);
@@ -25,6 +25,13 @@
 
 #include "command_match.h"
 #include "memory.h"
+#ifndef BUILDING_CLIPPY
+#include "prefix.h"
+#else
+/* prefix.h pulls in half of lib/, clippy only needs these two */
+#define IPV4_MAX_BITLEN 32
+#define IPV6_MAX_BITLEN 128
+#endif
 
 DEFINE_MTYPE_STATIC(LIB, CMD_MATCHSTACK, "Command Match Stack");
 
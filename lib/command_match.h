@@ -26,7 +26,7 @@
 
 #include "graph.h"
 #include "linklist.h"
-#include "command.h"
+#include "command_graph.h"
 
 #ifdef __cplusplus
 extern "C" {
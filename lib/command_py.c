@@ -34,6 +34,7 @@
 #include <stdlib.h>
 
 #include "command_graph.h"
+#include "command_match.h"
 #include "clippy.h"
 
 struct wrap_graph;
@@ -163,6 +164,33 @@ static PyTypeObject typeobj_graph_node = {
 	.tp_methods = methods_graph_node,
 };
 
+static const char *token_type_name(enum cmd_token_type type)
+{
+	switch (type) {
+#define item(x)                                                                \
+	case x:                                                                \
+		return #x
+		item(WORD_TKN);		// words
+		item(VARIABLE_TKN);	// almost anything
+		item(RANGE_TKN);	// integer range
+		item(IPV4_TKN);		// IPV4 addresses
+		item(IPV4_PREFIX_TKN);	// IPV4 network prefixes
+		item(IPV6_TKN);		// IPV6 prefixes
+		item(IPV6_PREFIX_TKN);	// IPV6 network prefixes
+		item(MAC_TKN);		// MAC address
+		item(MAC_PREFIX_TKN);	// MAC address with mask
+
+		/* plumbing types */
+		item(FORK_TKN);
+		item(JOIN_TKN);
+		item(START_TKN);
+		item(END_TKN);
+#undef item
+	default:
+		return "???";
+	}
+}
+
 static PyObject *graph_to_pyobj(struct wrap_graph *wgraph,
 				struct graph_node *gn)
 {
@@ -196,24 +224,8 @@ static PyObject *graph_to_pyobj(struct wrap_graph *wgraph,
 	wrap->allowrepeat = false;
 	if (gn->data) {
 		struct cmd_token *tok = gn->data;
-		switch (tok->type) {
-#define item(x) case x: wrap->type = #x; break;
-			item(WORD_TKN)		      // words
-				item(VARIABLE_TKN)    // almost anything
-				item(RANGE_TKN)       // integer range
-				item(IPV4_TKN)	// IPV4 addresses
-				item(IPV4_PREFIX_TKN) // IPV4 network prefixes
-				item(IPV6_TKN)	// IPV6 prefixes
-				item(IPV6_PREFIX_TKN) // IPV6 network prefixes
-				item(MAC_TKN)	 // MAC address
-				item(MAC_PREFIX_TKN)  // MAC address with mask
-
-				/* plumbing types */
-				item(FORK_TKN) item(JOIN_TKN) item(START_TKN)
-					item(END_TKN) default
-				: wrap->type = "???";
-		}
 
+		wrap->type = token_type_name(tok->type);
 		wrap->deprecated = (tok->attr == CMD_ATTR_DEPRECATED);
 		wrap->hidden = (tok->attr == CMD_ATTR_HIDDEN);
 		wrap->text = tok->text;
@@ -303,6 +315,242 @@ static PyObject *graph_parse(PyTypeObject *type, PyObject *args, PyObject *kwds)
 	return (PyObject *)gwrap;
 }
 
+/*
+ * command nodes are wrapped as follows:
+ *  - a CommandNode holds one command graph, like cmd_node->cmdgraph in
+ *    lib/command.c;  commands are merged into it with install()
+ *  - each installed command gets its own cmd_element (string & doc are
+ *    copied), with an index into the "keys" list so match() can return
+ *    whatever python object the command was installed with
+ *  - match() runs the actual command_match() on a list of input tokens
+ */
+struct cmd_entry {
+	struct cmd_element el;
+	size_t idx;
+};
+
+struct wrap_cmd_node {
+	PyObject_HEAD
+
+	struct graph *graph;
+	PyObject *keys;
+
+	struct cmd_entry **entries;
+	size_t n_entries, alloc_entries;
+};
+
+static PyObject *cmd_node_new(PyTypeObject *type, PyObject *args,
+			      PyObject *kwds)
+{
+	struct wrap_cmd_node *wnode;
+	struct cmd_token *token;
+	static const char *kwnames[] = {NULL};
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwds, "", (char **)kwnames))
+		return NULL;
+
+	wnode = (struct wrap_cmd_node *)type->tp_alloc(type, 0);
+	if (!wnode)
+		return NULL;
+
+	wnode->keys = PyList_New(0);
+	if (!wnode->keys) {
+		Py_DECREF(wnode);
+		return NULL;
+	}
+
+	wnode->graph = graph_new();
+	token = cmd_token_new(START_TKN, 0, NULL, NULL);
+	graph_new_node(wnode->graph, token, (void (*)(void *)) & cmd_token_del);
+	return (PyObject *)wnode;
+}
+
+static void cmd_node_dealloc(PyObject *self)
+{
+	struct wrap_cmd_node *wnode = (struct wrap_cmd_node *)self;
+
+	if (wnode->graph)
+		graph_delete_graph(wnode->graph);
+	for (size_t i = 0; i < wnode->n_entries; i++) {
+		free((char *)wnode->entries[i]->el.string);
+		free((char *)wnode->entries[i]->el.doc);
+		free(wnode->entries[i]);
+	}
+	free(wnode->entries);
+	Py_XDECREF(wnode->keys);
+	Py_TYPE(self)->tp_free(self);
+}
+
+/* node.install(cmddef, doc=None, key=None) -- add command, returns index */
+static PyObject *cmd_node_install(PyObject *self, PyObject *args,
+				  PyObject *kwds)
+{
+	struct wrap_cmd_node *wnode = (struct wrap_cmd_node *)self;
+	const char *def, *doc = NULL;
+	PyObject *key = Py_None;
+	struct cmd_entry *entry;
+	struct graph *graph;
+	struct cmd_token *token;
+	static const char *kwnames[] = {"cmddef", "doc", "key", NULL};
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|zO", (char **)kwnames,
+					 &def, &doc, &key))
+		return NULL;
+
+	if (wnode->n_entries == wnode->alloc_entries) {
+		size_t alloc = wnode->alloc_entries ? wnode->alloc_entries * 2
+						    : 64;
+		struct cmd_entry **entries;
+
+		entries = realloc(wnode->entries, alloc * sizeof(entries[0]));
+		if (!entries)
+			return PyErr_NoMemory();
+		wnode->entries = entries;
+		wnode->alloc_entries = alloc;
+	}
+
+	if (PyList_Append(wnode->keys, key))
+		return NULL;
+
+	entry = calloc(1, sizeof(*entry));
+	if (!entry)
+		return PyErr_NoMemory();
+	entry->idx = wnode->n_entries;
+	entry->el.string = strdup(def);
+	entry->el.doc = doc ? strdup(doc) : NULL;
+	wnode->entries[wnode->n_entries++] = entry;
+
+	/* same as _install_element() in lib/command.c */
+	graph = graph_new();
+	token = cmd_token_new(START_TKN, 0, NULL, NULL);
+	graph_new_node(graph, token, (void (*)(void *)) & cmd_token_del);
+
+	cmd_graph_parse(graph, &entry->el);
+	cmd_graph_names(graph);
+	cmd_graph_merge(wnode->graph, graph, +1);
+	graph_delete_graph(graph);
+
+	return PyLong_FromSize_t(entry->idx);
+}
+
+/*
+ * node.match(tokens) -- match a list of input words (cf. cmd_make_strvec)
+ *
+ * returns (status, key, args), with status one of the MATCHER_* constants.
+ * on MATCHER_OK, key is the key given to install() (or the command's index
+ * if that was None) and args is a list of (type, text, varname, arg) tuples
+ * for each matched token.  otherwise key and args are None.
+ */
+static PyObject *cmd_node_match(PyObject *self, PyObject *arg)
+{
+	struct wrap_cmd_node *wnode = (struct wrap_cmd_node *)self;
+	const struct cmd_element *el = NULL;
+	struct list *argv = NULL;
+	enum matcher_rv status;
+	PyObject *seq, *key, *pyargs, *ret = NULL;
+	Py_ssize_t count;
+	vector vline;
+
+	seq = PySequence_Fast(arg, "tokens must be a sequence of strings");
+	if (!seq)
+		return NULL;
+
+	count = PySequence_Fast_GET_SIZE(seq);
+	if (count == 0 || count >= CMD_ARGC_MAX) {
+		PyErr_SetString(PyExc_ValueError, "invalid number of tokens");
+		Py_DECREF(seq);
+		return NULL;
+	}
+
+	vline = vector_init(count);
+	for (Py_ssize_t i = 0; i < count; i++) {
+		/* pointers stay valid as long as seq holds the strings */
+		const char *word =
+			PyUnicode_AsUTF8(PySequence_Fast_GET_ITEM(seq, i));
+
+		if (!word) {
+			vector_free(vline);
+			Py_DECREF(seq);
+			return NULL;
+		}
+		vector_set_index(vline, i, (void *)word);
+	}
+
+	status = command_match(wnode->graph, vline, &argv, &el);
+	vector_free(vline);
+	Py_DECREF(seq);
+
+	if (status != MATCHER_OK) {
+		if (argv)
+			list_delete(&argv);
+		return Py_BuildValue("(iOO)", (int)status, Py_None, Py_None);
+	}
+
+	key = PyList_GET_ITEM(wnode->keys,
+			      container_of(el, struct cmd_entry, el)->idx);
+	if (key == Py_None)
+		key = PyLong_FromSize_t(
+			container_of(el, struct cmd_entry, el)->idx);
+	else
+		Py_INCREF(key);
+
+	pyargs = PyList_New(0);
+	if (key && pyargs) {
+		struct listnode *ln;
+		struct cmd_token *tok;
+		PyObject *item;
+
+		/* no ALL_LIST_ELEMENTS_RO, needs zebra.h for static_cast */
+		for (ln = listhead(argv); ln; ln = listnextnode(ln)) {
+			tok = listgetdata(ln);
+			item = Py_BuildValue("(szzz)", token_type_name(tok->type),
+					     tok->text, tok->varname, tok->arg);
+			if (!item || PyList_Append(pyargs, item)) {
+				Py_XDECREF(item);
+				goto out;
+			}
+			Py_DECREF(item);
+		}
+		ret = Py_BuildValue("(iOO)", (int)status, key, pyargs);
+	}
+out:
+	Py_XDECREF(key);
+	Py_XDECREF(pyargs);
+	list_delete(&argv);
+	return ret;
+}
+
+static PyObject *cmd_node_count(PyObject *self, PyObject *args)
+{
+	struct wrap_cmd_node *wnode = (struct wrap_cmd_node *)self;
+
+	return PyLong_FromSize_t(wnode->n_entries);
+}
+
+static PyMemberDef members_cmd_node[] = {
+	{(char *)"keys", T_OBJECT, offsetof(struct wrap_cmd_node, keys),
+	 READONLY, (char *)"install() keys, by command index"},
+	{},
+};
+
+static PyMethodDef methods_cmd_node[] = {
+	{"install", (PyCFunction)(void (*)(void))cmd_node_install,
+	 METH_VARARGS | METH_KEYWORDS, "add command to node"},
+	{"match", cmd_node_match, METH_O, "match input tokens"},
+	{"count", cmd_node_count, METH_NOARGS, "number of installed commands"},
+	{}};
+
+static PyTypeObject typeobj_cmd_node = {
+	PyVarObject_HEAD_INIT(NULL, 0).tp_name = "_clippy.CommandNode",
+	.tp_basicsize = sizeof(struct wrap_cmd_node),
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+	.tp_doc = "struct cmd_node command graph & matcher",
+	.tp_new = cmd_node_new,
+	.tp_dealloc = cmd_node_dealloc,
+	.tp_members = members_cmd_node,
+	.tp_methods = methods_cmd_node,
+};
+
 static PyMethodDef clippy_methods[] = {
 	{"parse", clippy_parse, METH_VARARGS, "Parse a C file"},
 	{NULL, NULL, 0, NULL}};
@@ -336,6 +584,8 @@ PyMODINIT_FUNC command_py_init(void)
 		initret(NULL);
 	if (PyType_Ready(&typeobj_graph) < 0)
 		initret(NULL);
+	if (PyType_Ready(&typeobj_cmd_node) < 0)
+		initret(NULL);
 
 	pymod = modcreate();
 	if (!pymod)
@@ -345,6 +595,12 @@ PyMODINIT_FUNC command_py_init(void)
 	PyModule_AddObject(pymod, "GraphNode", (PyObject *)&typeobj_graph_node);
 	Py_INCREF(&typeobj_graph);
 	PyModule_AddObject(pymod, "Graph", (PyObject *)&typeobj_graph);
+	Py_INCREF(&typeobj_cmd_node);
+	PyModule_AddObject(pymod, "CommandNode", (PyObject *)&typeobj_cmd_node);
+	PyModule_AddIntConstant(pymod, "MATCHER_NO_MATCH", MATCHER_NO_MATCH);
+	PyModule_AddIntConstant(pymod, "MATCHER_INCOMPLETE", MATCHER_INCOMPLETE);
+	PyModule_AddIntConstant(pymod, "MATCHER_AMBIGUOUS", MATCHER_AMBIGUOUS);
+	PyModule_AddIntConstant(pymod, "MATCHER_OK", MATCHER_OK);
 	if (!elf_py_init(pymod))
 		initret(NULL);
 	initret(pymod);
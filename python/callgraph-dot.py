@@ -19,6 +19,8 @@
 import re
 import sys
 import json
+import argparse
+from collections import deque
 
 
 class FunctionNode(object):
@@ -56,7 +58,7 @@ class FunctionNode(object):
 
     def unlink(self, other):
         self.out = list([edge for edge in self.out if edge.o != other])
-        other.inb = list([edge for edge in other.inb if edge.i != other])
+        other.inb = list([edge for edge in other.inb if edge.i != self])
 
     @classmethod
     def get(cls, name):
@@ -85,233 +87,233 @@ def nameclean(n):
     return n
 
 
-def calc_rank(queue, direction):
-    nextq = queue
+class CallGraph(object):
+    """
+    Compact call graph: functions are numbered, edges are adjacency lists of
+    numbers.  Ranks and cycle groups are derived from the strongly connected
+    components, which are computed in a single linear-time pass.
 
-    if direction == 1:
-        aggr = max
-        elem = lambda x: x.calls()
-    else:
-        aggr = min
-        elem = lambda x: x.calld()
+    Positive ranks are the height above the leaves for functions that do not
+    (transitively) call into a cycle; negative ranks the depth below the
+    roots for functions only reachable through such functions.  Whatever is
+    left (rank None) is the "cyclic set" that gets drawn.
+
+    Undefined functions (and pinned ones, see fixups) are treated as leaves
+    for ranking, i.e. their outgoing edges do not form cycles.  Queries use
+    all edges.
+    """
 
-    currank = direction
-    cont = True
+    VERSION = 1
 
-    while len(nextq) > 0 and cont:
-        queue = nextq
-        nextq = []
+    def __init__(self, names, calls, defined, defs, pinned=None):
+        self.names = names
+        self.ids = dict((name, i) for i, name in enumerate(names))
+        self.calls = calls
+        self.defined = defined
+        self.defs = defs
+        self.pinned = pinned or {}
 
-        # sys.stderr.write('rank %d\n' % currank)
+        self.calld = [[] for _ in names]
+        for i, outs in enumerate(calls):
+            for o in outs:
+                self.calld[o].append(i)
 
-        cont = False
+        self.calc_scc()
+        self.calc_rank()
 
-        for node in queue:
-            if not node.defined:
-                node.rank = 0
+    @classmethod
+    def from_functions(cls, funcs):
+        names = list(funcs.keys())
+        ids = dict((name, i) for i, name in enumerate(names))
+        calls, defined, defs, pinned = [], [], [], {}
+        for i, name in enumerate(names):
+            fn = funcs[name]
+            calls.append(sorted(set(ids[o.name] for o in fn.calls())))
+            defined.append(fn.defined)
+            defs.append(fn.defs)
+            if fn.rank is not None:
+                pinned[i] = fn.rank
+        return cls(names, calls, defined, defs, pinned)
+
+    def _ranked_calls(self, i):
+        if not self.defined[i] or i in self.pinned:
+            return ()
+        return self.calls[i]
+
+    def calc_scc(self):
+        """
+        iterative Tarjan.  self.components ends up in reverse topological
+        order, i.e. every component comes after all components it calls.
+        """
+        n = len(self.names)
+        index = [None] * n
+        lowlink = [0] * n
+        onstack = [False] * n
+        stack = []
+        self.comp = [None] * n
+        self.components = []
+        counter = 0
+
+        for root in range(n):
+            if index[root] is not None:
                 continue
 
-            rank = direction
-            for other in elem(node):
-                if other is node:
+            work = [(root, iter(self._ranked_calls(root)))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            onstack[root] = True
+
+            while work:
+                node, it = work[-1]
+                for o in it:
+                    if index[o] is None:
+                        index[o] = lowlink[o] = counter
+                        counter += 1
+                        stack.append(o)
+                        onstack[o] = True
+                        work.append((o, iter(self._ranked_calls(o))))
+                        break
+                    elif onstack[o]:
+                        lowlink[node] = min(lowlink[node], index[o])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        members = []
+                        while True:
+                            m = stack.pop()
+                            onstack[m] = False
+                            self.comp[m] = len(self.components)
+                            members.append(m)
+                            if m == node:
+                                break
+                        self.components.append(sorted(members))
+
+    def calc_rank(self):
+        rank = [None] * len(self.names)
+
+        # upwards, callees first
+        for members in self.components:
+            if len(members) > 1:
+                continue
+            i = members[0]
+            if i in self.pinned:
+                rank[i] = self.pinned[i]
+                continue
+            if not self.defined[i]:
+                rank[i] = 0
+                continue
+            r = 1
+            for o in self.calls[i]:
+                if o == i:
                     continue
-                if other.rank is None:
-                    nextq.append(node)
+                if rank[o] is None:
+                    r = None
                     break
-                rank = aggr(rank, other.rank + direction)
-            else:
-                cont = True
-                node.rank = rank
-
-        currank += direction
-
-    return nextq
-
+                r = max(r, rank[o] + 1)
+            rank[i] = r
 
-class Graph(dict):
-    class Subgraph(set):
-        def __init__(self):
-            super().__init__()
-
-    class NodeGroup(set):
-        def __init__(self, members):
-            super().__init__(members)
-
-    class Node(object):
-        def __init__(self, graph, fn):
-            super().__init__()
-            self._fn = fn
-            self._fns = [fn]
-            self._graph = graph
-            self._calls = set()
-            self._calld = set()
-            self._group = None
-
-        def __repr__(self):
-            return '<Graph.Node "%s()"/%d>' % (self._fn.name, len(self._fns))
-
-        def __hash__(self):
-            return hash(self._fn.name)
-
-        def _finalize(self):
-            for called in self._fn.calls():
-                if called.name == self._fn.name:
+        # downwards, callers first, for what calls into cycles
+        for members in reversed(self.components):
+            if len(members) > 1 or rank[members[0]] is not None:
+                continue
+            i = members[0]
+            r = -1
+            for c in self.calld[i]:
+                if c == i:
                     continue
-                if called.name in self._graph:
-                    self._calls.add(self._graph[called.name])
-                    self._graph[called.name]._calld.add(self)
-
-        def unlink(self, other):
-            self._calls.remove(other)
-            other._calld.remove(self)
-
-        @property
-        def name(self):
-            return self._fn.name
-
-        def calls(self):
-            return self._calls
+                if rank[c] is None:
+                    r = None
+                    break
+                r = min(r, rank[c] - 1)
+            rank[i] = r
 
-        def calld(self):
-            return self._calld
+        self.rank = rank
 
-        def group(self, members):
-            assert self in members
+    def cyclic_set(self):
+        return [i for i, r in enumerate(self.rank) if r is None]
 
-            pregroups = []
-            for g in [m._group for m in members]:
-                if g is None:
-                    continue
-                if g in pregroups:
-                    continue
+    def cycle_group(self, i):
+        return self.components[self.comp[i]]
 
-                assert g <= members
-                pregroups.append(g)
-
-            if len(pregroups) == 0:
-                group = self._graph.NodeGroup(members)
-                self._graph._groups.append(group)
-            elif len(pregroups) == 1:
-                group = pregroups[0]
-                group |= members
-            else:
-                for g in pregroups:
-                    self._graph._groups.remove(g)
-                group = self._graph.NodeGroup(members)
-                self._graph._groups.append(group)
-
-            for m in members:
-                m._group = group
-            return group
-
-        def merge(self, other):
-            self._fns.extend(other._fns)
-            self._calls = (self._calls | other._calls) - {self, other}
-            self._calld = (self._calld | other._calld) - {self, other}
-            for c in other._calls:
-                if c == self:
-                    continue
-                c._calld.remove(other)
-                c._calld.add(self)
-            for c in other._calld:
-                if c == self:
-                    continue
-                c._calls.remove(other)
-                c._calls.add(self)
-            del self._graph[other._fn.name]
+    def to_dict(self):
+        return {
+            "version": self.VERSION,
+            "names": self.names,
+            "calls": self.calls,
+            "defined": self.defined,
+            "defs": self.defs,
+            "pinned": sorted(self.pinned.items()),
+        }
 
-    def __init__(self, funcs):
-        super().__init__()
-        self._funcs = funcs
-        for fn in funcs:
-            self[fn.name] = self.Node(self, fn)
-        for node in self.values():
-            node._finalize()
-        self._groups = []
-
-    def automerge(self):
-        nodes = list(self.values())
-
-        while len(nodes):
-            node = nodes.pop(0)
-
-            candidates = {node}
-            evalset = set(node.calls())
-            prevevalset = None
-
-            while prevevalset != evalset:
-                prevevalset = evalset
-                evalset = set()
-
-                for evnode in prevevalset:
-                    inbound = set(evnode.calld())
-                    if inbound <= candidates:
-                        candidates.add(evnode)
-                        evalset |= set(evnode.calls()) - candidates
-                    else:
-                        evalset.add(evnode)
-
-            # if len(candidates) > 1:
-            #    for candidate in candidates:
-            #        if candidate != node:
-            #            #node.merge(candidate)
-            #            if candidate in nodes:
-            #                nodes.remove(candidate)
-            node.group(candidates)
-
-            for candidate in candidates:
-                if candidate in nodes:
-                    nodes.remove(candidate)
-
-    def calc_subgraphs(self):
-        nodes = list(self.values())
-        self._subgraphs = []
-        up = {}
-        down = {}
-
-        self._linear_nodes = []
-
-        while len(nodes):
-            sys.stderr.write("%d\n" % len(nodes))
-            node = nodes.pop(0)
-
-            down[node] = set()
-            queue = [node]
-            while len(queue):
-                now = queue.pop()
-                down[node].add(now)
-                for calls in now.calls():
-                    if calls in down[node]:
-                        continue
-                    queue.append(calls)
-
-            up[node] = set()
-            queue = [node]
-            while len(queue):
-                now = queue.pop()
-                up[node].add(now)
-                for calld in now.calld():
-                    if calld in up[node]:
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != cls.VERSION:
+            raise ValueError("unsupported index version %r" % data.get("version"))
+        return cls(
+            data["names"],
+            data["calls"],
+            data["defined"],
+            data["defs"],
+            dict(data["pinned"]),
+        )
+
+    def lookup(self, name):
+        if name not in self.ids:
+            raise KeyError("function %r not in call graph" % name)
+        return self.ids[name]
+
+    def reach(self, starts, edges):
+        """breadth-first walk, returns {node: distance}"""
+        dist = dict((i, 0) for i in starts)
+        queue = deque(starts)
+        while queue:
+            i = queue.popleft()
+            d = dist[i] + 1
+            for o in edges[i]:
+                if o not in dist:
+                    dist[o] = d
+                    queue.append(o)
+        return dist
+
+    def callers(self, name):
+        return self.reach([self.lookup(name)], self.calld)
+
+    def callees(self, name):
+        return self.reach([self.lookup(name)], self.calls)
+
+    def depth(self, name, roots):
+        """
+        shortest and longest call depth of name below any of roots, or
+        None if unreachable.  the longest path counts each cycle group as
+        a single step.
+        """
+        target = self.lookup(name)
+        starts = [self.lookup(root) for root in roots]
+        shortest = self.reach(starts, self.calls)
+        if target not in shortest:
+            return None
+
+        # longest path over the component DAG, callers (= later) first
+        longest = {}
+        for root in starts:
+            longest[self.comp[root]] = 0
+        for cid in range(len(self.components) - 1, -1, -1):
+            if cid not in longest:
+                continue
+            for i in self.components[cid]:
+                for o in self.calls[i]:
+                    ocid = self.comp[o]
+                    if ocid >= cid:
+                        # only edges down the DAG count; edges out of pinned
+                        # and undefined functions may point back up
                         continue
-                    queue.append(calld)
+                    longest[ocid] = max(longest.get(ocid, 0), longest[cid] + 1)
+        return shortest[target], longest.get(self.comp[target])
 
-            common = up[node] & down[node]
-
-            if len(common) == 1:
-                self._linear_nodes.append(node)
-            else:
-                sg = self.Subgraph()
-                sg |= common
-                self._subgraphs.append(sg)
-                for n in common:
-                    if n != node:
-                        nodes.remove(n)
-
-        return self._subgraphs, self._linear_nodes
-
-
-with open(sys.argv[1], "r") as fd:
-    data = json.load(fd)
 
 extra_info = {
     # zebra - LSP WQ
@@ -345,145 +347,230 @@ extra_info = {
 }
 
 
-for func, fdata in data["functions"].items():
-    func = nameclean(func)
-    fnode = FunctionNode.get(func).define(fdata)
+def load_callgraph(data):
+    for func, fdata in data["functions"].items():
+        func = nameclean(func)
+        fnode = FunctionNode.get(func).define(fdata)
 
-    for call in fdata["calls"]:
-        if call.get("type") in [None, "unnamed", "thread_sched"]:
-            if call.get("target") is None:
-                continue
-            tgt = nameclean(call["target"])
-            fnode.add_call(FunctionNode.get(tgt), call)
-            for fptr in call.get("funcptrs", []):
-                fnode.add_call(FunctionNode.get(nameclean(fptr)), call)
-            if tgt == "work_queue_add":
-                if (func, tgt) not in extra_info:
-                    sys.stderr.write(
-                        "%s:%d:%s(): work_queue_add() not handled\n"
-                        % (call["filename"], call["line"], func)
-                    )
-                else:
-                    attrs = dict(call)
-                    attrs.update({"is_external": False, "type": "workqueue"})
-                    for dst in extra_info[func, tgt]:
-                        fnode.add_call(FunctionNode.get(dst), call)
-        elif call["type"] == "install_element":
-            vty_node = FunctionNode.get("VTY_NODE_%d" % call["vty_node"])
-            vty_node.add_call(FunctionNode.get(nameclean(call["target"])), call)
-        elif call["type"] == "hook":
-            # TODO: edges for hooks from data['hooks']
-            pass
-
-n = FunctionNode.funcs
+        for call in fdata["calls"]:
+            if call.get("type") in [None, "unnamed", "thread_sched"]:
+                if call.get("target") is None:
+                    continue
+                tgt = nameclean(call["target"])
+                fnode.add_call(FunctionNode.get(tgt), call)
+                for fptr in call.get("funcptrs", []):
+                    fnode.add_call(FunctionNode.get(nameclean(fptr)), call)
+                if tgt == "work_queue_add":
+                    if (func, tgt) not in extra_info:
+                        sys.stderr.write(
+                            "%s:%d:%s(): work_queue_add() not handled\n"
+                            % (call["filename"], call["line"], func)
+                        )
+                    else:
+                        attrs = dict(call)
+                        attrs.update({"is_external": False, "type": "workqueue"})
+                        for dst in extra_info[func, tgt]:
+                            fnode.add_call(FunctionNode.get(dst), call)
+            elif call["type"] == "install_element":
+                vty_node = FunctionNode.get("VTY_NODE_%d" % call["vty_node"])
+                vty_node.add_call(FunctionNode.get(nameclean(call["target"])), call)
+            elif call["type"] == "hook":
+                # TODO: edges for hooks from data['hooks']
+                pass
+
+    n = FunctionNode.funcs
+
+    # fix some very low end functions cycling back very far to the top
+    if "peer_free" in n:
+        n["peer_free"].unlink(n["bgp_timer_set"])
+        n["peer_free"].unlink(n["bgp_addpath_set_peer_type"])
+    if "bgp_path_info_extra_free" in n:
+        n["bgp_path_info_extra_free"].rank = 0
+
+    if "zlog_ref" in n:
+        n["zlog_ref"].rank = 0
+    if "mt_checkalloc" in n:
+        n["mt_checkalloc"].rank = 0
+
+    return CallGraph.from_functions(n)
 
-# fix some very low end functions cycling back very far to the top
-if "peer_free" in n:
-    n["peer_free"].unlink(n["bgp_timer_set"])
-    n["peer_free"].unlink(n["bgp_addpath_set_peer_type"])
-if "bgp_path_info_extra_free" in n:
-    n["bgp_path_info_extra_free"].rank = 0
 
-if "zlog_ref" in n:
-    n["zlog_ref"].rank = 0
-if "mt_checkalloc" in n:
-    n["mt_checkalloc"].rank = 0
+def is_vnc(n):
+    return n.startswith("rfapi") or n.startswith("vnc") or ("_vnc_" in n)
 
-queue = list(FunctionNode.funcs.values())
-queue = calc_rank(queue, 1)
-queue = calc_rank(queue, -1)
 
-sys.stderr.write("%d functions in cyclic set\n" % len(queue))
+_vncstyle = ',fillcolor="#ffffcc",style=filled'
 
-graph = Graph(queue)
-graph.automerge()
 
-gv_nodes = []
-gv_edges = []
+def render_dot(cg):
+    cyclic = cg.cyclic_set()
+    cyclic_set = set(cyclic)
+
+    sys.stderr.write("%d functions in cyclic set\n" % len(cyclic))
+
+    # cycle groups, in order of first appearance
+    groups = []
+    group_of = {}
+    for i in cyclic:
+        cid = cg.comp[i]
+        if cid not in group_of:
+            group_of[cid] = len(groups)
+            groups.append(cg.components[cid])
+
+    sys.stderr.write("%d cycle groups\n" % len(groups))
+
+    gv_nodes = []
+    gv_edges = []
+
+    def node_text(i, members, indent):
+        name = cg.names[i]
+        has_cycle_callers = [
+            c for c in cg.calld[i] if c in cyclic_set and cg.comp[c] != cg.comp[i]
+        ]
+        has_ext_callers = set(cg.calld[i]) - cyclic_set
+
+        style = ""
+        etext = ""
+        if is_vnc(name):
+            style += _vncstyle
+        if len(members) > 1 and has_cycle_callers:
+            style += ",color=blue,penwidth=3"
+        if has_ext_callers:
+            style += ',fillcolor="#ffeebb",style=filled'
+            etext += '<br/><font point-size="10">(%d other callers)</font>' % (
+                len(has_ext_callers)
+            )
+        return '%s"%s" [shape=box,label=<%s%s>%s];' % (indent, name, name, etext, style)
+
+    for num, members in enumerate(groups):
+        if len(members) > 1:
+            gv_nodes.append("\tsubgraph cluster_%d {" % num)
+            gv_nodes.append("\t\tcolor=blue;")
+            for i in members:
+                gv_nodes.append(node_text(i, members, "\t\t"))
+            gv_nodes.append("\t}")
+        else:
+            gv_nodes.append(node_text(members[0], members, "\t"))
+
+    def xname(i):
+        num = group_of[cg.comp[i]]
+        if len(groups[num]) > 1:
+            return "cluster_%d" % num
+        return cg.names[i]
+
+    edges = set()
+    for i in cyclic:
+        for o in cg.calls[i]:
+            if o == i or o not in cyclic_set:
+                continue
+            if cg.comp[i] == cg.comp[o]:
+                gv_edges.append(
+                    '\t"%s" -> "%s" [color="#55aa55",style=dashed];'
+                    % (cg.names[i], cg.names[o])
+                )
+                continue
 
-sys.stderr.write("%d groups after automerge\n" % len(graph._groups))
+            tup = xname(i), cg.names[o]
+            if tup[0] != tup[1] and tup not in edges:
+                gv_edges.append('\t"%s" -> "%s" [weight=0.0,w=0.0,color=blue];' % tup)
+                edges.add(tup)
 
+    return """digraph {
+    node [fontsize=13,fontname="Fira Sans"];
+%s
+}""" % "\n".join(
+        gv_nodes + [""] + gv_edges
+    )
 
-def is_vnc(n):
-    return n.startswith("rfapi") or n.startswith("vnc") or ("_vnc_" in n)
 
+def query(cg, args):
+    if args.callers or args.callees:
+        name = args.callers or args.callees
+        dist = cg.callers(name) if args.callers else cg.callees(name)
+        for i, d in sorted(dist.items(), key=lambda item: (item[1], cg.names[item[0]])):
+            if d == 0 or (args.max_depth is not None and d > args.max_depth):
+                continue
+            sys.stdout.write("%3d %s\n" % (d, cg.names[i]))
+
+    if args.depth:
+        roots = args.root or [
+            i for i in ["main", "thread_call"] if i in cg.ids
+        ]
+        if not roots:
+            sys.stderr.write("no root functions found, use --root\n")
+            sys.exit(1)
+        result = cg.depth(args.depth, roots)
+        if result is None:
+            sys.stdout.write(
+                "%s: not reachable from %s\n" % (args.depth, ", ".join(roots))
+            )
+        else:
+            sys.stdout.write(
+                "%s: depth %d (shortest) / %s (longest, cycles collapsed) from %s\n"
+                % (args.depth, result[0], result[1], ", ".join(roots))
+            )
 
-_vncstyle = ',fillcolor="#ffffcc",style=filled'
-cyclic_set_names = set([fn.name for fn in graph.values()])
-
-for i, group in enumerate(graph._groups):
-    if len(group) > 1:
-        group.num = i
-        gv_nodes.append("\tsubgraph cluster_%d {" % i)
-        gv_nodes.append("\t\tcolor=blue;")
-        for gn in group:
-            has_cycle_callers = set(gn.calld()) - group
-            has_ext_callers = (
-                set([edge.i.name for edge in gn._fn.inb]) - cyclic_set_names
+    if args.info:
+        i = cg.lookup(args.info)
+        group = cg.cycle_group(i)
+        sys.stdout.write("%s:\n" % args.info)
+        for filename, line in cg.defs[i]:
+            sys.stdout.write("\tdefined at %s:%d\n" % (filename, line))
+        sys.stdout.write("\trank %r\n" % cg.rank[i])
+        sys.stdout.write("\t%d direct callers, %d direct callees\n" % (
+            len(set(cg.calld[i])), len(cg.calls[i])
+        ))
+        if len(group) > 1:
+            sys.stdout.write(
+                "\tcycle group of %d: %s\n"
+                % (len(group), " ".join(sorted(cg.names[m] for m in group)))
             )
 
-            style = ""
-            etext = ""
-            if is_vnc(gn.name):
-                style += _vncstyle
-            if has_cycle_callers:
-                style += ",color=blue,penwidth=3"
-            if has_ext_callers:
-                style += ',fillcolor="#ffeebb",style=filled'
-                etext += '<br/><font point-size="10">(%d other callers)</font>' % (
-                    len(has_ext_callers)
-                )
 
-            gv_nodes.append(
-                '\t\t"%s" [shape=box,label=<%s%s>%s];'
-                % (gn.name, "<br/>".join([fn.name for fn in gn._fns]), etext, style)
-            )
-        gv_nodes.append("\t}")
+def main():
+    argp = argparse.ArgumentParser(description="FRR call graph tool")
+    argp.add_argument("--index", type=str, help="write call graph index to file")
+    argp.add_argument(
+        "--load", type=str, help="load call graph index instead of callgraph json"
+    )
+    argp.add_argument("--callers", type=str, help="list transitive callers of function")
+    argp.add_argument("--callees", type=str, help="list transitive callees of function")
+    argp.add_argument("--max-depth", type=int, help="limit --callers/--callees")
+    argp.add_argument("--depth", type=str, help="call depth of function from roots")
+    argp.add_argument(
+        "--root",
+        type=str,
+        action="append",
+        help="root function for --depth (default: main & event loop)",
+    )
+    argp.add_argument("--info", type=str, help="rank, cycle group etc. of function")
+    argp.add_argument("input", type=str, nargs="?", help="callgraph json input")
+    argp.add_argument("output", type=str, nargs="?", help="graphviz dot output")
+    args = argp.parse_args()
+
+    if args.load:
+        with open(args.load, "r") as fd:
+            cg = CallGraph.from_dict(json.load(fd))
+    elif args.input:
+        with open(args.input, "r") as fd:
+            cg = load_callgraph(json.load(fd))
     else:
-        for gn in group:
-            has_ext_callers = (
-                set([edge.i.name for edge in gn._fn.inb]) - cyclic_set_names
-            )
+        argp.error("need either callgraph json input or --load")
 
-            style = ""
-            etext = ""
-            if is_vnc(gn.name):
-                style += _vncstyle
-            if has_ext_callers:
-                style += ',fillcolor="#ffeebb",style=filled'
-                etext += '<br/><font point-size="10">(%d other callers)</font>' % (
-                    len(has_ext_callers)
-                )
-            gv_nodes.append(
-                '\t"%s" [shape=box,label=<%s%s>%s];'
-                % (gn.name, "<br/>".join([fn.name for fn in gn._fns]), etext, style)
-            )
+    if args.index:
+        with open(args.index, "w") as fd:
+            json.dump(cg.to_dict(), fd, separators=(",", ":"))
 
-edges = set()
-for gn in graph.values():
-    for calls in gn.calls():
-        if gn._group == calls._group:
-            gv_edges.append(
-                '\t"%s" -> "%s" [color="#55aa55",style=dashed];' % (gn.name, calls.name)
-            )
-        else:
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(render_dot(cg))
 
-            def xname(nn):
-                if len(nn._group) > 1:
-                    return "cluster_%d" % nn._group.num
-                else:
-                    return nn.name
+    try:
+        query(cg, args)
+    except KeyError as e:
+        sys.stderr.write("%s\n" % e.args[0])
+        sys.exit(1)
 
-            tup = xname(gn), calls.name
-            if tup[0] != tup[1] and tup not in edges:
-                gv_edges.append('\t"%s" -> "%s" [weight=0.0,w=0.0,color=blue];' % tup)
-                edges.add(tup)
 
-with open(sys.argv[2], "w") as fd:
-    fd.write(
-        """digraph {
-    node [fontsize=13,fontname="Fira Sans"];
-%s
-}"""
-        % "\n".join(gv_nodes + [""] + gv_edges)
-    )
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,7 @@
 # with this program; see the file COPYING; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
-import clippy, traceback, sys, os
+import clippy, traceback, sys, os, json, hashlib
 from collections import OrderedDict
 from functools import reduce
 from pprint import pprint
@@ -261,7 +261,73 @@ class Macros(dict):
             self[name] = val
 
 
-def process_file(fn, ofd, dumpfd, all_defun, macros):
+class CliCache(object):
+    """
+    on-disk cache of rendered DEFPY blocks.  entries are keyed by the
+    expanded command string, the function name, the values of the macros
+    used in the command string and a hash of this script, so regenerating
+    a file with unchanged definitions skips the graph walk entirely.
+    entries are touched when used;  prune() drops the least recently used
+    ones once the cache exceeds max_size bytes.
+    """
+
+    _toolhash = None
+
+    def __init__(self, path, max_size=64 << 20):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def toolhash(cls):
+        # the graph is built by the clippy binary, so that goes in too
+        if cls._toolhash is None:
+            hashobj = hashlib.sha256()
+            for fn in [os.path.realpath(__file__)] + clippy.toolfiles():
+                with open(fn, "rb") as fd:
+                    hashobj.update(fd.read())
+            cls._toolhash = hashobj.hexdigest()
+        return cls._toolhash
+
+    def key(self, deftype, fnname, cmddef, used_macros):
+        data = [self.toolhash(), deftype, fnname, cmddef, sorted(used_macros.items())]
+        return hashlib.sha256(json.dumps(data).encode("utf-8")).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key[:2], key[2:] + ".json")
+
+    def get(self, key):
+        filename = self._filename(key)
+        try:
+            with open(filename, "r") as fd:
+                result = json.load(fd)
+            os.utime(filename)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        filename = self._filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpname = "%s.tmp-%d" % (filename, os.getpid())
+        with open(tmpname, "w") as fd:
+            json.dump(result, fd, separators=(",", ":"))
+        os.rename(tmpname, filename)
+        self.added += 1
+
+    def prune(self):
+        """keep the cache below max_size, only needed if anything was added"""
+        # batch workers only report hits/misses back, every miss adds one
+        if self.added or self.misses:
+            clippy.prune_cache(self.path, self.max_size)
+
+
+def process_file(fn, ofd, dumpfd, all_defun, macros, cache=None):
     errors = 0
     filedata = clippy.parse(fn)
 
@@ -279,8 +345,10 @@ def process_file(fn, ofd, dumpfd, all_defun, macros):
 
             cmddef = entry["args"][2]
             cmddefx = []
+            used_macros = {}
             for i in cmddef:
                 while i in macros:
+                    used_macros[i] = macros[i]
                     i = macros[i]
                 if i.startswith('"') and i.endswith('"'):
                     cmddefx.append(i[1:-1])
@@ -296,6 +364,16 @@ def process_file(fn, ofd, dumpfd, all_defun, macros):
             if cmddefx is None:
                 continue
             cmddef = "".join([i for i in cmddefx])
+            fnname = entry["args"][0][0]
+
+            if cache is not None:
+                cachekey = cache.key(entry["type"], fnname, cmddef, used_macros)
+                cached = cache.get(cachekey)
+                if cached is not None:
+                    if dumpfd is not None:
+                        dumpfd.write(cached["dump"])
+                    ofd.write(cached["code"])
+                    continue
 
             graph = clippy.Graph(cmddef)
             args = OrderedDict()
@@ -316,7 +394,7 @@ def process_file(fn, ofd, dumpfd, all_defun, macros):
             # clippy.dump(graph)
             # pprint(args)
 
-            params = {"cmddef": cmddef, "fnname": entry["args"][0][0]}
+            params = {"cmddef": cmddef, "fnname": fnname}
             argdefs = []
             argdecls = []
             arglist = []
@@ -379,11 +457,12 @@ def process_file(fn, ofd, dumpfd, all_defun, macros):
                     )
                 )
 
+            if len(arglist) > 0:
+                dump = '"%s":\n%s\n\n' % (cmddef, "\n".join(doc))
+            else:
+                dump = '"%s":\n\t---- no magic arguments ----\n\n' % (cmddef)
             if dumpfd is not None:
-                if len(arglist) > 0:
-                    dumpfd.write('"%s":\n%s\n\n' % (cmddef, "\n".join(doc)))
-                else:
-                    dumpfd.write('"%s":\n\t---- no magic arguments ----\n\n' % (cmddef))
+                dumpfd.write(dump)
 
             params["argdefs"] = "".join(argdefs)
             params["argdecls"] = "".join(argdecls)
@@ -392,11 +471,122 @@ def process_file(fn, ofd, dumpfd, all_defun, macros):
             params["canfail"] = canfail
             params["nonempty"] = len(argblocks)
             params["argassert"] = "".join(argassert)
-            ofd.write(templ.substitute(params))
+            code = templ.substitute(params)
+            ofd.write(code)
+
+            if cache is not None:
+                cache.put(cachekey, {"code": code, "dump": dump})
 
     return errors
 
 
+def load_macros():
+    """
+    load the macro tables needed to expand DEFPY command strings.  this is
+    the expensive part of startup, batch mode does it only once.
+    """
+    basepath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    macros = Macros()
+    macros.load("lib/route_types.h")
+    macros.load(os.path.join(basepath, "lib/command.h"))
+    macros.load(os.path.join(basepath, "bgpd/bgp_vty.h"))
+    # sigh :(
+    macros["PROTO_REDIST_STR"] = "FRR_REDIST_STR_ISISD"
+    return macros
+
+
+def reffiles(cfile):
+    return [cfile, os.path.realpath(__file__), sys.executable]
+
+
+def is_current(cfile, outfile):
+    """output exists and is newer than the input and the generator itself"""
+    try:
+        outtime = os.stat(outfile).st_mtime
+    except FileNotFoundError:
+        return False
+    return all(os.stat(ref).st_mtime < outtime for ref in reffiles(cfile))
+
+
+def process_pair(cfile, outfile, all_defun, macros, cache=None):
+    """generate outfile from cfile, only writing it if contents changed"""
+    ofd = StringIO()
+    errors = process_file(cfile, ofd, None, all_defun, macros, cache)
+    if errors == 0:
+        clippy.wrdiff(outfile, ofd, reffiles(cfile))
+    return errors
+
+
+_batch_state = {}
+
+
+def _batch_one(pair):
+    """worker: returns error count and cache hits/misses for one file"""
+    cfile, outfile = pair
+    cache = _batch_state["cache"]
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    try:
+        errors = process_pair(
+            cfile, outfile, _batch_state["all_defun"], _batch_state["macros"], cache
+        )
+    except Exception:
+        sys.stderr.write("%s: exception while processing:\n" % (cfile))
+        traceback.print_exc()
+        errors = 1
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return errors, hits, misses
+
+
+def read_batch(fd):
+    """read "input output" pairs, one per line"""
+    pairs = []
+    for lineno, line in enumerate(fd, 1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        items = line.split()
+        if len(items) != 2:
+            raise ValueError(
+                "batch list line %d: expected 2 items, got %r" % (lineno, line)
+            )
+        pairs.append(tuple(items))
+    return pairs
+
+
+def process_batch(pairs, all_defun, macros, jobs=None, update=False, cache=None):
+    """
+    process a list of (input, output) pairs with macros loaded once.  with
+    jobs > 1, files are spread over forked workers which inherit the macro
+    tables.  returns the number of files that failed.  cache hit/miss counts
+    from the workers are summed up on the passed-in cache object.
+    """
+    import multiprocessing
+
+    if update:
+        pairs = [pair for pair in pairs if not is_current(*pair)]
+    if not pairs:
+        return 0
+
+    _batch_state["all_defun"] = all_defun
+    _batch_state["macros"] = macros
+    _batch_state["cache"] = cache
+
+    nproc = jobs or min(len(pairs), os.cpu_count() or 1)
+    if nproc > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context("fork").Pool(nproc) as pool:
+            results = pool.map(_batch_one, pairs, chunksize=1)
+    else:
+        results = [_batch_one(pair) for pair in pairs]
+
+    if cache is not None and nproc > 1:
+        cache.hits = sum(hits for _, hits, _ in results)
+        cache.misses = sum(misses for _, _, misses in results)
+
+    return sum(1 for errors, _, _ in results if errors != 0)
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -414,9 +604,86 @@ if __name__ == "__main__":
         help="print out list of arguments and types for each definition",
     )
     argp.add_argument("-o", type=str, metavar="OUTFILE", help="output C file name")
-    argp.add_argument("cfile", type=str)
+    argp.add_argument(
+        "--batch",
+        type=str,
+        metavar="LISTFILE",
+        help='process "input output" pairs listed in LISTFILE ("-" for stdin)',
+    )
+    argp.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="number of parallel workers in batch mode (default: CPU count)",
+    )
+    argp.add_argument(
+        "-u",
+        "--update",
+        action="store_const",
+        const=True,
+        help="in batch mode, skip outputs newer than their inputs",
+    )
+    argp.add_argument(
+        "--cache",
+        type=str,
+        metavar="DIR",
+        help="cache rendered DEFPY blocks in DIR",
+    )
+    argp.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="prune the cache down to this size (default: 64)",
+    )
+    argp.add_argument(
+        "--cache-stats",
+        action="store_const",
+        const=True,
+        help="print cache hit/miss counts to stderr",
+    )
+    argp.add_argument("cfile", type=str, nargs="?")
     args = argp.parse_args()
 
+    cache = None
+    if args.cache is not None:
+        cache = CliCache(args.cache, args.cache_size << 20)
+
+    def cache_stats():
+        if cache is None:
+            return
+        cache.prune()
+        if args.cache_stats:
+            sys.stderr.write(
+                "clidef cache: %d hits, %d misses\n" % (cache.hits, cache.misses)
+            )
+
+    if args.batch is not None:
+        if args.cfile is not None or args.o is not None or args.show:
+            argp.error("--batch cannot be combined with -o, --show or an input file")
+
+        try:
+            if args.batch == "-":
+                pairs = read_batch(sys.stdin)
+            else:
+                with open(args.batch, "r") as fd:
+                    pairs = read_batch(fd)
+        except ValueError as e:
+            argp.error(str(e))
+
+        failed = process_batch(
+            pairs, args.all_defun, load_macros(), args.jobs, args.update, cache
+        )
+        cache_stats()
+        if failed != 0:
+            sys.stderr.write("%d file(s) failed to process\n" % (failed))
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.cfile is None:
+        argp.error("input file required")
+
     dumpfd = None
     if args.o is not None:
         ofd = StringIO()
@@ -427,20 +694,12 @@ if __name__ == "__main__":
         if args.show:
             dumpfd = sys.stderr
 
-    basepath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-    macros = Macros()
-    macros.load("lib/route_types.h")
-    macros.load(os.path.join(basepath, "lib/command.h"))
-    macros.load(os.path.join(basepath, "bgpd/bgp_vty.h"))
-    # sigh :(
-    macros["PROTO_REDIST_STR"] = "FRR_REDIST_STR_ISISD"
+    macros = load_macros()
 
-    errors = process_file(args.cfile, ofd, dumpfd, args.all_defun, macros)
+    errors = process_file(args.cfile, ofd, dumpfd, args.all_defun, macros, cache)
+    cache_stats()
     if errors != 0:
         sys.exit(1)
 
     if args.o is not None:
-        clippy.wrdiff(
-            args.o, ofd, [args.cfile, os.path.realpath(__file__), sys.executable]
-        )
+        clippy.wrdiff(args.o, ofd, reffiles(args.cfile))
@@ -16,13 +16,56 @@
 # with this program; see the file COPYING; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
-import os, stat
+import os, stat, sys
 import _clippy
 from _clippy import parse, Graph, GraphNode
 
 
 frr_top_src = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+def toolfiles():
+    """files making up clippy itself, for keying caches of its output
+
+    this package plus the _clippy module:  built into the clippy binary
+    (sys.executable) or loaded as an extension module.
+    """
+    files = [os.path.abspath(__file__), sys.executable]
+    if getattr(_clippy, "__file__", None):
+        files.append(_clippy.__file__)
+    return files
+
+
+def prune_cache(path, max_size):
+    """delete least recently used files below path down to max_size bytes
+
+    "used" is the mtime, so caches should touch entries they read.  returns
+    the number of files deleted.
+    """
+
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            filename = os.path.join(dirpath, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+            total += st.st_size
+
+    removed = 0
+    for _, size, filename in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.unlink(filename)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
 def graph_iterate(graph):
     """iterator yielding all nodes of a graph
 
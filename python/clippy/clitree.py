@@ -0,0 +1,298 @@
+# FRR CLI command tree & config marking
+#
+# Copyright (C) 2021  Network Device Education Foundation, Inc. ("NetDEF")
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; see the file COPYING; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+'''
+Rebuild vtysh's command tree in-process from the CLI data in frr.xref and
+match/mark configuration text against it, like "vtysh -m" does.
+
+The command definitions and the node each command is installed in come
+from frr.xref.  Two things are not in there since they're code rather than
+data: the parent of each node, and which commands enter a node.  Both are
+read from vtysh/vtysh.c (struct cmd_node initializers, and "vty->node = X"
+or vtysh_exit() in command bodies, or the command they return into),
+node numbers from lib/command.h.
+'''
+
+import os
+import re
+
+from _clippy import (
+    CommandNode,
+    MATCHER_OK,
+    MATCHER_NO_MATCH,
+    MATCHER_INCOMPLETE,
+    MATCHER_AMBIGUOUS,
+)
+
+from clippy import frr_top_src
+
+matcher_errors = {
+    MATCHER_NO_MATCH: 'Unknown command',
+    MATCHER_INCOMPLETE: 'Command incomplete',
+    MATCHER_AMBIGUOUS: 'Ambiguous command',
+}
+
+re_comment = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+re_node_enum = re.compile(r'\benum\s+node_type\s*\{(.*?)\};', re.S)
+re_cmd_node = re.compile(r'\bstruct\s+cmd_node\s+\w+\s*=\s*\{(.*?)\};', re.S)
+re_field = re.compile(r'\.(\w+)\s*=\s*("(?:[^"\\]|\\.)*"|\w+)')
+re_defun = re.compile(r'\b(DEFUNSH\w*|DEFUN\w*|DEFPY\w*)\s*\(\s*(\w+)\s*,\s*(\w+)(?:\s*,\s*(\w+))?')
+re_node_set = re.compile(r'\bvty->node\s*=\s*(\w+)\s*;')
+re_node_case = re.compile(r'\bcase\s+(\w+)\s*:\s*vty->node\s*=\s*(\w+)\s*;')
+re_exit_call = re.compile(r'\bvtysh_exit\w*\s*\(')
+re_delegate = re.compile(r'\breturn\s+(\w+)\s*\(\s*(?:self\s*,\s*)?vty\b')
+
+
+class CliMarkError(Exception):
+    def __init__(self, lineno, status, line):
+        self.lineno = lineno
+        self.status = status
+        self.line = line
+        super().__init__('line %d: %% %s: %s' % (
+            lineno, matcher_errors.get(status, status), line.rstrip('\n')))
+
+
+def parse_node_enum(text):
+    '''enum node_type item names from lib/command.h, in order'''
+    m = re_node_enum.search(re_comment.sub('', text))
+    if m is None:
+        raise ValueError('cannot find enum node_type')
+    return [item.strip() for item in m.group(1).split(',') if item.strip()]
+
+
+def _closing(text, pos):
+    '''
+    position of the bracket closing the one at text[pos], string and char
+    literals are skipped (command strings contain "{" and "}")
+    '''
+    opening = text[pos]
+    closing = {'(': ')', '{': '}'}[opening]
+    depth = 0
+    while pos < len(text):
+        ch = text[pos]
+        if ch in '"\'':
+            pos += 1
+            while pos < len(text) and text[pos] != ch:
+                pos += 2 if text[pos] == '\\' else 1
+        elif ch == opening:
+            depth += 1
+        elif ch == closing:
+            depth -= 1
+            if depth == 0:
+                return pos
+        pos += 1
+    return len(text)
+
+
+def _bodies(text):
+    '''(macro, args, body) for each DEFUN-style definition'''
+    for m in re_defun.finditer(text):
+        # body is the first "{" after the macro call's closing ")"
+        end = _closing(text, text.index('(', m.end(1)))
+        start = text.find('{', end)
+        if start < 0:
+            break
+        yield m.group(1), m.group(2, 3, 4), text[start:_closing(text, start)]
+
+
+def parse_vtysh(text):
+    '''
+    returns (parents, transitions):
+    - parents is {node name: parent node name}
+    - transitions is {cmd_element name: action}, with action being either
+      a node name, a {current node: new node} dict, or 'exit'
+    '''
+    text = re_comment.sub('', text)
+
+    parents = {}
+    for m in re_cmd_node.finditer(text):
+        fields = dict(re_field.findall(m.group(1)))
+        if 'node' in fields and 'parent_node' in fields:
+            parents[fields['node']] = fields['parent_node']
+
+    transitions = {}
+    funcs = {}
+    delegates = {}
+    for macro, args, body in _bodies(text):
+        # DEFUNSH(daemon, funcname, cmdname, ...) vs. DEFUN(funcname, cmdname, ...)
+        funcname, cmdname = args[1:3] if macro.startswith('DEFUNSH') else args[:2]
+        funcs[funcname] = cmdname
+
+        cases = re_node_case.findall(body)
+        if cases:
+            transitions[cmdname] = dict(cases)
+            continue
+        targets = re_node_set.findall(body)
+        if targets:
+            transitions[cmdname] = targets[0]
+        elif re_exit_call.search(body):
+            transitions[cmdname] = 'exit'
+        else:
+            # e.g. "quit" commands:  return rpki_exit(self, vty, argc, argv);
+            m = re_delegate.search(body)
+            if m is not None:
+                delegates[cmdname] = m.group(1)
+
+    for cmdname, funcname in delegates.items():
+        seen = set()
+        while funcname in funcs and funcname not in seen:
+            seen.add(funcname)
+            target = funcs[funcname]
+            if target in transitions:
+                transitions[cmdname] = transitions[target]
+                break
+            funcname = delegates.get(target)
+
+    return parents, transitions
+
+
+class CliTree(object):
+    '''
+    per-node command graphs plus node parent/transition tables.  nodes are
+    referred to by their enum node_type name (e.g. "BGP_NODE").
+    '''
+    error = CliMarkError
+
+    def __init__(self, nodenames, parents, transitions):
+        self.nodenames = nodenames
+        self.nodenum = dict((name, i) for i, name in enumerate(nodenames))
+        self.parents = parents
+        self.transitions = transitions
+        self.nodes = {}
+        self.config_node = 'CONFIG_NODE'
+
+    @classmethod
+    def from_source(cls, srcdir=frr_top_src):
+        with open(os.path.join(srcdir, 'lib', 'command.h'), 'r') as fd:
+            nodenames = parse_node_enum(fd.read())
+        with open(os.path.join(srcdir, 'vtysh', 'vtysh.c'), 'r') as fd:
+            parents, transitions = parse_vtysh(fd.read())
+        return cls(nodenames, parents, transitions)
+
+    @classmethod
+    def from_xref(cls, xrefdata, srcdir=frr_top_src, binary=None):
+        '''
+        build from frr.xref data (loaded JSON or Xrelfo.)  by default the
+        commands vtysh has are used;  if vtysh is not in the xref data, the
+        union of all daemons' commands.
+        '''
+        tree = cls.from_source(srcdir)
+        tree.load_cli(xrefdata['cli'], binary)
+        return tree
+
+    def node(self, name):
+        node = self.nodes.get(name)
+        if node is None:
+            node = self.nodes[name] = CommandNode()
+        return node
+
+    def install(self, node, cmdname, string, doc=None):
+        return self.node(node).install(string, doc, cmdname)
+
+    def load_cli(self, cli, binary=None):
+        if binary is None:
+            binaries = set(b for defs in cli.values() for b in defs)
+            vtysh = sorted(b for b in binaries if os.path.basename(b) == 'vtysh')
+            binary = vtysh[0] if vtysh else None
+
+        seen = set()
+        for cmdname, defs in sorted(cli.items()):
+            if binary is not None:
+                defs = [defs[binary]] if binary in defs else []
+            else:
+                defs = [defs[b] for b in sorted(defs)]
+
+            for clidef in defs:
+                for install in clidef.get('nodes', []):
+                    num = install['node']
+                    if not 0 <= num < len(self.nodenames):
+                        continue
+                    key = (num, clidef['string'])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    self.install(self.nodenames[num], cmdname, clidef['string'],
+                                 clidef.get('doc'))
+
+    def parent(self, node):
+        # unset .parent_node is 0 (AUTH_NODE), which ends the walk up
+        return self.parents.get(node, self.nodenames[0])
+
+    def match(self, node, words):
+        '''returns (status, cmdname, args), see _clippy.CommandNode.match'''
+        cmdnode = self.nodes.get(node)
+        if cmdnode is None:
+            return (MATCHER_NO_MATCH, None, None)
+        return cmdnode.match(words)
+
+    def enter(self, node, cmdname):
+        '''node after executing cmdname in node'''
+        action = self.transitions.get(cmdname)
+        if action is None:
+            return node
+        if action == 'exit':
+            return self.parents.get(node, node)
+        if isinstance(action, dict):
+            return action.get(node, node)
+        return action
+
+    def mark(self, lines):
+        '''
+        generator, same output as "vtysh -m -f":  "exit" lines are inserted
+        where the config leaves a node, "end" after "exit-vrf" and at the
+        end of the input.  raises CliMarkError on the first line that
+        doesn't match.
+        '''
+        config_num = self.nodenum[self.config_node]
+        node = self.config_node
+
+        for lineno, line in enumerate(lines, 1):
+            trimmed = line.strip()
+            if not trimmed or trimmed[0] in '!#':
+                yield line
+                continue
+            if trimmed == 'end':
+                continue
+
+            words = trimmed.split()
+            prev_node = node
+            status, cmdname, _ = saved = self.match(node, words)
+
+            # walk up the node tree, same as vtysh_mark_file()
+            tried = 0
+            while status not in (MATCHER_OK, MATCHER_AMBIGUOUS, MATCHER_INCOMPLETE) \
+                    and self.nodenum.get(node, 0) > config_num:
+                node = self.parent(node)
+                status, cmdname, _ = self.match(node, words)
+                tried += 1
+
+            if status != MATCHER_OK:
+                raise CliMarkError(lineno, saved[0] if tried else status, line)
+
+            for i in range(tried):
+                yield 'exit\n'
+            yield line
+            if trimmed == 'exit-vrf':
+                yield 'end\n'
+
+            node = self.enter(node, cmdname)
+
+        yield '\nend\n'
+
+    def mark_text(self, text):
+        return ''.join(self.mark(text.splitlines(True)))
@@ -0,0 +1,492 @@
+# FRR DWARF type information reader
+#
+# Copyright (C) 2021  Network Device Education Foundation, Inc. ("NetDEF")
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; see the file COPYING; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+'''
+Minimal DWARF (versions 2 to 5) .debug_info reader on top of ELFDissectFile.
+
+This only does what is needed to pull struct layouts out of a binary, i.e.
+walk the DIE tree of compilation units and follow type references.  Line
+numbers, location lists, macros etc. are not handled.  Split DWARF and
+compressed debug sections are not supported either, and neither are
+relocations, so the input needs to be a linked binary or library rather than
+an object file.
+'''
+
+import struct
+
+# DW_TAG_*
+TAG_array_type = 0x01
+TAG_enumeration_type = 0x04
+TAG_member = 0x0d
+TAG_pointer_type = 0x0f
+TAG_compile_unit = 0x11
+TAG_structure_type = 0x13
+TAG_subroutine_type = 0x15
+TAG_typedef = 0x16
+TAG_union_type = 0x17
+TAG_subrange_type = 0x21
+TAG_base_type = 0x24
+TAG_const_type = 0x26
+TAG_volatile_type = 0x35
+TAG_restrict_type = 0x37
+TAG_atomic_type = 0x47
+
+# DW_AT_* (only the ones kept when parsing)
+AT_name = 0x03
+AT_byte_size = 0x0b
+AT_bit_size = 0x0d
+AT_upper_bound = 0x2f
+AT_count = 0x37
+AT_data_member_location = 0x38
+AT_declaration = 0x3c
+AT_type = 0x49
+AT_data_bit_offset = 0x6b
+AT_str_offsets_base = 0x72
+
+keep_attrs = frozenset([
+    AT_name, AT_byte_size, AT_bit_size, AT_upper_bound, AT_count,
+    AT_data_member_location, AT_declaration, AT_type, AT_data_bit_offset,
+    AT_str_offsets_base,
+])
+
+# DW_FORM_* that reference another DIE, relative to the unit start
+cu_ref_forms = frozenset([0x11, 0x12, 0x13, 0x14, 0x15])
+FORM_ref_addr = 0x10
+FORM_indirect = 0x16
+FORM_implicit_const = 0x21
+FORM_exprloc = 0x18
+
+DW_OP_plus_uconst = 0x23
+
+
+class DWARFError(Exception):
+    pass
+
+
+def uleb(data, pos):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def sleb(data, pos):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            if byte & 0x40:
+                result -= 1 << shift
+            return result, pos
+
+
+def section_data(elffile, name):
+    sect = elffile.get_section(name)
+    if sect is None:
+        return None
+    return sect[0:sect._section.len]
+
+
+class DIE(object):
+    __slots__ = ['offset', 'tag', 'attrs', 'children']
+
+    def __init__(self, offset, tag, attrs):
+        self.offset = offset
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []
+
+    def __repr__(self):
+        return '<DIE 0x%x tag 0x%x %r>' % (self.offset, self.tag, self.attrs)
+
+
+class CompUnit(object):
+    '''
+    one compilation unit in .debug_info.  parse() reads all of its DIEs,
+    keeping only attributes in `keep_attrs`.
+    '''
+    def __init__(self, dwarf, offset):
+        self.dwarf = dwarf
+        self.offset = offset
+        data, endian = dwarf.info, dwarf.endian
+
+        length, = struct.unpack_from(endian + 'I', data, offset)
+        pos = offset + 4
+        self.offsize = 4
+        if length == 0xffffffff:
+            length, = struct.unpack_from(endian + 'Q', data, pos)
+            pos += 8
+            self.offsize = 8
+        self.end = pos + length
+        offfmt = endian + ('I' if self.offsize == 4 else 'Q')
+
+        self.version, = struct.unpack_from(endian + 'H', data, pos)
+        pos += 2
+        self.unit_type = 1
+        if self.version >= 5:
+            self.unit_type, self.addr_size = data[pos], data[pos + 1]
+            pos += 2
+            abbrev_offset, = struct.unpack_from(offfmt, data, pos)
+            pos += self.offsize
+            if self.unit_type in (4, 5):    # skeleton, split_compile
+                pos += 8
+            elif self.unit_type in (2, 6):  # type, split_type
+                pos += 8 + self.offsize
+        elif self.version >= 2:
+            abbrev_offset, = struct.unpack_from(offfmt, data, pos)
+            pos += self.offsize
+            self.addr_size = data[pos]
+            pos += 1
+        else:
+            raise DWARFError('unsupported DWARF version %d at 0x%x' % (self.version, offset))
+
+        self.die_start = pos
+        self.abbrevs = dwarf.abbrevs(abbrev_offset)
+        self.str_offsets_base = None
+
+    def _fixed_sizes(self):
+        off, addr = self.offsize, self.addr_size
+        return {
+            0x01: addr, 0x05: 2, 0x06: 4, 0x07: 8, 0x0b: 1, 0x0c: 1,
+            0x0e: off, 0x10: addr if self.version == 2 else off,
+            0x11: 1, 0x12: 2, 0x13: 4, 0x14: 8, 0x17: off, 0x19: 0,
+            0x1c: 4, 0x1d: off, 0x1e: 16, 0x1f: off, 0x20: 8, 0x21: 0,
+            0x24: 8, 0x25: 1, 0x26: 2, 0x27: 3, 0x28: 4, 0x29: 1,
+            0x2a: 2, 0x2b: 3, 0x2c: 4, 0x1f20: off, 0x1f21: off,
+        }
+
+    def _read(self, form, data, pos):
+        '''read a variable-length value, returns (value, newpos)'''
+        if form in (0x0f, 0x15, 0x1a, 0x1b, 0x22, 0x23, 0x1f01, 0x1f02):
+            return uleb(data, pos)
+        if form == 0x0d:
+            return sleb(data, pos)
+        if form == 0x08:
+            end = data.index(b'\0', pos)
+            return data[pos:end], end + 1
+        if form in (0x09, FORM_exprloc):
+            length, pos = uleb(data, pos)
+            return data[pos:pos + length], pos + length
+        if form == 0x0a:
+            return data[pos + 1:pos + 1 + data[pos]], pos + 1 + data[pos]
+        if form in (0x03, 0x04):
+            fmt = 'H' if form == 0x03 else 'I'
+            length, = struct.unpack_from(self.dwarf.endian + fmt, data, pos)
+            pos += struct.calcsize(fmt)
+            return data[pos:pos + length], pos + length
+        raise DWARFError('unsupported DW_FORM 0x%x in unit at 0x%x' % (form, self.offset))
+
+    def parse(self):
+        '''
+        returns ({offset: DIE}, [top level DIEs])
+        '''
+        data, endian = self.dwarf.info, self.dwarf.endian
+        fixed = self._fixed_sizes()
+        unpackers = dict((size, struct.Struct(endian + fmt).unpack_from)
+                         for size, fmt in [(2, 'H'), (4, 'I'), (8, 'Q')])
+
+        dies = {}
+        toplevel = []
+        stack = []
+        pos = self.die_start
+
+        while pos < self.end:
+            offset = pos
+            code, pos = uleb(data, pos)
+            if code == 0:
+                if stack:
+                    stack.pop()
+                continue
+
+            tag, has_children, specs = self.abbrevs[code]
+            attrs = {}
+            for attr, form, implicit in specs:
+                if form == FORM_indirect:
+                    form, pos = uleb(data, pos)
+                if form == FORM_implicit_const:
+                    if attr in keep_attrs:
+                        attrs[attr] = (form, implicit)
+                    continue
+
+                size = fixed.get(form)
+                if size is None:
+                    value, pos = self._read(form, data, pos)
+                elif attr in keep_attrs:
+                    if size == 1:
+                        value = data[pos]
+                    elif size in unpackers:
+                        value = unpackers[size](data, pos)[0]
+                    else:
+                        value = data[pos:pos + size]
+                    pos += size
+                else:
+                    pos += size
+                    continue
+
+                if attr in keep_attrs:
+                    if form in cu_ref_forms:
+                        value += self.offset
+                    attrs[attr] = (form, value)
+
+            die = DIE(offset, tag, attrs)
+            dies[offset] = die
+            if stack:
+                stack[-1].children.append(die)
+            else:
+                toplevel.append(die)
+                if tag == TAG_compile_unit and AT_str_offsets_base in attrs:
+                    self.str_offsets_base = attrs[AT_str_offsets_base][1]
+            if has_children:
+                stack.append(die)
+
+        return dies, toplevel
+
+    def string(self, attrval):
+        form, value = attrval
+        dwarf = self.dwarf
+        if form == 0x08:
+            raw = value
+        elif form in (0x0e, 0x1f):
+            sect = dwarf.str if form == 0x0e else dwarf.line_str
+            raw = sect[value:sect.index(b'\0', value)]
+        elif form in (0x1a, 0x25, 0x26, 0x27, 0x28, 0x1f02):
+            if isinstance(value, bytes):
+                value = int.from_bytes(value, 'big' if dwarf.endian == '>' else 'little')
+            base = self.str_offsets_base
+            if base is None:
+                base = 8 if self.offsize == 4 else 16
+            fmt = dwarf.endian + ('I' if self.offsize == 4 else 'Q')
+            stroffs, = struct.unpack_from(fmt, dwarf.str_offsets, base + value * self.offsize)
+            raw = dwarf.str[stroffs:dwarf.str.index(b'\0', stroffs)]
+        else:
+            raise DWARFError('unsupported string DW_FORM 0x%x' % form)
+        return raw.decode('UTF-8')
+
+
+class DWARFInfo(object):
+    '''
+    .debug_info access for an ELFDissectFile (or anything else providing
+    get_section() & endian the same way.)
+    '''
+    def __init__(self, elffile):
+        self.endian = elffile.endian
+        self.info = section_data(elffile, '.debug_info')
+        if self.info is None:
+            if elffile.get_section('.zdebug_info') is not None:
+                raise DWARFError('compressed debug sections are not supported')
+            raise DWARFError('no .debug_info section (not built with -g?)')
+        self.abbrev = section_data(elffile, '.debug_abbrev')
+        self.str = section_data(elffile, '.debug_str') or b''
+        self.line_str = section_data(elffile, '.debug_line_str') or b''
+        self.str_offsets = section_data(elffile, '.debug_str_offsets') or b''
+        self._abbrevs = {}
+
+    def abbrevs(self, offset):
+        if offset in self._abbrevs:
+            return self._abbrevs[offset]
+
+        data = self.abbrev
+        table = {}
+        pos = offset
+        while True:
+            code, pos = uleb(data, pos)
+            if code == 0:
+                break
+            tag, pos = uleb(data, pos)
+            has_children = data[pos]
+            pos += 1
+            specs = []
+            while True:
+                attr, pos = uleb(data, pos)
+                form, pos = uleb(data, pos)
+                implicit = None
+                if form == FORM_implicit_const:
+                    implicit, pos = sleb(data, pos)
+                if attr == 0 and form == 0:
+                    break
+                specs.append((attr, form, implicit))
+            table[code] = (tag, has_children, tuple(specs))
+
+        self._abbrevs[offset] = table
+        return table
+
+    def units(self):
+        offset = 0
+        while offset < len(self.info):
+            unit = CompUnit(self, offset)
+            yield unit
+            offset = unit.end
+
+
+class StructExtractor(object):
+    '''
+    Pull struct member lists out of DWARF info, in the same format
+    tiabwarfo.py used to create from pahole output.
+
+    Compilation units are scanned in order until all requested structs have
+    been found, so the cost depends on how early the structs show up rather
+    than the total size of the debug info.
+    '''
+    def __init__(self, dwarf):
+        self.dwarf = dwarf
+        self.missing = set()
+
+    def extract(self, names):
+        '''
+        returns {struct name: {'fields': [...]}}.  structs that are not in
+        the debug info at all are skipped (like pahole does) and listed in
+        self.missing.
+        '''
+        wanted = set(names)
+        out = {}
+        for unit in self.dwarf.units():
+            if unit.unit_type not in (1, 3):    # compile, partial
+                continue
+            dies, _ = unit.parse()
+            for die in dies.values():
+                if die.tag != TAG_structure_type or AT_declaration in die.attrs:
+                    continue
+                if AT_name not in die.attrs:
+                    continue
+                name = unit.string(die.attrs[AT_name])
+                if name in wanted and name not in out:
+                    out[name] = {'fields': self.fields(unit, dies, die, name)}
+            if set(out.keys()) >= wanted:
+                break
+
+        self.missing = wanted - set(out.keys())
+        return out
+
+    def _target(self, dies, die):
+        if AT_type not in die.attrs:
+            return None
+        form, ref = die.attrs[AT_type]
+        if ref not in dies:
+            raise DWARFError('type reference 0x%x (form 0x%x) outside of unit' % (ref, form))
+        return dies[ref]
+
+    def type_name(self, unit, dies, die):
+        if die is None:
+            return 'void'
+        tag = die.tag
+        if tag in (TAG_base_type, TAG_typedef):
+            return unit.string(die.attrs[AT_name])
+        if tag in (TAG_structure_type, TAG_union_type, TAG_enumeration_type):
+            kind = {TAG_structure_type: 'struct', TAG_union_type: 'union',
+                    TAG_enumeration_type: 'enum'}[tag]
+            if AT_name not in die.attrs:
+                raise DWARFError('anonymous %s at 0x%x not supported' % (kind, die.offset))
+            return '%s %s' % (kind, unit.string(die.attrs[AT_name]))
+        if tag in (TAG_const_type, TAG_volatile_type):
+            qual = 'const' if tag == TAG_const_type else 'volatile'
+            return '%s %s' % (qual, self.type_name(unit, dies, self._target(dies, die)))
+        if tag in (TAG_restrict_type, TAG_atomic_type):
+            return self.type_name(unit, dies, self._target(dies, die))
+        if tag == TAG_pointer_type:
+            target = self._target(dies, die)
+            if target is not None and target.tag == TAG_subroutine_type:
+                # function pointer, pahole "int (*func)(...)" ended up as "int *"
+                return self.type_name(unit, dies, self._target(dies, target)) + ' *'
+            if target is not None and target.tag == TAG_const_type:
+                # pahole's spacing, kept to make the JSON output identical
+                return self.type_name(unit, dies, target) + '  *'
+            return self.type_name(unit, dies, target) + ' *'
+        raise DWARFError('cannot name type DIE 0x%x (tag 0x%x)' % (die.offset, tag))
+
+    def type_size(self, unit, dies, die):
+        if die is None:
+            raise DWARFError('void has no size')
+        if AT_byte_size in die.attrs:
+            return die.attrs[AT_byte_size][1]
+        if die.tag == TAG_pointer_type:
+            return unit.addr_size
+        if die.tag == TAG_array_type:
+            return self.type_size(unit, dies, self._target(dies, die)) * self.array_count(die)
+        if die.tag in (TAG_typedef, TAG_const_type, TAG_volatile_type,
+                       TAG_restrict_type, TAG_atomic_type):
+            return self.type_size(unit, dies, self._target(dies, die))
+        raise DWARFError('cannot size type DIE 0x%x (tag 0x%x)' % (die.offset, die.tag))
+
+    @staticmethod
+    def array_count(die):
+        ranges = [c for c in die.children if c.tag == TAG_subrange_type]
+        if len(ranges) != 1:
+            raise DWARFError('array DIE 0x%x: %d dimensions not supported' % (die.offset, len(ranges)))
+        attrs = ranges[0].attrs
+        if AT_count in attrs:
+            return attrs[AT_count][1]
+        if AT_upper_bound in attrs:
+            return attrs[AT_upper_bound][1] + 1
+        return 0
+
+    @staticmethod
+    def member_offset(die):
+        form, value = die.attrs.get(AT_data_member_location, (None, 0))
+        if form == FORM_exprloc or isinstance(value, bytes):
+            if len(value) == 0 or value[0] != DW_OP_plus_uconst:
+                raise DWARFError('member DIE 0x%x: complex location not supported' % die.offset)
+            value, _ = uleb(value, 1)
+        return value
+
+    def fields(self, unit, dies, sdie, sname):
+        fields = []
+        next_offs = 0
+        for member in sdie.children:
+            if member.tag != TAG_member:
+                continue
+            if AT_bit_size in member.attrs or AT_data_bit_offset in member.attrs:
+                raise DWARFError('bitfield in struct %s not supported' % sname)
+
+            name = unit.string(member.attrs[AT_name])
+            mtype = self._target(dies, member)
+            data = {'name': name}
+            if mtype is not None and mtype.tag == TAG_array_type:
+                data['type'] = self.type_name(unit, dies, self._target(dies, mtype))
+                data['array'] = self.array_count(mtype)
+            else:
+                data['type'] = self.type_name(unit, dies, mtype)
+            fields.append(data)
+
+            offs = self.member_offset(member)
+            if offs != next_offs:
+                raise ValueError('%d padding bytes before struct %s.%s' % (offs - next_offs, sname, name))
+            next_offs = offs + self.type_size(unit, dies, mtype)
+
+        return fields
+
+
+def build_id(elffile):
+    '''
+    GNU build ID as hex string, or None.  Read from the .note.gnu.build-id
+    section.
+    '''
+    data = section_data(elffile, '.note.gnu.build-id')
+    if data is None or len(data) < 16:
+        return None
+    namesz, descsz, ntype = struct.unpack_from(elffile.endian + 'III', data, 0)
+    if ntype != 3:
+        return None
+    descoffs = 12 + ((namesz + 3) & ~3)
+    return data[descoffs:descoffs + descsz].hex()
@@ -31,7 +31,6 @@ fields as needed.
 '''
 
 import struct
-from collections import OrderedDict
 from weakref import WeakValueDictionary
 
 from _clippy import ELFFile, ELFAccessError
@@ -228,7 +227,7 @@ class ELFDissectStruct(ELFDissectData):
                 return None
             return self.cls(self.ptr)
 
-    def __new__(cls, dataptr, parent = None, replace = None):
+    def __new__(cls, dataptr, parent = None, replace = None, _raw = None):
         if dataptr._dstsect is None:
             return super().__new__(cls)
 
@@ -260,6 +259,8 @@ class ELFDissectStruct(ELFDissectData):
     def _setup_efields(cls):
         cls._efields = {}
         cls._esize = {}
+        cls._layouts = {}
+        cls._fieldidx = dict([(f[0], i) for i, f in enumerate(cls.fields) if f[0] is not None])
         for elfclass in [32, 64]:
             cls._efields[elfclass] = []
             size = 0
@@ -269,93 +270,111 @@ class ELFDissectStruct(ELFDissectData):
                 size += struct.calcsize(newf[1])
             cls._esize[elfclass] = size
 
-    def __init__(self, dataptr, parent = None, replace = None):
+    @classmethod
+    def _layout(cls, elfclass, ptrtype, endian):
+        '''
+        Compiled unpacking info for this struct in a particular ELF flavor
+
+        :returns: (struct.Struct, byte offset of each field,
+            tuple indices of pointer fields)
+        '''
+        if not hasattr(cls, '_efields'):
+            cls._setup_efields()
+
+        key = (elfclass, ptrtype, endian)
+        layout = cls._layouts.get(key)
+        if layout is not None:
+            return layout
+
+        # need to correlate output from struct.unpack with extra metadata
+        # about the particular fields, so note down byte offsets (in locs)
+        # and tuple indices of pointers (in ptrs)
+        pspec = ''
+        locs = []
+        ptrs = []
+
+        for idx, f in enumerate(cls._efields[elfclass]):
+            spec = f[1]
+            if spec == 'P':
+                ptrs.append(idx)
+                spec = ptrtype
+
+            locs.append(struct.calcsize(pspec))
+            pspec = pspec + spec
+
+        layout = (struct.Struct(endian + pspec), locs, tuple(ptrs))
+        cls._layouts[key] = layout
+        return layout
+
+    def __init__(self, dataptr, parent = None, replace = None, _raw = None):
         if not hasattr(self.__class__, '_efields'):
             self._setup_efields()
 
-        self._fdata = None
+        self._fdata = {}
+        self._fraw = None
         self._data = dataptr
         self._parent = parent
         self.symname = dataptr.symname
         if isinstance(dataptr, ELFNull) or isinstance(dataptr, ELFUnresolved):
-            self._fdata = {}
             return
 
         self._elfsect = dataptr._dstsect
         self.elfclass = self._elfsect._elffile.elfclass
         self.offset = dataptr._dstoffs
 
-        pspecl = [f[1] for f in self._efields[self.elfclass]]
+        st, self._locs, self._ptrs = self._layout(self.elfclass, self._elfsect.ptrtype, self._elfsect.endian)
+        self._total_size = st.size
 
-        # need to correlate output from struct.unpack with extra metadata
-        # about the particular fields, so note down byte offsets (in locs)
-        # and tuple indices of pointers (in ptrs)
-        pspec = ''
-        locs = {}
-        ptrs = set()
+        if _raw is None:
+            # bulk decoding in ELFSubset.iter_data passes this in already
+            _raw = st.unpack(dataptr.get_data(st.size))
 
-        for idx, spec in enumerate(pspecl):
-            if spec == 'P':
-                ptrs.add(idx)
-                spec = self._elfsect.ptrtype
+        self._fraw = _raw
+        self._replace = replace or {}
 
-            locs[idx] = struct.calcsize(pspec)
-            pspec = pspec + spec
+    def _field(self, name):
+        '''
+        Decode a field on first access (strings, nested structs, pointers.)
+        '''
+        if name in self._fdata:
+            return self._fdata[name]
+        if self._fraw is None or name not in self._fieldidx:
+            raise AttributeError(name)
+
+        i = self._fieldidx[name]
+        item = self._fraw[i]
+        field = self.fields[i]
+        if i in self._ptrs and name not in self._replace:
+            # raw pointer value, look up the relocation only when used
+            item = self._elfsect.pointer_value(self.offset + self._locs[i], item)
+
+        if name in self._replace:
+            value = self._replace[name]
+        elif isinstance(field[1], type) and issubclass(field[1], ELFDissectData):
+            value = field[1](self._data.offset(self._locs[i]), self)
+        elif len(field) == 3 and field[2] == str:
+            value = item.get_string()
+        elif len(field) == 3 and field[2] is not None and issubclass(field[2], ELFDissectData):
+            value = self.Pointer(field[2], item)
+        else:
+            value = item
 
-        self._total_size = struct.calcsize(pspec)
-
-        def replace_ptrs(v):
-            idx, val = v[0], v[1]
-            if idx not in ptrs:
-                return val
-            return self._elfsect.pointer(self.offset + locs[idx])
-
-        data = dataptr.get_data(struct.calcsize(pspec))
-        unpacked = struct.unpack(self._elfsect.endian + pspec, data)
-        unpacked = list(map(replace_ptrs, enumerate(unpacked)))
-        self._fraw = unpacked
-        self._fdata = OrderedDict()
-        replace = replace or {}
-
-        for i, item in enumerate(unpacked):
-            name = self.fields[i][0]
-            if name is None:
-                continue
-
-            if name in replace:
-                self._fdata[name] = replace[name]
-                continue
-
-            if isinstance(self.fields[i][1], type) and issubclass(self.fields[i][1], ELFDissectData):
-                dataobj = self.fields[i][1](dataptr.offset(locs[i]), self)
-                self._fdata[name] = dataobj
-                continue
-            if len(self.fields[i]) == 3:
-                if self.fields[i][2] == str:
-                    self._fdata[name] = item.get_string()
-                    continue
-                elif self.fields[i][2] is None:
-                    pass
-                elif issubclass(self.fields[i][2], ELFDissectData):
-                    cls = self.fields[i][2]
-                    dataobj = self.Pointer(cls, item)
-                    self._fdata[name] = dataobj
-                    continue
-
-            self._fdata[name] = item
+        self._fdata[name] = value
+        return value
 
     def __getattr__(self, attrname):
-        if attrname not in self._fdata:
+        if attrname.startswith('__') or attrname in ('_fdata', '_fraw', '_replace'):
             raise AttributeError(attrname)
-        if isinstance(self._fdata[attrname], self.Pointer):
-            self._fdata[attrname] = self._fdata[attrname]()
-        return self._fdata[attrname]
+        value = self._field(attrname)
+        if isinstance(value, self.Pointer):
+            value = self._fdata[attrname] = value()
+        return value
 
     def __repr__(self):
         if not isinstance(self._data, ELFData):
             return '<%s: %r>' % (self.__class__.__name__, self._data)
         return '<%s: %s>' % (self.__class__.__name__,
-                ', '.join(['%s=%r' % t for t in self._fdata.items()]))
+                ', '.join(['%s=%r' % (f[0], self._field(f[0])) for f in self.fields if f[0] is not None]))
 
     @classmethod
     def calcsize(cls, elfclass):
@@ -447,10 +466,24 @@ class ELFSubset(object):
         stop = slice_.stop or self._obj.len
         if stop < 0:
             stop = self._obj.len - stop
+        if offset >= stop:
+            return
+
+        # read the whole array in one go and unpack all fixed fields from
+        # that, rather than slicing and unpacking once per struct.  Fields
+        # are only turned into Python objects, and pointers only resolved
+        # through their relocation, when accessed (see _field)
+        count = (stop - offset + size - 1) // size
+        st = scls._layout(self._elffile.elfclass, self.ptrtype, self.endian)[0]
+        data = memoryview(self[offset:offset + count * size])
+
+        if st.size == size:
+            rows = st.iter_unpack(data)
+        else:
+            rows = (st.unpack_from(data, i * size) for i in range(count))
 
-        while offset < stop:
-            yield scls(ELFData(self, offset, size))
-            offset += size
+        for base, raw in zip(range(offset, stop, size), rows):
+            yield scls(ELFData(self, base, size), _raw = raw)
 
     def pointer(self, offset):
         '''
@@ -467,7 +500,15 @@ class ELFSubset(object):
 
         ptrsize = struct.calcsize(self.ptrtype)
         data = struct.unpack(self.endian + self.ptrtype, self[offset:offset + ptrsize])[0]
+        return self.pointer_value(offset, data)
+
+    def pointer_value(self, offset, data):
+        '''
+        Same as `pointer`, but with the pointer value already read
 
+        :param offset: byte offset of the pointer (for relocation lookup)
+        :param data:   pointer value as stored at `offset`
+        '''
         reloc = self.getreloc(offset)
         dstsect = None
         if reloc:
@@ -128,6 +128,25 @@ out_lines.append("# clippy{\n# main clippy targets")
 for clippy_file in clippy_scan:
     out_lines.append(clippydep.substitute(clippybase=clippy_file[:-2]))
 
+# one clidef.py run for all outdated _clippy.c files, see lib/subdir.am
+out_lines.append("")
+out_lines.append(
+    "clippy_batch = %s"
+    % (
+        " \\\n\t".join(
+            "$(top_srcdir)/%s %s_clippy.c" % (clippy_file, clippy_file[:-2])
+            for clippy_file in clippy_scan
+        )
+    )
+)
+out_lines.append("$(CLIPPY_BATCH_STAMP): $(clippy_scan) $(CLIPPY_DEPS)")
+out_lines.append(
+    "\t$(AM_V_CLIPPY_BATCH)printf '%s %s\\n' $(clippy_batch) | "
+    "$(CLIPPY) $(top_srcdir)/python/clidef.py $(CLIPPY_BATCH_FLAGS) "
+    "--cache $(CLIPPY_CACHE) -u --batch -"
+)
+out_lines.append("\t@touch $@")
+
 out_lines.append("")
 out_lines.append("xrefs = %s" % (" ".join(["%s.xref" % target for target in xref_targets])))
 out_lines.append("frr.xref: $(xrefs)")
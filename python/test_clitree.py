@@ -0,0 +1,251 @@
+# tests for the in-process CLI tree & config marking
+#
+# Copyright (C) 2021  Network Device Education Foundation, Inc. ("NetDEF")
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; see the file COPYING; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import sys
+import os
+import json
+import subprocess
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(root, 'python'))
+
+from clippy.clitree import CliTree, CliMarkError, parse_node_enum, parse_vtysh
+
+# (node, cmdname, string) - cmdnames with a transition are vtysh's own
+commands = [
+    ('CONFIG_NODE', 'hostname_cmd', 'hostname WORD'),
+    ('CONFIG_NODE', 'router_bgp_cmd',
+     'router bgp [(1-4294967295) [<view|vrf> WORD]]'),
+    ('CONFIG_NODE', 'vtysh_interface_cmd', 'interface IFNAME [vrf NAME]'),
+    ('CONFIG_NODE', 'vtysh_vrf_cmd', 'vrf NAME'),
+    ('CONFIG_NODE', 'bfd_enter_cmd', 'bfd'),
+    ('BGP_NODE', 'neighbor_remote_as_cmd',
+     'neighbor <A.B.C.D|X:X::X:X|WORD> remote-as <(1-4294967295)|internal|external>'),
+    ('BGP_NODE', 'address_family_ipv4_cmd', 'address-family ipv4 [unicast]'),
+    ('BGP_NODE', 'vtysh_exit_bgpd_cmd', 'exit'),
+    ('BGP_IPV4_NODE', 'bgp_network_cmd', 'network A.B.C.D/M'),
+    ('BGP_IPV4_NODE', 'neighbor_activate_cmd',
+     'neighbor <A.B.C.D|X:X::X:X|WORD> activate'),
+    ('BGP_IPV4_NODE', 'exit_address_family_cmd', 'exit-address-family'),
+    ('BGP_IPV4_NODE', 'vtysh_exit_bgpd_cmd', 'exit'),
+    ('INTERFACE_NODE', 'ip_address_cmd', 'ip address A.B.C.D/M'),
+    ('INTERFACE_NODE', 'vtysh_exit_interface_cmd', 'exit'),
+    ('VRF_NODE', 'ip_route_vrf_cmd', 'ip route A.B.C.D/M A.B.C.D'),
+    ('VRF_NODE', 'exit_vrf_config_cmd', 'exit-vrf'),
+    ('VRF_NODE', 'vtysh_exit_vrf_cmd', 'exit'),
+    ('BFD_NODE', 'bfd_peer_enter_cmd',
+     'peer <A.B.C.D|X:X::X:X> [{multihop|local-address <A.B.C.D|X:X::X:X>|interface IFNAME|vrf NAME}]'),
+    ('BFD_PEER_NODE', 'bfd_peer_shutdown_cmd', 'shutdown'),
+    ('BFD_PEER_NODE', 'bfd_peer_rx_cmd', 'receive-interval (10-60000)'),
+]
+
+# (config, "vtysh -m -f" output)
+configs = [
+    ('''hostname r1
+router bgp 65001
+ neighbor 10.0.0.2 remote-as 65002
+ address-family ipv4 unicast
+  network 10.1.0.0/24
+  neighbor 10.0.0.2 activate
+ exit-address-family
+!
+interface eth0
+ ip address 10.0.0.1/24
+''', '''hostname r1
+router bgp 65001
+ neighbor 10.0.0.2 remote-as 65002
+ address-family ipv4 unicast
+  network 10.1.0.0/24
+  neighbor 10.0.0.2 activate
+ exit-address-family
+!
+exit
+interface eth0
+ ip address 10.0.0.1/24
+
+end
+'''),
+    ('''router bgp 65001
+ address-family ipv4 unicast
+  network 10.1.0.0/24
+end
+interface eth0
+''', '''router bgp 65001
+ address-family ipv4 unicast
+  network 10.1.0.0/24
+exit
+exit
+interface eth0
+
+end
+'''),
+    ('''bfd
+ peer 10.0.0.2 multihop local-address 10.0.0.1
+  shutdown
+ peer 10.0.0.3
+  receive-interval 300
+vrf red
+ ip route 10.2.0.0/24 10.0.0.2
+exit-vrf
+interface eth1 vrf red
+''', '''bfd
+ peer 10.0.0.2 multihop local-address 10.0.0.1
+  shutdown
+exit
+ peer 10.0.0.3
+  receive-interval 300
+exit
+exit
+vrf red
+ ip route 10.2.0.0/24 10.0.0.2
+exit-vrf
+end
+interface eth1 vrf red
+
+end
+'''),
+]
+
+@pytest.fixture(scope='module')
+def tree():
+    tree = CliTree.from_source(root)
+    for node, cmdname, string in commands:
+        tree.install(node, cmdname, string)
+    return tree
+
+def test_parse_node_enum():
+    assert parse_node_enum('''
+enum node_type {
+	AUTH_NODE,		 /* Authentication mode, { } */
+	VIEW_NODE,
+	// CONFIG_NODE commented out,
+	NODE_TYPE_MAX, /* maximum */
+};''') == ['AUTH_NODE', 'VIEW_NODE', 'NODE_TYPE_MAX']
+
+    with open(os.path.join(root, 'lib', 'command.h'), 'r') as fd:
+        nodenames = parse_node_enum(fd.read())
+    assert nodenames[0] == 'AUTH_NODE'
+    assert nodenames[-1] == 'NODE_TYPE_MAX'
+    assert nodenames.index('CONFIG_NODE') < nodenames.index('BGP_NODE')
+
+    with pytest.raises(ValueError):
+        parse_node_enum('enum other { A, B };')
+
+def test_parse_vtysh():
+    parents, transitions = parse_vtysh(r'''
+static struct cmd_node foo_node = {
+	.name = "foo {",
+	.node = FOO_NODE,
+	.parent_node = CONFIG_NODE,
+	.prompt = "%s(config-foo)# ",
+};
+
+DEFUNSH(VTYSH_FOO, foo_enter, foo_enter_cmd,
+	"foo [{bar|baz}]", "Foo\n" "Bar\n" "Baz\n")
+{
+	char c = '}';
+
+	vty->node = FOO_NODE;
+	return CMD_SUCCESS;
+}
+
+DEFUN (foo_case, foo_case_cmd, "case", "Case\n")
+{
+	switch (vty->node) {
+	case FOO_NODE: vty->node = BAR_NODE; break;
+	}
+	return CMD_SUCCESS;
+}
+
+DEFUNSH(VTYSH_FOO, foo_exit, foo_exit_cmd, "exit", "Exit \"{\"\n")
+{
+	return vtysh_exit(vty);
+}
+
+DEFUNSH(VTYSH_FOO, foo_quit, foo_quit_cmd, "quit", "Quit\n")
+{
+	return foo_exit(self, vty, argc, argv);
+}
+
+DEFUN (foo_bye, foo_bye_cmd, "bye", "Bye\n")
+{
+	return foo_quit(self, vty, argc, argv);
+}
+
+DEFUN (foo_other, foo_other_cmd, "other", "Other\n")
+{
+	return foo_helper(vty);
+}
+''')
+    assert parents == {'FOO_NODE': 'CONFIG_NODE'}
+    assert transitions == {
+        'foo_enter_cmd': 'FOO_NODE',
+        'foo_case_cmd': {'FOO_NODE': 'BAR_NODE'},
+        'foo_exit_cmd': 'exit',
+        # delegating to another command's function, also chained
+        'foo_quit_cmd': 'exit',
+        'foo_bye_cmd': 'exit',
+    }
+
+    with open(os.path.join(root, 'vtysh', 'vtysh.c'), 'r') as fd:
+        parents, transitions = parse_vtysh(fd.read())
+    assert parents['BGP_IPV4_NODE'] == 'BGP_NODE'
+    assert parents['BFD_PEER_NODE'] == 'BFD_NODE'
+    assert transitions['router_bgp_cmd'] == 'BGP_NODE'
+    assert transitions['bfd_enter_cmd'] == 'BFD_NODE'
+    # command string has "{" in it
+    assert transitions['bfd_peer_enter_cmd'] == 'BFD_PEER_NODE'
+    assert transitions['vtysh_exit_bgpd_cmd'] == 'exit'
+    assert transitions['vtysh_quit_bgpd_cmd'] == 'exit'
+    assert transitions['rpki_quit_cmd'] == 'exit'
+    assert transitions['bmp_quit_cmd'] == 'exit'
+    assert transitions['exit_vrf_config_cmd'] == 'CONFIG_NODE'
+
+@pytest.mark.parametrize('config,marked', configs)
+def test_mark(tree, config, marked):
+    assert tree.mark_text(config) == marked
+
+def test_mark_error(tree):
+    with pytest.raises(CliMarkError) as err:
+        tree.mark_text('router bgp 65001\n neighbor 10.0.0.2 remote-as\n')
+    assert err.value.lineno == 2
+    assert str(err.value) == \
+        'line 2: % Command incomplete:  neighbor 10.0.0.2 remote-as'
+
+    with pytest.raises(CliMarkError) as err:
+        tree.mark_text('interface eth0\n bogus\n')
+    assert err.value.lineno == 2
+    assert 'Unknown command' in str(err.value)
+
+@pytest.mark.parametrize('config,marked', configs)
+def test_mark_vtysh(tmpdir, config, marked):
+    '''compare against a built vtysh, with the tree from the built frr.xref'''
+    vtysh = os.path.join(root, 'vtysh', 'vtysh')
+    xref = os.path.join(root, 'frr.xref')
+    if not (os.path.exists(vtysh) and os.path.exists(xref)):
+        pytest.skip('needs a build tree with vtysh and frr.xref')
+
+    conffile = tmpdir.join('frr.conf')
+    conffile.write(config)
+    output = subprocess.check_output([vtysh, '-u', '-m', '-f', str(conffile)])
+    assert output.decode() == marked
+
+    with open(xref, 'r') as fd:
+        tree = CliTree.from_xref(json.load(fd), root)
+    assert tree.mark_text(config) == marked
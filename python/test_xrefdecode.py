@@ -0,0 +1,133 @@
+# tests for the xref UID log decoder
+#
+# Copyright (C) 2021  Network Device Education Foundation, Inc. ("NetDEF")
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; see the file COPYING; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import sys
+import os
+import io
+import json
+import subprocess
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(root, 'python'))
+
+from xrefdecode import UidIndex, LogDecoder
+
+# same layout as the "refs" part of frr.xref
+xrefdata = {
+    'refs': {
+        'AAAAA-AAAAA': [
+            {'type': 'logmsg', 'file': 'bgpd/bgpd.c', 'line': 10,
+             'func': 'bgp_start', 'priority': 6, 'fmtstring': 'start %s',
+             'binary': 'bgpd/bgpd'},
+        ],
+        'BBBBB-BBBBB': [
+            {'type': 'logmsg', 'file': 'lib/log.c', 'line': 20,
+             'func': 'zlog_foo', 'priority': 3, 'fmtstring': 'foo',
+             'binary': 'zebra/zebra'},
+            {'type': 'logmsg', 'file': 'lib/log.c', 'line': 20,
+             'func': 'zlog_foo', 'priority': 3, 'fmtstring': 'foo',
+             'binary': 'bgpd/bgpd'},
+        ],
+        'CCCCC-CCCCC': [
+            {'type': 'install_element', 'file': 'lib/command.c', 'line': 30,
+             'func': 'cmd_init'},
+        ],
+    },
+}
+
+log = b'''2021/01/01 00:00:00 BGP: [AAAAA-AAAAA] start r1
+2021/01/01 00:00:01 BGP: no tag here
+Jan  1 00:00:02 host bgpd[123]: [BBBBB-BBBBB] foo
+2021/01/01 00:00:03 ZEBRA: [BBBBB-BBBBB] foo
+2021/01/01 00:00:04 BGP: [ZZZZZ-ZZZZZ] from a newer build
+2021/01/01 00:00:05 BGP: [AAAAA-AAAAA] start r2'''
+
+annotated = b'''2021/01/01 00:00:00 BGP: [AAAAA-AAAAA] start r1 <bgpd/bgpd.c:10 bgp_start>
+2021/01/01 00:00:01 BGP: no tag here
+Jan  1 00:00:02 host bgpd[123]: [BBBBB-BBBBB] foo <lib/log.c:20 zlog_foo>
+2021/01/01 00:00:03 ZEBRA: [BBBBB-BBBBB] foo <lib/log.c:20 zlog_foo>
+2021/01/01 00:00:04 BGP: [ZZZZZ-ZZZZZ] from a newer build
+2021/01/01 00:00:05 BGP: [AAAAA-AAAAA] start r2 <bgpd/bgpd.c:10 bgp_start>'''
+
+def test_index():
+    index = UidIndex.from_xrelfo(xrefdata)
+    assert index.uids == {'AAAAA-AAAAA': 0, 'BBBBB-BBBBB': 1}
+    assert index.sites[1] == ('lib/log.c', 20, 'zlog_foo', 3, 'foo',
+                              ['bgpd/bgpd', 'zebra/zebra'])
+
+    buf = io.StringIO()
+    index.save(buf)
+    buf.seek(0)
+    loaded = UidIndex.load(buf)
+    assert loaded.uids == index.uids
+    assert loaded.sites == index.sites
+
+    with pytest.raises(ValueError):
+        UidIndex.load(io.StringIO('{"version": 0, "sites": [], "uids": {}}'))
+
+def test_annotate():
+    out = io.BytesIO()
+    decoder = LogDecoder(UidIndex.from_xrelfo(xrefdata), out)
+    decoder.feed(io.BytesIO(log))
+    assert out.getvalue() == annotated
+
+    assert decoder.lines == 6 and decoder.bytes == len(log)
+    result = decoder.to_dict()
+    assert [(site['uid'], site['count']) for site in result['sites']] == [
+        ('AAAAA-AAAAA', 2), ('BBBBB-BBBBB', 2)]
+    assert result['sites'][1]['priority'] == 'error'
+    assert dict((daemon, stats['count'])
+                for daemon, stats in result['daemons'].items()) == {
+        'BGP': 3, 'bgpd': 1, 'ZEBRA': 1}
+    assert result['unknown'] == {'ZZZZZ-ZZZZZ': 1}
+
+    decoder = LogDecoder(UidIndex.from_xrelfo(xrefdata), None)
+    decoder.feed(io.BytesIO(log))
+    assert decoder.to_dict(1)['sites'][0]['uid'] == 'AAAAA-AAAAA'
+
+def test_main(tmpdir):
+    '''saved index, annotated log on stdout and stats on stderr'''
+    indexfile = tmpdir.join('frr.uidx')
+    with open(str(indexfile), 'w') as fd:
+        UidIndex.from_xrelfo(xrefdata).save(fd)
+    logfile = tmpdir.join('bgpd.log')
+    logfile.write_binary(log)
+
+    script = os.path.join(root, 'python', 'xrefdecode.py')
+    copy = tmpdir.join('copy.uidx')
+    subprocess.check_call([sys.executable, script, '--index', str(indexfile),
+                           '--save-index', str(copy)])
+    with open(str(copy), 'r') as fd:
+        assert UidIndex.load(fd).uids == {'AAAAA-AAAAA': 0, 'BBBBB-BBBBB': 1}
+
+    proc = subprocess.run([sys.executable, script, '--index', str(copy),
+                           '-a', '-s', str(logfile)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          check=True)
+    assert proc.stdout == annotated
+    assert proc.stderr.startswith(
+        b'6 lines, %d bytes, 5 with xref UID (1 unknown UIDs)\n' % len(log))
+
+    jsonfile = tmpdir.join('stats.json')
+    proc = subprocess.run([sys.executable, script, '--index', str(copy),
+                           '-s', '-j', str(jsonfile), str(logfile)],
+                          stdout=subprocess.PIPE, check=True)
+    assert proc.stdout.startswith(b'6 lines')
+    with open(str(jsonfile), 'r') as fd:
+        assert json.load(fd)['lines'] == 6
@@ -25,6 +25,7 @@ root = os.path.dirname(os.path.dirname(__file__))
 sys.path.append(os.path.join(root, 'python'))
 
 import xrelfo
+import clippy
 from clippy import elf, uidhash
 
 def test_uidhash():
@@ -63,3 +64,27 @@ def test_xrelfo_bin():
 
     pprint(xrefs[0])
     pprint(xrefs[0]._data)
+
+def test_xrelfo_cache(tmpdir):
+    cache = xrelfo.XrelfoCache(str(tmpdir), max_size=1000)
+    assert os.path.abspath(clippy.__file__) in clippy.toolfiles()
+
+    # only hashed, doesn't need to be an ELF file
+    key = cache.key(__file__, 'test.lo', [])
+    assert key != cache.key(__file__, 'test.lo', ['Wlog_format'])
+    assert cache.get(key) is None
+
+    cache.prune()
+    assert cache.added == 0
+    names = ['%064x' % i for i in range(10)]
+    for i, name in enumerate(names):
+        cache.put(name, {'data': 'x' * 200})
+        os.utime(os.path.join(str(tmpdir), name + '.json'), (i + 1, i + 1))
+    assert cache.get(names[0]) == {'data': 'x' * 200}
+
+    # least recently used go first, get() counts as use
+    cache.prune()
+    assert sum(os.path.getsize(str(f)) for f in tmpdir.listdir()) <= 1000
+    assert cache.get(names[0]) is not None
+    assert cache.get(names[1]) is None
+    assert cache.get(names[9]) is not None
@@ -23,9 +23,50 @@ import re
 import argparse
 import subprocess
 import json
+import hashlib
 
 structs = ['xref', 'xref_logmsg', 'xref_threadsched', 'xref_install_element', 'xrefdata', 'xrefdata_logmsg', 'cmd_element']
 
+def extract_dwarf(filename='lib/.libs/libfrr.so', cachedir=None):
+    '''
+    Read struct definitions directly from DWARF debug info, through the
+    clippy ELF reader (i.e. needs to run under clippy.)  Output is the same
+    as from extract() below, without needing pahole.
+
+    With cachedir, results are cached keyed by the file's GNU build ID.
+    '''
+    from clippy.elf import ELFDissectFile
+    from clippy import dwarf
+
+    elffile = ELFDissectFile(filename)
+
+    cachefile = None
+    buildid = dwarf.build_id(elffile)
+    if cachedir is not None and buildid is not None:
+        hashobj = hashlib.sha256()
+        for fn in [__file__, dwarf.__file__]:
+            with open(fn, 'rb') as fd:
+                hashobj.update(fd.read())
+        hashobj.update(json.dumps([buildid, sorted(structs)]).encode('UTF-8'))
+        cachefile = os.path.join(cachedir, hashobj.hexdigest() + '.json')
+        try:
+            with open(cachefile, 'r') as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            pass
+
+    extractor = dwarf.StructExtractor(dwarf.DWARFInfo(elffile))
+    out = extractor.extract(structs)
+    for sname in sorted(extractor.missing):
+        sys.stderr.write('warning: struct %s not found in %s\n' % (sname, filename))
+
+    if cachefile is not None:
+        os.makedirs(cachedir, exist_ok=True)
+        with open(cachefile + '.tmp', 'w') as fd:
+            json.dump(out, fd)
+        os.rename(cachefile + '.tmp', cachefile)
+    return out
+
 def extract(filename='lib/.libs/libfrr.so'):
     '''
     Convert output from "pahole" to JSON.
@@ -192,9 +233,23 @@ def main():
     argp = argparse.ArgumentParser(description = 'FRR DWARF structure extractor')
     argp.add_argument('-o', dest='output', type=str, help='write JSON output', default='python/xrefstructs.json')
     argp.add_argument('-i', dest='input',  type=str, help='ELF file to read',  default='lib/.libs/libfrr.so')
+    argp.add_argument('--pahole', action='store_const', const=True, help='use pahole instead of reading DWARF directly')
+    argp.add_argument('--cache', type=str, help='cache directory for DWARF results (keyed by build ID)')
+    argp.add_argument('--check', action='store_const', const=True, help='only compare against existing output, exit 1 if different')
     args = argp.parse_args()
 
-    out = extract(args.input)
+    if args.pahole:
+        out = extract(args.input)
+    else:
+        out = extract_dwarf(args.input, args.cache)
+
+    if args.check:
+        with open(args.output, 'r') as fd:
+            if json.load(fd) != out:
+                sys.stderr.write('%s is out of date with respect to %s\n' % (args.output, args.input))
+                sys.exit(1)
+        return
+
     with open(args.output + '.tmp', 'w') as fd:
         json.dump(out, fd, indent=2, sort_keys=True)
     os.rename(args.output + '.tmp', args.output)
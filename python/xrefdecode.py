@@ -0,0 +1,299 @@
+# FRR xref UID log decoder
+#
+# Copyright (C) 2021  Network Device Education Foundation, Inc. ("NetDEF")
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; see the file COPYING; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+'''
+Annotate FRR logs with the source location of each message's xref UID
+(the "[XXXXX-XXXXX]" tag) and/or aggregate message counts per call site
+and per daemon.
+
+Building the UID index from ELF files or frr.xref uses xrelfo.py and thus
+needs to run under clippy.  The index can be saved with --save-index; using
+a saved index (--index) only needs a plain python3, so logs can be decoded
+on systems without an FRR build tree.
+'''
+
+import sys
+import os
+import io
+import re
+import json
+import argparse
+
+INDEX_VERSION = 1
+
+uid_re = re.compile(rb'\[([0-9A-Z]{5}-[0-9A-Z]{5})\]')
+prionames = ['emerg', 'alert', 'crit', 'error', 'warn', 'notif', 'info', 'debug']
+
+
+class UidIndex(object):
+    '''
+    compact UID => call site mapping.  sites are stored once as tuples of
+    (file, line, func, priority, fmtstring, binaries), UIDs map to their
+    position in that list.
+    '''
+    def __init__(self, sites=None, uids=None):
+        self.sites = sites or []
+        self.uids = uids or {}
+
+    @classmethod
+    def from_xrelfo(cls, xrelfo):
+        index = cls()
+        for uid, items in sorted(xrelfo['refs'].items()):
+            items = [item for item in items if item.get('type') == 'logmsg']
+            if not items:
+                continue
+            first = items[0]
+            binaries = sorted(set(item['binary'] for item in items if 'binary' in item))
+            index.uids[uid] = len(index.sites)
+            index.sites.append((first['file'], first['line'], first['func'],
+                                first.get('priority', 7), first['fmtstring'], binaries))
+        return index
+
+    @classmethod
+    def from_files(cls, filenames):
+        # needs to run under clippy
+        from xrelfo import Xrelfo
+
+        xrelfo = Xrelfo()
+        for fn in filenames:
+            xrelfo.load_file(fn)
+        return cls.from_xrelfo(xrelfo)
+
+    @classmethod
+    def load(cls, fd):
+        data = json.load(fd)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError('unsupported index version %r' % data.get('version'))
+        return cls([tuple(site) for site in data['sites']], data['uids'])
+
+    def save(self, fd):
+        json.dump({
+            'version': INDEX_VERSION,
+            'sites': self.sites,
+            'uids': self.uids,
+        }, fd, separators=(',', ':'))
+
+    def bytes_map(self):
+        '''uid (as bytes, as found in log lines) => site number'''
+        return dict((uid.encode('ASCII'), num) for uid, num in self.uids.items())
+
+
+def daemon_of(line, start):
+    '''
+    the log source is the "name:" (file/stdout logs) or "name[pid]:"
+    (syslog) token in front of the UID tag
+    '''
+    prefix = line[:start].rstrip()
+    if not prefix.endswith(b':'):
+        return None
+    name = prefix[:-1].rsplit(None, 1)[-1]
+    if name.endswith(b']'):
+        name = name.split(b'[', 1)[0]
+    return name.decode('UTF-8', 'replace')
+
+
+class LogDecoder(object):
+    '''
+    process a log stream line by line, never holding more than one line.
+    annotation strings are built once per UID.
+    '''
+    def __init__(self, index, annotate=None, fmt=' <{file}:{line} {func}>'):
+        self.index = index
+        self.uidmap = index.bytes_map()
+        self.annotate = annotate
+        self.fmt = fmt
+        self._annot = {}
+
+        self.lines = 0
+        self.bytes = 0
+        self.site_count = [0] * len(index.sites)
+        self.site_bytes = [0] * len(index.sites)
+        self.unknown = {}
+        self.daemons = {}
+
+    def annotation(self, num):
+        annot = self._annot.get(num)
+        if annot is None:
+            file, line, func, prio, fmtstring, binaries = self.index.sites[num]
+            annot = self.fmt.format(file=file, line=line, func=func,
+                                    prio=prionames[prio & 7], fmtstring=fmtstring,
+                                    binaries=','.join(binaries)).encode('UTF-8')
+            self._annot[num] = annot
+        return annot
+
+    def feed(self, fd):
+        uidmap = self.uidmap
+        site_count, site_bytes = self.site_count, self.site_bytes
+        daemons, unknown = self.daemons, self.unknown
+        search = uid_re.search
+        out = self.annotate
+        nlines, nbytes = 0, 0
+
+        for line in fd:
+            nlines += 1
+            nbytes += len(line)
+
+            m = search(line)
+            if m is None:
+                if out is not None:
+                    out.write(line)
+                continue
+
+            uid = m.group(1)
+            num = uidmap.get(uid)
+            if num is None:
+                unknown[uid] = unknown.get(uid, 0) + 1
+            else:
+                site_count[num] += 1
+                site_bytes[num] += len(line)
+
+            daemon = daemon_of(line, m.start())
+            stats = daemons.get(daemon)
+            if stats is None:
+                stats = daemons[daemon] = [0, 0]
+            stats[0] += 1
+            stats[1] += len(line)
+
+            if out is not None:
+                if num is None:
+                    out.write(line)
+                elif line.endswith(b'\n'):
+                    out.write(line[:-1] + self.annotation(num) + b'\n')
+                else:
+                    out.write(line + self.annotation(num))
+
+        self.lines += nlines
+        self.bytes += nbytes
+
+    def top_sites(self, limit=None):
+        nums = sorted((num for num, count in enumerate(self.site_count) if count),
+                      key=lambda num: (-self.site_count[num], num))
+        return nums[:limit] if limit else nums
+
+    def to_dict(self, limit=None):
+        uids = dict((num, uid) for uid, num in self.index.uids.items())
+        sites = []
+        for num in self.top_sites(limit):
+            file, line, func, prio, fmtstring, binaries = self.index.sites[num]
+            sites.append({
+                'uid': uids[num],
+                'count': self.site_count[num],
+                'bytes': self.site_bytes[num],
+                'file': file,
+                'line': line,
+                'func': func,
+                'priority': prionames[prio & 7],
+                'fmtstring': fmtstring,
+                'binaries': binaries,
+            })
+        return {
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'sites': sites,
+            'daemons': dict((daemon or '', {'count': count, 'bytes': nbytes})
+                            for daemon, (count, nbytes) in self.daemons.items()),
+            'unknown': dict((uid.decode('ASCII'), count)
+                            for uid, count in self.unknown.items()),
+        }
+
+    def report(self, fd, limit=20):
+        tagged = sum(self.site_count) + sum(self.unknown.values())
+        fd.write('%d lines, %d bytes, %d with xref UID (%d unknown UIDs)\n\n' % (
+            self.lines, self.bytes, tagged, len(self.unknown)))
+
+        fd.write('%9s %6s %12s  %-11s %-6s %s\n' % (
+            'count', '%', 'bytes', 'uid', 'prio', 'location / format'))
+        uids = dict((num, uid) for uid, num in self.index.uids.items())
+        for num in self.top_sites(limit):
+            file, line, func, prio, fmtstring, binaries = self.index.sites[num]
+            count = self.site_count[num]
+            fd.write('%9d %6.2f %12d  %-11s %-6s %s:%d %s()\n%48s%r\n' % (
+                count, 100.0 * count / max(tagged, 1), self.site_bytes[num],
+                uids[num], prionames[prio & 7], file, line, func, '', fmtstring))
+
+        fd.write('\n%9s %12s  %s\n' % ('count', 'bytes', 'daemon'))
+        for daemon, (count, nbytes) in sorted(self.daemons.items(),
+                                              key=lambda item: -item[1][0]):
+            fd.write('%9d %12d  %s\n' % (count, nbytes, daemon or '?'))
+
+
+def _main():
+    argp = argparse.ArgumentParser(description='FRR xref UID log decoder')
+    argp.add_argument('-x', '--xref', type=str, action='append', default=[],
+                      help='build UID index from frr.xref / ELF / libtool file (needs clippy)')
+    argp.add_argument('--index', type=str, help='load previously saved UID index')
+    argp.add_argument('--save-index', type=str, help='save UID index to file')
+    argp.add_argument('-a', '--annotate', action='store_const', const=True,
+                      help='write log with source locations appended (default without -s/-j)')
+    argp.add_argument('--format', type=str, default=' <{file}:{line} {func}>',
+                      help='annotation format, fields: file line func prio fmtstring binaries')
+    argp.add_argument('-s', '--stats', action='store_const', const=True,
+                      help='print per call site and per daemon counts')
+    argp.add_argument('-j', '--json', type=str, help='write counts as JSON to file')
+    argp.add_argument('-n', '--top', type=int, default=20,
+                      help='number of call sites to report (0 = all)')
+    argp.add_argument('logfile', type=str, nargs='*', help='log files to read (default: stdin)')
+    args = argp.parse_args()
+
+    if args.index:
+        with open(args.index, 'r') as fd:
+            index = UidIndex.load(fd)
+    elif args.xref:
+        index = UidIndex.from_files(args.xref)
+    else:
+        argp.error('need either --index or -x/--xref')
+
+    if args.save_index:
+        tmpname = '%s.tmp-%d' % (args.save_index, os.getpid())
+        with open(tmpname, 'w') as fd:
+            index.save(fd)
+        os.rename(tmpname, args.save_index)
+        if not args.logfile and not (args.annotate or args.stats or args.json):
+            return
+
+    annotate = args.annotate or not (args.stats or args.json)
+    out = io.BufferedWriter(io.FileIO(sys.stdout.fileno(), 'w', closefd=False),
+                            buffer_size=1 << 20) if annotate else None
+
+    decoder = LogDecoder(index, out, args.format)
+    try:
+        for fn in args.logfile or ['-']:
+            if fn == '-':
+                decoder.feed(io.BufferedReader(io.FileIO(sys.stdin.fileno(), 'r', closefd=False),
+                                               buffer_size=1 << 20))
+            else:
+                with open(fn, 'rb', buffering=1 << 20) as fd:
+                    decoder.feed(fd)
+    except BrokenPipeError:
+        return
+    finally:
+        if out is not None:
+            try:
+                out.flush()
+            except BrokenPipeError:
+                pass
+
+    if args.stats:
+        decoder.report(sys.stderr if annotate else sys.stdout, args.top)
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump(decoder.to_dict(args.top), fd, indent=2)
+            fd.write('\n')
+
+if __name__ == '__main__':
+    _main()
@@ -23,10 +23,12 @@ import re
 import traceback
 import json
 import argparse
+import hashlib
+import multiprocessing
 
 from clippy.uidhash import uidhash
 from clippy.elf import *
-from clippy import frr_top_src
+from clippy import frr_top_src, toolfiles, prune_cache
 from tiabwarfo import FieldApplicator
 
 try:
@@ -34,8 +36,8 @@ try:
         xrefstructs = json.load(fd)
 except FileNotFoundError:
     sys.stderr.write('''
-The "xrefstructs.json" file (created by running tiabwarfo.py with the pahole
-tool available) could not be found.  It should be included with the sources.
+The "xrefstructs.json" file (created by running tiabwarfo.py on a build
+with debug info) could not be found.  It should be included with the sources.
 ''')
     sys.exit(1)
 
@@ -241,6 +243,48 @@ fieldapply.add(XrefInstallElement)
 fieldapply()
 
 
+def json_canon(item):
+    return json.dumps(item, sort_keys=True, separators=(',', ':'))
+
+def json_stream(fd, items, indent=None, levels=1, _level=0):
+    '''
+    write (key, value) pairs from `items` as JSON object to `fd`, producing
+    the same text as json.dump(dict(items), fd, indent=indent,
+    sort_keys=True) if `items` is sorted.  Values that are dicts are
+    streamed the same way up to `levels` deep, everything below that is
+    encoded one value at a time (using the C encoder when indent is None.)
+    '''
+    if indent is None:
+        itemsep, keysep, nl, pad, padend = ',', ':', '', '', ''
+    else:
+        itemsep, keysep, nl = ',', ': ', '\n'
+        pad = nl + ' ' * (indent * (_level + 1))
+        padend = nl + ' ' * (indent * _level)
+
+    first = True
+    for key, value in items:
+        if first:
+            fd.write('{' + pad)
+            first = False
+        else:
+            fd.write(itemsep + pad)
+        fd.write(json.dumps(key) + keysep)
+
+        if _level + 1 < levels and isinstance(value, dict) and value:
+            json_stream(fd, sorted(value.items()), indent, levels, _level + 1)
+            continue
+
+        if indent is None:
+            fd.write(json.dumps(value, sort_keys=True, separators=(',', ':')))
+        else:
+            text = json.dumps(value, sort_keys=True, indent=indent)
+            fd.write(text.replace('\n', pad))
+
+    if first:
+        fd.write('{}')
+    else:
+        fd.write(padend + '}')
+
 class Xrelfo(dict):
     def __init__(self):
         super().__init__({
@@ -248,8 +292,15 @@ class Xrelfo(dict):
             'cli': {},
         })
         self._xrefs = []
-
-    def load_file(self, filename):
+        # uid => (set of canonicalized items, len) for self['refs'][uid]
+        self._refkeys = {}
+
+    @staticmethod
+    def resolve_file(filename):
+        '''
+        find the actual file for `filename`, following libtool wrappers.
+        returns (path, orig_filename, 'elf' or 'json')
+        '''
         orig_filename = filename
         if filename.endswith('.la') or filename.endswith('.lo'):
             with open(filename, 'r') as fd:
@@ -279,8 +330,7 @@ class Xrelfo(dict):
                 hdr = fd.read(4)
 
             if hdr == b'\x7fELF':
-                self.load_elf(filename, orig_filename)
-                return
+                return filename, orig_filename, 'elf'
 
             if hdr[:2] == b'#!':
                 path, name = os.path.split(filename)
@@ -288,12 +338,18 @@ class Xrelfo(dict):
                 continue
 
             if hdr[:1] == b'{':
-                with open(filename, 'r') as fd:
-                    self.load_json(fd)
-                return
+                return filename, orig_filename, 'json'
 
             raise ValueError('cannot determine file type for %s' % (filename))
 
+    def load_file(self, filename):
+        filename, orig_filename, kind = self.resolve_file(filename)
+        if kind == 'elf':
+            self.load_elf(filename, orig_filename)
+        else:
+            with open(filename, 'r') as fd:
+                self.load_json(fd)
+
     def load_elf(self, filename, orig_filename):
         edf = ELFDissectFile(filename)
         edf.orig_filename = orig_filename
@@ -334,13 +390,22 @@ class Xrelfo(dict):
         return edf
 
     def load_json(self, fd):
-        data = json.load(fd)
+        return self.load_dict(json.load(fd))
+
+    def load_dict(self, data):
         for uid, items in data['refs'].items():
             myitems = self['refs'].setdefault(uid, [])
+            keys, count = self._refkeys.get(uid, (None, None))
+            if count != len(myitems):
+                # first merge into this uid, or items added from ELF files
+                keys = set(map(json_canon, myitems))
             for item in items:
-                if item in myitems:
+                key = json_canon(item)
+                if key in keys:
                     continue
+                keys.add(key)
                 myitems.append(item)
+            self._refkeys[uid] = (keys, len(myitems))
 
         for cmd, items in data['cli'].items():
             self['cli'].setdefault(cmd, {}).update(items)
@@ -351,14 +416,108 @@ class Xrelfo(dict):
         for xref in self._xrefs:
             yield from xref.check(checks)
 
+class XrelfoCache(object):
+    '''
+    on-disk cache of extraction results, keyed by the content hash of the
+    ELF file (and of the extractor itself, so changes to it invalidate all
+    entries.)  entries are touched when used;  prune() drops the least
+    recently used ones once the cache exceeds max_size bytes.
+    '''
+    _toolhash = None
+
+    def __init__(self, path, max_size=256 << 20):
+        self.path = path
+        self.max_size = max_size
+        self.added = 0
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def filehash(filename, hashobj=None):
+        hashobj = hashobj or hashlib.sha256()
+        with open(filename, 'rb') as fd:
+            for block in iter(lambda: fd.read(1 << 20), b''):
+                hashobj.update(block)
+        return hashobj
+
+    @classmethod
+    def toolhash(cls):
+        if cls._toolhash is None:
+            hashobj = hashlib.sha256()
+            # toolfiles() is the clippy package and the _clippy module
+            for fn in [__file__, sys.modules[ELFDissectFile.__module__].__file__,
+                       os.path.join(frr_top_src, 'python', 'xrefstructs.json')] \
+                      + toolfiles():
+                cls.filehash(fn, hashobj)
+            cls._toolhash = hashobj.hexdigest()
+        return cls._toolhash
+
+    def key(self, filename, orig_filename, checks):
+        hashobj = self.filehash(filename)
+        hashobj.update(json.dumps([self.toolhash(), orig_filename, checks]).encode('utf-8'))
+        return hashobj.hexdigest()
+
+    def get(self, key):
+        filename = os.path.join(self.path, key + '.json')
+        try:
+            with open(filename, 'r') as fd:
+                result = json.load(fd)
+            os.utime(filename)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        filename = os.path.join(self.path, key + '.json')
+        tmpname = '%s.tmp-%d' % (filename, os.getpid())
+        with open(tmpname, 'w') as fd:
+            json.dump(result, fd, separators=(',', ':'))
+        os.rename(tmpname, filename)
+        self.added += 1
+
+    def prune(self):
+        '''keep the cache below max_size, only needed if anything was added'''
+        if self.added:
+            prune_cache(self.path, self.max_size)
+
+def _check_opts(args):
+    return sorted(o for o in vars(args) if o.startswith('W') and o != 'Werror' and getattr(args, o))
+
+def _extract(job):
+    '''
+    worker: extract one ELF file, returning refs, cli and check warnings
+    as plain (JSON-compatible) data.
+    '''
+    filename, orig_filename, checks = job
+    xrelfo = Xrelfo()
+    xrelfo.load_elf(filename, orig_filename)
+
+    wopts = argparse.Namespace(**dict((c, c in checks) for c in ['Wlog_format', 'Wlog_args']))
+    warnings = sorted(xrelfo.check(wopts)) if checks else []
+    return {
+        'refs': xrelfo['refs'],
+        'cli': xrelfo['cli'],
+        # same shape as after a trip through the JSON cache
+        'checks': [[list(loc), text] for loc, text in warnings],
+    }
+
+def _extract_safe(job):
+    try:
+        return _extract(job), None
+    except:
+        return None, traceback.format_exc()
+
 def main():
     argp = argparse.ArgumentParser(description = 'FRR xref ELF extractor')
     argp.add_argument('-o', dest='output', type=str, help='write JSON output')
     argp.add_argument('--out-by-file',     type=str, help='write by-file JSON output')
+    argp.add_argument('--compact',         action='store_const', const=True, help='write compact (non-indented) JSON')
     argp.add_argument('-Wlog-format',      action='store_const', const=True)
     argp.add_argument('-Wlog-args',        action='store_const', const=True)
     argp.add_argument('-Werror',           action='store_const', const=True)
     argp.add_argument('--profile',         action='store_const', const=True)
+    argp.add_argument('-j', '--jobs',      type=int, default=None, help='number of worker processes')
+    argp.add_argument('--cache',           type=str, help='directory to cache extraction results in')
+    argp.add_argument('--cache-size',      type=int, default=256, metavar='MB', help='prune the cache down to this size (default: 256)')
     argp.add_argument('binaries', metavar='BINARY', nargs='+', type=str, help='files to read (ELF files or libtool objects)')
     args = argp.parse_args()
 
@@ -371,23 +530,60 @@ def main():
 def _main(args):
     errors = 0
     xrelfo = Xrelfo()
+    cache = XrelfoCache(args.cache, args.cache_size << 20) if args.cache else None
+    checkopts = _check_opts(args)
 
+    # JSON inputs are merged directly, ELF files are extracted in workers
+    # (or taken from the cache.)  Results are merged in command line order.
+    inputs = []
     for fn in args.binaries:
         try:
-            xrelfo.load_file(fn)
+            filename, orig_filename, kind = Xrelfo.resolve_file(fn)
+            if kind == 'json':
+                with open(filename, 'r') as fd:
+                    inputs.append((fn, None, json.load(fd), None))
+                continue
+
+            job = (filename, orig_filename, checkopts)
+            key = cache.key(filename, orig_filename, checkopts) if cache else None
+            inputs.append((fn, job, cache.get(key) if cache else None, key))
         except:
             errors += 1
             sys.stderr.write('while processing %s:\n' % (fn))
             traceback.print_exc()
 
-    for option in dir(args):
-        if option.startswith('W') and option != 'Werror':
-            checks = sorted(xrelfo.check(args))
-            sys.stderr.write(''.join([c[-1] for c in checks]))
+    jobs = [i[1] for i in inputs if i[1] is not None and i[2] is None]
+    nproc = args.jobs or min(len(jobs), os.cpu_count() or 1)
+    if nproc > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        # fork, since we're possibly running inside the clippy binary
+        with multiprocessing.get_context('fork').Pool(nproc) as pool:
+            results = iter(pool.map(_extract_safe, jobs, chunksize=1))
+    else:
+        results = map(_extract_safe, jobs)
 
-            if args.Werror and len(checks) > 0:
+    allchecks = []
+    for fn, job, result, key in inputs:
+        if job is not None and result is None:
+            result, error = next(results)
+            if error is not None:
                 errors += 1
-            break
+                sys.stderr.write('while processing %s:\n%s' % (fn, error))
+                continue
+            if cache:
+                cache.put(key, result)
+
+        xrelfo.load_dict(result)
+        allchecks.extend(result.get('checks', []))
+
+    if cache:
+        cache.prune()
+
+    if checkopts:
+        checks = sorted(allchecks)
+        sys.stderr.write(''.join([c[-1] for c in checks]))
+
+        if args.Werror and len(checks) > 0:
+            errors += 1
 
 
     refs = xrelfo['refs']
@@ -399,29 +595,31 @@ def _main(args):
             print('\033[31;1m%s\033[m' % k)
         counts[k] = len(v)
 
-    out = xrelfo
-    outbyfile = {}
-    for uid, locs in refs.items():
-        for loc in locs:
-            filearray = outbyfile.setdefault(loc['file'], [])
-            loc = dict(loc)
-            del loc['file']
-            filearray.append(loc)
-
-    for k in outbyfile.keys():
-        outbyfile[k] = sorted(outbyfile[k], key=lambda x: x['line'])
-
     if errors:
         sys.exit(1)
 
+    indent = None if args.compact else 2
+
     if args.output:
         with open(args.output + '.tmp', 'w') as fd:
-            json.dump(out, fd, indent=2, sort_keys=True)
+            json_stream(fd, sorted(xrelfo.items()), indent, levels=2)
         os.rename(args.output + '.tmp', args.output)
 
     if args.out_by_file:
+        # only references into refs here, the per-file copies without the
+        # 'file' key are created one file at a time while writing
+        byfile = {}
+        for uid, locs in refs.items():
+            for loc in locs:
+                byfile.setdefault(loc['file'], []).append(loc)
+
+        def outbyfile():
+            for filename in sorted(byfile.keys()):
+                locs = sorted(byfile.pop(filename), key=lambda x: x['line'])
+                yield filename, [dict((k, v) for k, v in loc.items() if k != 'file') for loc in locs]
+
         with open(args.out_by_file + '.tmp', 'w') as fd:
-            json.dump(outbyfile, fd, indent=2, sort_keys=True)
+            json_stream(fd, outbyfile(), indent)
         os.rename(args.out_by_file + '.tmp', args.out_by_file)
 
 if __name__ == '__main__':
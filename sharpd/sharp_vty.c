@@ -179,7 +179,7 @@ DEFPY (install_routes_data_dump,
 	struct timeval r;
 
 	timersub(&sg.r.t_end, &sg.r.t_start, &r);
-	vty_out(vty, "Prefix: %pFX Total: %u %u %u Time: %jd.%ld\n",
+	vty_out(vty, "Prefix: %pFX Total: %u %u %u Time: %jd.%06ld\n",
 		&sg.r.orig_prefix, sg.r.total_routes, sg.r.installed_routes,
 		sg.r.removed_routes, (intmax_t)r.tv_sec, (long)r.tv_usec);
 
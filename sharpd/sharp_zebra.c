@@ -494,7 +494,7 @@ static int route_notify_owner(ZAPI_CALLBACK_ARGS)
 		if (sg.r.total_routes == sg.r.installed_routes) {
 			monotime(&sg.r.t_end);
 			timersub(&sg.r.t_end, &sg.r.t_start, &r);
-			zlog_debug("Installed All Items %jd.%ld",
+			zlog_debug("Installed All Items %jd.%06ld",
 				   (intmax_t)r.tv_sec, (long)r.tv_usec);
 			handle_repeated(true);
 		}
@@ -510,7 +510,7 @@ static int route_notify_owner(ZAPI_CALLBACK_ARGS)
 		if (sg.r.total_routes == sg.r.removed_routes) {
 			monotime(&sg.r.t_end);
 			timersub(&sg.r.t_end, &sg.r.t_start, &r);
-			zlog_debug("Removed all Items %jd.%ld",
+			zlog_debug("Removed all Items %jd.%06ld",
 				   (intmax_t)r.tv_sec, (long)r.tv_usec);
 			handle_repeated(false);
 		}
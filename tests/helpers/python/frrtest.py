@@ -28,6 +28,11 @@ import re
 import inspect
 import os
 import difflib
+import json
+import threading
+import multiprocessing
+
+import pytest
 
 import frrsix
 
@@ -64,17 +69,89 @@ class MetaTestMultiOut(type):
         return registrar
 
 
+class _Prefetch(object):
+    """
+    Result of a program started by run_parallel(), wait() returns
+    (output, exitcode) once the program has finished.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.cls._run_program()
+        except Exception:
+            self.error = sys.exc_info()
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            frrsix.reraise(*self.error)
+        return self.result
+
+
+def run_parallel(classes, jobs=None):
+    """
+    Start the programs of the given test classes on `jobs` threads (default:
+    one per CPU) and return immediately.  The tests pick up the output of
+    their program when they get to run, so the programs execute
+    concurrently while results are still reported in order.
+    """
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    pending = []
+    for cls in classes:
+        if "_prefetch" not in cls.__dict__:
+            cls._prefetch = _Prefetch(cls)
+            pending.append(cls._prefetch)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                prefetch = pending.pop(0)
+            prefetch.run()
+
+    for _ in range(0, min(jobs, len(pending))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+
+def _program_output(cls):
+    """
+    Output of the class' program, from run_parallel() if it was started
+    there, otherwise the program is run now.
+    """
+    prefetch = cls.__dict__.get("_prefetch")
+    if prefetch is not None:
+        return prefetch.wait()
+    return cls._run_program()
+
+
 @frrsix.add_metaclass(MetaTestMultiOut)
 class _TestMultiOut(object):
+    @classmethod
+    def _run_program(cls):
+        basedir = os.path.dirname(inspect.getsourcefile(cls))
+        program = os.path.join(basedir, cls.program)
+        proc = subprocess.Popen([binpath(program)], stdout=subprocess.PIPE)
+        output, _ = proc.communicate()
+        return output, proc.wait()
+
     def _run_tests(self):
         if "tests_run" in dir(self.__class__) and self.tests_run:
             return
         self.__class__.tests_run = True
-        basedir = os.path.dirname(inspect.getsourcefile(type(self)))
-        program = os.path.join(basedir, self.program)
-        proc = subprocess.Popen([binpath(program)], stdout=subprocess.PIPE)
-        self.output, _ = proc.communicate("")
-        self.exitcode = proc.wait()
+        self.output, self.exitcode = _program_output(type(self))
+        self.outpos = 0
 
         self.__class__.testresults = {}
         for test in self.tests:
@@ -126,13 +203,13 @@ class _TestMultiOut(object):
 #
 # Say you want to add a test type called foobarlicious. Then define
 # a function _foobarlicious here that takes self and the test arguments
-# when called. That function should check the output in self.output
-# to see whether it matches the expectation of foobarlicious with the
-# given arguments and should then adjust self.output according to how
-# much output it consumed.
+# when called. That function should check the output in self.output,
+# starting at offset self.outpos, to see whether it matches the expectation
+# of foobarlicious with the given arguments and should then advance
+# self.outpos past the output it consumed.
 # If the output doesn't meet the expectations, MultiTestFailure can be
-# raised, however that should only be done after self.output has been
-# modified according to consumed content.
+# raised, however that should only be done after self.outpos has been
+# advanced according to consumed content.
 #
 
 re_okfail = re.compile(r"(?:[3[12]m|^)?(?P<ret>OK|failed)".encode("utf8"), re.MULTILINE)
@@ -142,19 +219,19 @@ class TestMultiOut(_TestMultiOut):
     def _onesimple(self, line):
         if type(line) is str:
             line = line.encode("utf8")
-        idx = self.output.find(line)
+        idx = self.output.find(line, self.outpos)
         if idx != -1:
-            self.output = self.output[idx + len(line) :]
+            self.outpos = idx + len(line)
         else:
             raise MultiTestFailure("%r could not be found" % line)
 
     def _okfail(self, line, okfail=re_okfail):
         self._onesimple(line)
 
-        m = okfail.search(self.output)
+        m = okfail.search(self.output, self.outpos)
         if m is None:
             raise MultiTestFailure("OK/fail not found")
-        self.output = self.output[m.end() :]
+        self.outpos = m.end()
 
         if m.group("ret") != "OK".encode("utf8"):
             raise MultiTestFailure("Test output indicates failure")
@@ -190,30 +267,42 @@ class TestExitNonzero(Exception):
 
 
 class TestRefOut(object):
-    def test_refout(self):
-        basedir = os.path.dirname(inspect.getsourcefile(type(self)))
-        program = os.path.join(basedir, self.program)
+    @classmethod
+    def _ref_paths(cls):
+        basedir = os.path.dirname(inspect.getsourcefile(cls))
+        program = os.path.join(basedir, cls.program)
 
-        if getattr(self, "built_refin", False):
+        if getattr(cls, "built_refin", False):
             refin = binpath(program) + ".in"
         else:
             refin = program + ".in"
-        if getattr(self, "built_refout", False):
+        if getattr(cls, "built_refout", False):
             refout = binpath(program) + ".refout"
         else:
             refout = program + ".refout"
+        return program, refin, refout
 
-        intext = ""
+    @classmethod
+    def _run_program(cls):
+        program, refin, _ = cls._ref_paths()
+
+        intext = b""
         if os.path.exists(refin):
             with open(refin, "rb") as f:
                 intext = f.read()
-        with open(refout, "rb") as f:
-            reftext = f.read()
 
         proc = subprocess.Popen(
             [binpath(program)], stdin=subprocess.PIPE, stdout=subprocess.PIPE
         )
         outtext, _ = proc.communicate(intext)
+        return outtext, proc.wait()
+
+    def test_refout(self):
+        _, _, refout = self._ref_paths()
+        with open(refout, "rb") as f:
+            reftext = f.read()
+
+        outtext, exitcode = _program_output(type(self))
 
         # Get rid of newline problems (Windows vs Unix Style)
         outtext_str = outtext.decode("utf8").replace("\r\n", "\n").replace("\r", "\n")
@@ -221,5 +310,171 @@ class TestRefOut(object):
 
         if outtext_str != reftext_str:
             raise TestRefMismatch(self, outtext_str, reftext_str)
+        if exitcode != 0:
+            raise TestExitNonzero(self)
+
+
+#
+# This class implements a benchmark: the program is run several times, the
+# timings it prints are collected and compared against a stored baseline.
+#
+# Subclasses set "program" (and optionally "args") and either "metrics", a
+# list of regexes with "name" and "value" groups matched against each output
+# line ("value" is a time in units of "unit" seconds), or override parse().
+#
+# Benchmarks only run if FRR_BENCHMARK is set in the environment:
+#   FRR_BENCHMARK_RUNS        number of runs (default: class attribute "runs")
+#   FRR_BENCHMARK_TOLERANCE   allowed slowdown, 0.25 = median may be 25% slower
+#                             than the baseline (default: "tolerance")
+#   FRR_BENCHMARK_BASELINE    directory holding <program>.baseline.json
+#                             (default: next to the test's source)
+#   FRR_BENCHMARK_UPDATE      write the medians of this run as new baseline
+#
+# The per-metric results and the comparison are written to
+# <program>.bench.json in the build directory.
+#
+
+
+class BenchmarkRegression(Exception):
+    def __init__(self, _test, regressions):
+        self.regressions = regressions
+
+    def __str__(self):
+        rv = "Benchmark slower than baseline:\n"
+        for name, result in sorted(self.regressions.items()):
+            rv += "  %s: median %.6fs, baseline %.6fs (limit %.6fs)\n" % (
+                name,
+                result["median"],
+                result["baseline"],
+                result["limit"],
+            )
+        return rv
+
+
+class TestBenchmark(object):
+    args = []
+    metrics = []
+    unit = 1.0
+    runs = 5
+    tolerance = 0.25
+    # absolute slack in seconds, keeps very short timings from failing on noise
+    noise = 0.002
+
+    def parse(self, output):
+        """
+        Return a dict of metric name => seconds for the output of one run.
+        """
+        values = {}
+        for line in output.decode("utf8").splitlines():
+            for regex in self.metrics:
+                m = re.search(regex, line)
+                if m is not None:
+                    self.add_metric(values, m.group("name"), m.group("value"))
+                    break
+        return values
+
+    def add_metric(self, values, name, value):
+        "Store a metric, numbering repeated names"
+        if name in values:
+            index = 2
+            while "%s #%d" % (name, index) in values:
+                index += 1
+            name = "%s #%d" % (name, index)
+        values[name] = float(value) * self.unit
+
+    def _baseline_path(self, program):
+        basedir = os.environ.get("FRR_BENCHMARK_BASELINE")
+        if basedir:
+            program = os.path.join(basedir, os.path.basename(program))
+        return program + ".baseline.json"
+
+    def _run_once(self, program):
+        proc = subprocess.Popen(
+            [binpath(program)] + list(self.args),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        output, _ = proc.communicate()
         if proc.wait() != 0:
             raise TestExitNonzero(self)
+        return self.parse(output)
+
+    def test_benchmark(self):
+        if "FRR_BENCHMARK" not in os.environ:
+            pytest.skip("FRR_BENCHMARK not set")
+
+        basedir = os.path.dirname(inspect.getsourcefile(type(self)))
+        program = os.path.join(basedir, self.program)
+        runs = int(os.environ.get("FRR_BENCHMARK_RUNS", self.runs))
+        tolerance = float(os.environ.get("FRR_BENCHMARK_TOLERANCE", self.tolerance))
+
+        samples = {}
+        for _ in range(0, runs):
+            for name, value in self._run_once(program).items():
+                samples.setdefault(name, []).append(value)
+        if not samples:
+            raise MultiTestFailure("No timings found in the program output")
+
+        baseline_path = self._baseline_path(program)
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+
+        results = {}
+        regressions = {}
+        for name, values in samples.items():
+            values.sort()
+            mid = len(values) // 2
+            if len(values) % 2:
+                median = values[mid]
+            else:
+                median = (values[mid - 1] + values[mid]) / 2
+            result = {
+                "runs": values,
+                "min": values[0],
+                "median": median,
+                "max": values[-1],
+            }
+            if name in baseline:
+                ref = baseline[name]
+                result["baseline"] = ref["median"]
+                result["limit"] = (
+                    ref["median"] * (1 + ref.get("tolerance", tolerance)) + self.noise
+                )
+                result["ratio"] = median / ref["median"] if ref["median"] else None
+                if median > result["limit"]:
+                    regressions[name] = result
+            results[name] = result
+        missing = sorted(set(baseline) - set(results))
+
+        with open(binpath(program) + ".bench.json", "w") as f:
+            json.dump(
+                {
+                    "program": self.program,
+                    "args": list(self.args),
+                    "runs": runs,
+                    "tolerance": tolerance,
+                    "metrics": results,
+                    "missing": missing,
+                    "regressions": sorted(regressions),
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+        if "FRR_BENCHMARK_UPDATE" in os.environ:
+            for name, result in results.items():
+                ref = baseline.setdefault(name, {})
+                ref["median"] = result["median"]
+            with open(baseline_path, "w") as f:
+                json.dump(baseline, f, indent=2, sort_keys=True)
+            return
+
+        if missing:
+            raise MultiTestFailure(
+                "Metrics missing from the program output: %s" % ", ".join(missing)
+            )
+        if regressions:
+            raise BenchmarkRegression(self, regressions)
@@ -0,0 +1,9 @@
+import frrtest
+
+
+class TestTimerPerformance(frrtest.TestBenchmark):
+    program = "./test_timer_performance"
+    metrics = [
+        r"^(?P<name>Scheduling|Removing) \d+ random timers "
+        r"took (?P<value>[\d.]+) seconds"
+    ]
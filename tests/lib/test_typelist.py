@@ -1,4 +1,5 @@
 import frrtest
+import re
 
 
 class TestTypelist(frrtest.TestMultiOut):
@@ -19,3 +20,25 @@ TestTypelist.onesimple("RBTREE_UNIQ end")
 TestTypelist.onesimple("RBTREE_NONUNIQ end")
 TestTypelist.onesimple("ATOMSORT_UNIQ end")
 TestTypelist.onesimple("ATOMSORT_NONUNIQ end")
+
+
+class TestTypelistBenchmark(frrtest.TestBenchmark):
+    program = "./test_typelist"
+    runs = 3
+    unit = 0.000001
+
+    re_start = re.compile(r"^(?P<type>\S+) start$")
+    re_time = re.compile(r"^\s*(?P<value>\d+)us  (?P<name>.+?)(?:\s+\*?[0-9a-f]{64})?$")
+
+    def parse(self, output):
+        values = {}
+        prefix = ""
+        for line in output.decode("utf8").splitlines():
+            m = self.re_start.match(line)
+            if m is not None:
+                prefix = m.group("type") + "/"
+                continue
+            m = self.re_time.match(line)
+            if m is not None:
+                self.add_metric(values, prefix + m.group("name"), m.group("value"))
+        return values
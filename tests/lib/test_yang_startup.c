@@ -0,0 +1,171 @@
+/*
+ * Test program which measures YANG context setup time at daemon startup.
+ *
+ * Copyright (C) 2021  Network Device Education Foundation, Inc. ("NetDEF")
+ *
+ * This program is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the Free
+ * Software Foundation; either version 2 of the License, or (at your option)
+ * any later version.
+ *
+ * This program is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+ * more details.
+ *
+ * You should have received a copy of the GNU General Public License along
+ * with this program; see the file COPYING; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+ */
+
+/*
+ * This repeats what nb_init() does with the YANG modules:  create a libyang
+ * context with the embedded modules, load the requested modules and compile
+ * them.  Two variants are timed:
+ *
+ * - "incremental":  libyang recompiles the context on every module load.
+ *   This is what daemons currently do.
+ * - "deferred":  modules are parsed first and compiled once at the end
+ *   (LY_CTX_EXPLICIT_COMPILE).
+ *
+ * The parse step is the same for both, so the difference between the two is
+ * the cost of the repeated compiles.
+ *
+ * Usage: test_yang_startup [-n ITERATIONS] [-i|-d] [MODULE ...]
+ */
+
+#include <zebra.h>
+
+#include <getopt.h>
+
+#include "log.h"
+#include "monotime.h"
+#include "yang.h"
+
+#define DEFAULT_ITERATIONS 10
+
+static const char *const default_modules[] = {
+	"frr-interface", "frr-vrf",   "frr-routing", "frr-route-map",
+	"frr-nexthop",   "frr-ripd",  "frr-isisd",   "frr-zebra",
+};
+
+struct result {
+	const char *name;
+	int64_t min, max, total;
+};
+
+static int64_t run_once(bool deferred, const char *const *modules,
+			size_t nmodules)
+{
+	struct timeval start;
+	int64_t elapsed;
+
+	monotime(&start);
+
+	yang_init(true, deferred);
+	for (size_t i = 0; i < nmodules; i++)
+		yang_module_load(modules[i]);
+	if (deferred)
+		yang_init_loading_complete();
+
+	elapsed = monotime_since(&start, NULL);
+
+	yang_terminate();
+	return elapsed;
+}
+
+static void run(struct result *res, bool deferred, unsigned iterations,
+		const char *const *modules, size_t nmodules)
+{
+	/* first run is warmup (page faults, libyang plugin loading) */
+	run_once(deferred, modules, nmodules);
+
+	res->name = deferred ? "deferred" : "incremental";
+	res->min = INT64_MAX;
+	res->max = 0;
+	res->total = 0;
+
+	for (unsigned i = 0; i < iterations; i++) {
+		int64_t elapsed = run_once(deferred, modules, nmodules);
+
+		res->total += elapsed;
+		if (elapsed < res->min)
+			res->min = elapsed;
+		if (elapsed > res->max)
+			res->max = elapsed;
+	}
+}
+
+static void print_result(const struct result *res, unsigned iterations)
+{
+	printf("%-12s min %8.3f ms  avg %8.3f ms  max %8.3f ms\n", res->name,
+	       res->min / 1000.0, res->total / 1000.0 / iterations,
+	       res->max / 1000.0);
+}
+
+static void usage(const char *progname, int status)
+{
+	fprintf(status ? stderr : stdout,
+		"Usage: %s [-n ITERATIONS] [-i|-d] [MODULE ...]\n"
+		"  -n  number of timed iterations (default %d)\n"
+		"  -i  only time incremental compile\n"
+		"  -d  only time deferred compile\n",
+		progname, DEFAULT_ITERATIONS);
+	exit(status);
+}
+
+int main(int argc, char **argv)
+{
+	const char *const *modules = default_modules;
+	size_t nmodules = array_size(default_modules);
+	unsigned iterations = DEFAULT_ITERATIONS;
+	bool do_incremental = true, do_deferred = true;
+	struct result res;
+	int opt;
+
+	while ((opt = getopt(argc, argv, "n:idh")) != -1) {
+		switch (opt) {
+		case 'n':
+			iterations = strtoul(optarg, NULL, 10);
+			if (!iterations)
+				usage(argv[0], 1);
+			break;
+		case 'i':
+			do_deferred = false;
+			break;
+		case 'd':
+			do_incremental = false;
+			break;
+		case 'h':
+			usage(argv[0], 0);
+			break;
+		default:
+			usage(argv[0], 1);
+			break;
+		}
+	}
+
+	if (optind < argc) {
+		modules = (const char *const *)&argv[optind];
+		nmodules = argc - optind;
+	}
+
+	zlog_aux_init("NONE: ", ZLOG_DISABLED);
+
+	printf("%zu modules, %u iterations:", nmodules, iterations);
+	for (size_t i = 0; i < nmodules; i++)
+		printf(" %s", modules[i]);
+	printf("\n");
+
+	if (do_incremental) {
+		run(&res, false, iterations, modules, nmodules);
+		print_result(&res, iterations);
+	}
+	if (do_deferred) {
+		run(&res, true, iterations, modules, nmodules);
+		print_result(&res, iterations);
+	}
+	fflush(stdout);
+
+	return 0;
+}
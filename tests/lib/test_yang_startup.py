@@ -0,0 +1,8 @@
+import frrtest
+
+
+class TestYangStartup(frrtest.TestBenchmark):
+    program = "./test_yang_startup"
+    args = ["-n", "3"]
+    unit = 0.001
+    metrics = [r"^(?P<name>\S+)\s+min\s+[\d.]+ ms\s+avg\s+(?P<value>[\d.]+) ms"]
@@ -3,4 +3,46 @@ import sys
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "helpers", "python"))
-raise SystemExit(pytest.main(sys.argv[1:]))
+
+import frrtest
+
+
+class ParallelPrograms(object):
+    """
+    Start the test programs of all collected tests concurrently, the tests
+    themselves still run (and report) in order.  Benchmarks and tests that
+    are skipped unconditionally are left alone.
+    """
+
+    def pytest_addoption(self, parser):
+        parser.addoption(
+            "--jobs",
+            type=int,
+            default=None,
+            help="number of test programs to run concurrently "
+            "(default: one per CPU, 1 runs them serially)",
+        )
+
+    def pytest_collection_finish(self, session):
+        jobs = session.config.getoption("jobs")
+        if jobs == 1:
+            return
+
+        classes = []
+        for item in session.items:
+            cls = getattr(item, "cls", None)
+            if cls is None or cls in classes:
+                continue
+            if not issubclass(cls, (frrtest._TestMultiOut, frrtest.TestRefOut)):
+                continue
+            if any(
+                mark.name == "skip" or (mark.args and mark.args[0])
+                for mark in item.iter_markers()
+                if mark.name in ("skip", "skipif")
+            ):
+                continue
+            classes.append(cls)
+        frrtest.run_parallel(classes, jobs)
+
+
+raise SystemExit(pytest.main(sys.argv[1:], plugins=[ParallelPrograms()]))
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+#
+# test_bgp_bmp_perf.py
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+test_bgp_bmp_perf.py: BMP route monitoring throughput.
+
+    peer1 (AS 65001) ---- r1 (AS 65000) ---> BMP collector (in r1)
+
+lib/bgpspeaker.py on peer1 injects up to a full table into r1, whose BMP
+module exports pre- and post-policy route monitoring to lib/bmp.py.  For
+every step the collector's tables must end up matching what was injected,
+and the message rate, the delay from injection to the first/last message,
+the collector's socket backlog and bgpd's BMP output queue ("show bmp")
+are logged.  Results are written to bgp_bmp_perf.json in r1's log
+directory.
+"""
+
+import json
+import os
+import sys
+import time
+import pytest
+
+# Save the Current Working Directory to find configuration files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../"))
+
+# pylint: disable=C0413
+# Import topogen and topotest helpers
+from lib.topogen import Topogen, TopoRouter, get_topogen
+from lib.topolog import logger
+from lib.bgpspeaker import BgpSpeaker
+from lib.bmp import BmpCollector, bmp_clients
+
+# Required to instantiate the topology builder class.
+from mininet.topo import Topo
+
+pytestmark = [pytest.mark.bgpd]
+
+R1 = "10.0.1.1"
+PEER = "10.0.1.101"
+
+# prefixes per step, and how long the collector may take to get them all
+STEPS = [(10000, 60), (100000, 180), (1000000, 900)]
+
+speaker = None
+collector = None
+results = []
+
+
+class NetworkTopo(Topo):
+    "BGP BMP Performance Topology"
+
+    def build(self, **_opts):
+        "Build function"
+
+        tgen = get_topogen(self)
+
+        tgen.add_router("r1")
+        switch = tgen.add_switch("s1")
+        switch.add_link(tgen.gears["r1"])
+        switch.add_link(tgen.add_host("peer1", PEER + "/24", "via " + R1))
+
+
+def setup_module(module):
+    "Setup topology"
+    global speaker, collector
+
+    tgen = Topogen(NetworkTopo, module.__name__)
+
+    frrdir = tgen.config.get(tgen.CONFIG_SECTION, "frrdir")
+    if not os.path.exists(os.path.join(frrdir, "modules", "bgpd_bmp.so")):
+        pytest.skip("bgpd BMP module not available")
+
+    tgen.start_topology()
+
+    r1 = tgen.gears["r1"]
+    r1.load_config(TopoRouter.RD_ZEBRA, os.path.join(CWD, "r1/zebra.conf"))
+    r1.load_config(TopoRouter.RD_BGP, os.path.join(CWD, "r1/bgpd.conf"), "-M bmp")
+
+    # bgpd keeps retrying "bmp connect", the collector may come up later
+    tgen.start_router()
+
+    collector = BmpCollector(tgen, "r1")
+    if not collector.start():
+        tgen.set_error("BMP collector failed to start")
+        return
+    speaker = BgpSpeaker(tgen, "peer1")
+    if not speaker.start():
+        tgen.set_error("BGP speaker failed to start")
+
+
+def teardown_module(_mod):
+    "Teardown the pytest environment"
+    tgen = get_topogen()
+
+    if speaker is not None:
+        speaker.stop()
+    if collector is not None:
+        collector.stop()
+    if results:
+        rdir = os.path.join(tgen.gears["r1"].logdir, "r1")
+        with open(os.path.join(rdir, "bgp_bmp_perf.json"), "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    tgen.stop_topology()
+
+
+def test_bmp_session():
+    "Wait for bgpd's BMP session and the BGP session from peer1"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    result = collector.wait(timeout=60, connected=True)
+    assert not result["timeout"], "bgpd did not connect to the BMP collector"
+    logger.info("BMP session from %s", result["info"])
+
+    result = speaker.session(R1, local_as=65001, peer_as=65000, families=[4])
+    assert result["established"], "session failed: {}".format(result["error"])
+
+    result = collector.wait(timeout=30, peers_up=1, peer=PEER)
+    assert not result["timeout"], "no BMP peer up for {}".format(PEER)
+
+
+def export(op, count, timeout):
+    "Announce or withdraw, follow the export until the tables are complete"
+    r1 = get_topogen().gears["r1"]
+    expect = count if op == "announce" else 0
+
+    mark = collector.mark()
+    sent = getattr(speaker, op)(R1, "100.0.0.0/24", count)
+    assert "error" not in sent, "{} failed: {}".format(op, sent["error"])
+
+    # poll once a second to sample bgpd's BMP queue on the way
+    queue = []
+    deadline = time.time() + timeout
+    while True:
+        result = collector.wait(timeout=1, peer=PEER, policy="post", prefixes=expect)
+        clients = bmp_clients(r1)
+        if clients:
+            queue.append(
+                {
+                    "time": time.time() - sent["start"],
+                    "ByteQ": clients[0]["ByteQ"],
+                    "ByteQKernel": clients[0]["ByteQKernel"],
+                }
+            )
+        if not result["timeout"] or time.time() > deadline:
+            break
+    post = result["peer"]["post"] if "peer" in result else {}
+    assert not result["timeout"], "post-policy table has {} of {} prefixes".format(
+        post.get("prefixes"), expect
+    )
+    result = collector.wait(timeout=30, peer=PEER, policy="pre", prefixes=expect)
+    pre = result["peer"]["pre"]
+    assert not result["timeout"], "pre-policy table has {} of {} prefixes".format(
+        pre["prefixes"], expect
+    )
+
+    if op == "announce":
+        for policy in ("pre", "post"):
+            route = collector.route(PEER, "100.0.0.0/24", policy)
+            assert route["as_path"] == [65001] and route["next_hop"] == PEER, (
+                "{}-policy route has attributes {}".format(policy, route)
+            )
+
+    step = {
+        "sent": sent,
+        "messages": result["route_monitoring"],
+        "rate": result["rate"],
+        "first": mark + result["first"] - sent["start"],
+        "last": mark + result["last"] - sent["start"],
+        "lag": result["lag"],
+        "backlog": result["backlog"],
+        "bgpd_queue": queue,
+        "rates": collector.rates(),
+    }
+    logger.info(
+        "%s %d prefixes: %d BMP messages at %.0f/s, last after %.2fs, "
+        "collector backlog max %d bytes, bgpd queue max %d bytes",
+        op,
+        count,
+        step["messages"],
+        step["rate"] or 0,
+        step["last"],
+        step["backlog"]["max"],
+        max([sample["ByteQ"] for sample in queue] or [0]),
+    )
+    return step
+
+
+def test_bmp_export_rate():
+    "Inject and withdraw tables, measure the BMP export"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    # like route_scale, leave out the big step on small machines
+    steps = STEPS
+    with open("/proc/meminfo") as fd:
+        mem = int(fd.readline().split()[1])
+    if mem < 4000000:
+        logger.info("Limited memory available: %d kB, skipping 1M prefixes", mem)
+        steps = [step for step in STEPS if step[0] < 1000000]
+
+    for count, timeout in steps:
+        step = {"prefixes": count}
+        for op in ("announce", "withdraw"):
+            step[op] = export(op, count, timeout)
+        results.append(step)
+
+    route = collector.route(PEER, "100.0.0.0/24")
+    assert route is None, "withdrawn route still in the post-policy table"
+
+
+# Mem leak testcase
+def test_memory_leak():
+    "Run the memory leak test and report results."
+    tgen = get_topogen()
+    if not tgen.is_memleak_enabled():
+        pytest.skip("Memory leak test/report is disabled")
+    tgen.report_memory_leaks()
+
+
+if __name__ == "__main__":
+    args = ["-s"] + sys.argv[1:]
+    sys.exit(pytest.main(args))
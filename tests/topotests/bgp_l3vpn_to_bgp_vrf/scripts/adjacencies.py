@@ -1,19 +1,49 @@
-from lib.lutil import luCommand
+from lib.lutil import luCommand, luBatch, luCheck
 
-luCommand("ce1", 'vtysh -c "show bgp summary"', " 00:0", "wait", "Adjacencies up", 180)
-luCommand("ce2", 'vtysh -c "show bgp summary"', " 00:0", "wait", "Adjacencies up", 180)
-luCommand("ce3", 'vtysh -c "show bgp summary"', " 00:0", "wait", "Adjacencies up", 180)
-luCommand(
-    "ce4", 'vtysh -c "show bgp vrf all summary"', " 00:0", "wait", "Adjacencies up", 180
-)
-luCommand(
-    "r1", "ping 2.2.2.2 -c 1", " 0. packet loss", "wait", "PE->P2 (loopback) ping", 60
-)
-luCommand(
-    "r3", "ping 2.2.2.2 -c 1", " 0. packet loss", "wait", "PE->P2 (loopback) ping", 60
-)
-luCommand(
-    "r4", "ping 2.2.2.2 -c 1", " 0. packet loss", "wait", "PE->P2 (loopback) ping", 60
+luBatch(
+    [
+        luCheck(
+            "ce1", 'vtysh -c "show bgp summary"', " 00:0", "wait", "Adjacencies up", 180
+        ),
+        luCheck(
+            "ce2", 'vtysh -c "show bgp summary"', " 00:0", "wait", "Adjacencies up", 180
+        ),
+        luCheck(
+            "ce3", 'vtysh -c "show bgp summary"', " 00:0", "wait", "Adjacencies up", 180
+        ),
+        luCheck(
+            "ce4",
+            'vtysh -c "show bgp vrf all summary"',
+            " 00:0",
+            "wait",
+            "Adjacencies up",
+            180,
+        ),
+        luCheck(
+            "r1",
+            "ping 2.2.2.2 -c 1",
+            " 0. packet loss",
+            "wait",
+            "PE->P2 (loopback) ping",
+            60,
+        ),
+        luCheck(
+            "r3",
+            "ping 2.2.2.2 -c 1",
+            " 0. packet loss",
+            "wait",
+            "PE->P2 (loopback) ping",
+            60,
+        ),
+        luCheck(
+            "r4",
+            "ping 2.2.2.2 -c 1",
+            " 0. packet loss",
+            "wait",
+            "PE->P2 (loopback) ping",
+            60,
+        ),
+    ]
 )
 luCommand(
     "r2",
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+#
+# test_bgp_speaker_perf.py
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+test_bgp_speaker_perf.py: bgpd update throughput and convergence.
+
+    peer1 (AS 65001) ---- r1 (AS 65000) ---- peer2 (AS 65002)
+
+lib/bgpspeaker.py on peer1 injects increasing numbers of prefixes into r1
+and withdraws them again, the speaker on peer2 records r1's updates.  For
+every step the injection rate and the delay until peer2 got the first and
+last prefix are logged.  A churn phase then re-announces slices of a
+table with changing attributes.  r1 runs with "bgp no-rib", so only bgpd
+is measured.  Results are written to bgp_speaker_perf.json in r1's log
+directory.
+"""
+
+import json
+import os
+import sys
+import pytest
+from functools import partial
+
+# Save the Current Working Directory to find configuration files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../"))
+
+# pylint: disable=C0413
+# Import topogen and topotest helpers
+from lib import topotest
+from lib.topogen import Topogen, TopoRouter, get_topogen
+from lib.topolog import logger
+from lib.bgpspeaker import BgpSpeaker
+
+# Required to instantiate the topology builder class.
+from mininet.topo import Topo
+
+pytestmark = [pytest.mark.bgpd]
+
+R1 = "10.0.1.1"
+PEERS = {"peer1": ("10.0.1.101", 65001), "peer2": ("10.0.1.102", 65002)}
+
+# prefixes per injection step, and how long each step may take
+INJECT_STEPS = [(10000, 60), (100000, 120), (1000000, 600)]
+
+# churn on a table of CHURN_TABLE prefixes: fraction re-announced per
+# round, rounds, seconds between rounds
+CHURN_TABLE = 100000
+CHURN = (0.05, 10, 1.0)
+
+speakers = {}
+results = {"inject": [], "churn": None}
+
+
+class NetworkTopo(Topo):
+    "BGP Speaker Performance Topology"
+
+    def build(self, **_opts):
+        "Build function"
+
+        tgen = get_topogen(self)
+
+        tgen.add_router("r1")
+        switch = tgen.add_switch("s1")
+        switch.add_link(tgen.gears["r1"])
+
+        for name, (address, _) in sorted(PEERS.items()):
+            host = tgen.add_host(name, "{}/24".format(address), "via {}".format(R1))
+            switch.add_link(host)
+
+
+def setup_module(module):
+    "Setup topology"
+    tgen = Topogen(NetworkTopo, module.__name__)
+    tgen.start_topology()
+
+    r1 = tgen.gears["r1"]
+    r1.load_config(TopoRouter.RD_ZEBRA, os.path.join(CWD, "r1/zebra.conf"))
+    r1.load_config(TopoRouter.RD_BGP, os.path.join(CWD, "r1/bgpd.conf"))
+    tgen.start_router()
+
+    for name in sorted(PEERS):
+        speaker = BgpSpeaker(tgen, name)
+        if not speaker.start():
+            tgen.set_error("BGP speaker on {} failed to start".format(name))
+            break
+        speakers[name] = speaker
+
+
+def teardown_module(_mod):
+    "Teardown the pytest environment"
+    tgen = get_topogen()
+
+    for speaker in speakers.values():
+        speaker.stop()
+    if results["inject"]:
+        rdir = os.path.join(tgen.gears["r1"].logdir, "r1")
+        with open(os.path.join(rdir, "bgp_speaker_perf.json"), "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    tgen.stop_topology()
+
+
+def test_bgp_sessions():
+    "Open the sessions from both speakers"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    for name, (_, asn) in sorted(PEERS.items()):
+        result = speakers[name].session(
+            R1, local_as=asn, peer_as=65000, families=[4], hold=30
+        )
+        assert result["established"], "{}: session failed: {}".format(
+            name, result["error"]
+        )
+        logger.info("%s: UPDATEs up to %d bytes", name, result["max_size"])
+
+    expected = {
+        "ipv4Unicast": {
+            "peers": dict(
+                (address, {"state": "Established"}) for address, _ in PEERS.values()
+            )
+        }
+    }
+    test_func = partial(
+        topotest.router_json_cmp, tgen.gears["r1"], "show bgp summary json", expected
+    )
+    _, result = topotest.run_and_expect(test_func, None, count=30, wait=1)
+    assert result is None, "sessions not established on r1"
+
+
+def arrival(stats, mark, origin):
+    "first/last arrival in `stats` as seconds after `origin`"
+    if "first" not in stats:
+        return None
+    return {
+        "first": mark + stats["first"] - origin,
+        "last": mark + stats["last"] - origin,
+        "rate": stats["rate"],
+    }
+
+
+def inject(start, count, timeout):
+    "Announce and withdraw `count` prefixes, returns the step results"
+    injector, receiver = speakers["peer1"], speakers["peer2"]
+    step = {"prefixes": count}
+
+    for op, expect in (("announce", count), ("withdraw", 0)):
+        mark = receiver.mark(R1)
+        sent = getattr(injector, op)(R1, start, count)
+        assert "error" not in sent, "{} failed: {}".format(op, sent["error"])
+        result = receiver.wait(R1, timeout=timeout, prefixes=expect)
+        assert not result["timeout"], "peer2 has {} of {} prefixes after {}".format(
+            result["prefixes"], expect, op
+        )
+        delay = arrival(result, mark, sent["start"])
+        step[op] = {
+            "sent": sent,
+            "received": delay,
+            "updates": result["updates"],
+            "update_sizes": result["update_sizes"],
+        }
+        logger.info(
+            "%s %d prefixes: sent %.0f/s in %d UPDATEs, peer2 %s",
+            op,
+            count,
+            sent["rate"] or 0,
+            sent["updates"],
+            delay,
+        )
+    return step
+
+
+def test_inject_rate():
+    "Inject and withdraw prefixes, measure rate and convergence"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    # like route_scale, leave out the big step on small machines
+    steps = INJECT_STEPS
+    with open("/proc/meminfo") as fd:
+        mem = int(fd.readline().split()[1])
+    if mem < 4000000:
+        logger.info("Limited memory available: %d kB, skipping 1M prefixes", mem)
+        steps = [step for step in INJECT_STEPS if step[0] < 1000000]
+
+    for count, timeout in steps:
+        results["inject"].append(inject("100.0.0.0/24", count, timeout))
+
+
+def test_churn():
+    "Re-announce slices of a table, measure how fast peer2 sees the changes"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    injector, receiver = speakers["peer1"], speakers["peer2"]
+    injector.announce(R1, "100.0.0.0/24", CHURN_TABLE)
+    result = receiver.wait(R1, timeout=120, prefixes=CHURN_TABLE)
+    assert not result["timeout"], "table not received by peer2"
+
+    fraction, rounds, interval = CHURN
+    changed = int(CHURN_TABLE * fraction) * rounds
+    mark = receiver.mark(R1)
+    sent = injector.churn(
+        R1, "100.0.0.0/24", CHURN_TABLE, "community", fraction, rounds, interval
+    )
+    assert "error" not in sent, "churn failed: {}".format(sent)
+
+    # the large community changes every round, so bgpd can't suppress any
+    # of the re-announcements towards peer2
+    result = receiver.wait(R1, timeout=120, adds=changed, prefixes=CHURN_TABLE)
+    assert not result["timeout"], "peer2 saw {} of {} re-announcements".format(
+        result["adds"], changed
+    )
+    results["churn"] = {
+        "table": CHURN_TABLE,
+        "fraction": fraction,
+        "rounds": sent,
+        "received": arrival(result, mark, sent[0]["start"]),
+        "adds": result["adds"],
+        "withdraws": result["withdraws"],
+        "rates": receiver.rates(R1),
+    }
+    logger.info(
+        "churn: peer2 got %d re-announcements, %s",
+        result["adds"],
+        results["churn"]["received"],
+    )
+
+    injector.withdraw(R1, "100.0.0.0/24", CHURN_TABLE)
+    result = receiver.wait(R1, timeout=120, prefixes=0)
+    assert not result["timeout"], "table not withdrawn at peer2"
+
+
+# Mem leak testcase
+def test_memory_leak():
+    "Run the memory leak test and report results."
+    tgen = get_topogen()
+    if not tgen.is_memleak_enabled():
+        pytest.skip("Memory leak test/report is disabled")
+    tgen.report_memory_leaks()
+
+
+if __name__ == "__main__":
+    args = ["-s"] + sys.argv[1:]
+    sys.exit(pytest.main(args))
@@ -2,16 +2,15 @@
 Topotest conftest.py file.
 """
 
-import glob
 import os
 import pdb
-import re
 import pytest
 
 from lib.topogen import get_topogen, diagnose_env
 from lib.topotest import json_cmp_result
 from lib.topotest import g_extra_config as topotest_extra_config
-from lib.topolog import logger
+from lib.topotest import LogWatcher
+from lib.topolog import logger, cmdlog
 
 try:
     from _pytest._code.code import ExceptionInfo
@@ -111,6 +110,10 @@ def pytest_addoption(parser):
     )
 
 
+# valgrind output files are only scanned for newly appended data
+valgrind_watcher = LogWatcher()
+
+
 def check_for_memleaks():
     if not topotest_extra_config["valgrind_memleaks"]:
         return
@@ -123,17 +126,16 @@ def check_for_memleaks():
         logdir = "/tmp/topotests/{}".format(tgen.modname)
         if hasattr(tgen, "valgrind_existing_files"):
             existing = tgen.valgrind_existing_files
-        latest = glob.glob(os.path.join(logdir, "*.valgrind.*"))
+        latest = valgrind_watcher.glob(os.path.join(logdir, "*.valgrind.*"))
 
     for vfile in latest:
         if vfile in existing:
             continue
-        with open(vfile) as vf:
-            vfcontent = vf.read()
-            match = re.search(r"ERROR SUMMARY: (\d+) errors", vfcontent)
-            if match and match.group(1) != "0":
-                emsg = '{} in {}'.format(match.group(1), vfile)
-                leaks.append(emsg)
+        valgrind_watcher.update(vfile, keep_text=False)
+        summaries = valgrind_watcher.found(vfile, "valgrind")
+        if summaries and summaries[0]["groups"][0] != "0":
+            emsg = "{} in {}".format(summaries[0]["groups"][0], vfile)
+            leaks.append(emsg)
 
     if leaks:
         if leak_check_ok:
@@ -239,6 +241,8 @@ def pytest_runtest_makereport(item, call):
 
     if call.excinfo is None:
         error = False
+        if call.when == "setup":
+            cmdlog.new_step(item.name)
     else:
         parent = item.parent
         modname = parent.module.__name__
@@ -267,6 +271,9 @@ def pytest_runtest_makereport(item, call):
             if not pause:
                 pause = topotest_extra_config["pause_after"]
 
+            # Keep the full output of the commands run in the failed step.
+            cmdlog.dump_step()
+
             # (topogen) Set topology error to avoid advancing in the test.
             tgen = get_topogen()
             if tgen is not None:
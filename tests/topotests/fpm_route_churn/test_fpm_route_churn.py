@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+#
+# test_fpm_route_churn.py
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+test_fpm_route_churn.py: measure how fast zebra pushes route updates over
+FPM (dplane_fpm_nl).
+
+sharpd installs and removes routes in bulk, lib/fpm.py receives zebra's
+FPM stream in r1's namespace.  For every step the update rate, the number
+of routes per FPM frame and per socket read, and the time from the sharp
+command to the first/last update on the FPM socket are logged and written
+to fpm_route_churn.json in the router log directory.
+"""
+
+import json
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find configuration files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../"))
+
+# pylint: disable=C0413
+# Import topogen and topotest helpers
+from lib.topogen import Topogen, TopoRouter, get_topogen
+from lib.topolog import logger
+from lib.fpm import FpmServer
+
+# Required to instantiate the topology builder class.
+from mininet.topo import Topo
+
+pytestmark = [pytest.mark.sharpd]
+
+# number of routes per churn step, and how long each step may take
+CHURN_STEPS = [(1000, 30), (10000, 60), (100000, 180)]
+
+fpm = None
+results = []
+
+
+class NetworkTopo(Topo):
+    "FPM Route Churn Topology"
+
+    def build(self, **_opts):
+        "Build function"
+
+        tgen = get_topogen(self)
+
+        tgen.add_router("r1")
+
+        switch = tgen.add_switch("sw1")
+        switch.add_link(tgen.gears["r1"])
+
+
+def setup_module(module):
+    "Setup topology"
+    global fpm
+
+    tgen = Topogen(NetworkTopo, module.__name__)
+
+    # dplane_fpm_nl is only built with --enable-fpm
+    frrdir = tgen.config.get(tgen.CONFIG_SECTION, "frrdir")
+    if not os.path.exists(os.path.join(frrdir, "modules", "dplane_fpm_nl.so")):
+        pytest.skip("zebra dplane_fpm_nl module not available")
+
+    tgen.start_topology()
+
+    r1 = tgen.gears["r1"]
+    r1.load_config(
+        TopoRouter.RD_ZEBRA, os.path.join(CWD, "r1/zebra.conf"), "-M dplane_fpm_nl"
+    )
+    r1.load_config(TopoRouter.RD_SHARP, os.path.join(CWD, "r1/sharpd.conf"))
+
+    # zebra only connects once "fpm address" is configured, so the server
+    # can be started before the daemons
+    fpm = FpmServer(tgen, "r1")
+    if not fpm.start():
+        tgen.set_error("FPM server failed to start")
+
+    tgen.start_router()
+
+
+def teardown_module(_mod):
+    "Teardown the pytest environment"
+    tgen = get_topogen()
+
+    if fpm is not None:
+        fpm.stop()
+    if results:
+        rdir = os.path.join(tgen.gears["r1"].logdir, "r1")
+        with open(os.path.join(rdir, "fpm_route_churn.json"), "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    tgen.stop_topology()
+
+
+def test_fpm_connection():
+    "Wait for zebra to connect to the FPM server and sync its table"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    assert fpm.wait_connected(timeout=60), "zebra did not connect to FPM"
+
+    # the connected route must show up in the initial table dump
+    result = fpm.wait(timeout=30, adds=1)
+    assert not result["timeout"], "no routes received over FPM"
+    assert fpm.route("192.168.1.0/24") is not None, "connected route missing"
+    assert not result["errors"], "FPM stream errors: {}".format(result["errors"])
+
+
+def log_step(step, count, result):
+    logger.info(
+        "%s %d routes: %.0f routes/s, first after %.3fs, last after %.3fs",
+        step,
+        count,
+        result.get("rate") or 0,
+        result.get("first", -1),
+        result.get("last", -1),
+    )
+    logger.info(
+        "  routes/frame %s, routes/read %s",
+        result["frame_sizes"],
+        result["read_sizes"],
+    )
+
+
+def run_churn(r1, count, timeout):
+    fpm.mark()
+    r1.vtysh_cmd(
+        "sharp install routes 10.0.0.0 nexthop 192.168.1.2 {}".format(count),
+        isjson=False,
+    )
+    added = fpm.wait(timeout=timeout, adds=count)
+    added["rates"] = fpm.rates()
+    log_step("install", count, added)
+    assert not added["timeout"], "FPM got {} of {} route adds".format(
+        added["adds"], count
+    )
+    # sharpd installs /32s counting up from the start address
+    assert fpm.route("10.0.0.0/32") is not None, "first route missing on FPM"
+
+    fpm.mark()
+    r1.vtysh_cmd("sharp remove routes 10.0.0.0 {}".format(count), isjson=False)
+    removed = fpm.wait(timeout=timeout, dels=count)
+    removed["rates"] = fpm.rates()
+    log_step("remove", count, removed)
+    assert not removed["timeout"], "FPM got {} of {} route deletes".format(
+        removed["dels"], count
+    )
+    assert fpm.route("10.0.0.0/32") is None, "removed route still on FPM"
+
+    assert not removed["errors"], "FPM stream errors: {}".format(removed["errors"])
+    results.append({"routes": count, "install": added, "remove": removed})
+
+
+def test_fpm_route_churn():
+    "Install and remove increasing numbers of routes, measure the FPM path"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    r1 = tgen.gears["r1"]
+    for count, timeout in CHURN_STEPS:
+        run_churn(r1, count, timeout)
+
+
+# Mem leak testcase
+def test_memory_leak():
+    "Run the memory leak test and report results."
+    tgen = get_topogen()
+    if not tgen.is_memleak_enabled():
+        pytest.skip("Memory leak test/report is disabled")
+    tgen.report_memory_leaks()
+
+
+if __name__ == "__main__":
+    args = ["-s"] + sys.argv[1:]
+    sys.exit(pytest.main(args))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+#
+# test_grpc_northbound_perf.py
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+test_grpc_northbound_perf.py: northbound gRPC throughput.
+
+staticd and zebra are started with the grpc module.  lib/northbound_grpc.py
+is run inside r1's namespace to measure:
+
+- commits/sec adding and removing static routes through staticd, one
+  commit per route, sequential and pipelined
+- Get streaming throughput for zebra's RIB operational state with a large
+  number of sharpd routes installed
+
+Results are logged and written to grpc_northbound_perf.json in the router
+log directory.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+from functools import partial
+
+# Save the Current Working Directory to find configuration files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../"))
+
+# pylint: disable=C0413
+# Import topogen and topotest helpers
+from lib import topotest
+from lib.topogen import Topogen, TopoRouter, get_topogen
+from lib.topolog import logger
+from lib import northbound_grpc
+
+# Required to instantiate the topology builder class.
+from mininet.topo import Topo
+
+pytestmark = [pytest.mark.sharpd]
+
+ZEBRA_GRPC = "localhost:50051"
+STATICD_GRPC = "localhost:50052"
+
+COMMIT_COUNT = 1000
+COMMIT_DEPTHS = [1, 8, 32]
+RIB_ROUTES = 100000
+RIB_PATH = "/frr-vrf:lib/vrf[name='default']/frr-zebra:zebra/ribs"
+
+results = {}
+
+
+class NetworkTopo(Topo):
+    "gRPC Northbound Performance Topology"
+
+    def build(self, **_opts):
+        "Build function"
+
+        tgen = get_topogen(self)
+
+        tgen.add_router("r1")
+
+        switch = tgen.add_switch("sw1")
+        switch.add_link(tgen.gears["r1"])
+
+
+def setup_module(module):
+    "Setup topology"
+    tgen = Topogen(NetworkTopo, module.__name__)
+
+    frrdir = tgen.config.get(tgen.CONFIG_SECTION, "frrdir")
+    if not os.path.exists(os.path.join(frrdir, "modules", "grpc.so")):
+        pytest.skip("grpc module not available (--enable-grpc)")
+    try:
+        # also generates the bindings for the client run in the namespace
+        northbound_grpc.load_bindings()
+    except ImportError as error:
+        pytest.skip("python grpc not available: {}".format(error))
+
+    tgen.start_topology()
+
+    r1 = tgen.gears["r1"]
+    r1.load_config(
+        TopoRouter.RD_ZEBRA,
+        os.path.join(CWD, "r1/zebra.conf"),
+        "-M grpc:{}".format(ZEBRA_GRPC.split(":")[1]),
+    )
+    r1.load_config(
+        TopoRouter.RD_STATIC,
+        os.path.join(CWD, "r1/staticd.conf"),
+        "-M grpc:{}".format(STATICD_GRPC.split(":")[1]),
+    )
+    r1.load_config(TopoRouter.RD_SHARP, os.path.join(CWD, "r1/sharpd.conf"))
+
+    tgen.start_router()
+
+
+def teardown_module(_mod):
+    "Teardown the pytest environment"
+    tgen = get_topogen()
+
+    if results:
+        rdir = os.path.join(tgen.gears["r1"].logdir, "r1")
+        with open(os.path.join(rdir, "grpc_northbound_perf.json"), "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    tgen.stop_topology()
+
+
+def run_client(router, target, args, timeout=600):
+    "Run lib/northbound_grpc.py in the router namespace, returns its JSON"
+    cmd = [sys.executable, os.path.abspath(northbound_grpc.__file__)]
+    cmd += ["--target", target] + args
+    proc = router.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        output, error = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        output, error = proc.communicate()
+    assert proc.returncode == 0, "gRPC client {} failed: {}".format(args[0], error)
+    return json.loads(output)
+
+
+def test_grpc_capabilities():
+    "Check both daemons answer on their gRPC ports"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    r1 = tgen.gears["r1"]
+    for target in (ZEBRA_GRPC, STATICD_GRPC):
+        caps = run_client(r1, target, ["capabilities"], timeout=60)
+        logger.info("%s: FRR %s", target, caps["frr_version"])
+        assert caps["modules"], "no YANG modules reported by {}".format(target)
+
+
+def test_commit_rate():
+    "Add and remove static routes with one commit each"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    r1 = tgen.gears["r1"]
+    args = ["bench-commit", "--count", str(COMMIT_COUNT), "--gateway", "192.168.1.2"]
+    for depth in COMMIT_DEPTHS:
+        args += ["--depth", str(depth)]
+    runs = run_client(r1, STATICD_GRPC, args)
+    results["commit"] = runs
+
+    for run in runs:
+        for step in ("add", "delete"):
+            stats = run[step]
+            logger.info(
+                "%s depth %d: %d transactions, %.1f commits/s, %d coalesced, latency %s",
+                step,
+                stats["depth"],
+                stats["transactions"],
+                stats["rate"] or 0,
+                stats["coalesced"],
+                stats.get("latency"),
+            )
+            assert not stats["errors"], "{} depth {} errors: {}".format(
+                step, stats["depth"], stats["error_messages"]
+            )
+
+    # every run removed what it added
+    def static_routes():
+        output = r1.vtysh_cmd("show ip route summary json", isjson=True)
+        return sum(
+            entry.get("rib", 0)
+            for entry in output.get("routes", [])
+            if entry.get("type") == "static"
+        )
+
+    success, count = topotest.run_and_expect(static_routes, 0, 10, 1)
+    assert success, "{} static routes left after the commit benchmark".format(count)
+
+
+def test_get_streaming():
+    "Stream zebra's RIB operational state with many routes installed"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    r1 = tgen.gears["r1"]
+    r1.vtysh_cmd(
+        "sharp install routes 20.0.0.0 nexthop 192.168.1.2 {}".format(RIB_ROUTES),
+        isjson=False,
+    )
+    expected = {"routes": [{"type": "sharp", "rib": RIB_ROUTES}]}
+    test_func = partial(
+        topotest.router_json_cmp, r1, "show ip route summary json", expected
+    )
+    success, result = topotest.run_and_expect(test_func, None, 60, 2)
+    assert success, "sharp routes not installed:\n{}".format(result)
+
+    runs = run_client(r1, ZEBRA_GRPC, ["bench-get", "--repeat", "3", RIB_PATH])
+    results["get"] = runs
+    for run in runs:
+        logger.info(
+            "Get %s: %d bytes in %.3fs (first chunk %.3fs), %.1f MB/s",
+            RIB_PATH,
+            run["bytes"],
+            run["elapsed"],
+            run["first_chunk"] or 0,
+            (run["throughput"] or 0) / 1e6,
+        )
+        assert run["bytes"] > 0, "empty Get response"
+
+    r1.vtysh_cmd("sharp remove routes 20.0.0.0 {}".format(RIB_ROUTES), isjson=False)
+
+
+# Mem leak testcase
+def test_memory_leak():
+    "Run the memory leak test and report results."
+    tgen = get_topogen()
+    if not tgen.is_memleak_enabled():
+        pytest.skip("Memory leak test/report is disabled")
+    tgen.report_memory_leaks()
+
+
+if __name__ == "__main__":
+    args = ["-s"] + sys.argv[1:]
+    sys.exit(pytest.main(args))
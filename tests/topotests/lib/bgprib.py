@@ -43,42 +43,74 @@ class BgpRib:
     def log(self, str):
         LUtil.log("BgpRib: " + str)
 
-    def routes_include_wanted(self, pfxtbl, want, debug):
-        # helper function to RequireVpnRoutes
-        for pfx in pfxtbl.keys():
-            if debug:
-                self.log("trying pfx %s" % pfx)
-            if pfx != want["p"]:
-                if debug:
-                    self.log("want pfx=" + want["p"] + ", not " + pfx)
-                continue
-            if debug:
-                self.log("have pfx=%s" % pfx)
-            for r in pfxtbl[pfx]:
+    def index_table(self, pfxtbl):
+        # build {prefix: {nexthop: set(bestpath values)}} for one table, so
+        # that each wanted route is a couple of dict lookups instead of a
+        # scan over every prefix in the table
+        index = {}
+        for pfx, routes in pfxtbl.items():
+            nhmap = index.setdefault(pfx, {})
+            for r in routes:
                 bp = r.get("bestpath", False)
-                if debug:
-                    self.log("trying route %s bp=%s" % (r, bp))
-                nexthops = r["nexthops"]
-                for nh in nexthops:
-                    if debug:
-                        self.log("trying nh %s" % nh["ip"])
-                    if nh["ip"] == want["n"]:
-                        if debug:
-                            self.log("found %s" % want["n"])
-                        if bp == want.get("bp", bp):
-                            return 1
-                        elif debug:
-                            self.log("bestpath mismatch %s != %s" % (bp, want["bp"]))
-                    else:
-                        if debug:
-                            self.log("want nh=" + want["n"] + ", not " + nh["ip"])
-            if debug:
-                self.log("missing route: pfx=" + want["p"] + ", nh=" + want["n"])
-            return 0
+                for nh in r.get("nexthops", []):
+                    nhmap.setdefault(nh.get("ip"), set()).add(bp)
+        return index
+
+    def route_in_index(self, index, want):
+        nhmap = index.get(want["p"])
+        if nhmap is None:
+            return False
+        bps = nhmap.get(want["n"])
+        if bps is None:
+            return False
+        if "bp" not in want:
+            return True
+        return want["bp"] in bps
+
+    def routes_include_wanted(self, pfxtbl, want):
+        # helper function to RequireVpnRoutes, kept for single-route callers
+        return int(self.route_in_index(self.index_table(pfxtbl), want))
+
+    def check_wanted(self, indexes, wantroutes, key=None):
+        """
+        Check all of `wantroutes` against `indexes` in one pass.
+
+        `indexes` maps a table key (RD for VPN tables, None for unicast) to
+        the result of index_table().  Returns a report dict with:
+
+        * "missing": wanted routes not present in their table
+        * "extra": {key: [prefixes]} present in a table but not wanted
+        """
+        missing = []
+        wanted_pfx = {}
+        for want in wantroutes:
+            k = want[key] if key else None
+            wanted_pfx.setdefault(k, set()).add(want["p"])
+            index = indexes.get(k)
+            if index is None or not self.route_in_index(index, want):
+                missing.append(want)
+
+        extra = {}
+        for k, index in indexes.items():
+            if k not in wanted_pfx:
+                continue
+            unwanted = sorted(set(index.keys()) - wanted_pfx[k])
+            if unwanted:
+                extra[k] = unwanted
+        return {"missing": missing, "extra": extra}
+
+    def empty_report(self, wantroutes):
+        # check_wanted() result for a missing or empty table
+        return {"missing": list(wantroutes), "extra": {}}
+
+    def log_report(self, report, debug):
+        for want in report["missing"]:
+            self.log("missing route: %s" % want)
+        if debug:
+            for k, pfxs in report["extra"].items():
+                self.log("extra routes in %s: %s" % (k or "table", pfxs))
 
     def RequireVpnRoutes(self, target, title, wantroutes, debug=0):
-        import json
-
         logstr = "RequireVpnRoutes " + str(wantroutes)
         # non json form for humans
         luCommand(
@@ -97,29 +129,19 @@ class BgpRib:
         )
         if re.search(r"^\s*$", ret):
             # degenerate case: empty json means no routes
-            if len(wantroutes) > 0:
-                luResult(target, False, title, logstr)
-                return
-            luResult(target, True, title, logstr)
+            report = self.empty_report(wantroutes)
+            luResult(target, not report["missing"], title, logstr)
+            return report
         rib = json.loads(ret)
         rds = rib["routes"]["routeDistinguishers"]
-        for want in wantroutes:
-            found = 0
-            if debug:
-                self.log("want rd %s" % want["rd"])
-            for rd in rds.keys():
-                if rd != want["rd"]:
-                    continue
-                if debug:
-                    self.log("found rd %s" % rd)
-                table = rds[rd]
-                if self.routes_include_wanted(table, want, debug):
-                    found = 1
-                    break
-            if not found:
-                luResult(target, False, title, logstr)
-                return
-        luResult(target, True, title, logstr)
+        wanted_rds = set(want["rd"] for want in wantroutes)
+        indexes = dict(
+            (rd, self.index_table(rds[rd])) for rd in wanted_rds if rd in rds
+        )
+        report = self.check_wanted(indexes, wantroutes, "rd")
+        self.log_report(report, debug)
+        luResult(target, not report["missing"], title, logstr)
+        return report
 
     def RequireUnicastRoutes(self, target, afi, vrf, title, wantroutes, debug=0):
         logstr = "RequireVpnRoutes %s" % str(wantroutes)
@@ -140,10 +162,9 @@ class BgpRib:
         )
         if re.search(r"^\s*$", ret):
             # degenerate case: empty json means no routes
-            if len(wantroutes) > 0:
-                luResult(target, False, title, logstr)
-                return
-            luResult(target, True, title, logstr)
+            report = self.empty_report(wantroutes)
+            luResult(target, not report["missing"], title, logstr)
+            return report
         rib = json.loads(ret)
         try:
             table = rib["routes"]
@@ -154,24 +175,19 @@ class BgpRib:
             else:
                 errstr = "-script ERROR: check if vrf missing"
             luResult(target, False, title + errstr, logstr)
-            return
-        # if debug:
-        #    self.log("table=%s" % table)
-        for want in wantroutes:
-            if debug:
-                self.log("want=%s" % want)
-            if not self.routes_include_wanted(table, want, debug):
-                luResult(target, False, title, logstr)
-                return
-        luResult(target, True, title, logstr)
+            return dict(self.empty_report(wantroutes), error=errstr)
+        report = self.check_wanted({None: self.index_table(table)}, wantroutes)
+        self.log_report(report, debug)
+        luResult(target, not report["missing"], title, logstr)
+        return report
 
 
 BgpRib = BgpRib()
 
 
 def bgpribRequireVpnRoutes(target, title, wantroutes, debug=0):
-    BgpRib.RequireVpnRoutes(target, title, wantroutes, debug)
+    return BgpRib.RequireVpnRoutes(target, title, wantroutes, debug)
 
 
 def bgpribRequireUnicastRoutes(target, afi, vrf, title, wantroutes, debug=0):
-    BgpRib.RequireUnicastRoutes(target, afi, vrf, title, wantroutes, debug)
+    return BgpRib.RequireUnicastRoutes(target, afi, vrf, title, wantroutes, debug)
@@ -0,0 +1,1061 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+Lightweight BGP speaker for topotests, to inject and withdraw large
+numbers of prefixes without ExaBGP.
+
+Announcements are packed densely: all prefixes of a request share one set
+of path attributes, so each UPDATE carries as many NLRI as fit into the
+maximum message size (65535 bytes when both sides support extended
+messages, RFC 8654).  Received UPDATEs are applied to an Adj-RIB-In
+(RibIn) with arrival timestamps, so a second session can measure when
+bgpd's updates arrive.
+
+Like lib/fpm.py, this file is both the speaker, started inside a host or
+router namespace, and the library tests use to control it:
+
+    peer1 = tgen.add_host("peer1", "10.0.1.101/24", "via 10.0.1.1")
+    ...
+    speaker = BgpSpeaker(tgen, "peer1")
+    speaker.start()
+    speaker.session("10.0.1.1", local_as=65001, peer_as=65000)
+    result = speaker.announce("10.0.1.1", "10.0.0.0/24", 1000000)
+    logger.info("%.0f prefixes/s", result["rate"])
+    speaker.stop()
+
+The BGP message encoding/decoding and RibIn are also used by lib/bmp.py.
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import socket
+import struct
+import time
+from collections import deque
+
+try:
+    from lib.nsservice import (
+        NsService,
+        NsServiceClient,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+except ImportError:
+    # started as a script from the host/router namespace
+    from nsservice import (
+        NsService,
+        NsServiceClient,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+
+BGP_PORT = 179
+BGP_VERSION = 4
+BGP_MARKER = b"\xff" * 16
+BGP_HDR = struct.Struct("!16sHB")
+BGP_MAX_SIZE = 4096
+BGP_EXTENDED_MAX_SIZE = 65535
+
+MSG_OPEN = 1
+MSG_UPDATE = 2
+MSG_NOTIFICATION = 3
+MSG_KEEPALIVE = 4
+MSG_ROUTE_REFRESH = 5
+
+AFI_IPV4 = 1
+AFI_IPV6 = 2
+SAFI_UNICAST = 1
+
+CAP_MP = 1
+CAP_ROUTE_REFRESH = 2
+CAP_EXT_MESSAGE = 6
+CAP_AS4 = 65
+
+ATTR_ORIGIN = 1
+ATTR_AS_PATH = 2
+ATTR_NEXT_HOP = 3
+ATTR_MED = 4
+ATTR_LOCAL_PREF = 5
+ATTR_COMMUNITIES = 8
+ATTR_MP_REACH_NLRI = 14
+ATTR_MP_UNREACH_NLRI = 15
+ATTR_LARGE_COMMUNITIES = 32
+
+FLAG_OPTIONAL = 0x80
+FLAG_TRANSITIVE = 0x40
+FLAG_EXTENDED = 0x10
+
+AS_SET = 1
+AS_SEQUENCE = 2
+AS_TRANS = 23456
+
+ORIGINS = {"igp": 0, "egp": 1, "incomplete": 2}
+
+
+#
+# Encoding
+#
+def _afi(family):
+    "AFI for 4, 6 or an AFI"
+    return {4: AFI_IPV4, 6: AFI_IPV6}.get(family, family)
+
+
+def encode_msg(msgtype, body=b""):
+    return BGP_HDR.pack(BGP_MARKER, BGP_HDR.size + len(body), msgtype) + body
+
+
+def encode_attr(flags, attr_type, value):
+    if len(value) > 255:
+        return struct.pack("!BBH", flags | FLAG_EXTENDED, attr_type, len(value)) + value
+    return struct.pack("!BBB", flags, attr_type, len(value)) + value
+
+
+def _capability(code, value=b""):
+    return struct.pack("!BB", code, len(value)) + value
+
+
+def encode_open(local_as, router_id, hold=180, families=(4,), extended=True):
+    "OPEN with MP, route refresh, 4-byte AS and optionally extended messages"
+    caps = b""
+    for family in families:
+        caps += _capability(CAP_MP, struct.pack("!HBB", _afi(family), 0, SAFI_UNICAST))
+    caps += _capability(CAP_ROUTE_REFRESH)
+    caps += _capability(CAP_AS4, struct.pack("!I", local_as))
+    if extended:
+        caps += _capability(CAP_EXT_MESSAGE)
+    params = struct.pack("!BB", 2, len(caps)) + caps
+    my_as = local_as if local_as < 65536 else AS_TRANS
+    body = struct.pack(
+        "!BHH4sB", BGP_VERSION, my_as, hold, socket.inet_aton(router_id), len(params)
+    )
+    return encode_msg(MSG_OPEN, body + params)
+
+
+def encode_notification(code, subcode=0, data=b""):
+    return encode_msg(MSG_NOTIFICATION, struct.pack("!BB", code, subcode) + data)
+
+
+def encode_prefix(prefix):
+    "NLRI encoding of a prefix string (IPv4 or IPv6)"
+    net = ipaddress.ip_network(prefix, strict=False)
+    plen = net.prefixlen
+    return struct.pack("!B", plen) + net.network_address.packed[: (plen + 7) // 8]
+
+
+def prefix_str(afi, raw):
+    "Prefix string of an NLRI"
+    plen = raw[0]
+    size = 16 if afi == AFI_IPV6 else 4
+    addr = raw[1:] + b"\0" * (size - len(raw) + 1)
+    if afi == AFI_IPV6:
+        return "{}/{}".format(ipaddress.IPv6Address(addr), plen)
+    return "{}/{}".format(socket.inet_ntoa(addr), plen)
+
+
+def prefix_range(start, count, step=1):
+    """
+    NLRI of `count` consecutive prefixes of the length of `start` (e.g.
+    "10.0.0.0/24" gives 10.0.0.0/24, 10.0.1.0/24, ...), every `step`th one.
+    Returns (afi, list of NLRI).
+    """
+    net = ipaddress.ip_network(start, strict=False)
+    plen = net.prefixlen
+    nbytes = (plen + 7) // 8
+    bits = net.max_prefixlen
+    increment = (1 << (bits - plen)) * step
+    base = int(net.network_address)
+    head = struct.pack("!B", plen)
+    width = bits // 8
+    if width == 4:
+        pack = struct.Struct("!I").pack
+        nlri = [
+            head + pack(base + i * increment)[:nbytes] for i in range(count)
+        ]
+    else:
+        nlri = [
+            head + (base + i * increment).to_bytes(width, "big")[:nbytes]
+            for i in range(count)
+        ]
+    return (AFI_IPV6 if net.version == 6 else AFI_IPV4), nlri
+
+
+def encode_as_path(as_path, as4=True):
+    fmt = "!I" if as4 else "!H"
+    value = b""
+    for pos in range(0, len(as_path), 255):
+        segment = as_path[pos : pos + 255]
+        value += struct.pack("!BB", AS_SEQUENCE, len(segment))
+        value += b"".join(
+            struct.pack(fmt, asn if as4 or asn < 65536 else AS_TRANS)
+            for asn in segment
+        )
+    return encode_attr(FLAG_TRANSITIVE, ATTR_AS_PATH, value)
+
+
+def encode_path_attrs(
+    as_path=(),
+    origin="igp",
+    med=None,
+    local_pref=None,
+    communities=(),
+    large_communities=(),
+    as4=True,
+):
+    "Path attributes shared by the prefixes of an announcement, no next hop"
+    origin = struct.pack("!B", ORIGINS[origin])
+    attrs = encode_attr(FLAG_TRANSITIVE, ATTR_ORIGIN, origin)
+    attrs += encode_as_path(list(as_path), as4)
+    if med is not None:
+        attrs += encode_attr(FLAG_OPTIONAL, ATTR_MED, struct.pack("!I", med))
+    if local_pref is not None:
+        value = struct.pack("!I", local_pref)
+        attrs += encode_attr(FLAG_TRANSITIVE, ATTR_LOCAL_PREF, value)
+    if communities:
+        value = b"".join(
+            struct.pack("!HH", *(int(x) for x in c.split(":"))) for c in communities
+        )
+        attrs += encode_attr(FLAG_OPTIONAL | FLAG_TRANSITIVE, ATTR_COMMUNITIES, value)
+    if large_communities:
+        value = b"".join(
+            struct.pack("!III", *(int(x) for x in c.split(":")))
+            for c in large_communities
+        )
+        attrs += encode_attr(
+            FLAG_OPTIONAL | FLAG_TRANSITIVE, ATTR_LARGE_COMMUNITIES, value
+        )
+    return attrs
+
+
+def _pack_nlri(nlri, room):
+    "Split NLRI into chunks of at most `room` bytes"
+    chunk, size = [], 0
+    for raw in nlri:
+        if size + len(raw) > room and chunk:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+        chunk.append(raw)
+        size += len(raw)
+    if chunk:
+        yield b"".join(chunk)
+
+
+def build_updates(afi, nlri, attrs=b"", nexthop=None, max_size=BGP_MAX_SIZE):
+    """
+    UPDATE messages announcing `nlri` with path attributes `attrs` (from
+    encode_path_attrs()), or withdrawing them if `nexthop` is None.  Each
+    message is filled up to `max_size`.
+    """
+    fixed = BGP_HDR.size + 4
+    if afi == AFI_IPV4 and nexthop is None:
+        for chunk in _pack_nlri(nlri, max_size - fixed):
+            body = struct.pack("!H", len(chunk)) + chunk + b"\0\0"
+            yield encode_msg(MSG_UPDATE, body)
+    elif afi == AFI_IPV4:
+        attrs += encode_attr(FLAG_TRANSITIVE, ATTR_NEXT_HOP, socket.inet_aton(nexthop))
+        head = b"\0\0" + struct.pack("!H", len(attrs)) + attrs
+        for chunk in _pack_nlri(nlri, max_size - fixed - len(attrs)):
+            yield encode_msg(MSG_UPDATE, head + chunk)
+    elif nexthop is None:
+        # MP_UNREACH_NLRI: 4 bytes attribute header, afi/safi
+        for chunk in _pack_nlri(nlri, max_size - fixed - 4 - 3):
+            value = struct.pack("!HB", afi, SAFI_UNICAST) + chunk
+            mp = encode_attr(FLAG_OPTIONAL, ATTR_MP_UNREACH_NLRI, value)
+            yield encode_msg(MSG_UPDATE, b"\0\0" + struct.pack("!H", len(mp)) + mp)
+    else:
+        nh = socket.inet_pton(socket.AF_INET6, nexthop)
+        mp_head = struct.pack("!HBB", afi, SAFI_UNICAST, len(nh)) + nh + b"\0"
+        room = max_size - fixed - len(attrs) - 4 - len(mp_head)
+        for chunk in _pack_nlri(nlri, room):
+            mp = encode_attr(FLAG_OPTIONAL, ATTR_MP_REACH_NLRI, mp_head + chunk)
+            all_attrs = mp + attrs
+            yield encode_msg(
+                MSG_UPDATE, b"\0\0" + struct.pack("!H", len(all_attrs)) + all_attrs
+            )
+
+
+#
+# Decoding
+#
+class BgpFramer(object):
+    """
+    Splits a byte stream into BGP messages.  feed() returns (type, body) of
+    every complete message, a partial one is kept for the next call.
+    """
+
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data):
+        buf = self.buf + data if self.buf else data
+        msgs = []
+        pos, end = 0, len(buf)
+        while end - pos >= BGP_HDR.size:
+            marker, length, msgtype = BGP_HDR.unpack_from(buf, pos)
+            if marker != BGP_MARKER or length < BGP_HDR.size:
+                raise ValueError("bad BGP header at offset {}".format(pos))
+            if end - pos < length:
+                break
+            msgs.append((msgtype, buf[pos + BGP_HDR.size : pos + length]))
+            pos += length
+        self.buf = buf[pos:]
+        return msgs
+
+
+def split_nlri(data, pos=0, end=None):
+    "List of the raw NLRI in data[pos:end]"
+    end = len(data) if end is None else end
+    nlri = []
+    while pos < end:
+        size = 1 + (data[pos] + 7) // 8
+        nlri.append(data[pos : pos + size])
+        pos += size
+    return nlri
+
+
+def decode_open(body):
+    "dict of an OPEN message, capabilities as {code: [value, ...]}"
+    version, my_as, hold, router_id, plen = struct.unpack_from("!BHH4sB", body)
+    caps = {}
+    pos, end = 10, 10 + plen
+    while pos + 2 <= end:
+        ptype, size = struct.unpack_from("!BB", body, pos)
+        if ptype == 2:
+            cpos = pos + 2
+            while cpos + 2 <= pos + 2 + size:
+                code, clen = struct.unpack_from("!BB", body, cpos)
+                caps.setdefault(code, []).append(body[cpos + 2 : cpos + 2 + clen])
+                cpos += 2 + clen
+        pos += 2 + size
+    asn = my_as
+    if CAP_AS4 in caps:
+        asn = struct.unpack("!I", caps[CAP_AS4][0])[0]
+    return {
+        "version": version,
+        "asn": asn,
+        "hold": hold,
+        "router_id": socket.inet_ntoa(router_id),
+        "capabilities": caps,
+    }
+
+
+def _as_path(value, as4):
+    size = 4 if as4 else 2
+    code = "I" if as4 else "H"
+    path = []
+    pos = 0
+    while pos + 2 <= len(value):
+        stype, count = struct.unpack_from("!BB", value, pos)
+        asns = list(struct.unpack_from("!{}{}".format(count, code), value, pos + 2))
+        path.append(asns if stype == AS_SEQUENCE else [asns])
+        pos += 2 + count * size
+    # flatten sequences, AS_SETs stay lists
+    return [asn for segment in path for asn in segment]
+
+
+def decode_attrs(data, as4=True):
+    """
+    Path attributes as a dict: origin, as_path, next_hop, med, local_pref,
+    communities, large_communities; mp_reach / mp_unreach as
+    (afi, NLRI list); anything else by number, raw.
+    """
+    attrs = {}
+    pos, end = 0, len(data)
+    while pos + 3 <= end:
+        flags, atype = data[pos], data[pos + 1]
+        if flags & FLAG_EXTENDED:
+            length = struct.unpack_from("!H", data, pos + 2)[0]
+            pos += 4
+        else:
+            length = data[pos + 2]
+            pos += 3
+        value = data[pos : pos + length]
+        pos += length
+        if atype == ATTR_ORIGIN:
+            attrs["origin"] = value[0]
+        elif atype == ATTR_AS_PATH:
+            attrs["as_path"] = _as_path(value, as4)
+        elif atype == ATTR_NEXT_HOP:
+            attrs["next_hop"] = socket.inet_ntoa(value)
+        elif atype == ATTR_MED:
+            attrs["med"] = struct.unpack("!I", value)[0]
+        elif atype == ATTR_LOCAL_PREF:
+            attrs["local_pref"] = struct.unpack("!I", value)[0]
+        elif atype == ATTR_COMMUNITIES:
+            attrs["communities"] = [
+                "{}:{}".format(*struct.unpack_from("!HH", value, i))
+                for i in range(0, len(value), 4)
+            ]
+        elif atype == ATTR_LARGE_COMMUNITIES:
+            attrs["large_communities"] = [
+                "{}:{}:{}".format(*struct.unpack_from("!III", value, i))
+                for i in range(0, len(value), 12)
+            ]
+        elif atype == ATTR_MP_REACH_NLRI:
+            afi, _, nhlen = struct.unpack_from("!HBB", value)
+            nh = value[4 : 4 + nhlen]
+            if afi == AFI_IPV6:
+                attrs["next_hop"] = str(ipaddress.IPv6Address(nh[:16]))
+            elif nhlen >= 4:
+                attrs["next_hop"] = socket.inet_ntoa(nh[:4])
+            attrs["mp_reach"] = (afi, split_nlri(value, 5 + nhlen))
+        elif atype == ATTR_MP_UNREACH_NLRI:
+            afi = struct.unpack_from("!H", value)[0]
+            attrs["mp_unreach"] = (afi, split_nlri(value, 3))
+        else:
+            attrs[atype] = value
+    return attrs
+
+
+def decode_update(body, as4=True, cache=None):
+    """
+    (withdrawn, announced, attrs) of an UPDATE: withdrawn and announced are
+    lists of (afi, NLRI), attrs without mp_reach/mp_unreach.
+
+    With a `cache` dict, decoded attributes without MP_(UN)REACH_NLRI are
+    kept by their encoding and the same object is returned for every
+    UPDATE carrying them, which helps with one prefix per UPDATE streams.
+    """
+    wlen = struct.unpack_from("!H", body)[0]
+    withdrawn = [(AFI_IPV4, raw) for raw in split_nlri(body, 2, 2 + wlen)]
+    alen = struct.unpack_from("!H", body, 2 + wlen)[0]
+    apos = 4 + wlen
+    raw_attrs = body[apos : apos + alen]
+    attrs = cache.get(raw_attrs) if cache is not None else None
+    if attrs is None:
+        attrs = decode_attrs(raw_attrs, as4)
+        if cache is not None and "mp_reach" not in attrs and "mp_unreach" not in attrs:
+            if len(cache) >= 10000:
+                cache.clear()
+            cache[raw_attrs] = attrs
+    announced = [(AFI_IPV4, raw) for raw in split_nlri(body, apos + alen)]
+    if "mp_reach" in attrs:
+        afi, nlri = attrs.pop("mp_reach")
+        announced += [(afi, raw) for raw in nlri]
+    if "mp_unreach" in attrs:
+        afi, nlri = attrs.pop("mp_unreach")
+        withdrawn += [(afi, raw) for raw in nlri]
+    return withdrawn, announced, attrs
+
+
+#
+# Adj-RIB-In
+#
+class RibIn(object):
+    """
+    Prefixes received from a peer, with counters and arrival times.
+
+    `routes` maps (afi, NLRI) to an index into `attrs`: path attributes are
+    stored once per distinct set, as is typical for densely packed updates,
+    to keep millions of routes affordable.  Counters, update sizes and
+    arrivals are since the last mark().
+    """
+
+    def __init__(self, ring=100000):
+        self.routes = {}
+        self.attrs = []
+        self.attr_index = {}
+        self.last_attrs = (None, None)
+        self.ring = ring
+        self.mark()
+
+    def mark(self):
+        self.t_mark = time.time()
+        self.t_first = None
+        self.t_last = None
+        self.counters = {"updates": 0, "adds": 0, "withdraws": 0, "bytes": 0}
+        self.update_sizes = deque(maxlen=self.ring)
+        self.arrivals = deque(maxlen=self.ring)
+
+    def _intern(self, attrs):
+        # same object as last time, e.g. from decode_update()'s cache
+        if attrs is self.last_attrs[0]:
+            return self.last_attrs[1]
+        key = json.dumps(attrs, sort_keys=True, default=repr)
+        index = self.attr_index.get(key)
+        if index is None:
+            index = self.attr_index[key] = len(self.attrs)
+            self.attrs.append(attrs)
+        self.last_attrs = (attrs, index)
+        return index
+
+    def apply(self, withdrawn, announced, attrs, now, size=0):
+        routes = self.routes
+        for key in withdrawn:
+            routes.pop(key, None)
+        if announced:
+            index = self._intern(attrs)
+            for key in announced:
+                routes[key] = index
+        count = len(withdrawn) + len(announced)
+        self.counters["updates"] += 1
+        self.counters["adds"] += len(announced)
+        self.counters["withdraws"] += len(withdrawn)
+        self.counters["bytes"] += size
+        self.update_sizes.append(count)
+        if count:
+            if self.t_first is None:
+                self.t_first = now
+            self.t_last = now
+            self.arrivals.append((now, count))
+
+    def clear(self):
+        self.routes.clear()
+
+    def route(self, prefix):
+        "Attributes of `prefix`, None if not received"
+        afi = AFI_IPV6 if ":" in prefix else AFI_IPV4
+        index = self.routes.get((afi, encode_prefix(prefix)))
+        return None if index is None else self.attrs[index]
+
+    def count(self, family=None):
+        if family is None:
+            return len(self.routes)
+        afi = _afi(family)
+        return sum(1 for key in self.routes if key[0] == afi)
+
+    def stats(self):
+        result = dict(self.counters)
+        result["prefixes"] = len(self.routes)
+        result["update_sizes"] = distribution(self.update_sizes)
+        if self.t_first is not None:
+            duration = self.t_last - self.t_first
+            result["first"] = self.t_first - self.t_mark
+            result["last"] = self.t_last - self.t_mark
+            result["duration"] = duration
+            changes = self.counters["adds"] + self.counters["withdraws"]
+            result["rate"] = changes / duration if duration > 0 else None
+        return result
+
+    def rates(self, interval=1.0):
+        "Prefix changes per `interval` seconds since mark(), as a list"
+        if not self.arrivals:
+            return []
+        buckets = {}
+        for t, count in self.arrivals:
+            slot = int((t - self.t_mark) / interval)
+            buckets[slot] = buckets.get(slot, 0) + count
+        last = max(buckets)
+        return [buckets.get(slot, 0) / interval for slot in range(last + 1)]
+
+
+#
+# Session
+#
+class BgpError(Exception):
+    "Session failed or was closed by the peer"
+
+
+class BgpSession(object):
+    """
+    One BGP session, actively opened towards `peer`.
+
+    * `families`: address families to negotiate (4 and/or 6)
+    * `extended`: offer extended messages (65535 byte UPDATEs)
+    """
+
+    def __init__(
+        self,
+        peer,
+        local_as,
+        peer_as=None,
+        router_id=None,
+        hold=180,
+        families=(4, 6),
+        extended=True,
+        port=BGP_PORT,
+        local_address=None,
+    ):
+        self.peer = peer
+        self.local_as = local_as
+        self.peer_as = peer_as
+        self.router_id = router_id
+        self.hold = hold
+        self.families = families
+        self.extended = extended
+        self.port = port
+        self.local_address = local_address
+        self.rib = RibIn()
+        self.reader = None
+        self.writer = None
+        self.tasks = []
+        self.changed = None
+        self.established = False
+        self.error = None
+        self.open = None
+        self.as4 = False
+        self.max_size = BGP_MAX_SIZE
+        self.sent = {"updates": 0, "bytes": 0}
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def _read_msg(self, framer, pending):
+        while not pending:
+            data = await self.reader.read(1 << 20)
+            if not data:
+                raise BgpError("connection closed by peer")
+            pending.extend(framer.feed(data))
+        return pending.popleft()
+
+    async def connect(self, timeout=30):
+        "Open the session, raises BgpError if it does not get established"
+        self.changed = asyncio.Event()
+        local = (self.local_address, 0) if self.local_address else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.peer, self.port, local_addr=local), timeout
+        )
+        sockname = self.writer.get_extra_info("sockname")
+        self.local_address = sockname[0]
+        if self.router_id is None:
+            self.router_id = (
+                self.local_address if ":" not in self.local_address else "10.255.255.1"
+            )
+
+        self.writer.write(
+            encode_open(
+                self.local_as, self.router_id, self.hold, self.families, self.extended
+            )
+        )
+        framer, pending = BgpFramer(), deque()
+        msgtype, body = await asyncio.wait_for(
+            self._read_msg(framer, pending), timeout
+        )
+        if msgtype != MSG_OPEN:
+            raise BgpError("expected OPEN, got message type {}".format(msgtype))
+        self.open = decode_open(body)
+        caps = self.open["capabilities"]
+        if self.peer_as is not None and self.open["asn"] != self.peer_as:
+            self.writer.write(encode_notification(2, 2))
+            raise BgpError("peer AS {} != {}".format(self.open["asn"], self.peer_as))
+        self.peer_as = self.open["asn"]
+        self.as4 = CAP_AS4 in caps
+        if self.extended and CAP_EXT_MESSAGE in caps:
+            self.max_size = BGP_EXTENDED_MAX_SIZE
+        self.hold = min(self.hold, self.open["hold"])
+
+        self.writer.write(encode_msg(MSG_KEEPALIVE))
+        while True:
+            msgtype, body = await asyncio.wait_for(
+                self._read_msg(framer, pending), timeout
+            )
+            if msgtype == MSG_KEEPALIVE:
+                break
+            if msgtype == MSG_NOTIFICATION:
+                raise BgpError("NOTIFICATION {}/{}".format(body[0], body[1]))
+        self.established = True
+        self.tasks = [asyncio.ensure_future(self._read_loop(framer, pending))]
+        if self.hold:
+            self.tasks.append(asyncio.ensure_future(self._keepalive_loop()))
+        self._notify()
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.hold / 3.0)
+            self.writer.write(encode_msg(MSG_KEEPALIVE))
+
+    async def _read_loop(self, framer, pending):
+        try:
+            # messages that came in with the peer's KEEPALIVE
+            msgs = list(pending)
+            now = time.time()
+            while True:
+                for msgtype, body in msgs:
+                    if msgtype == MSG_UPDATE:
+                        withdrawn, announced, attrs = decode_update(body, self.as4)
+                        self.rib.apply(
+                            withdrawn, announced, attrs, now, len(body) + BGP_HDR.size
+                        )
+                    elif msgtype == MSG_NOTIFICATION:
+                        raise BgpError("NOTIFICATION {}/{}".format(body[0], body[1]))
+                self._notify()
+                data = await self.reader.read(1 << 20)
+                if not data:
+                    raise BgpError("connection closed by peer")
+                now = time.time()
+                msgs = framer.feed(data)
+        except (BgpError, ValueError, ConnectionError) as error:
+            self.error = str(error)
+        finally:
+            self.established = False
+            self._notify()
+
+    async def close(self):
+        if self.writer is None:
+            return
+        if self.established:
+            # cease / administrative shutdown
+            self.writer.write(encode_notification(6, 2))
+        self.writer.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.established = False
+
+    def _default_as_path(self):
+        return [self.local_as] if self.peer_as != self.local_as else []
+
+    async def send_updates(self, messages, batch=1 << 20):
+        "Write UPDATE messages, returns (updates, bytes)"
+        if not self.established:
+            raise BgpError(self.error or "session not established")
+        count, size = 0, 0
+        chunk, chunk_size = [], 0
+        for msg in messages:
+            chunk.append(msg)
+            chunk_size += len(msg)
+            count += 1
+            if chunk_size >= batch:
+                self.writer.write(b"".join(chunk))
+                size += chunk_size
+                chunk, chunk_size = [], 0
+                await self.writer.drain()
+        if chunk:
+            self.writer.write(b"".join(chunk))
+            size += chunk_size
+        await self.writer.drain()
+        self.sent["updates"] += count
+        self.sent["bytes"] += size
+        return count, size
+
+    async def announce(self, afi, nlri, nexthop=None, as_path=None, **attrs):
+        """
+        Announce `nlri` with shared attributes (see encode_path_attrs()).
+        The next hop defaults to the local address of the session.
+        """
+        if as_path is None:
+            as_path = self._default_as_path()
+        if nexthop is None:
+            nexthop = self.local_address
+            if afi == AFI_IPV6 and ":" not in nexthop:
+                nexthop = "::ffff:" + nexthop
+        path_attrs = encode_path_attrs(as_path, as4=self.as4, **attrs)
+        t_start = time.time()
+        count, size = await self.send_updates(
+            build_updates(afi, nlri, path_attrs, nexthop, self.max_size)
+        )
+        return self._result(len(nlri), count, size, t_start)
+
+    async def withdraw(self, afi, nlri):
+        t_start = time.time()
+        count, size = await self.send_updates(
+            build_updates(afi, nlri, max_size=self.max_size)
+        )
+        return self._result(len(nlri), count, size, t_start)
+
+    @staticmethod
+    def _result(prefixes, updates, size, t_start):
+        elapsed = time.time() - t_start
+        return {
+            "prefixes": prefixes,
+            "updates": updates,
+            "bytes": size,
+            "start": t_start,
+            "elapsed": elapsed,
+            "rate": prefixes / elapsed if elapsed > 0 else None,
+        }
+
+    async def churn(
+        self, afi, nlri, pattern="flap", fraction=0.1, rounds=10, interval=1.0, **attrs
+    ):
+        """
+        Churn on `fraction` of `nlri` (already announced) every `interval`
+        seconds for `rounds` rounds, a different slice each round:
+
+        * "flap": withdraw the slice, then announce it again
+        * "med": re-announce the slice with a MED changing every round
+        * "community": re-announce the slice with a large community
+          (local AS:0:round) added, which every peer has to be told about
+        * "withdraw": withdraw the slice (and leave it withdrawn)
+        """
+        size = max(1, int(len(nlri) * fraction))
+        results = []
+        for rnd in range(rounds):
+            t_round = time.time()
+            pos = (rnd * size) % len(nlri)
+            part = nlri[pos : pos + size]
+            if pattern == "flap":
+                result = await self.withdraw(afi, part)
+                again = await self.announce(afi, part, **attrs)
+                result["prefixes"] += again["prefixes"]
+                result["updates"] += again["updates"]
+                result["bytes"] += again["bytes"]
+                result["elapsed"] = time.time() - result["start"]
+            elif pattern == "med":
+                result = await self.announce(afi, part, **dict(attrs, med=rnd + 1))
+            elif pattern == "community":
+                tag = "{}:0:{}".format(self.local_as, rnd + 1)
+                large = list(attrs.get("large_communities", ())) + [tag]
+                result = await self.announce(
+                    afi, part, **dict(attrs, large_communities=large)
+                )
+            elif pattern == "withdraw":
+                result = await self.withdraw(afi, part)
+            else:
+                raise ValueError("unknown churn pattern {}".format(pattern))
+            results.append(result)
+            remaining = interval - (time.time() - t_round)
+            if remaining > 0 and rnd < rounds - 1:
+                await asyncio.sleep(remaining)
+        return results
+
+    def stats(self):
+        result = self.rib.stats()
+        result["established"] = self.established
+        result["error"] = self.error
+        result["sent"] = dict(self.sent)
+        result["max_size"] = self.max_size
+        return result
+
+
+#
+# Speaker (runs inside the host/router namespace)
+#
+class BgpSpeakerService(NsService):
+    "Holds BGP sessions, answers queries on a UNIX socket."
+
+    def __init__(self, sockpath):
+        super(BgpSpeakerService, self).__init__(sockpath)
+        self.sessions = {}
+
+    async def session(self, req):
+        peer = req["peer"]
+        old = self.sessions.pop(peer, None)
+        if old is not None:
+            await old.close()
+        session = BgpSession(
+            peer,
+            req["local_as"],
+            req.get("peer_as"),
+            req.get("router_id"),
+            req.get("hold", 180),
+            req.get("families", [4, 6]),
+            req.get("extended", True),
+            req.get("port", BGP_PORT),
+            req.get("local_address"),
+        )
+        self.sessions[peer] = session
+        deadline = time.time() + req.get("timeout", 60)
+        # bgpd may not be accepting the session yet
+        while True:
+            try:
+                await session.connect(max(1, deadline - time.time()))
+                break
+            except (BgpError, OSError, asyncio.TimeoutError) as error:
+                session.error = str(error) or type(error).__name__
+                if session.writer is not None:
+                    session.writer.close()
+                if time.time() > deadline:
+                    break
+                await asyncio.sleep(1)
+        return session.stats()
+
+    def _satisfied(self, session, req):
+        if req.get("established") and not session.established:
+            return False
+        counters = session.rib.counters
+        for key in ("updates", "adds", "withdraws"):
+            if key in req and counters[key] < req[key]:
+                return False
+        if "prefixes" in req and len(session.rib.routes) != req["prefixes"]:
+            return False
+        return True
+
+    async def wait(self, session, req):
+        return await self.wait_for(
+            lambda: self._satisfied(session, req),
+            session.stats,
+            req.get("timeout", 30),
+            changed=lambda: session.changed,
+            abort=lambda: session.error and not session.established,
+        )
+
+    async def query(self, req):
+        op = req.get("op")
+        if op == "session":
+            return await self.session(req)
+        session = self.sessions.get(req.get("peer"))
+        if session is None:
+            return {"error": "no session to {}".format(req.get("peer"))}
+        if op in ("announce", "withdraw", "churn"):
+            afi, nlri = prefix_range(req["start"], req["count"], req.get("step", 1))
+            attrs = req.get("attrs", {})
+            try:
+                if op == "announce":
+                    return await session.announce(afi, nlri, **attrs)
+                if op == "withdraw":
+                    return await session.withdraw(afi, nlri)
+                return await session.churn(
+                    afi,
+                    nlri,
+                    req.get("pattern", "flap"),
+                    req.get("fraction", 0.1),
+                    req.get("rounds", 10),
+                    req.get("interval", 1.0),
+                    **attrs
+                )
+            except (BgpError, ConnectionError) as error:
+                return {"error": str(error)}
+        if op == "stats":
+            return session.stats()
+        if op == "mark":
+            session.rib.mark()
+            return session.rib.t_mark
+        if op == "wait":
+            return await self.wait(session, req)
+        if op == "rates":
+            return session.rib.rates(req.get("interval", 1.0))
+        if op == "route":
+            return session.rib.route(req["prefix"])
+        if op == "clear":
+            session.rib.clear()
+            return True
+        if op == "close":
+            await session.close()
+            del self.sessions[req["peer"]]
+            return True
+        return None
+
+    async def teardown(self):
+        for session in self.sessions.values():
+            await session.close()
+
+
+#
+# Test side API
+#
+class BgpSpeaker(NsServiceClient):
+    """
+    Controls a BGP speaker running in the namespace of `name` (a host or a
+    router).  Sessions are identified by the peer's address.
+    """
+
+    description = "BGP speaker"
+
+    def __init__(self, tgen, name):
+        sockpath = service_sockpath(tgen, name, "bgpspeaker.sock")
+        super(BgpSpeaker, self).__init__(tgen, name, sockpath)
+        self.name = name
+
+    def start(self, timeout=10):
+        "Start the speaker, returns True when it is ready"
+        return self.start_service(__file__, timeout=timeout)
+
+    def session(self, peer, local_as, peer_as=None, timeout=60, **options):
+        """
+        Open a session to `peer`, retrying for up to `timeout` seconds.
+        `options`: router_id, hold, families, extended, port, local_address.
+        Returns stats(), check "established".
+        """
+        return self._request(
+            "session",
+            peer=peer,
+            local_as=local_as,
+            peer_as=peer_as,
+            timeout=timeout,
+            **options
+        )
+
+    def announce(self, peer, start, count, step=1, **attrs):
+        """
+        Announce `count` prefixes starting at `start` (see prefix_range())
+        with shared attributes `attrs`: nexthop, as_path, origin, med,
+        local_pref, communities, large_communities.  Returns prefixes,
+        updates, bytes, start (absolute time), elapsed and rate.
+        """
+        return self._request(
+            "announce", peer=peer, start=start, count=count, step=step, attrs=attrs
+        )
+
+    def withdraw(self, peer, start, count, step=1):
+        "Withdraw prefixes announced with announce(), returns the same"
+        return self._request("withdraw", peer=peer, start=start, count=count, step=step)
+
+    def churn(
+        self,
+        peer,
+        start,
+        count,
+        pattern="flap",
+        fraction=0.1,
+        rounds=10,
+        interval=1.0,
+        **attrs
+    ):
+        "Run a churn pattern (see BgpSession.churn()), returns per round results"
+        return self._request(
+            "churn",
+            peer=peer,
+            start=start,
+            count=count,
+            pattern=pattern,
+            fraction=fraction,
+            rounds=rounds,
+            interval=interval,
+            attrs=attrs,
+        )
+
+    def mark(self, peer):
+        "Reset receive counters and start timing"
+        return self._request("mark", peer=peer)
+
+    def stats(self, peer):
+        """
+        Session state and received updates since mark(): updates, adds,
+        withdraws, bytes, prefixes (in the Adj-RIB-In), update_sizes and,
+        once something arrived, first/last (seconds after mark), duration
+        and rate (prefix changes/s)
+        """
+        return self._request("stats", peer=peer)
+
+    def wait(self, peer, timeout=30, **conditions):
+        """
+        Wait until the session matches `conditions` (established, updates,
+        adds, withdraws as minimums, prefixes as exact Adj-RIB-In size),
+        returns stats() with "timeout" set if it didn't within `timeout`.
+        """
+        conditions["timeout"] = timeout
+        return self._request("wait", peer=peer, **conditions)
+
+    def rates(self, peer, interval=1.0):
+        "Received prefix changes per second in `interval` slots since mark()"
+        return self._request("rates", peer=peer, interval=interval)
+
+    def route(self, peer, prefix):
+        "Attributes `prefix` was received with, None if it wasn't"
+        return self._request("route", peer=peer, prefix=prefix)
+
+    def close(self, peer):
+        "Close the session to `peer`"
+        return self._request("close", peer=peer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BGP speaker")
+    parser.add_argument("socket", help="UNIX socket to answer queries on")
+    args = parser.parse_args()
+
+    run_service(BgpSpeakerService(args.socket))
+
+
+if __name__ == "__main__":
+    main()
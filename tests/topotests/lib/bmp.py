@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+BMP (RFC 7854) collector for topotests.
+
+bgpd's BMP module ("-M bmp") connects to the collector with
+
+    bmp targets NAME
+     bmp monitor ipv4 unicast pre-policy
+     bmp monitor ipv4 unicast post-policy
+     bmp connect 127.0.0.1 port 1790 min-retry 100 max-retry 1000
+
+The collector parses the stream as it arrives and keeps, for every
+monitored BGP peer, the pre-policy (Adj-RIB-In) and post-policy tables as
+lib/bgpspeaker.RibIn, so the usual counts, arrival times and rates are
+available per table.  It also tracks message counts and rates, the bytes
+waiting unread on its socket (backlog) and the lag between the per-peer
+header timestamp and the arrival of a message.
+
+Like lib/fpm.py, this file is both the collector, started in the router's
+namespace, and the library tests use to query it:
+
+    collector = BmpCollector(tgen, "r1")
+    collector.start()
+    ...
+    collector.wait(timeout=60, peer="10.0.1.101", policy="post", prefixes=1000)
+    collector.stop()
+"""
+
+import argparse
+import array
+import asyncio
+import fcntl
+import re
+import socket
+import struct
+import termios
+import time
+from collections import deque
+
+try:
+    from lib.bgpspeaker import (
+        AFI_IPV4,
+        AFI_IPV6,
+        BGP_HDR,
+        CAP_AS4,
+        MSG_UPDATE,
+        RibIn,
+        decode_open,
+        decode_update,
+    )
+    from lib.nsservice import (
+        NsService,
+        NsServiceClient,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+except ImportError:
+    # started as a script from the router namespace
+    from bgpspeaker import (
+        AFI_IPV4,
+        AFI_IPV6,
+        BGP_HDR,
+        CAP_AS4,
+        MSG_UPDATE,
+        RibIn,
+        decode_open,
+        decode_update,
+    )
+    from nsservice import (
+        NsService,
+        NsServiceClient,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+
+BMP_PORT = 1790
+BMP_VERSION = 3
+BMP_HDR = struct.Struct("!BIB")
+BMP_PEER_HDR = struct.Struct("!BB8s16sI4sII")
+BMP_TIMESTAMP = struct.Struct("!II")
+
+BMP_ROUTE_MONITORING = 0
+BMP_STATISTICS_REPORT = 1
+BMP_PEER_DOWN = 2
+BMP_PEER_UP = 3
+BMP_INITIATION = 4
+BMP_TERMINATION = 5
+BMP_ROUTE_MIRRORING = 6
+
+BMP_MSG_NAMES = {
+    BMP_ROUTE_MONITORING: "route_monitoring",
+    BMP_STATISTICS_REPORT: "statistics",
+    BMP_PEER_DOWN: "peer_down",
+    BMP_PEER_UP: "peer_up",
+    BMP_INITIATION: "initiation",
+    BMP_TERMINATION: "termination",
+    BMP_ROUTE_MIRRORING: "route_mirroring",
+}
+
+BMP_PEER_FLAG_V = 0x80
+BMP_PEER_FLAG_L = 0x40
+
+BMP_INFO_TYPES = {0: "string", 1: "sysDescr", 2: "sysName"}
+
+
+#
+# Decoding
+#
+class BmpFramer(object):
+    """
+    Splits a byte stream into BMP messages.  feed() returns (type, body) of
+    every complete message, body without the common header.
+    """
+
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data):
+        buf = self.buf + data if self.buf else data
+        msgs = []
+        pos, end = 0, len(buf)
+        while end - pos >= BMP_HDR.size:
+            version, length, msgtype = BMP_HDR.unpack_from(buf, pos)
+            if version != BMP_VERSION or length < BMP_HDR.size:
+                raise ValueError("bad BMP header at offset {}".format(pos))
+            if end - pos < length:
+                break
+            msgs.append((msgtype, buf[pos + BMP_HDR.size : pos + length]))
+            pos += length
+        self.buf = buf[pos:]
+        return msgs
+
+
+def _address(raw, ipv6):
+    if ipv6:
+        return socket.inet_ntop(socket.AF_INET6, raw)
+    return socket.inet_ntoa(raw[12:])
+
+
+def decode_peer_header(body):
+    "Per-peer header at the start of `body` as a dict"
+    ptype, flags, rd, addr, asn, bgp_id, sec, usec = BMP_PEER_HDR.unpack_from(body)
+    return {
+        "type": ptype,
+        "flags": flags,
+        "post": bool(flags & BMP_PEER_FLAG_L),
+        "address": _address(addr, flags & BMP_PEER_FLAG_V),
+        "asn": asn,
+        "bgp_id": socket.inet_ntoa(bgp_id),
+        "timestamp": sec + usec / 1000000.0,
+    }
+
+
+def decode_info_tlvs(data, pos=0):
+    "Information TLVs (initiation, peer up) as {name: value}"
+    info = {}
+    while pos + 4 <= len(data):
+        itype, length = struct.unpack_from("!HH", data, pos)
+        value = data[pos + 4 : pos + 4 + length].decode("utf-8", "replace")
+        info[BMP_INFO_TYPES.get(itype, str(itype))] = value
+        pos += 4 + length
+    return info
+
+
+def decode_peer_up(body):
+    "Local address/port, remote port and the OPENs of a Peer Up message"
+    pos = BMP_PEER_HDR.size
+    flags = body[1]
+    local = _address(body[pos : pos + 16], flags & BMP_PEER_FLAG_V)
+    local_port, remote_port = struct.unpack_from("!HH", body, pos + 16)
+    pos += 20
+    opens = []
+    for _ in range(2):
+        length = BGP_HDR.unpack_from(body, pos)[1]
+        opens.append(decode_open(body[pos + BGP_HDR.size : pos + length]))
+        pos += length
+    return {
+        "local_address": local,
+        "local_port": local_port,
+        "remote_port": remote_port,
+        "sent_open": opens[0],
+        "received_open": opens[1],
+        "info": decode_info_tlvs(body, pos),
+    }
+
+
+def decode_stats(body):
+    "Statistics report counters as {type: value}"
+    pos = BMP_PEER_HDR.size
+    count = struct.unpack_from("!I", body, pos)[0]
+    pos += 4
+    stats = {}
+    for _ in range(count):
+        stype, length = struct.unpack_from("!HH", body, pos)
+        value = body[pos + 4 : pos + 4 + length]
+        if length in (4, 8):
+            value = int.from_bytes(value, "big")
+        elif length == 11:
+            # AFI/SAFI gauge
+            value = int.from_bytes(value[3:], "big")
+        else:
+            value = value.hex()
+        stats[stype] = value
+        pos += 4 + length
+    return stats
+
+
+def _eor_afi(update):
+    "AFI if the UPDATE (without BGP header) is an End-of-RIB marker, else None"
+    if update == b"\0\0\0\0":
+        return AFI_IPV4
+    if len(update) == 10 and update[:4] == b"\0\0\0\x06" and update[5] == 15:
+        return struct.unpack_from("!H", update, 7)[0]
+    return None
+
+
+#
+# Collector (runs inside the router namespace)
+#
+class BmpPeer(object):
+    "A BGP peer of the monitored router, with its tables"
+
+    def __init__(self, header):
+        self.address = header["address"]
+        self.asn = header["asn"]
+        self.bgp_id = header["bgp_id"]
+        self.up = False
+        self.as4 = True
+        self.ribs = {"pre": RibIn(), "post": RibIn()}
+        self.eor = set()
+        self.stats = {}
+        self.down_reason = None
+
+    def json(self):
+        return {
+            "address": self.address,
+            "asn": self.asn,
+            "bgp_id": self.bgp_id,
+            "up": self.up,
+            "eor": sorted(self.eor),
+            "down_reason": self.down_reason,
+            "stats": self.stats,
+            "pre": self.ribs["pre"].stats(),
+            "post": self.ribs["post"].stats(),
+        }
+
+
+class BmpService(NsService):
+    "Accepts BMP sessions, answers queries on a UNIX socket."
+
+    def __init__(self, sockpath, address, port, ring=100000):
+        super(BmpService, self).__init__(sockpath)
+        self.address = address
+        self.port = port
+        self.ring = ring
+        self.peers = {}
+        self.info = {}
+        self.connected = False
+        self.sessions = 0
+        self.attr_cache = {}
+        self.header_cache = {}
+        self.bmp_server = None
+        self.mark()
+
+    def mark(self):
+        self.t_mark = time.time()
+        self.counters = dict((name, 0) for name in BMP_MSG_NAMES.values())
+        self.counters["bytes"] = 0
+        self.arrivals = deque(maxlen=self.ring)
+        self.lags = deque(maxlen=self.ring)
+        self.backlog = deque(maxlen=self.ring)
+        return self.t_mark
+
+    def _peer(self, header):
+        peer = self.peers.get(header["address"])
+        if peer is None:
+            peer = self.peers[header["address"]] = BmpPeer(header)
+        return peer
+
+    def _route_monitoring(self, body, now):
+        # the per-peer header only differs in the timestamp between the
+        # messages for one peer and table
+        key = body[:34]
+        cached = self.header_cache.get(key)
+        if cached is None:
+            header = decode_peer_header(body)
+            policy = "post" if header["post"] else "pre"
+            cached = self.header_cache[key] = (self._peer(header), policy)
+        peer, policy = cached
+        pos = BMP_PEER_HDR.size
+        length, bgptype = BGP_HDR.unpack_from(body, pos)[1:]
+        if bgptype != MSG_UPDATE:
+            return
+        update = body[pos + BGP_HDR.size : pos + length]
+        afi = _eor_afi(update)
+        if afi is not None:
+            peer.eor.add("{}/{}".format(policy, {AFI_IPV6: 6}.get(afi, 4)))
+            return
+        withdrawn, announced, attrs = decode_update(update, peer.as4, self.attr_cache)
+        peer.ribs[policy].apply(withdrawn, announced, attrs, now, length)
+        sec, usec = BMP_TIMESTAMP.unpack_from(body, 34)
+        if sec:
+            self.lags.append(now - sec - usec / 1000000.0)
+
+    def handle_message(self, msgtype, body, now):
+        name = BMP_MSG_NAMES.get(msgtype, str(msgtype))
+        self.counters[name] = self.counters.get(name, 0) + 1
+        if msgtype == BMP_ROUTE_MONITORING:
+            self._route_monitoring(body, now)
+        elif msgtype == BMP_PEER_UP:
+            peer = self._peer(decode_peer_header(body))
+            peer_up = decode_peer_up(body)
+            peer.up = True
+            peer.down_reason = None
+            peer.as4 = (
+                CAP_AS4 in peer_up["sent_open"]["capabilities"]
+                and CAP_AS4 in peer_up["received_open"]["capabilities"]
+            )
+        elif msgtype == BMP_PEER_DOWN:
+            peer = self._peer(decode_peer_header(body))
+            peer.up = False
+            peer.down_reason = body[BMP_PEER_HDR.size]
+            peer.eor.clear()
+            for rib in peer.ribs.values():
+                rib.clear()
+        elif msgtype == BMP_STATISTICS_REPORT:
+            peer = self._peer(decode_peer_header(body))
+            peer.stats = decode_stats(body)
+        elif msgtype == BMP_INITIATION:
+            self.info = decode_info_tlvs(body)
+        elif msgtype == BMP_TERMINATION:
+            self.info["termination"] = decode_info_tlvs(body)
+
+    async def handle_bmp(self, reader, writer):
+        # a new session resends everything
+        self.peers.clear()
+        self.header_cache.clear()
+        self.info = {}
+        self.connected = True
+        self.sessions += 1
+        self._notify()
+
+        sock = writer.get_extra_info("socket")
+        pending = array.array("i", [0])
+        framer = BmpFramer()
+        try:
+            while True:
+                data = await reader.read(1 << 20)
+                if not data:
+                    break
+                now = time.time()
+                fcntl.ioctl(sock.fileno(), termios.FIONREAD, pending)
+                self.backlog.append((now, pending[0]))
+                msgs = framer.feed(data)
+                for msgtype, body in msgs:
+                    self.handle_message(msgtype, body, now)
+                self.counters["bytes"] += len(data)
+                self.arrivals.append((now, len(msgs)))
+                self._notify()
+        except (ValueError, ConnectionError) as error:
+            self.info["error"] = str(error)
+        finally:
+            self.connected = False
+            writer.close()
+            self._notify()
+
+    def stats(self):
+        result = dict(self.counters)
+        result["connected"] = self.connected
+        result["sessions"] = self.sessions
+        result["info"] = self.info
+        result["peers"] = sorted(self.peers)
+        result["lag"] = distribution(self.lags)
+        backlog = [size for _, size in self.backlog]
+        result["backlog"] = {
+            "last": backlog[-1] if backlog else 0,
+            "max": max(backlog) if backlog else 0,
+        }
+        if self.arrivals:
+            first, last = self.arrivals[0][0], self.arrivals[-1][0]
+            messages = sum(count for _, count in self.arrivals)
+            result["first"] = first - self.t_mark
+            result["last"] = last - self.t_mark
+            result["rate"] = messages / (last - first) if last > first else None
+        return result
+
+    def rates(self, interval=1.0):
+        "Messages and maximum backlog per `interval` seconds since mark()"
+        slots = {}
+        for t, count in self.arrivals:
+            slot = slots.setdefault(int((t - self.t_mark) / interval), [0, 0])
+            slot[0] += count
+        for t, size in self.backlog:
+            slot = slots.setdefault(int((t - self.t_mark) / interval), [0, 0])
+            slot[1] = max(slot[1], size)
+        if not slots:
+            return []
+        result = []
+        for slot in range(max(slots) + 1):
+            messages, backlog = slots.get(slot, (0, 0))
+            result.append({"messages": messages / interval, "backlog": backlog})
+        return result
+
+    def _satisfied(self, req):
+        if req.get("connected") and not self.connected:
+            return False
+        if "peers_up" in req:
+            if sum(1 for p in self.peers.values() if p.up) < req["peers_up"]:
+                return False
+        for key in ("route_monitoring", "peer_up", "statistics"):
+            if key in req and self.counters[key] < req[key]:
+                return False
+        if "peer" not in req:
+            return True
+        peer = self.peers.get(req["peer"])
+        if peer is None:
+            return False
+        if "eor" in req and req["eor"] not in peer.eor:
+            return False
+        rib = peer.ribs[req.get("policy", "post")]
+        for key in ("adds", "withdraws"):
+            if key in req and rib.counters[key] < req[key]:
+                return False
+        if "prefixes" in req and len(rib.routes) != req["prefixes"]:
+            return False
+        return True
+
+    def _peer_result(self, req):
+        result = self.stats()
+        peer = self.peers.get(req.get("peer"))
+        if peer is not None:
+            result["peer"] = peer.json()
+        return result
+
+    async def wait(self, req):
+        return await self.wait_for(
+            lambda: self._satisfied(req),
+            lambda: self._peer_result(req),
+            req.get("timeout", 30),
+        )
+
+    async def query(self, req):
+        op = req.get("op")
+        if op == "stats":
+            return self.stats()
+        if op == "mark":
+            for peer in self.peers.values():
+                for rib in peer.ribs.values():
+                    rib.mark()
+            return self.mark()
+        if op == "wait":
+            return await self.wait(req)
+        if op == "rates":
+            return self.rates(req.get("interval", 1.0))
+        peer = self.peers.get(req.get("peer"))
+        if op == "peer":
+            return None if peer is None else peer.json()
+        if op == "route":
+            if peer is None:
+                return None
+            return peer.ribs[req.get("policy", "post")].route(req["prefix"])
+        if op == "peer_rates":
+            if peer is None:
+                return []
+            rib = peer.ribs[req.get("policy", "post")]
+            return rib.rates(req.get("interval", 1.0))
+        return None
+
+    async def setup(self):
+        self.bmp_server = await asyncio.start_server(
+            self.handle_bmp, self.address, self.port, reuse_address=True
+        )
+
+    async def teardown(self):
+        self.bmp_server.close()
+
+
+#
+# Test side API
+#
+def bmp_clients(router):
+    """
+    bgpd's view of its BMP sessions, from "show bmp": one dict per
+    connected client with remote, MonSent, MirrSent, MirrLost, ByteSent,
+    ByteQ (queued in bgpd) and ByteQKernel (queued in the socket).
+    """
+    output = router.vtysh_cmd("show bmp")
+    clients = []
+    columns = None
+    for line in output.splitlines():
+        fields = line.split()
+        if fields[:1] == ["remote"] and "ByteQ" in fields:
+            columns = fields
+        elif columns is None or re.match(r"^-*$", line.strip()):
+            continue
+        elif len(fields) == len(columns) and fields[-1].isdigit():
+            client = dict(zip(columns[:2], fields[:2]))
+            for name, value in zip(columns[2:], fields[2:]):
+                client[name] = int(value)
+            clients.append(client)
+        else:
+            columns = None
+    return clients
+
+
+class BmpCollector(NsServiceClient):
+    """
+    Runs a BMP collector listening on `address`:`port` in the namespace of
+    `router` and queries it.
+    """
+
+    description = "BMP collector"
+
+    def __init__(self, tgen, router, address="127.0.0.1", port=BMP_PORT):
+        sockpath = service_sockpath(tgen, router, "bmp.sock")
+        super(BmpCollector, self).__init__(tgen, router, sockpath)
+        self.address = address
+        self.port = port
+
+    def start(self, timeout=10):
+        "Start the collector, returns True when it is ready"
+        args = ["--address", self.address, "--port", self.port]
+        return self.start_service(__file__, args, timeout)
+
+    def mark(self):
+        "Reset counters and timing, returns the mark time"
+        return self._request("mark")
+
+    def stats(self):
+        """
+        Messages received since mark() by type and bytes, connected,
+        sessions, info (initiation sysName/sysDescr), peers, lag (arrival
+        minus per-peer header timestamp; bgpd only sends whole seconds),
+        backlog (bytes unread on the socket: last and max) and, once
+        something arrived, first/last (seconds after mark) and rate
+        (messages/s)
+        """
+        return self._request("stats")
+
+    def peer(self, peer):
+        "Peer state, statistics and pre/post table stats (see RibIn.stats())"
+        return self._request("peer", peer=peer)
+
+    def wait(self, timeout=30, **conditions):
+        """
+        Wait until the collector matches `conditions`: connected, peers_up,
+        route_monitoring, peer_up, statistics (message minimums) and, for
+        `peer` and its `policy` table ("pre" or "post", the default): eor
+        ("post/4", ...), adds, withdraws (minimums), prefixes (exact).
+        Returns stats() plus the peer's state, with "timeout" set if the
+        conditions weren't met within `timeout`.
+        """
+        conditions["timeout"] = timeout
+        return self._request("wait", **conditions)
+
+    def rates(self, interval=1.0):
+        "Messages/s and maximum backlog in `interval` slots since mark()"
+        return self._request("rates", interval=interval)
+
+    def peer_rates(self, peer, policy="post", interval=1.0):
+        "Prefix changes/s of one table in `interval` slots since mark()"
+        return self._request("peer_rates", peer=peer, policy=policy, interval=interval)
+
+    def route(self, peer, prefix, policy="post"):
+        "Attributes of `prefix` in a peer's table, None if it isn't there"
+        return self._request("route", peer=peer, prefix=prefix, policy=policy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BMP collector")
+    parser.add_argument("socket", help="UNIX socket to answer queries on")
+    parser.add_argument("--address", default="127.0.0.1", help="listen address")
+    parser.add_argument("--port", type=int, default=BMP_PORT, help="listen port")
+    args = parser.parse_args()
+
+    run_service(BmpService(args.socket, args.address, args.port))
+
+
+if __name__ == "__main__":
+    main()
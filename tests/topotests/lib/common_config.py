@@ -46,7 +46,7 @@ except ImportError:
     from io import StringIO
     import configparser
 
-from lib.topolog import logger, logger_config
+from lib.topolog import logger, logger_config, cmdlog
 from lib.topogen import TopoRouter, get_topogen
 from lib.topotest import interface_set_status, version_cmp, frr_unicode
 
@@ -233,17 +233,14 @@ def run_frr_cmd(rnode, cmd, isjson=False):
     if cmd:
         ret_data = rnode.vtysh_cmd(cmd, isjson=isjson)
 
-        if True:
-            if isjson:
-                print_data = json.dumps(ret_data)
-            else:
-                print_data = ret_data
-            logger.info(
-                "Output for command [%s] on router %s:\n%s",
-                cmd,
-                rnode.name,
-                print_data,
-            )
+        # the full output is kept in the router's command log, see
+        # lib/topolog.py:CommandLog
+        logger.info(
+            "Output for command [%s] on router %s:\n%s",
+            cmd,
+            rnode.name,
+            cmdlog.truncate(ret_data),
+        )
         return ret_data
 
     else:
@@ -483,6 +480,27 @@ def check_router_status(tgen):
     return True
 
 
+def frr_reload_command():
+    """
+    Command and environment to run frr-reload.py with.  If `clippy` and
+    `frr_xref` are set in pytest.ini, frr-reload.py runs under clippy and marks
+    configs in-process using the CLI data from frr.xref, instead of calling
+    "vtysh -m" for each config.
+    """
+    tgen = get_topogen()
+    clippy = tgen.config.get(tgen.CONFIG_SECTION, "clippy")
+    xref = tgen.config.get(tgen.CONFIG_SECTION, "frr_xref")
+    if not clippy or not xref:
+        return ["/usr/lib/frr/frr-reload.py"], None
+
+    env = dict(os.environ)
+    pythondir = os.path.join(os.path.dirname(os.path.dirname(clippy)), "python")
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [pythondir, env.get("PYTHONPATH")])
+    )
+    return [clippy, "/usr/lib/frr/frr-reload.py", "--xref", xref], env
+
+
 def reset_config_on_routers(tgen, routerName=None):
     """
     Resets configuration on routers to the snapshot created using input JSON
@@ -529,12 +547,13 @@ def reset_config_on_routers(tgen, routerName=None):
     #
     # Get all delta's in parallel
     #
+    reload_cmd, reload_env = frr_reload_command()
     procs = {}
     for rname in router_list:
         logger.info("Generating delta for router %s to new configuration", rname)
         procs[rname] = subprocess.Popen(
-            [ "/usr/lib/frr/frr-reload.py",
-              "--test-reset",
+            reload_cmd +
+            [ "--test-reset",
               "--input",
               run_cfg_fmt.format(rname),
               "--test",
@@ -542,6 +561,7 @@ def reset_config_on_routers(tgen, routerName=None):
             stdin=None,
             stdout=open(delta_fmt.format(rname), "w"),
             stderr=subprocess.PIPE,
+            env=reload_env,
         )
     for rname, p in procs.items():
         _, error = p.communicate()
@@ -1862,6 +1882,7 @@ class Stepper:
     count = 1
 
     def __call__(self, msg, reset):
+        cmdlog.new_step(msg)
         if reset:
             Stepper.count = 1
             logger.info(msg)
@@ -0,0 +1,249 @@
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+CPU and memory usage of FRR daemons for performance topotests.
+
+Process CPU time and RSS come from /proc, FRR's own accounting from
+"show memory" and zebra's dataplane counters from "show zebra dplane".
+DaemonSampler collects them while a test waits for something to happen:
+
+    sampler = DaemonSampler(r1, "zebra")
+    sampler.mark()
+    ... trigger, then call sampler.sample() while polling ...
+    summary = sampler.summary()
+"""
+
+import os
+import re
+import time
+
+# /proc/PID/stat fields after the command name, see proc(5)
+STAT_UTIME = 11
+STAT_STIME = 12
+STAT_THREADS = 17
+
+MEM_UNITS = {"byte": 1, "bytes": 1, "KiB": 1 << 10, "MiB": 1 << 20}
+
+
+def daemon_pid(router, daemon):
+    "PID of `daemon` on `router` from its pid file, None if not running"
+    output = router.run("cat /var/run/{}/{}.pid".format(router.routertype, daemon))
+    output = output.strip()
+    return int(output) if output.isdigit() else None
+
+
+def parse_proc(stat, status):
+    """
+    CPU seconds (user, system), threads, rss and rss_max (bytes) from the
+    contents of /proc/PID/stat and /proc/PID/status
+    """
+    fields = stat[stat.rindex(")") + 2 :].split()
+    ticks = float(os.sysconf("SC_CLK_TCK"))
+    result = {
+        "user": int(fields[STAT_UTIME]) / ticks,
+        "system": int(fields[STAT_STIME]) / ticks,
+        "threads": int(fields[STAT_THREADS]),
+    }
+    for line in status.splitlines():
+        m = re.match(r"^Vm(RSS|HWM):\s+(\d+) kB", line)
+        if m is not None:
+            key = "rss" if m.group(1) == "RSS" else "rss_max"
+            result[key] = int(m.group(2)) * 1024
+    return result
+
+
+def proc_stats(router, pid):
+    "parse_proc() for process `pid` on `router`, None if it is gone"
+    output = router.run(
+        "cat /proc/{0}/stat; echo; cat /proc/{0}/status".format(pid)
+    ).strip()
+    if not output or ")" not in output:
+        return None
+    stat, _, status = output.partition("\n")
+    return parse_proc(stat, status)
+
+
+def _memstr(value):
+    "Bytes from mtype_memstr() output, None for '> 2GB'"
+    m = re.match(r"^(\d+) (\w+)$", value.strip())
+    if m is None or m.group(2) not in MEM_UNITS:
+        return None
+    return int(m.group(1)) * MEM_UNITS[m.group(2)]
+
+
+def parse_show_memory(output):
+    """
+    "show memory" of one daemon: heap and used (allocator statistics,
+    bytes, rounded), mtypes ({name: {count, size, total, max, max_bytes}},
+    size None for variable sized types, totals only with
+    malloc_usable_size()) and total (sum of the mtype totals or None)
+    """
+    result = {"heap": None, "used": None, "mtypes": {}, "total": None}
+    for line in output.splitlines():
+        m = re.match(r"^\s+(Total heap allocated|Used ordinary blocks):\s+(.*)$", line)
+        if m is not None:
+            key = "heap" if m.group(1).startswith("Total") else "used"
+            result[key] = _memstr(m.group(2))
+            continue
+        name, sep, rest = line.partition(":")
+        tokens = rest.split()
+        if not sep or not tokens or not tokens[0].isdigit():
+            continue
+        # with malloc_usable_size: count [size] total max max_bytes,
+        # otherwise: count [size] max
+        if len(tokens) in (3, 5):
+            size = tokens.pop(1)
+            size = int(size) if size.isdigit() else None
+        else:
+            size = None
+        if len(tokens) not in (2, 4) or not all(t.isdigit() for t in tokens):
+            continue
+        values = [int(token) for token in tokens]
+        mtype = {"count": values[0], "size": size, "max": values[-1]}
+        if len(values) == 4:
+            mtype["total"] = values[1]
+            mtype["max"] = values[2]
+            mtype["max_bytes"] = values[3]
+            result["total"] = (result["total"] or 0) + values[1]
+        result["mtypes"][name.strip()] = mtype
+    return result
+
+
+def show_memory(router, daemon):
+    "parse_show_memory() for `daemon` on `router`"
+    return parse_show_memory(router.vtysh_cmd("show memory", daemon=daemon))
+
+
+def parse_counters(output):
+    """
+    "Some counter:   123" lines as {"some_counter": 123}, for "show zebra
+    dplane" and similar
+    """
+    result = {}
+    for line in output.splitlines():
+        m = re.match(r"^\s*([A-Za-z][\w ]*?)\s*:\s+(\d+)\s*$", line)
+        if m is not None:
+            key = re.sub(r"\W+", "_", m.group(1).strip().lower())
+            result[key] = int(m.group(2))
+    return result
+
+
+def zebra_dplane(router):
+    "zebra's dataplane counters and queue depth from 'show zebra dplane'"
+    return parse_counters(router.vtysh_cmd("show zebra dplane"))
+
+
+class DaemonSampler(object):
+    """
+    Samples CPU time and RSS of `daemon` on `router` every sample(), and
+    "show memory" at most every `memory_interval` seconds (it walks all
+    memory types, which is not free).
+    """
+
+    def __init__(self, router, daemon, memory_interval=5.0):
+        self.router = router
+        self.daemon = daemon
+        self.memory_interval = memory_interval
+        self.pid = None
+        self.mark()
+
+    def mark(self):
+        "Drop the samples and take a first one, call before triggering work"
+        self.samples = []
+        self.memory = []
+        self.t_mark = time.time()
+        self.t_memory = None
+        if self.pid is None:
+            self.pid = daemon_pid(self.router, self.daemon)
+        self.sample(memory=True)
+
+    def sample(self, memory=False, **extra):
+        """
+        Take a sample, with "show memory" if `memory` or if it is due,
+        `extra` is stored with it.  Returns the sample, None if the daemon
+        is gone.
+        """
+        now = time.time()
+        stats = proc_stats(self.router, self.pid) if self.pid else None
+        if stats is None:
+            return None
+        sample = {"time": now - self.t_mark, "cpu": stats["user"] + stats["system"]}
+        sample.update(stats)
+        sample.update(extra)
+        if self.samples:
+            prev = self.samples[-1]
+            elapsed = sample["time"] - prev["time"]
+            if elapsed > 0:
+                sample["cpu_load"] = (sample["cpu"] - prev["cpu"]) / elapsed
+        self.samples.append(sample)
+
+        if memory or self.t_memory is None or now - self.t_memory >= (
+            self.memory_interval
+        ):
+            self.t_memory = now
+            result = show_memory(self.router, self.daemon)
+            result["time"] = now - self.t_mark
+            self.memory.append(result)
+        return sample
+
+    def summary(self, top=10):
+        """
+        CPU seconds used since mark(), average and peak load (CPU seconds
+        per second), RSS at mark/end/max, the "show memory" totals over
+        time and the `top` memory types that changed the most since mark()
+        (in bytes if known, otherwise in allocations).  Take a last
+        sample(memory=True) first to see the final state.
+        """
+        if not self.samples:
+            return {}
+        first, last = self.samples[0], self.samples[-1]
+        result = {
+            "samples": len(self.samples),
+            "duration": last["time"] - first["time"],
+            "cpu": last["cpu"] - first["cpu"],
+            "cpu_load_max": max(s.get("cpu_load", 0.0) for s in self.samples),
+            "rss_start": first.get("rss"),
+            "rss_end": last.get("rss"),
+            "rss_max": max(s.get("rss", 0) for s in self.samples),
+            "threads": last["threads"],
+        }
+        if result["duration"] > 0:
+            result["cpu_load"] = result["cpu"] / result["duration"]
+
+        if self.memory:
+            mem_first, mem_last = self.memory[0], self.memory[-1]
+            for key in ("heap", "used", "total"):
+                result["memory_" + key] = mem_last[key]
+            result["memory"] = [
+                dict((key, mem[key]) for key in ("time", "heap", "used", "total"))
+                for mem in self.memory
+            ]
+            growth = []
+            for name, mtype in mem_last["mtypes"].items():
+                before = mem_first["mtypes"].get(name, {})
+                delta = {
+                    "count": mtype["count"] - before.get("count", 0),
+                    "total": mtype.get("total", 0) - before.get("total", 0),
+                }
+                if delta["count"] or delta["total"]:
+                    growth.append((name, delta))
+            growth.sort(
+                key=lambda item: (abs(item[1]["total"]), abs(item[1]["count"])),
+                reverse=True,
+            )
+            result["mtype_growth"] = dict(growth[:top])
+        return result
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+FPM (Forwarding Plane Manager) server for topotests.
+
+Like the other lib/nsservice.py tools, this file is both the server, which
+is started inside a router namespace and accepts zebra's FPM connection,
+and the library used by tests to talk to it:
+
+    fpm = FpmServer(tgen, "r1")
+    fpm.start()
+    fpm.mark()
+    r1.vtysh_cmd("sharp install routes 10.0.0.0 nexthop 192.168.1.2 10000")
+    result = fpm.wait(adds=10000, timeout=60)
+    logger.info("%.0f routes/s", result["rate"])
+    fpm.stop()
+
+Both FPM encodings are decoded incrementally from the stream: netlink
+(dplane_fpm_nl, "fpm" module default) and protobuf ("-M fpm:protobuf").
+The server keeps the current state of every prefix plus counters, the
+number of route updates per frame and per socket read ("batch sizes") and
+the arrival time of each update.  Timing is relative to mark(), which the
+test calls right before triggering the churn, so wait() results include
+the whole path from the CLI command through zebra to the FPM socket.
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import socket
+import struct
+import time
+from collections import deque
+
+try:
+    from lib.nsservice import (
+        NsService,
+        NsServiceClient,
+        current_task,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+except ImportError:
+    # started as a script from the router namespace
+    from nsservice import (
+        NsService,
+        NsServiceClient,
+        current_task,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+
+FPM_DEFAULT_PORT = 2620
+FPM_PROTO_VERSION = 1
+FPM_MSG_TYPE_NETLINK = 1
+FPM_MSG_TYPE_PROTOBUF = 2
+FPM_HDR = struct.Struct("!BBH")
+
+NLMSG_HDR = struct.Struct("=IHHII")
+RTMSG = struct.Struct("=BBBBBBBBI")
+NHMSG = struct.Struct("=BBBBI")
+RTATTR = struct.Struct("=HH")
+RTNEXTHOP = struct.Struct("=HBBi")
+
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_NEWNEXTHOP = 104
+RTM_DELNEXTHOP = 105
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_MULTIPATH = 9
+RTA_TABLE = 15
+RTA_NH_ID = 30
+
+NHA_ID = 1
+NHA_GROUP = 2
+NHA_BLACKHOLE = 4
+NHA_OIF = 5
+NHA_GATEWAY = 6
+
+RTN_BLACKHOLE = 6
+RTN_UNREACHABLE = 7
+
+AF_INET = socket.AF_INET
+AF_INET6 = socket.AF_INET6
+
+
+def nla_align(length):
+    return (length + 3) & ~3
+
+
+#
+# Stream framing
+#
+class FpmFramer(object):
+    """
+    Splits a byte stream into FPM frames.  feed() takes whatever the socket
+    returned and yields (msg_type, payload) for every complete frame; a
+    partial frame at the end is kept for the next call.
+    """
+
+    def __init__(self):
+        self.buf = b""
+        self.frames = 0
+        self.bytes = 0
+
+    def feed(self, data):
+        buf = self.buf + data if self.buf else data
+        pos, end = 0, len(buf)
+        while end - pos >= FPM_HDR.size:
+            version, msg_type, msg_len = FPM_HDR.unpack_from(buf, pos)
+            if version != FPM_PROTO_VERSION or msg_len < FPM_HDR.size:
+                raise ValueError(
+                    "bad FPM header at offset {}: version {} length {}".format(
+                        self.bytes + pos, version, msg_len
+                    )
+                )
+            if end - pos < msg_len:
+                break
+            yield msg_type, buf[pos + FPM_HDR.size : pos + msg_len]
+            pos += msg_len
+            self.frames += 1
+        self.bytes += pos
+        self.buf = buf[pos:]
+
+
+#
+# Netlink decoding
+#
+def parse_rtattrs(data, pos, end):
+    "{type: payload} for the rtattrs in data[pos:end]"
+    attrs = {}
+    while end - pos >= RTATTR.size:
+        rta_len, rta_type = RTATTR.unpack_from(data, pos)
+        if rta_len < RTATTR.size:
+            break
+        attrs[rta_type & 0x3FFF] = data[pos + RTATTR.size : pos + rta_len]
+        pos += nla_align(rta_len)
+    return attrs
+
+
+def rta_addr(family, raw):
+    "Address of `family` in the rtattr payload `raw`, as a string"
+    if family == AF_INET6:
+        return str(ipaddress.IPv6Address(raw[:16]))
+    return str(ipaddress.IPv4Address(raw[:4]))
+
+
+def rta_u32(raw):
+    "Host order u32 in the rtattr payload `raw`"
+    return struct.unpack("=I", raw[:4])[0]
+
+
+def decode_rtmsg(nltype, data, pos, end):
+    family, dst_len, _, _, table, proto, _, rtype, _ = RTMSG.unpack_from(data, pos)
+    attrs = parse_rtattrs(data, pos + RTMSG.size, end)
+
+    if RTA_TABLE in attrs:
+        table = rta_u32(attrs[RTA_TABLE])
+    if RTA_DST in attrs:
+        dst = rta_addr(family, attrs[RTA_DST])
+    else:
+        dst = "::" if family == AF_INET6 else "0.0.0.0"
+
+    nexthops = []
+    if RTA_MULTIPATH in attrs:
+        mp = attrs[RTA_MULTIPATH]
+        mpos = 0
+        while len(mp) - mpos >= RTNEXTHOP.size:
+            rtnh_len, _, _, ifindex = RTNEXTHOP.unpack_from(mp, mpos)
+            if rtnh_len < RTNEXTHOP.size:
+                break
+            nhattrs = parse_rtattrs(mp, mpos + RTNEXTHOP.size, mpos + rtnh_len)
+            nh = {"ifindex": ifindex}
+            if RTA_GATEWAY in nhattrs:
+                nh["gateway"] = rta_addr(family, nhattrs[RTA_GATEWAY])
+            nexthops.append(nh)
+            mpos += nla_align(rtnh_len)
+    elif RTA_GATEWAY in attrs or RTA_OIF in attrs:
+        nh = {}
+        if RTA_OIF in attrs:
+            nh["ifindex"] = rta_u32(attrs[RTA_OIF])
+        if RTA_GATEWAY in attrs:
+            nh["gateway"] = rta_addr(family, attrs[RTA_GATEWAY])
+        nexthops.append(nh)
+
+    route = {
+        "op": "add" if nltype == RTM_NEWROUTE else "del",
+        "vrf": table,
+        "prefix": "{}/{}".format(dst, dst_len),
+        "protocol": proto,
+        "nexthops": nexthops,
+    }
+    if rtype == RTN_BLACKHOLE:
+        route["type"] = "blackhole"
+    elif rtype == RTN_UNREACHABLE:
+        route["type"] = "unreachable"
+    if RTA_PRIORITY in attrs:
+        route["metric"] = rta_u32(attrs[RTA_PRIORITY])
+    if RTA_NH_ID in attrs:
+        route["nhg"] = rta_u32(attrs[RTA_NH_ID])
+    return route
+
+
+def decode_nhmsg(nltype, data, pos, end):
+    family = NHMSG.unpack_from(data, pos)[0]
+    attrs = parse_rtattrs(data, pos + NHMSG.size, end)
+    nhg = {
+        "op": "nhg-add" if nltype == RTM_NEWNEXTHOP else "nhg-del",
+        "id": rta_u32(attrs[NHA_ID]) if NHA_ID in attrs else 0,
+    }
+    if NHA_GROUP in attrs:
+        raw = attrs[NHA_GROUP]
+        # struct nexthop_grp: u32 id, u8 weight, u8 resvd1, u16 resvd2
+        nhg["group"] = [
+            struct.unpack_from("=I", raw, i)[0] for i in range(0, len(raw) - 7, 8)
+        ]
+    if NHA_GATEWAY in attrs:
+        nhg["gateway"] = rta_addr(family, attrs[NHA_GATEWAY])
+    if NHA_OIF in attrs:
+        nhg["ifindex"] = rta_u32(attrs[NHA_OIF])
+    if NHA_BLACKHOLE in attrs:
+        nhg["type"] = "blackhole"
+    return nhg
+
+
+def decode_netlink(payload):
+    "Updates in a FPM netlink frame (zebra may put several messages in one)"
+    updates = []
+    pos, end = 0, len(payload)
+    while end - pos >= NLMSG_HDR.size:
+        nlmsg_len, nltype = NLMSG_HDR.unpack_from(payload, pos)[:2]
+        if nlmsg_len < NLMSG_HDR.size or pos + nlmsg_len > end:
+            raise ValueError("truncated netlink message")
+        body = pos + NLMSG_HDR.size
+        if nltype in (RTM_NEWROUTE, RTM_DELROUTE):
+            updates.append(decode_rtmsg(nltype, payload, body, pos + nlmsg_len))
+        elif nltype in (RTM_NEWNEXTHOP, RTM_DELNEXTHOP):
+            updates.append(decode_nhmsg(nltype, payload, body, pos + nlmsg_len))
+        pos += nla_align(nlmsg_len)
+    return updates
+
+
+#
+# Protobuf decoding (fpm/fpm.proto, qpb/qpb.proto)
+#
+# Only the wire format is needed to read these messages, so there's no
+# dependency on the protobuf package (or on generated code.)
+#
+def _varint(data, pos):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def pb_fields(data):
+    "{field number: [values]}, length-delimited values are left as bytes"
+    fields = {}
+    pos, end = 0, len(data)
+    while pos < end:
+        key, pos = _varint(data, pos)
+        wiretype = key & 7
+        if wiretype == 0:
+            value, pos = _varint(data, pos)
+        elif wiretype == 1:
+            value = struct.unpack_from("<Q", data, pos)[0]
+            pos += 8
+        elif wiretype == 2:
+            length, pos = _varint(data, pos)
+            value = data[pos : pos + length]
+            pos += length
+        elif wiretype == 5:
+            value = struct.unpack_from("<I", data, pos)[0]
+            pos += 4
+        else:
+            raise ValueError("unsupported protobuf wire type {}".format(wiretype))
+        fields.setdefault(key >> 3, []).append(value)
+    return fields
+
+
+def _pb_first(fields, num, default=None):
+    values = fields.get(num)
+    return values[0] if values else default
+
+
+# qpb.AddressFamily
+PB_AF = {1: AF_INET, 2: AF_INET6}
+# fpm.Message.Type
+PB_ADD_ROUTE = 1
+PB_DELETE_ROUTE = 2
+
+
+def _pb_prefix(family, routekey):
+    l3prefix = pb_fields(_pb_first(pb_fields(routekey), 1, b""))
+    length = _pb_first(l3prefix, 1, 0)
+    raw = _pb_first(l3prefix, 2, b"")
+    size = 16 if family == AF_INET6 else 4
+    return "{}/{}".format(rta_addr(family, raw.ljust(size, b"\0")), length)
+
+
+def _pb_nexthop(data):
+    fields = pb_fields(data)
+    nh = {}
+    if_id = _pb_first(fields, 2)
+    if if_id is not None:
+        if_fields = pb_fields(if_id)
+        if 1 in if_fields:
+            nh["ifindex"] = if_fields[1][0]
+        if 2 in if_fields:
+            nh["ifname"] = if_fields[2][0].decode("utf-8", "replace")
+    address = _pb_first(fields, 3)
+    if address is not None:
+        addr_fields = pb_fields(address)
+        if 1 in addr_fields:
+            value = _pb_first(pb_fields(addr_fields[1][0]), 1, 0)
+            nh["gateway"] = str(ipaddress.IPv4Address(value))
+        elif 2 in addr_fields:
+            raw = _pb_first(pb_fields(addr_fields[2][0]), 1, b"")
+            nh["gateway"] = rta_addr(AF_INET6, raw)
+    return nh
+
+
+def decode_protobuf(payload):
+    "Updates in a FPM protobuf frame (one fpm.Message)"
+    msg = pb_fields(payload)
+    msgtype = _pb_first(msg, 1, 0)
+    if msgtype == PB_ADD_ROUTE:
+        body, op = _pb_first(msg, 2), "add"
+    elif msgtype == PB_DELETE_ROUTE:
+        body, op = _pb_first(msg, 3), "del"
+    else:
+        return []
+    if body is None:
+        return []
+
+    fields = pb_fields(body)
+    family = PB_AF.get(_pb_first(fields, 2, 1), AF_INET)
+    route = {
+        "op": op,
+        "vrf": _pb_first(fields, 1, 0),
+        "prefix": _pb_prefix(family, _pb_first(fields, 4, b"")),
+    }
+    if op == "add":
+        route["protocol"] = _pb_first(fields, 6, 0)
+        route["metric"] = _pb_first(fields, 8, 0)
+        route["nexthops"] = [_pb_nexthop(nh) for nh in fields.get(9, [])]
+        rtype = _pb_first(fields, 5, 1)
+        if rtype == 2:
+            route["type"] = "unreachable"
+        elif rtype == 3:
+            route["type"] = "blackhole"
+    return [route]
+
+
+DECODERS = {
+    FPM_MSG_TYPE_NETLINK: decode_netlink,
+    FPM_MSG_TYPE_PROTOBUF: decode_protobuf,
+}
+
+
+#
+# Route state and statistics
+#
+class FpmState(object):
+    """
+    Current FIB as seen over FPM plus counters since the last mark().
+
+    `routes` maps (vrf, prefix) to the last add for it; deletes remove the
+    entry.  Per-update arrival times are kept in a ring buffer of `ring`
+    entries, per-frame and per-read update counts in rings of the same size.
+    """
+
+    def __init__(self, ring=100000):
+        self.routes = {}
+        self.nhgs = {}
+        self.ring = ring
+        self.connections = 0
+        self.errors = []
+        self.mark()
+
+    def mark(self):
+        self.t_mark = time.time()
+        self.t_first = None
+        self.t_last = None
+        self.counters = {
+            "frames": 0,
+            "bytes": 0,
+            "reads": 0,
+            "adds": 0,
+            "dels": 0,
+            "nhg_adds": 0,
+            "nhg_dels": 0,
+        }
+        self.frame_sizes = deque(maxlen=self.ring)
+        self.read_sizes = deque(maxlen=self.ring)
+        self.arrivals = deque(maxlen=self.ring)
+
+    def apply(self, updates, now):
+        for upd in updates:
+            op = upd["op"]
+            if op == "add":
+                self.routes[(upd["vrf"], upd["prefix"])] = upd
+                self.counters["adds"] += 1
+            elif op == "del":
+                self.routes.pop((upd["vrf"], upd["prefix"]), None)
+                self.counters["dels"] += 1
+            elif op == "nhg-add":
+                self.nhgs[upd["id"]] = upd
+                self.counters["nhg_adds"] += 1
+            elif op == "nhg-del":
+                self.nhgs.pop(upd["id"], None)
+                self.counters["nhg_dels"] += 1
+        if updates:
+            if self.t_first is None:
+                self.t_first = now
+            self.t_last = now
+            self.arrivals.append((now, len(updates)))
+
+    def feed(self, framer, data, now):
+        "Decode one socket read, returns the number of route updates in it"
+        total = 0
+        for msg_type, payload in framer.feed(data):
+            decoder = DECODERS.get(msg_type)
+            if decoder is None:
+                continue
+            updates = decoder(payload)
+            self.frame_sizes.append(len(updates))
+            self.counters["frames"] += 1
+            self.apply(updates, now)
+            total += len(updates)
+        self.counters["reads"] += 1
+        self.counters["bytes"] += len(data)
+        self.read_sizes.append(total)
+        return total
+
+    def updates(self):
+        c = self.counters
+        return c["adds"] + c["dels"]
+
+    def stats(self):
+        result = dict(self.counters)
+        result["routes"] = len(self.routes)
+        result["nhgs"] = len(self.nhgs)
+        result["connections"] = self.connections
+        result["errors"] = list(self.errors)
+        result["frame_sizes"] = distribution(self.frame_sizes)
+        result["read_sizes"] = distribution(self.read_sizes)
+        if self.t_first is not None:
+            duration = self.t_last - self.t_first
+            result["first"] = self.t_first - self.t_mark
+            result["last"] = self.t_last - self.t_mark
+            result["duration"] = duration
+            result["rate"] = self.updates() / duration if duration > 0 else None
+        return result
+
+    def rates(self, interval=1.0):
+        "Route updates per `interval` seconds since mark(), as a list"
+        if not self.arrivals:
+            return []
+        buckets = {}
+        for t, count in self.arrivals:
+            slot = int((t - self.t_mark) / interval)
+            buckets[slot] = buckets.get(slot, 0) + count
+        last = max(buckets)
+        return [buckets.get(slot, 0) / interval for slot in range(last + 1)]
+
+
+#
+# Server (runs inside the router namespace)
+#
+class FpmService(NsService):
+    "Accepts zebra's FPM connections and answers queries on a UNIX socket."
+
+    def __init__(self, sockpath, port=FPM_DEFAULT_PORT, address="127.0.0.1", ring=100000):
+        super(FpmService, self).__init__(sockpath)
+        self.port = port
+        self.address = address
+        self.state = FpmState(ring)
+        self.connections = {}
+        self.fpm_server = None
+
+    async def handle_fpm(self, reader, writer):
+        task = current_task()
+        self.connections[task] = writer
+        framer = FpmFramer()
+        self.state.connections += 1
+        self._notify()
+        try:
+            while True:
+                data = await reader.read(1 << 20)
+                if not data:
+                    break
+                try:
+                    self.state.feed(framer, data, time.time())
+                except ValueError as error:
+                    self.state.errors.append(str(error))
+                    break
+                self._notify()
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    def _satisfied(self, req):
+        counters = self.state.counters
+        for key in ("adds", "dels", "nhg_adds", "frames"):
+            if key in req and counters[key] < req[key]:
+                return False
+        if "routes" in req and len(self.state.routes) != req["routes"]:
+            return False
+        if "connections" in req and self.state.connections < req["connections"]:
+            return False
+        return True
+
+    async def wait(self, req):
+        return await self.wait_for(
+            lambda: self._satisfied(req), self.state.stats, req.get("timeout", 30)
+        )
+
+    async def query(self, req):
+        op = req.get("op")
+        if op == "stats":
+            return self.state.stats()
+        if op == "mark":
+            self.state.mark()
+            return self.state.t_mark
+        if op == "wait":
+            return await self.wait(req)
+        if op == "rates":
+            return self.state.rates(req.get("interval", 1.0))
+        if op == "route":
+            return self.state.routes.get((req.get("vrf", 254), req["prefix"]))
+        if op == "routes":
+            return [
+                [vrf, prefix]
+                for (vrf, prefix) in sorted(self.state.routes)
+                if req.get("vrf") in (None, vrf)
+            ]
+        return None
+
+    async def setup(self):
+        self.fpm_server = await asyncio.start_server(
+            self.handle_fpm, self.address, self.port, reuse_address=True
+        )
+
+    async def teardown(self):
+        self.fpm_server.close()
+        await self.fpm_server.wait_closed()
+        # closing the transports makes the handlers see EOF and finish
+        tasks = list(self.connections)
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+#
+# Test side API
+#
+class FpmServer(NsServiceClient):
+    """
+    Controls a FPM server running in the namespace of router `router`.
+
+    * `port`: TCP port to listen on, zebra's "fpm address" must match
+    * `ring`: number of arrival times / batch sizes to keep
+    """
+
+    description = "FPM server"
+
+    def __init__(self, tgen, router, port=FPM_DEFAULT_PORT, ring=100000):
+        super(FpmServer, self).__init__(
+            tgen, router, service_sockpath(tgen, router, "fpm.sock")
+        )
+        self.port = port
+        self.ring = ring
+
+    def start(self, timeout=10):
+        "Start the server, returns True when it is ready"
+        return self.start_service(
+            __file__, ["--port", self.port, "--ring", self.ring], timeout
+        )
+
+    def mark(self):
+        "Reset counters and start timing, call right before triggering churn"
+        return self._request("mark")
+
+    def stats(self):
+        """
+        Counters since mark(): frames, bytes, reads, adds, dels, routes (now
+        in the FIB), frame_sizes/read_sizes distributions and, once updates
+        arrived, first/last (seconds after mark), duration and rate
+        (updates/s between first and last)
+        """
+        return self._request("stats")
+
+    def wait(self, timeout=30, **conditions):
+        """
+        Wait until the counters reach `conditions` (adds, dels, nhg_adds,
+        frames, connections as minimums, routes as exact FIB size), returns
+        stats() with "timeout" set if they didn't within `timeout` seconds.
+        """
+        conditions["timeout"] = timeout
+        return self._request("wait", **conditions)
+
+    def wait_connected(self, timeout=30):
+        "Wait for zebra to connect, returns True if it did"
+        return not self.wait(timeout, connections=1)["timeout"]
+
+    def rates(self, interval=1.0):
+        "Route updates per second in `interval` sized slots since mark()"
+        return self._request("rates", interval=interval)
+
+    def route(self, prefix, vrf=254):
+        "Last add seen for `prefix` in table `vrf`, None if not in the FIB"
+        return self._request("route", prefix=prefix, vrf=vrf)
+
+    def routes(self, vrf=None):
+        "(vrf, prefix) of all routes currently in the FIB"
+        return [tuple(item) for item in self._request("routes", vrf=vrf)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FPM server")
+    parser.add_argument("socket", help="UNIX socket to answer queries on")
+    parser.add_argument("--address", default="127.0.0.1", help="address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=FPM_DEFAULT_PORT, help="port to listen on"
+    )
+    parser.add_argument(
+        "--ring", type=int, default=100000, help="arrival times to keep"
+    )
+    args = parser.parse_args()
+
+    run_service(FpmService(args.socket, args.port, args.address, args.ring))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,888 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+Kernel FIB reader for topotests, using rtnetlink instead of parsing the
+text output of "ip route" / "ip rule".
+
+Run as a script inside a router namespace, this file either dumps the
+kernel's routes once as JSON (--dump, see kernel_routes()) or keeps
+running as a monitor: it dumps links, routes, rules and nexthop objects,
+then follows the kernel's notifications to keep an indexed copy of the
+FIB, and answers queries from the test on a UNIX socket (like
+lib/fpm.py):
+
+    fib = FibMonitor(tgen, "r1")
+    fib.start()
+    fib.mark()
+    r1.vtysh_cmd("sharp install routes 10.0.0.0 nexthop 192.168.1.2 100000")
+    result = fib.wait(timeout=60, table="main", proto="sharp", routes=100000)
+    route = fib.route("10.0.0.0/32")
+    fib.stop()
+
+Polling the monitor does not re-read the FIB, so it stays cheap with
+hundreds of thousands of routes installed.
+
+Routes are indexed by (table, prefix).  Entries have the table, family,
+proto (number), type, scope, metric, dev/via of the first nexthop and the
+list of all nexthops; routes using a nexthop object (nhid) get their
+nexthops resolved through it, including groups.
+"""
+
+import argparse
+import asyncio
+import errno
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+try:
+    from lib.fpm import NLMSG_HDR, RTMSG, NHMSG, RTNEXTHOP
+    from lib.fpm import nla_align, parse_rtattrs, rta_addr, rta_u32
+    from lib.nsservice import NsService, NsServiceClient, run_service, service_sockpath
+except ImportError:
+    # run as a script from lib/
+    from fpm import NLMSG_HDR, RTMSG, NHMSG, RTNEXTHOP
+    from fpm import nla_align, parse_rtattrs, rta_addr, rta_u32
+    from nsservice import NsService, NsServiceClient, run_service, service_sockpath
+
+NETLINK_ROUTE = 0
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWRULE = 32
+RTM_DELRULE = 33
+RTM_GETRULE = 34
+RTM_NEWNEXTHOP = 104
+RTM_DELNEXTHOP = 105
+RTM_GETNEXTHOP = 106
+
+RTNLGRP_LINK = 1
+RTNLGRP_IPV4_ROUTE = 7
+RTNLGRP_IPV4_RULE = 8
+RTNLGRP_IPV6_ROUTE = 11
+RTNLGRP_IPV6_RULE = 19
+RTNLGRP_NEXTHOP = 32
+
+IFINFOMSG = struct.Struct("=BxHiII")
+RTGENMSG = struct.Struct("=Bxxx")
+FIB_RULE_HDR = struct.Struct("=BBBBBBBBI")
+NEXTHOP_GRP = struct.Struct("=IBBH")
+
+IFLA_IFNAME = 3
+IFLA_LINKINFO = 18
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_VRF_TABLE = 1
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_PREFSRC = 7
+RTA_MULTIPATH = 9
+RTA_TABLE = 15
+RTA_PREF = 20
+RTA_NH_ID = 30
+
+FRA_DST = 1
+FRA_SRC = 2
+FRA_IIFNAME = 3
+FRA_PRIORITY = 6
+FRA_FWMARK = 10
+FRA_TABLE = 15
+FRA_FWMASK = 16
+FRA_OIFNAME = 17
+FRA_PROTOCOL = 21
+
+NHA_ID = 1
+NHA_GROUP = 2
+NHA_BLACKHOLE = 4
+NHA_OIF = 5
+NHA_GATEWAY = 6
+
+RT_TABLE_MAIN = 254
+RT_TABLE_LOCAL = 255
+TABLE_NAMES = {"default": 253, "main": RT_TABLE_MAIN, "local": RT_TABLE_LOCAL}
+
+RTN_TYPES = [
+    "unspec",
+    "unicast",
+    "local",
+    "broadcast",
+    "anycast",
+    "multicast",
+    "blackhole",
+    "unreachable",
+    "prohibit",
+    "throw",
+    "nat",
+    "xresolve",
+]
+
+# ICMPV6_ROUTER_PREF_*
+RTA_PREFS = {0: "medium", 1: "high", 3: "low"}
+
+FR_ACT_TO_TBL = 1
+
+# route protocol numbers, FRR's from zebra/rt_netlink.h; "static" is
+# staticd as in topotest.proto_name_to_number()
+PROTO_NUMBERS = {
+    "kernel": 2,
+    "boot": 3,
+    "zebra": 11,
+    "babel": 42,
+    "bgp": 186,
+    "isis": 187,
+    "ospf": 188,
+    "rip": 189,
+    "ripng": 190,
+    "nhrp": 191,
+    "eigrp": 192,
+    "ldp": 193,
+    "sharp": 194,
+    "pbr": 195,
+    "static": 196,
+    "openfabric": 197,
+    "srte": 198,
+}
+
+
+def proto_number(proto):
+    "Protocol name (or number) to number, None passes through"
+    if proto is None or isinstance(proto, int):
+        return proto
+    if proto.isdigit():
+        return int(proto)
+    return PROTO_NUMBERS[proto]
+
+
+def _family(family):
+    return {socket.AF_INET: 4, socket.AF_INET6: 6}.get(family, family)
+
+
+#
+# Netlink decoding
+#
+def decode_link(data, pos, end):
+    "(ifindex, name, vrf table or None) of a RTM_NEWLINK/DELLINK"
+    ifindex = IFINFOMSG.unpack_from(data, pos)[2]
+    attrs = parse_rtattrs(data, pos + IFINFOMSG.size, end)
+    name = attrs.get(IFLA_IFNAME, b"").split(b"\0")[0].decode("utf-8")
+    vrf_table = None
+    if IFLA_LINKINFO in attrs:
+        info = attrs[IFLA_LINKINFO]
+        linkinfo = parse_rtattrs(info, 0, len(info))
+        kind = linkinfo.get(IFLA_INFO_KIND, b"").split(b"\0")[0]
+        if kind == b"vrf" and IFLA_INFO_DATA in linkinfo:
+            raw = linkinfo[IFLA_INFO_DATA]
+            vrfinfo = parse_rtattrs(raw, 0, len(raw))
+            if IFLA_VRF_TABLE in vrfinfo:
+                vrf_table = rta_u32(vrfinfo[IFLA_VRF_TABLE])
+    return ifindex, name, vrf_table
+
+
+def decode_route(data, pos, end):
+    "Route dict of a RTM_NEWROUTE/DELROUTE, nexthops still with ifindexes"
+    family, dst_len, _, _, table, proto, scope, rtype, _ = RTMSG.unpack_from(
+        data, pos
+    )
+    attrs = parse_rtattrs(data, pos + RTMSG.size, end)
+
+    if RTA_TABLE in attrs:
+        table = rta_u32(attrs[RTA_TABLE])
+    if RTA_DST in attrs:
+        dst = rta_addr(family, attrs[RTA_DST])
+    else:
+        dst = "::" if family == socket.AF_INET6 else "0.0.0.0"
+
+    nexthops = []
+    if RTA_MULTIPATH in attrs:
+        mp = attrs[RTA_MULTIPATH]
+        mpos = 0
+        while len(mp) - mpos >= RTNEXTHOP.size:
+            rtnh_len, _, hops, ifindex = RTNEXTHOP.unpack_from(mp, mpos)
+            if rtnh_len < RTNEXTHOP.size:
+                break
+            nhattrs = parse_rtattrs(mp, mpos + RTNEXTHOP.size, mpos + rtnh_len)
+            nh = {"ifindex": ifindex, "weight": hops + 1}
+            if RTA_GATEWAY in nhattrs:
+                nh["via"] = rta_addr(family, nhattrs[RTA_GATEWAY])
+            nexthops.append(nh)
+            mpos += nla_align(rtnh_len)
+    elif RTA_GATEWAY in attrs or RTA_OIF in attrs:
+        nh = {}
+        if RTA_OIF in attrs:
+            nh["ifindex"] = rta_u32(attrs[RTA_OIF])
+        if RTA_GATEWAY in attrs:
+            nh["via"] = rta_addr(family, attrs[RTA_GATEWAY])
+        nexthops.append(nh)
+
+    route = {
+        "prefix": "{}/{}".format(dst, dst_len),
+        "family": _family(family),
+        "table": table,
+        "proto": proto,
+        "scope": scope,
+        "type": RTN_TYPES[rtype] if rtype < len(RTN_TYPES) else rtype,
+        "metric": rta_u32(attrs[RTA_PRIORITY]) if RTA_PRIORITY in attrs else 0,
+        "nexthops": nexthops,
+    }
+    if RTA_PREFSRC in attrs:
+        route["src"] = rta_addr(family, attrs[RTA_PREFSRC])
+    if RTA_PREF in attrs:
+        route["pref"] = RTA_PREFS.get(attrs[RTA_PREF][0], "medium")
+    if RTA_NH_ID in attrs:
+        route["nhid"] = rta_u32(attrs[RTA_NH_ID])
+    return route
+
+
+def decode_rule(data, pos, end):
+    "Rule dict of a RTM_NEWRULE/DELRULE, keys as in topotest.ip_rules()"
+    family, dst_len, src_len, _, table, _, _, action, _ = FIB_RULE_HDR.unpack_from(
+        data, pos
+    )
+    attrs = parse_rtattrs(data, pos + FIB_RULE_HDR.size, end)
+    if FRA_TABLE in attrs:
+        table = rta_u32(attrs[FRA_TABLE])
+
+    rule = {
+        "family": _family(family),
+        "pref": rta_u32(attrs[FRA_PRIORITY]) if FRA_PRIORITY in attrs else 0,
+        "from": "all",
+        "action": action,
+    }
+    if FRA_SRC in attrs:
+        rule["from"] = "{}/{}".format(rta_addr(family, attrs[FRA_SRC]), src_len)
+    if FRA_DST in attrs:
+        rule["to"] = "{}/{}".format(rta_addr(family, attrs[FRA_DST]), dst_len)
+    if FRA_IIFNAME in attrs:
+        rule["iif"] = attrs[FRA_IIFNAME].split(b"\0")[0].decode("utf-8")
+    if FRA_OIFNAME in attrs:
+        rule["oif"] = attrs[FRA_OIFNAME].split(b"\0")[0].decode("utf-8")
+    if FRA_FWMARK in attrs:
+        rule["fwmark"] = rta_u32(attrs[FRA_FWMARK])
+    if FRA_FWMASK in attrs:
+        rule["fwmask"] = rta_u32(attrs[FRA_FWMASK])
+    if FRA_PROTOCOL in attrs:
+        rule["proto"] = struct.unpack("B", attrs[FRA_PROTOCOL][:1])[0]
+    if action == FR_ACT_TO_TBL:
+        rule["table"] = table
+    return rule
+
+
+def decode_nexthop(data, pos, end):
+    "Nexthop object dict of a RTM_NEWNEXTHOP/DELNEXTHOP"
+    family, _, proto, _, _ = NHMSG.unpack_from(data, pos)
+    attrs = parse_rtattrs(data, pos + NHMSG.size, end)
+    nhe = {
+        "id": rta_u32(attrs[NHA_ID]) if NHA_ID in attrs else 0,
+        "family": _family(family),
+        "proto": proto,
+    }
+    if NHA_GROUP in attrs:
+        raw = attrs[NHA_GROUP]
+        nhe["group"] = [
+            {"id": nhid, "weight": weight + 1}
+            for nhid, weight, _, _ in NEXTHOP_GRP.iter_unpack(
+                raw[: len(raw) - len(raw) % NEXTHOP_GRP.size]
+            )
+        ]
+    if NHA_GATEWAY in attrs:
+        nhe["via"] = rta_addr(family, attrs[NHA_GATEWAY])
+    if NHA_OIF in attrs:
+        nhe["ifindex"] = rta_u32(attrs[NHA_OIF])
+    if NHA_BLACKHOLE in attrs:
+        nhe["blackhole"] = True
+    return nhe
+
+
+#
+# FIB state
+#
+class FibState(object):
+    """
+    Links, routes, rules and nexthop objects, kept up to date from
+    rtnetlink messages.
+
+    `routes` maps (table, prefix) to {metric: route}; several routes for a
+    prefix in the same table only differ in metric.  `counts` keeps the
+    number of routes per (table, family, proto) so counting with filters
+    does not walk the routes.  Counters and first/last update times are
+    since the last mark().
+    """
+
+    def __init__(self):
+        self.links = {}
+        self.vrfs = {}
+        self.routes = {}
+        self.counts = {}
+        self.rules = {}
+        self.nexthops = {}
+        self.errors = []
+        self.synced = False
+        self.mark()
+
+    def mark(self):
+        self.t_mark = time.time()
+        self.t_first = None
+        self.t_last = None
+        self.counters = {
+            "messages": 0,
+            "adds": 0,
+            "dels": 0,
+            "rule_adds": 0,
+            "rule_dels": 0,
+            "nhg_adds": 0,
+            "nhg_dels": 0,
+        }
+
+    def table_id(self, table):
+        "Table number for a number, table name or VRF name"
+        if table is None or isinstance(table, int):
+            return table
+        if table.isdigit():
+            return int(table)
+        if table in TABLE_NAMES:
+            return TABLE_NAMES[table]
+        return self.vrfs.get(table, -1)
+
+    def _count(self, route, delta):
+        key = (route["table"], route["family"], route["proto"])
+        count = self.counts.get(key, 0) + delta
+        if count:
+            self.counts[key] = count
+        else:
+            self.counts.pop(key, None)
+
+    def _route_add(self, route):
+        metrics = self.routes.setdefault((route["table"], route["prefix"]), {})
+        old = metrics.get(route["metric"])
+        if old is not None:
+            self._count(old, -1)
+        metrics[route["metric"]] = route
+        self._count(route, 1)
+        self.counters["adds"] += 1
+
+    def _route_del(self, route):
+        key = (route["table"], route["prefix"])
+        metrics = self.routes.get(key)
+        if metrics is not None:
+            old = metrics.pop(route["metric"], None)
+            if old is not None:
+                self._count(old, -1)
+            if not metrics:
+                del self.routes[key]
+        self.counters["dels"] += 1
+
+    @staticmethod
+    def _rule_key(rule):
+        return tuple(sorted(rule.items()))
+
+    def apply(self, nltype, data, pos, end):
+        "Apply one rtnetlink message (without nlmsghdr at data[pos:end])"
+        if nltype in (RTM_NEWLINK, RTM_DELLINK):
+            ifindex, name, vrf_table = decode_link(data, pos, end)
+            if nltype == RTM_NEWLINK:
+                self.links[ifindex] = name
+                if vrf_table is not None:
+                    self.vrfs[name] = vrf_table
+            else:
+                self.links.pop(ifindex, None)
+                self.vrfs.pop(name, None)
+            return
+        if nltype == RTM_NEWROUTE:
+            self._route_add(decode_route(data, pos, end))
+        elif nltype == RTM_DELROUTE:
+            self._route_del(decode_route(data, pos, end))
+        elif nltype == RTM_NEWRULE:
+            rule = decode_rule(data, pos, end)
+            self.rules[self._rule_key(rule)] = rule
+            self.counters["rule_adds"] += 1
+        elif nltype == RTM_DELRULE:
+            self.rules.pop(self._rule_key(decode_rule(data, pos, end)), None)
+            self.counters["rule_dels"] += 1
+        elif nltype == RTM_NEWNEXTHOP:
+            nhe = decode_nexthop(data, pos, end)
+            self.nexthops[nhe["id"]] = nhe
+            self.counters["nhg_adds"] += 1
+        elif nltype == RTM_DELNEXTHOP:
+            self.nexthops.pop(decode_nexthop(data, pos, end)["id"], None)
+            self.counters["nhg_dels"] += 1
+        else:
+            return
+        self.counters["messages"] += 1
+
+    def feed(self, data, now):
+        """
+        Apply a netlink datagram.  Returns [(seq, error)] for the
+        NLMSG_DONE (error 0) and NLMSG_ERROR messages in it.
+        """
+        done = []
+        pos, end = 0, len(data)
+        before = self.counters["messages"]
+        while end - pos >= NLMSG_HDR.size:
+            nlmsg_len, nltype, _, seq, _ = NLMSG_HDR.unpack_from(data, pos)
+            if nlmsg_len < NLMSG_HDR.size or pos + nlmsg_len > end:
+                raise ValueError("truncated netlink message")
+            body = pos + NLMSG_HDR.size
+            if nltype == NLMSG_DONE:
+                done.append((seq, 0))
+            elif nltype == NLMSG_ERROR:
+                done.append((seq, -struct.unpack_from("=i", data, body)[0]))
+            else:
+                self.apply(nltype, data, body, pos + nlmsg_len)
+            pos += nla_align(nlmsg_len)
+        if self.counters["messages"] != before:
+            if self.t_first is None:
+                self.t_first = now
+            self.t_last = now
+        return done
+
+    #
+    # Queries
+    #
+    def resolve(self, route):
+        "Nexthops of a route, through its nexthop object if it has one"
+        if "nhid" not in route:
+            return route["nexthops"]
+        nhe = self.nexthops.get(route["nhid"])
+        if nhe is None:
+            return []
+        members = nhe.get("group", [{"id": nhe["id"], "weight": 1}])
+        nexthops = []
+        for member in members:
+            nh = self.nexthops.get(member["id"])
+            if nh is None:
+                continue
+            entry = {"weight": member["weight"], "nhid": member["id"]}
+            for key in ("ifindex", "via", "blackhole"):
+                if key in nh:
+                    entry[key] = nh[key]
+            nexthops.append(entry)
+        return nexthops
+
+    def present(self, route):
+        "Route as returned to tests: nexthops resolved, interface names"
+        result = dict(route)
+        nexthops = []
+        for nh in self.resolve(route):
+            nh = dict(nh)
+            if "ifindex" in nh:
+                nh["dev"] = self.links.get(nh["ifindex"], str(nh["ifindex"]))
+            nexthops.append(nh)
+        result["nexthops"] = nexthops
+        if nexthops:
+            for key in ("dev", "via"):
+                if key in nexthops[0]:
+                    result[key] = nexthops[0][key]
+        return result
+
+    def route(self, prefix, table=RT_TABLE_MAIN):
+        "Lowest metric route for `prefix` in `table`, None if there is none"
+        metrics = self.routes.get((self.table_id(table), prefix))
+        if not metrics:
+            return None
+        return self.present(metrics[min(metrics)])
+
+    def count(self, table=None, family=None, proto=None):
+        table = self.table_id(table)
+        proto = proto_number(proto)
+        return sum(
+            count
+            for (ctable, cfamily, cproto), count in self.counts.items()
+            if table in (None, ctable)
+            and family in (None, cfamily)
+            and proto in (None, cproto)
+        )
+
+    def prefixes(self, table=None, family=None, proto=None):
+        "[table, prefix] of the routes matching the filter"
+        table = self.table_id(table)
+        proto = proto_number(proto)
+        result = []
+        for (rtable, prefix), metrics in self.routes.items():
+            if table not in (None, rtable):
+                continue
+            for route in metrics.values():
+                if family in (None, route["family"]) and proto in (
+                    None,
+                    route["proto"],
+                ):
+                    result.append([rtable, prefix])
+                    break
+        return sorted(result)
+
+    def dump(self, table=RT_TABLE_MAIN, family=None):
+        "{prefix: route} for the lowest metric routes in `table`"
+        table = self.table_id(table)
+        result = {}
+        for (rtable, prefix), metrics in self.routes.items():
+            if rtable != table:
+                continue
+            route = metrics[min(metrics)]
+            if family in (None, route["family"]):
+                result[prefix] = self.present(route)
+        return result
+
+    def rule_list(self, family=None):
+        "Rules ordered by preference, as topotest.ip_rules()"
+        rules = [r for r in self.rules.values() if family in (None, r["family"])]
+        return sorted(rules, key=lambda r: (r["pref"], r["family"]))
+
+    def stats(self):
+        result = dict(self.counters)
+        result["synced"] = self.synced
+        result["routes"] = sum(self.counts.values())
+        result["tables"] = {}
+        for (table, _, _), count in self.counts.items():
+            key = str(table)
+            result["tables"][key] = result["tables"].get(key, 0) + count
+        result["rules"] = len(self.rules)
+        result["nexthops"] = len(self.nexthops)
+        result["errors"] = list(self.errors)
+        if self.t_first is not None:
+            duration = self.t_last - self.t_first
+            updates = self.counters["adds"] + self.counters["dels"]
+            result["first"] = self.t_first - self.t_mark
+            result["last"] = self.t_last - self.t_mark
+            result["duration"] = duration
+            result["rate"] = updates / duration if duration > 0 else None
+        return result
+
+
+#
+# Netlink socket
+#
+class NetlinkSocket(object):
+    "NETLINK_ROUTE socket, optionally subscribed to route/rule/nexthop groups"
+
+    DUMPS = [
+        (RTM_GETLINK, socket.AF_UNSPEC),
+        (RTM_GETNEXTHOP, socket.AF_UNSPEC),
+        (RTM_GETROUTE, socket.AF_UNSPEC),
+        (RTM_GETRULE, socket.AF_INET),
+        (RTM_GETRULE, socket.AF_INET6),
+    ]
+    GROUPS = [
+        RTNLGRP_LINK,
+        RTNLGRP_NEXTHOP,
+        RTNLGRP_IPV4_ROUTE,
+        RTNLGRP_IPV6_ROUTE,
+        RTNLGRP_IPV4_RULE,
+        RTNLGRP_IPV6_RULE,
+    ]
+
+    def __init__(self, subscribe=False, rcvbuf=64 << 20):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            # SO_RCVBUFFORCE, root may exceed rmem_max
+            self.sock.setsockopt(socket.SOL_SOCKET, 33, rcvbuf)
+        except OSError:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.bind((0, 0))
+        if subscribe:
+            for group in self.GROUPS:
+                try:
+                    self.sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+                except OSError:
+                    # no nexthop objects on older kernels
+                    pass
+        self.seq = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send_dump(self, nltype, family):
+        self.seq += 1
+        body = RTGENMSG.pack(family)
+        if nltype == RTM_GETROUTE:
+            body = RTMSG.pack(family, 0, 0, 0, 0, 0, 0, 0, 0)
+        elif nltype == RTM_GETNEXTHOP:
+            body = NHMSG.pack(family, 0, 0, 0, 0)
+        elif nltype == RTM_GETLINK:
+            body = IFINFOMSG.pack(family, 0, 0, 0, 0)
+        elif nltype == RTM_GETRULE:
+            body = FIB_RULE_HDR.pack(family, 0, 0, 0, 0, 0, 0, 0, 0)
+        hdr = NLMSG_HDR.pack(
+            NLMSG_HDR.size + len(body), nltype, NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0
+        )
+        self.sock.send(hdr + body)
+        return self.seq
+
+    def recv(self):
+        return self.sock.recv(1 << 20)
+
+    def close(self):
+        self.sock.close()
+
+    def dump(self, state):
+        "Blocking full dump into `state`"
+        for nltype, family in self.DUMPS:
+            seq = self.send_dump(nltype, family)
+            while True:
+                done = dict(state.feed(self.recv(), time.time()))
+                if seq in done:
+                    if done[seq] not in (0, errno.EOPNOTSUPP, errno.EINVAL):
+                        state.errors.append(
+                            "dump {}: {}".format(nltype, os.strerror(done[seq]))
+                        )
+                    break
+        state.synced = True
+
+
+#
+# Monitor (runs inside the router namespace)
+#
+class FibService(NsService):
+    "Follows the kernel FIB, answers queries on a UNIX socket."
+
+    def __init__(self, sockpath):
+        super(FibService, self).__init__(sockpath)
+        self.state = FibState()
+        self.nl = None
+        self.dumps = []
+        self.dump_seq = None
+
+    def _next_dump(self):
+        if self.dumps:
+            self.dump_seq = self.nl.send_dump(*self.dumps.pop(0))
+        else:
+            self.dump_seq = None
+            self.state.synced = True
+
+    def resync(self):
+        "(Re)start the dump of everything, after startup or lost messages"
+        self.state.synced = False
+        self.dumps = list(NetlinkSocket.DUMPS)
+        self._next_dump()
+
+    def on_readable(self):
+        try:
+            data = self.nl.recv()
+        except OSError as error:
+            if error.errno == errno.ENOBUFS:
+                # the socket buffer overflowed, the copy is stale
+                self.state.errors.append("ENOBUFS, resyncing")
+                self.state.routes.clear()
+                self.state.counts.clear()
+                self.state.rules.clear()
+                self.state.nexthops.clear()
+                self.resync()
+            return
+        for seq, error in self.state.feed(data, time.time()):
+            if seq == self.dump_seq and seq != 0:
+                if error not in (0, errno.EOPNOTSUPP, errno.EINVAL):
+                    self.state.errors.append(
+                        "dump failed: {}".format(os.strerror(error))
+                    )
+                self._next_dump()
+        self._notify()
+
+    def _satisfied(self, req):
+        state = self.state
+        if not state.synced:
+            return False
+        counters = state.counters
+        for key in ("adds", "dels", "rule_adds", "rule_dels", "nhg_adds"):
+            if key in req and counters[key] < req[key]:
+                return False
+        if "routes" in req:
+            count = state.count(req.get("table"), req.get("family"), req.get("proto"))
+            if count != req["routes"]:
+                return False
+        if "prefix" in req:
+            route = state.route(req["prefix"], req.get("table") or RT_TABLE_MAIN)
+            if req.get("present", True) != (route is not None):
+                return False
+            if route is not None and "nexthops" in req:
+                if len(route["nexthops"]) != req["nexthops"]:
+                    return False
+        if "rules" in req and len(state.rule_list(req.get("family"))) != req["rules"]:
+            return False
+        return True
+
+    async def wait(self, req):
+        return await self.wait_for(
+            lambda: self._satisfied(req), self.state.stats, req.get("timeout", 30)
+        )
+
+    async def query(self, req):
+        op = req.get("op")
+        state = self.state
+        if op == "stats":
+            return state.stats()
+        if op == "mark":
+            state.mark()
+            return state.t_mark
+        if op == "wait":
+            return await self.wait(req)
+        if op == "route":
+            return state.route(req["prefix"], req.get("table") or RT_TABLE_MAIN)
+        if op == "count":
+            return state.count(req.get("table"), req.get("family"), req.get("proto"))
+        if op == "prefixes":
+            return state.prefixes(req.get("table"), req.get("family"), req.get("proto"))
+        if op == "dump":
+            return state.dump(req.get("table") or RT_TABLE_MAIN, req.get("family"))
+        if op == "rules":
+            return state.rule_list(req.get("family"))
+        if op == "nexthop":
+            return state.nexthops.get(req["id"])
+        return None
+
+    async def setup(self):
+        # subscribe before dumping so no change is missed; notifications
+        # for things already dumped are simply applied again
+        self.nl = NetlinkSocket(subscribe=True)
+        self.nl.sock.setblocking(False)
+        asyncio.get_event_loop().add_reader(self.nl.fileno(), self.on_readable)
+        self.resync()
+
+    async def teardown(self):
+        asyncio.get_event_loop().remove_reader(self.nl.fileno())
+        self.nl.close()
+
+
+#
+# Test side API
+#
+def kernel_routes(node, family=None, table="main"):
+    """
+    One-shot netlink dump of the kernel routes of `table` (number, "main",
+    "local" or a VRF name) in the namespace of `node`, as {prefix: route}
+    (see FibState.present()).  Use FibMonitor to poll repeatedly.
+    """
+    cmd = "{} {} --dump --table {}".format(
+        sys.executable, os.path.abspath(__file__), table
+    )
+    if family is not None:
+        cmd += " --family {}".format(family)
+    return json.loads(node.run(cmd + " 2>/dev/null"))
+
+
+class FibMonitor(NsServiceClient):
+    "Controls a kernel FIB monitor running in the namespace of `router`."
+
+    description = "FIB monitor"
+
+    def __init__(self, tgen, router):
+        sockpath = service_sockpath(tgen, router, "kernelfib.sock")
+        super(FibMonitor, self).__init__(tgen, router, sockpath)
+
+    def start(self, timeout=30):
+        "Start the monitor, returns True once it has read the whole FIB"
+        deadline = time.time() + timeout
+        if not self.start_service(__file__, timeout=timeout):
+            return False
+        return not self.wait(deadline - time.time())["timeout"]
+
+    def mark(self):
+        "Reset counters and start timing, call right before triggering changes"
+        return self._request("mark")
+
+    def stats(self):
+        """
+        Route/rule/nexthop object counts, "tables" (routes per table),
+        counters since mark() and, once something changed, first/last
+        (seconds after mark), duration and rate (route updates/s)
+        """
+        return self._request("stats")
+
+    def wait(self, timeout=30, **conditions):
+        """
+        Wait until the FIB matches `conditions`, returns stats() with
+        "timeout" set if it didn't within `timeout` seconds:
+
+        * routes: exact number of routes matching table/family/proto
+        * prefix (in table, default main): present (default True) and,
+          if given, with exactly `nexthops` nexthops
+        * rules: exact number of rules (of family)
+        * adds, dels, rule_adds, rule_dels, nhg_adds: minimums since mark()
+        """
+        conditions["timeout"] = timeout
+        return self._request("wait", **conditions)
+
+    def route(self, prefix, table="main"):
+        "Lowest metric route for `prefix`, None if not in the FIB"
+        return self._request("route", prefix=prefix, table=table)
+
+    def count(self, table=None, family=None, proto=None):
+        "Number of routes matching the filter (proto as name or number)"
+        return self._request("count", table=table, family=family, proto=proto)
+
+    def prefixes(self, table=None, family=None, proto=None):
+        "(table, prefix) of the routes matching the filter"
+        return [
+            tuple(item)
+            for item in self._request(
+                "prefixes", table=table, family=family, proto=proto
+            )
+        ]
+
+    def dump(self, table="main", family=None):
+        "{prefix: route} of `table`, like kernel_routes()"
+        return self._request("dump", table=table, family=family)
+
+    def rules(self, family=None):
+        "Policy routing rules, ordered by preference"
+        return self._request("rules", family=family)
+
+    def nexthop(self, nhid):
+        "Nexthop object `nhid`, None if it does not exist"
+        return self._request("nexthop", id=nhid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="kernel FIB monitor")
+    parser.add_argument("socket", nargs="?", help="UNIX socket to answer queries on")
+    parser.add_argument(
+        "--dump", action="store_true", help="print the routes as JSON and exit"
+    )
+    parser.add_argument("--table", default="main", help="table to --dump")
+    parser.add_argument("--family", type=int, choices=(4, 6), help="family to --dump")
+    args = parser.parse_args()
+
+    if args.dump:
+        state = FibState()
+        nl = NetlinkSocket()
+        nl.dump(state)
+        nl.close()
+        json.dump(state.dump(args.table, args.family), sys.stdout)
+        return
+    if args.socket is None:
+        parser.error("no socket given")
+
+    run_service(FibService(args.socket))
+
+
+if __name__ == "__main__":
+    main()
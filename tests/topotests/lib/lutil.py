@@ -24,6 +24,7 @@ import datetime
 import json
 import math
 import time
+from concurrent.futures import ThreadPoolExecutor
 from lib.topolog import logger
 from lib.topotest import json_cmp
 from mininet.net import Mininet
@@ -57,6 +58,10 @@ class lUtil:
     fsum = ""
     net = ""
 
+    # compiled regexps and parsed JSON expectations, shared by all checks
+    re_cache = {}
+    json_cache = {}
+
     def log(self, str, level=6):
         if self.l_level > 0:
             if self.fout == "":
@@ -191,14 +196,25 @@ Total %-4d                                                           %-4d %d\n\
             self.log("unable to read: " + tstFile)
             sys.exit(1)
 
-    def command(self, target, command, regexp, op, result, returnJson):
-        global net
-        if op != "wait":
-            self.l_line += 1
-
-        if op == "jsoncmp_pass" or op == "jsoncmp_fail":
-            returnJson = True
+    def compile(self, regexp, flags=0):
+        key = (regexp, flags)
+        pat = self.re_cache.get(key)
+        if pat is None:
+            pat = re.compile(regexp, flags)
+            self.re_cache[key] = pat
+        return pat
+
+    def json_expect(self, regexp):
+        # json_cmp() deep-copies its arguments, so the cached object can be
+        # shared between checks.  Failed loads are cached as None as well.
+        if regexp not in self.json_cache:
+            try:
+                self.json_cache[regexp] = json.loads(regexp)
+            except:
+                self.json_cache[regexp] = None
+        return self.json_cache[regexp]
 
+    def logCommand(self, target, command, regexp, op, result):
         self.log(
             "%s (#%d) %s:%s COMMAND:%s:%s:%s:%s:%s:"
             % (
@@ -213,57 +229,79 @@ Total %-4d                                                           %-4d %d\n\
                 result,
             )
         )
-        if self.net == "":
-            return False
-        # self.log("Running %s %s" % (target, command))
-        js = None
-        out = self.net[target].cmd(command).rstrip()
+
+    def logWait(self, target, command, regexp, op, result, wait, wait_time):
+        self.log(
+            "%s:%s WAIT:%s:%s:%s:%s:%s:%s:%s:"
+            % (
+                self.l_filename,
+                self.l_line,
+                target,
+                command,
+                regexp,
+                op,
+                result,
+                wait,
+                wait_time,
+            )
+        )
+
+    def match(self, out, regexp, op, returnJson):
+        """
+        Evaluate command output `out` against `regexp` for operation `op`.
+
+        This does not log or record anything, so it is safe to call from
+        worker threads; the returned dict is handed to record() afterwards.
+        """
+        m = {"out": out, "js": None, "msgs": [], "success": None}
         if len(out) == 0:
-            report = "<no output>"
+            m["report"] = "<no output>"
         else:
-            report = out
+            m["report"] = out
             if returnJson == True:
                 try:
-                    js = json.loads(out)
+                    m["js"] = json.loads(out)
                 except:
-                    js = None
-                    self.log(
-                        "WARNING: JSON load failed -- confirm command output is in JSON format."
+                    m["js"] = None
+                    m["msgs"].append(
+                        (
+                            "WARNING: JSON load failed -- confirm command output is in JSON format.",
+                            6,
+                        )
                     )
-        self.log("COMMAND OUTPUT:%s:" % report)
 
         # JSON comparison
         if op == "jsoncmp_pass" or op == "jsoncmp_fail":
-            try:
-                expect = json.loads(regexp)
-            except:
-                expect = None
-                self.log(
-                    "WARNING: JSON load failed -- confirm regex input is in JSON format."
+            expect = self.json_expect(regexp)
+            if expect is None:
+                m["msgs"].append(
+                    (
+                        "WARNING: JSON load failed -- confirm regex input is in JSON format.",
+                        6,
+                    )
                 )
-            json_diff = json_cmp(js, expect)
+            json_diff = json_cmp(m["js"], expect)
             if json_diff != None:
                 if op == "jsoncmp_fail":
                     success = True
                 else:
                     success = False
-                    self.log("JSON DIFF:%s:" % json_diff)
+                    m["msgs"].append(("JSON DIFF:%s:" % json_diff, 6))
                 ret = success
             else:
                 if op == "jsoncmp_fail":
                     success = False
                 else:
                     success = True
-            self.result(target, success, result)
-            if js != None:
-                return js
-            return ret
+                ret = None
+            m["success"] = success
+            m["ret"] = m["js"] if m["js"] != None else ret
+            return m
 
         # Experiment: can we achieve the same match behavior via DOTALL
         # without converting newlines to spaces?
-        out_nl = out
-        search_nl = re.search(regexp, out_nl, re.DOTALL)
-        self.l_last_nl = search_nl
+        search_nl = self.compile(regexp, re.DOTALL).search(out)
+        m["search_nl"] = search_nl
         # Set up for comparison
         if search_nl != None:
             group_nl = search_nl.group()
@@ -272,8 +310,8 @@ Total %-4d                                                           %-4d %d\n\
             group_nl_converted = None
 
         out = " ".join(out.splitlines())
-        search = re.search(regexp, out)
-        self.l_last = search
+        search = self.compile(regexp).search(out)
+        m["search"] = search
         if search == None:
             if op == "fail":
                 success = True
@@ -288,37 +326,52 @@ Total %-4d                                                           %-4d %d\n\
             else:
                 success = False
                 level = 5
-            self.log("found:%s:" % ret, level)
+            m["msgs"].append(("found:%s:" % ret, level))
             # Experiment: compare matched strings obtained each way
             if self.l_dotall_experiment and (group_nl_converted != ret):
-                self.log(
-                    "DOTALL experiment: strings differ dotall=[%s] orig=[%s]"
-                    % (group_nl_converted, ret),
-                    9,
+                m["msgs"].append(
+                    (
+                        "DOTALL experiment: strings differ dotall=[%s] orig=[%s]"
+                        % (group_nl_converted, ret),
+                        9,
+                    )
                 )
-        if op == "pass" or op == "fail":
-            self.result(target, success, result)
-        if js != None:
-            return js
-        return ret
+        m["success"] = success
+        m["ret"] = m["js"] if m["js"] != None else ret
+        return m
+
+    def record(self, target, m, op, result):
+        self.log("COMMAND OUTPUT:%s:" % m["report"])
+        for msg, level in m["msgs"]:
+            self.log(msg, level)
+        if "search" in m:
+            self.l_last_nl = m["search_nl"]
+            self.l_last = m["search"]
+        if op in ["pass", "fail", "jsoncmp_pass", "jsoncmp_fail"]:
+            self.result(target, m["success"], result)
+        return m["ret"]
+
+    def command(self, target, command, regexp, op, result, returnJson):
+        global net
+        if op != "wait":
+            self.l_line += 1
+
+        if op == "jsoncmp_pass" or op == "jsoncmp_fail":
+            returnJson = True
+
+        self.logCommand(target, command, regexp, op, result)
+        if self.net == "":
+            return False
+        # self.log("Running %s %s" % (target, command))
+        out = self.net[target].cmd(command).rstrip()
+        return self.record(
+            target, self.match(out, regexp, op, returnJson), op, result
+        )
 
     def wait(
         self, target, command, regexp, op, result, wait, returnJson, wait_time=0.5
     ):
-        self.log(
-            "%s:%s WAIT:%s:%s:%s:%s:%s:%s:%s:"
-            % (
-                self.l_filename,
-                self.l_line,
-                target,
-                command,
-                regexp,
-                op,
-                result,
-                wait,
-                wait_time,
-            )
-        )
+        self.logWait(target, command, regexp, op, result, wait, wait_time)
         found = False
         n = 0
         startt = time.time()
@@ -348,6 +401,96 @@ Total %-4d                                                           %-4d %d\n\
         )
         return found
 
+    def runCheck(self, check):
+        # worker side of batch(): runs one check to completion without
+        # touching any logging or result state.
+        target = check["target"]
+        node = self.net[target]
+        if check["op"] != "wait":
+            out = node.cmd(check["command"]).rstrip()
+            check["match"] = self.match(
+                out, check["regexp"], check["op"], check["returnJson"]
+            )
+            return
+
+        n = 0
+        startt = time.time()
+        wait_time = check["wait_time"]
+        wait_count = int(math.ceil(check["time"] / wait_time)) + 1
+        while wait_count > 0:
+            n += 1
+            out = node.cmd(check["command"]).rstrip()
+            m = self.match(out, check["regexp"], "wait", check["returnJson"])
+            if m["ret"] is not False:
+                break
+            wait_count -= 1
+            if wait_count > 0:
+                time.sleep(wait_time)
+        check["loops"] = n
+        check["found"] = m["ret"]
+        check["delta"] = time.time() - startt
+        out = node.cmd(check["command"]).rstrip()
+        check["match"] = self.match(out, check["regexp"], "pass", check["returnJson"])
+
+    def batch(self, checks, workers=None):
+        """
+        Run a list of independent checks concurrently.
+
+        Each check is a dict with the same keys as luCommand() arguments.
+        Checks on the same target run in order in one worker (a mininet
+        node has a single shell), different targets run in parallel.
+        Logging and pass/fail results are recorded afterwards in the order
+        the checks were given, exactly as sequential luCommand() calls
+        would have recorded them.  Returns the list of luCommand() results.
+        """
+        if self.net == "":
+            return [False] * len(checks)
+
+        bytarget = {}
+        for check in checks:
+            if check["op"] == "jsoncmp_pass" or check["op"] == "jsoncmp_fail":
+                check["returnJson"] = True
+            bytarget.setdefault(check["target"], []).append(check)
+
+        def run_target(tchecks):
+            for check in tchecks:
+                self.runCheck(check)
+
+        if workers is None:
+            workers = len(bytarget)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for future in [
+                executor.submit(run_target, tchecks) for tchecks in bytarget.values()
+            ]:
+                future.result()
+
+        rets = []
+        for check in checks:
+            target, op, result = check["target"], check["op"], check["result"]
+            args = (target, check["command"], check["regexp"])
+            if op != "wait":
+                self.l_line += 1
+                self.logCommand(*args, op=op, result=result)
+                rets.append(self.record(target, check["match"], op, result))
+                continue
+
+            self.logWait(
+                *args,
+                op=op,
+                result=result,
+                wait=check["time"],
+                wait_time=check["wait_time"]
+            )
+            self.log(
+                "Done after %d loops, time=%s, Found=%s"
+                % (check["loops"], check["delta"], check["found"])
+            )
+            result = "%s +%4.2f secs" % (result, check["delta"])
+            self.l_line += 1
+            self.logCommand(*args, op="pass", result=result)
+            rets.append(self.record(target, check["match"], "pass", result))
+        return rets
+
 
 # initialized by luStart
 LUtil = None
@@ -395,6 +538,43 @@ def luCommand(
         )
 
 
+def luBatch(checks, workers=None):
+    """
+    Run several independent luCommand() checks concurrently, e.g.:
+
+        luBatch([
+            luCheck("r1", 'vtysh -c "show bgp summary"', " 00:0", "wait", "up", 180),
+            luCheck("r3", 'vtysh -c "show bgp summary"', " 00:0", "wait", "up", 180),
+        ])
+
+    Results are recorded in list order.  Returns the list of results.
+    """
+    return LUtil.batch(checks, workers)
+
+
+def luCheck(
+    target,
+    command,
+    regexp=".",
+    op="none",
+    result="",
+    time=10,
+    returnJson=False,
+    wait_time=0.5,
+):
+    "Build a check for luBatch(), taking the same arguments as luCommand()."
+    return {
+        "target": target,
+        "command": command,
+        "regexp": regexp,
+        "op": op,
+        "result": result,
+        "time": time,
+        "returnJson": returnJson,
+        "wait_time": wait_time,
+    }
+
+
 def luLast(usenl=False):
     if usenl:
         if LUtil.l_last_nl != None:
@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+Python client for the northbound gRPC service (grpc/frr-northbound.proto,
+lib/northbound_grpc.cpp).
+
+    client = NorthboundClient("localhost:50051")
+    print(client.capabilities().frr_version)
+
+    for chunk in client.get(["/frr-interface:lib"], datatype="state"):
+        print(chunk.path, chunk.tree)
+
+    with client.candidate() as cand:
+        cand.edit(update={xpath: ""})
+        cand.commit(comment="add route")
+
+    with client.pipeline(depth=8) as pipe:
+        for xpath in xpaths:
+            pipe.submit(update={xpath: ""})
+    print(pipe.stats())
+
+Needs the grpcio package.  The Python bindings are generated from
+frr-northbound.proto with grpcio-tools on first use and cached (unless
+frr_northbound_pb2 is importable already, e.g. generated as described in
+doc/developer/grpc.rst.)
+
+Run as a script, this file is also a small CLI to query a daemon and to
+benchmark commits/sec and Get streaming throughput against it; results
+are printed as JSON.  Topotests run it inside the router namespace since
+the daemons' gRPC ports are only reachable from there.
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+
+CWD = os.path.dirname(os.path.realpath(__file__))
+PROTO = os.path.join(CWD, "../../../grpc/frr-northbound.proto")
+
+DEFAULT_CHANNEL_OPTIONS = [
+    # operational trees (e.g. the RIB) easily exceed the 4MB default
+    ("grpc.max_receive_message_length", -1),
+    ("grpc.max_send_message_length", -1),
+]
+
+_bindings = None
+
+
+def _import_grpc():
+    # a "grpc" directory in the current directory (i.e. running from the
+    # top of the FRR tree) shadows the grpcio package
+    saved = sys.path
+    sys.path = [p for p in sys.path if os.path.abspath(p or ".") != os.getcwd()]
+    try:
+        return importlib.import_module("grpc")
+    finally:
+        sys.path = saved
+
+
+def load_bindings(proto=PROTO, cachedir=None):
+    """
+    Returns (grpc, frr_northbound_pb2, frr_northbound_pb2_grpc).  Raises
+    ImportError if grpcio (or grpcio-tools, when the bindings have to be
+    generated) is not installed.
+    """
+    global _bindings
+
+    if _bindings is not None:
+        return _bindings
+
+    grpc = _import_grpc()
+    try:
+        pb2 = importlib.import_module("frr_northbound_pb2")
+        pb2_grpc = importlib.import_module("frr_northbound_pb2_grpc")
+        _bindings = (grpc, pb2, pb2_grpc)
+        return _bindings
+    except ImportError:
+        pass
+
+    with open(proto, "rb") as fd:
+        digest = hashlib.sha1(fd.read()).hexdigest()[:16]
+    if cachedir is None:
+        cachedir = os.path.join(tempfile.gettempdir(), "frr-grpc-python")
+    outdir = os.path.join(cachedir, digest)
+
+    if not os.path.exists(os.path.join(outdir, "frr_northbound_pb2_grpc.py")):
+        from grpc_tools import protoc
+
+        os.makedirs(cachedir, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=cachedir)
+        protodir = os.path.dirname(os.path.abspath(proto))
+        ret = protoc.main(
+            [
+                "grpc_tools.protoc",
+                "-I" + protodir,
+                "--python_out=" + tmpdir,
+                "--grpc_python_out=" + tmpdir,
+                os.path.abspath(proto),
+            ]
+        )
+        if ret != 0:
+            raise ImportError("protoc failed on {} ({})".format(proto, ret))
+        try:
+            os.rename(tmpdir, outdir)
+        except OSError:
+            # someone else generated it concurrently
+            pass
+
+    sys.path.insert(0, outdir)
+    try:
+        pb2 = importlib.import_module("frr_northbound_pb2")
+        pb2_grpc = importlib.import_module("frr_northbound_pb2_grpc")
+    finally:
+        sys.path.remove(outdir)
+
+    _bindings = (grpc, pb2, pb2_grpc)
+    return _bindings
+
+
+class NorthboundError(Exception):
+    "A northbound RPC failed, `code` is the grpc.StatusCode name"
+
+    def __init__(self, rpc, code, details):
+        super(NorthboundError, self).__init__(
+            "{} failed: {}: {}".format(rpc, code, details)
+        )
+        self.rpc = rpc
+        self.code = code
+        self.details = details
+
+
+def _rpc_error(grpc, rpc, error):
+    if isinstance(error, grpc.RpcError):
+        return NorthboundError(rpc, error.code().name, error.details())
+    return error
+
+
+class DataChunk(object):
+    """
+    One GetResponse.  The DataTree is decoded on first access of `tree`
+    (a dict for JSON, an Element for XML), so a consumer only pays for the
+    chunks it looks at while the next ones are being received.
+    """
+
+    __slots__ = ("path", "timestamp", "encoding", "data", "_tree")
+
+    def __init__(self, path, timestamp, encoding, data):
+        self.path = path
+        self.timestamp = timestamp
+        self.encoding = encoding
+        self.data = data
+        self._tree = None
+
+    @property
+    def tree(self):
+        if self._tree is None and self.data:
+            if self.encoding == "xml":
+                self._tree = ElementTree.fromstring(self.data)
+            else:
+                self._tree = json.loads(self.data)
+        return self._tree
+
+    def __len__(self):
+        return len(self.data)
+
+
+def merge_json(dst, src):
+    "Merge decoded JSON tree `src` into `dst` (lists are concatenated)"
+    for key, value in src.items():
+        if key in dst and isinstance(dst[key], dict) and isinstance(value, dict):
+            merge_json(dst[key], value)
+        elif key in dst and isinstance(dst[key], list) and isinstance(value, list):
+            dst[key].extend(value)
+        else:
+            dst[key] = value
+    return dst
+
+
+class NorthboundClient(object):
+    """
+    Connection to one daemon's northbound gRPC service.  All calls share one
+    channel; candidates created through candidate() are kept and reused.
+    """
+
+    def __init__(self, target, timeout=60, options=None):
+        self.grpc, self.pb2, pb2_grpc = load_bindings()
+        self.target = target
+        self.timeout = timeout
+        self.channel = self.grpc.insecure_channel(
+            target, options=DEFAULT_CHANNEL_OPTIONS + list(options or [])
+        )
+        self.stub = pb2_grpc.NorthboundStub(self.channel)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for cand in idle:
+            cand.delete()
+        self.channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def wait_ready(self, timeout=30):
+        "Wait for the channel to connect, returns True if it did"
+        try:
+            self.grpc.channel_ready_future(self.channel).result(timeout=timeout)
+            return True
+        except self.grpc.FutureTimeoutError:
+            return False
+
+    def call(self, rpc, request):
+        "Unary call of `rpc` (method name) with NorthboundError on failure"
+        try:
+            return getattr(self.stub, rpc)(request, timeout=self.timeout)
+        except self.grpc.RpcError as error:
+            raise _rpc_error(self.grpc, rpc, error)
+
+    def capabilities(self):
+        return self.call("GetCapabilities", self.pb2.GetCapabilitiesRequest())
+
+    def _encoding(self, encoding):
+        return self.pb2.XML if encoding == "xml" else self.pb2.JSON
+
+    def get(self, paths, datatype="all", encoding="json", with_defaults=False):
+        """
+        Streaming Get, yields a DataChunk per GetResponse as it arrives
+        (the daemon sends one per requested path.)  `datatype` is "all",
+        "config" or "state".
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        request = self.pb2.GetRequest(
+            type=getattr(self.pb2.GetRequest, datatype.upper()),
+            encoding=self._encoding(encoding),
+            with_defaults=with_defaults,
+            path=paths,
+        )
+        try:
+            for index, response in enumerate(
+                self.stub.Get(request, timeout=self.timeout)
+            ):
+                path = paths[index] if index < len(paths) else None
+                yield DataChunk(
+                    path, response.timestamp, encoding, response.data.data
+                )
+        except self.grpc.RpcError as error:
+            raise _rpc_error(self.grpc, "Get", error)
+
+    def get_tree(self, paths, datatype="all", with_defaults=False):
+        "Get, with all JSON chunks merged into one dict"
+        tree = {}
+        for chunk in self.get(paths, datatype, "json", with_defaults):
+            if chunk.tree:
+                merge_json(tree, chunk.tree)
+        return tree
+
+    def execute(self, path, inputs=None):
+        request = self.pb2.ExecuteRequest(path=path)
+        for ipath, value in (inputs or {}).items():
+            request.input.add(path=ipath, value=value)
+        response = self.call("Execute", request)
+        return dict((pv.path, pv.value) for pv in response.output)
+
+    def candidate(self):
+        "A Candidate, reusing one released earlier if possible"
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        response = self.call("CreateCandidate", self.pb2.CreateCandidateRequest())
+        return Candidate(self, response.candidate_id)
+
+    def release(self, cand):
+        "Give a candidate back for reuse (it is rebased on running config)"
+        try:
+            cand.update()
+        except NorthboundError:
+            cand.delete()
+            return
+        with self._lock:
+            self._idle.append(cand)
+
+    def pipeline(self, depth=8, comment=None):
+        return CommitPipeline(self, depth, comment)
+
+    def path_values(self, values):
+        "PathValue list from a {path: value} dict or a list of paths"
+        if isinstance(values, dict):
+            items = values.items()
+        else:
+            items = ((path, "") for path in values or [])
+        return [self.pb2.PathValue(path=path, value=value) for path, value in items]
+
+
+class Candidate(object):
+    """
+    A candidate configuration on the daemon.  Used as a context manager it
+    is handed back to the client for reuse on exit instead of being
+    deleted, so a sequence of transactions doesn't pay for Create/Delete
+    (each of which copies the running configuration) every time.
+    """
+
+    def __init__(self, client, candidate_id):
+        self.client = client
+        self.id = candidate_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.client.release(self)
+
+    def edit_request(self, update=None, delete=None):
+        client = self.client
+        return client.pb2.EditCandidateRequest(
+            candidate_id=self.id,
+            update=client.path_values(update),
+            delete=client.path_values(delete),
+        )
+
+    def commit_request(self, phase="all", comment=None):
+        pb2 = self.client.pb2
+        return pb2.CommitRequest(
+            candidate_id=self.id,
+            phase=getattr(pb2.CommitRequest, phase.upper()),
+            comment=comment or "",
+        )
+
+    def edit(self, update=None, delete=None):
+        "update: {xpath: value}, delete: [xpath] (or a dict)"
+        self.client.call("EditCandidate", self.edit_request(update, delete))
+
+    def load(self, data, encoding="json", replace=False):
+        pb2 = self.client.pb2
+        request = pb2.LoadToCandidateRequest(
+            candidate_id=self.id,
+            type=pb2.LoadToCandidateRequest.REPLACE
+            if replace
+            else pb2.LoadToCandidateRequest.MERGE,
+            config=pb2.DataTree(encoding=self.client._encoding(encoding), data=data),
+        )
+        self.client.call("LoadToCandidate", request)
+
+    def commit(self, phase="all", comment=None):
+        "Returns the transaction id (0 if none was created)"
+        response = self.client.call("Commit", self.commit_request(phase, comment))
+        return response.transaction_id
+
+    def update(self):
+        pb2 = self.client.pb2
+        self.client.call(
+            "UpdateCandidate", pb2.UpdateCandidateRequest(candidate_id=self.id)
+        )
+
+    def delete(self):
+        pb2 = self.client.pb2
+        try:
+            self.client.call(
+                "DeleteCandidate", pb2.DeleteCandidateRequest(candidate_id=self.id)
+            )
+        except NorthboundError:
+            pass
+
+
+class CommitPipeline(object):
+    """
+    Pipelined EditCandidate + Commit on one candidate and one channel.
+
+    submit() sends the EditCandidate and Commit of a transaction without
+    waiting for any reply; up to `depth` transactions are in flight.  The
+    daemon handles northbound RPCs one at a time in arrival order, so a
+    commit normally contains exactly its own edit.  When a commit overtakes
+    its edit or a later edit sneaks in before it, the changes end up in a
+    neighbouring commit and the empty one is answered with ABORTED ("no
+    changes"); that is counted as coalesced, not as an error.  close()
+    waits for everything and sends a final commit so no edit is left
+    uncommitted.
+    """
+
+    def __init__(self, client, depth=8, comment=None):
+        self.client = client
+        self.depth = max(depth, 1)
+        self.comment = comment
+        self.cand = client.candidate()
+        self.slots = threading.Semaphore(self.depth)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.idle = threading.Condition(self.lock)
+        self.submitted = 0
+        self.committed = 0
+        self.coalesced = 0
+        self.errors = []
+        self.latencies = []
+        self.start = time.time()
+        self.end = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _done(self, kind, started, future):
+        grpc = self.client.grpc
+        error = future.exception()
+        with self.lock:
+            if kind == "commit":
+                self.latencies.append(time.time() - started)
+                if error is None:
+                    self.committed += 1
+                elif error.code() == grpc.StatusCode.ABORTED:
+                    self.coalesced += 1
+                else:
+                    self.errors.append(str(_rpc_error(grpc, "Commit", error)))
+            elif error is not None:
+                self.errors.append(str(_rpc_error(grpc, "EditCandidate", error)))
+            self.pending -= 1
+            if not self.pending:
+                self.idle.notify_all()
+        if kind == "commit":
+            self.slots.release()
+
+    def submit(self, update=None, delete=None):
+        "Queue one transaction, blocks while `depth` are in flight"
+        self.slots.acquire()
+        stub, timeout = self.client.stub, self.client.timeout
+        started = time.time()
+        with self.lock:
+            self.pending += 2
+            self.submitted += 1
+
+        edit = stub.EditCandidate.future(
+            self.cand.edit_request(update, delete), timeout=timeout
+        )
+        edit.add_done_callback(lambda f: self._done("edit", started, f))
+        commit = stub.Commit.future(
+            self.cand.commit_request("all", self.comment), timeout=timeout
+        )
+        commit.add_done_callback(lambda f: self._done("commit", started, f))
+
+    def flush(self):
+        "Wait for all transactions in flight"
+        with self.lock:
+            while self.pending:
+                self.idle.wait()
+
+    def close(self):
+        self.flush()
+        try:
+            self.cand.commit(comment=self.comment)
+            self.committed += 1
+        except NorthboundError as error:
+            if error.code != "ABORTED":
+                self.errors.append(str(error))
+        self.end = time.time()
+        self.client.release(self.cand)
+
+    def stats(self):
+        end = self.end or time.time()
+        elapsed = end - self.start
+        lat = sorted(self.latencies)
+        result = {
+            "depth": self.depth,
+            "transactions": self.submitted,
+            "commits": self.committed,
+            "coalesced": self.coalesced,
+            "errors": len(self.errors),
+            "elapsed": elapsed,
+            "rate": self.submitted / elapsed if elapsed > 0 else None,
+        }
+        if lat:
+            result["latency"] = {
+                "min": lat[0],
+                "p50": lat[len(lat) // 2],
+                "p99": lat[min(len(lat) - 1, len(lat) * 99 // 100)],
+                "max": lat[-1],
+            }
+        return result
+
+
+#
+# Benchmarks
+#
+STATIC_ROUTE_XPATH = (
+    "/frr-routing:routing/control-plane-protocols/"
+    "control-plane-protocol[type='frr-staticd:staticd'][name='staticd'][vrf='default']/"
+    "frr-staticd:staticd/route-list[prefix='{prefix}'][afi-safi='frr-routing:ipv4-unicast']"
+)
+STATIC_NEXTHOP_XPATH = (
+    "/path-list[table-id='0'][distance='1']/frr-nexthops/"
+    "nexthop[nh-type='ip4'][vrf='default'][gateway='{gateway}'][interface='(null)']"
+)
+
+
+def static_route_xpaths(count, gateway, start="10.0.0.0"):
+    "(route xpath, nexthop xpath) for `count` staticd /32 routes"
+    base = sum(int(octet) << (24 - 8 * i) for i, octet in enumerate(start.split(".")))
+    for i in range(count):
+        addr = base + i
+        prefix = "{}.{}.{}.{}/32".format(
+            addr >> 24, (addr >> 16) & 255, (addr >> 8) & 255, addr & 255
+        )
+        route = STATIC_ROUTE_XPATH.format(prefix=prefix)
+        yield route, route + STATIC_NEXTHOP_XPATH.format(gateway=gateway)
+
+
+def bench_commit(client, count, depth, gateway, start="10.0.0.0"):
+    """
+    Add `count` static routes with one commit each, then remove them again,
+    with `depth` transactions in flight (1 = strictly sequential).
+    """
+    routes = list(static_route_xpaths(count, gateway, start))
+
+    with client.pipeline(depth, comment="bench-commit add") as pipe:
+        for _, nexthop in routes:
+            pipe.submit(update={nexthop: ""})
+    add = pipe.stats()
+    add["error_messages"] = pipe.errors[:10]
+
+    with client.pipeline(depth, comment="bench-commit del") as pipe:
+        for route, _ in routes:
+            pipe.submit(delete=[route])
+    remove = pipe.stats()
+    remove["error_messages"] = pipe.errors[:10]
+
+    return {"add": add, "delete": remove}
+
+
+def bench_get(client, paths, datatype="state", encoding="json", decode=True):
+    "Time a streaming Get of `paths`, decoding each chunk as it arrives"
+    start = time.time()
+    first = None
+    nbytes = 0
+    chunks = []
+    for chunk in client.get(paths, datatype, encoding):
+        now = time.time()
+        if first is None:
+            first = now - start
+        nbytes += len(chunk)
+        entry = {"path": chunk.path, "bytes": len(chunk), "received": now - start}
+        if decode:
+            chunk.tree
+            entry["decoded"] = time.time() - start
+        chunks.append(entry)
+    elapsed = time.time() - start
+    return {
+        "paths": len(paths),
+        "bytes": nbytes,
+        "elapsed": elapsed,
+        "first_chunk": first,
+        "throughput": nbytes / elapsed if elapsed > 0 else None,
+        "chunks": chunks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FRR northbound gRPC client")
+    parser.add_argument(
+        "--target", default="localhost:50051", help="daemon gRPC address:port"
+    )
+    parser.add_argument("--timeout", type=float, default=60, help="RPC timeout")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("capabilities", help="show capabilities")
+
+    p = sub.add_parser("get", help="streaming Get")
+    p.add_argument("path", nargs="+")
+    p.add_argument("--type", default="all", choices=("all", "config", "state"))
+    p.add_argument("--encoding", default="json", choices=("json", "xml"))
+
+    p = sub.add_parser("bench-commit", help="measure commits/sec (staticd)")
+    p.add_argument("--count", type=int, default=1000, help="transactions")
+    p.add_argument(
+        "--depth", type=int, action="append", help="transactions in flight"
+    )
+    p.add_argument("--gateway", default="192.168.1.2", help="static nexthop")
+    p.add_argument("--start", default="10.0.0.0", help="first prefix")
+
+    p = sub.add_parser("bench-get", help="measure Get streaming throughput")
+    p.add_argument("path", nargs="+")
+    p.add_argument("--type", default="state", choices=("all", "config", "state"))
+    p.add_argument("--encoding", default="json", choices=("json", "xml"))
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--no-decode", action="store_true", help="don't decode chunks")
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error("no command given")
+
+    client = NorthboundClient(args.target, args.timeout)
+    if not client.wait_ready(args.timeout):
+        sys.stderr.write("cannot connect to {}\n".format(args.target))
+        sys.exit(1)
+
+    if args.command == "capabilities":
+        caps = client.capabilities()
+        result = {
+            "frr_version": caps.frr_version,
+            "rollback_support": caps.rollback_support,
+            "modules": [m.name for m in caps.supported_modules],
+        }
+    elif args.command == "get":
+        for chunk in client.get(args.path, args.type, args.encoding):
+            sys.stdout.write(chunk.data)
+            sys.stdout.write("\n")
+        client.close()
+        return
+    elif args.command == "bench-commit":
+        result = [
+            bench_commit(client, args.count, depth, args.gateway, args.start)
+            for depth in args.depth or [1, 8]
+        ]
+    elif args.command == "bench-get":
+        result = [
+            bench_get(client, args.path, args.type, args.encoding, not args.no_decode)
+            for _ in range(args.repeat)
+        ]
+
+    client.close()
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
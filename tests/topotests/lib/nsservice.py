@@ -0,0 +1,264 @@
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+Helper services running inside a router namespace.
+
+Tools like lib/fpm.py or lib/bgpspeaker.py are both a service, started as
+a script in the namespace of a router (or host), and the library tests use
+to query it.  The two sides talk over a UNIX socket in the router's log
+directory, one JSON request per line ({"op": ..., ...}) answered by one
+JSON line.  This file has the parts they share:
+
+* NsService: asyncio service answering requests with its query() method
+  until it gets a "stop" request.
+* NsServiceClient: starts the service script with popen() and sends it
+  requests.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+def distribution(values):
+    "count, min, max, avg, p50 and p99 of `values`"
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    count = len(values)
+    return {
+        "count": count,
+        "min": values[0],
+        "max": values[-1],
+        "avg": sum(values) / float(count),
+        "p50": values[count // 2],
+        "p99": values[min(count - 1, (count * 99) // 100)],
+    }
+
+
+def decode_request(line):
+    "Request dict from one request line, raises ValueError if it isn't one"
+    # UnicodeDecodeError is a ValueError as well
+    req = json.loads(line.decode("utf-8"))
+    if not isinstance(req, dict):
+        raise ValueError("request is not an object")
+    return req
+
+
+def current_task():
+    # asyncio.current_task() is python 3.7+
+    if hasattr(asyncio, "current_task"):
+        return asyncio.current_task()
+    return asyncio.Task.current_task()
+
+
+#
+# Service side (runs inside the router namespace)
+#
+class NsService(object):
+    """
+    Answers requests on the UNIX socket `sockpath`.  Subclasses implement
+    query() and optionally the setup(), started() and teardown() steps of
+    run().  `query_errors` raised by query() are answered as {"error": ...}.
+    """
+
+    query_errors = ()
+
+    def __init__(self, sockpath):
+        self.sockpath = sockpath
+        self.changed = None
+        self.stopped = None
+
+    def _notify(self):
+        # wake up all wait requests, they re-check their condition
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for(self, satisfied, result, timeout, changed=None, abort=None):
+        """
+        Wait until satisfied() or `timeout` seconds passed (or abort()),
+        re-checking whenever the event returned by changed() (default:
+        self.changed) is set.  Returns result() with "timeout" added.
+        """
+        if changed is None:
+            changed = lambda: self.changed
+        deadline = time.time() + timeout
+        while not satisfied():
+            remaining = deadline - time.time()
+            if remaining <= 0 or (abort is not None and abort()):
+                reply = result()
+                reply["timeout"] = True
+                return reply
+            try:
+                await asyncio.wait_for(changed().wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        reply = result()
+        reply["timeout"] = False
+        return reply
+
+    async def query(self, req):
+        "Answer request `req`, the result must be JSON serializable"
+        return None
+
+    async def setup(self):
+        "Called before the query socket is opened"
+
+    async def started(self):
+        "Called once the query socket accepts connections"
+
+    async def teardown(self):
+        "Called after the query socket was closed"
+
+    async def handle_query(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = decode_request(line)
+                except ValueError as error:
+                    result = {"error": "invalid request: {}".format(error)}
+                else:
+                    if req.get("op") == "stop":
+                        writer.write(b"true\n")
+                        await writer.drain()
+                        self.stopped.set()
+                        break
+                    try:
+                        result = await self.query(req)
+                    except self.query_errors as error:
+                        result = {"error": str(error)}
+                writer.write(json.dumps(result).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def run(self):
+        self.changed = asyncio.Event()
+        self.stopped = asyncio.Event()
+        try:
+            os.unlink(self.sockpath)
+        except OSError:
+            pass
+
+        await self.setup()
+        query_server = await asyncio.start_unix_server(
+            self.handle_query, self.sockpath
+        )
+        await self.started()
+        await self.stopped.wait()
+
+        query_server.close()
+        await query_server.wait_closed()
+        await self.teardown()
+        os.unlink(self.sockpath)
+
+
+def run_service(service):
+    "Run `service` until it is stopped, for the main() of service scripts"
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(service.run())
+    loop.close()
+
+
+#
+# Test side API
+#
+def service_sockpath(tgen, name, filename):
+    "Query socket `filename` in the log directory of router or host `name`"
+    gear = tgen.gears[name]
+    if hasattr(gear, "logdir"):
+        rdir = os.path.join(gear.logdir, name)
+    else:
+        rdir = os.path.join("/tmp/topotests", tgen.modname, name)
+        if not os.path.isdir(rdir):
+            os.makedirs(rdir)
+    return os.path.join(rdir, filename)
+
+
+class NsServiceClient(object):
+    """
+    Runs a service script in the namespace of `router` (a router or host
+    name) and sends it requests.  `description` names the service in
+    errors.
+    """
+
+    description = "service"
+
+    def __init__(self, tgen, router, sockpath):
+        self.tgen = tgen
+        self.router = router
+        self.sockpath = sockpath
+        self.proc = None
+        self.sock = None
+        self.buf = b""
+
+    def start_service(self, script, args=(), timeout=10):
+        """
+        Start `script` with the socket path and `args` as arguments, returns
+        True once it accepts connections on the query socket
+        """
+        cmd = [sys.executable, os.path.abspath(script), self.sockpath]
+        cmd += [str(arg) for arg in args]
+        self.proc = self.tgen.gears[self.router].popen(cmd)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                return False
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0)
+            try:
+                self.sock.connect(self.sockpath)
+                return True
+            except (OSError, socket.error):
+                self.sock.close()
+                self.sock = None
+                time.sleep(0.1)
+        return False
+
+    def _request(self, op, **kwargs):
+        kwargs["op"] = op
+        self.sock.sendall(json.dumps(kwargs).encode("utf-8") + b"\n")
+        while b"\n" not in self.buf:
+            data = self.sock.recv(1 << 20)
+            if not data:
+                raise EOFError("{} on {} exited".format(self.description, self.router))
+            self.buf += data
+        line, self.buf = self.buf.split(b"\n", 1)
+        return json.loads(line.decode("utf-8"))
+
+    def stop(self):
+        "Stop the service"
+        if self.sock is not None:
+            try:
+                self._request("stop")
+            except (EOFError, OSError, socket.error):
+                pass
+            self.sock.close()
+            self.sock = None
+        if self.proc is not None:
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
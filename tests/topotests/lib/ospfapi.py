@@ -0,0 +1,987 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+asyncio client for ospfd's opaque LSA API (ospfd/ospf_api.h), the Python
+counterpart of ospfclient/ospf_apiclient.c.
+
+The protocol uses two TCP connections: requests and replies go over the
+"sync" connection the client opens to ospfd (port 2607), notifications
+come over the "async" connection ospfd opens back to the client, on the
+client's sync port + 1.  Unlike ospf_apiclient.c, requests are not
+answered one at a time: every request gets a future resolved by the reply
+with the same sequence number, so originations and deletions can be
+pipelined.  LSA update/delete notifications are applied to an indexed
+mirror of ospfd's LSDB (Lsdb).
+
+    client = OspfApiClient()
+    await client.connect("127.0.0.1")
+    await client.register_opaque_type(OSPF_OPAQUE_AREA_LSA, 240)
+    await client.wait_ready(OSPF_OPAQUE_AREA_LSA, 240)
+    await client.sync_lsdb()
+    await client.originate(OSPF_OPAQUE_AREA_LSA, 240, 1, b"data", area="0.0.0.0")
+
+ospfd must run with "-a" (--apiserver) and "capability opaque".
+
+Like lib/fpm.py, this file is also a service started inside a router
+namespace that keeps a client connected and answers queries from the test
+over a UNIX socket; OspfApiAgent is the test side of it:
+
+    agent = OspfApiAgent(tgen, "r1")
+    agent.start()
+    agent.register(OSPF_OPAQUE_AREA_LSA, 240)
+    result = agent.originate(OSPF_OPAQUE_AREA_LSA, 240, count=1000, depth=32)
+    agent.stop()
+"""
+
+import argparse
+import asyncio
+import socket
+import struct
+import time
+
+try:
+    from lib.nsservice import (
+        NsService,
+        NsServiceClient,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+except ImportError:
+    # started as a script from the router namespace
+    from nsservice import (
+        NsService,
+        NsServiceClient,
+        distribution,
+        run_service,
+        service_sockpath,
+    )
+
+OSPF_API_SYNC_PORT = 2607
+OSPF_API_VERSION = 1
+
+MSG_REGISTER_OPAQUETYPE = 1
+MSG_UNREGISTER_OPAQUETYPE = 2
+MSG_REGISTER_EVENT = 3
+MSG_SYNC_LSDB = 4
+MSG_ORIGINATE_REQUEST = 5
+MSG_DELETE_REQUEST = 6
+MSG_REPLY = 10
+MSG_READY_NOTIFY = 11
+MSG_LSA_UPDATE_NOTIFY = 12
+MSG_LSA_DELETE_NOTIFY = 13
+MSG_NEW_IF = 14
+MSG_DEL_IF = 15
+MSG_ISM_CHANGE = 16
+MSG_NSM_CHANGE = 17
+
+OSPF_OPAQUE_LINK_LSA = 9
+OSPF_OPAQUE_AREA_LSA = 10
+OSPF_OPAQUE_AS_LSA = 11
+
+# lsa_filter_type origin
+NON_SELF_ORIGINATED = 0
+SELF_ORIGINATED = 1
+ANY_ORIGIN = 2
+
+API_ERRORS = {
+    0: "OK",
+    -1: "no such interface",
+    -2: "no such area",
+    -3: "no such LSA",
+    -4: "illegal LSA type",
+    -5: "opaque type in use",
+    -6: "opaque type not registered",
+    -7: "not ready",
+    -8: "no memory",
+    -9: "error",
+    -10: "undefined",
+}
+
+MIN_SEQ = 1
+MAX_SEQ = 2147483647
+
+API_HDR = struct.Struct("!BBHI")
+LSA_HDR = struct.Struct("!HBB4s4sIHH")
+OSPF_MAX_LSA_SIZE = 1500
+
+
+class OspfApiError(Exception):
+    "A request was answered with an error code"
+
+    def __init__(self, errcode, request=None):
+        self.errcode = errcode
+        self.request = request
+        super(OspfApiError, self).__init__(
+            "{}: {} ({})".format(
+                request or "request", API_ERRORS.get(errcode, "unknown"), errcode
+            )
+        )
+
+
+#
+# Encoding / decoding
+#
+def _ip(addr):
+    return socket.inet_aton(addr or "0.0.0.0")
+
+
+def _str(raw):
+    return socket.inet_ntoa(raw)
+
+
+def opaque_lsid(opaque_type, opaque_id):
+    "Link state ID of an opaque LSA, as SET_OPAQUE_LSID()"
+    return _str(struct.pack("!I", (opaque_type << 24) | (opaque_id & 0xFFFFFF)))
+
+
+def encode_msg(msgtype, seq, body=b""):
+    return API_HDR.pack(OSPF_API_VERSION, msgtype, len(body), seq) + body
+
+
+def encode_register_opaque_type(lsa_type, opaque_type):
+    return struct.pack("!BBxx", lsa_type, opaque_type)
+
+
+def encode_filter(typemask=0xFFFF, origin=ANY_ORIGIN, areas=()):
+    "lsa_filter_type for MSG_REGISTER_EVENT and MSG_SYNC_LSDB"
+    body = struct.pack("!HBB", typemask, origin, len(areas))
+    return body + b"".join(_ip(area) for area in areas)
+
+
+def encode_originate(lsa_type, opaque_type, opaque_id, data, area=None, ifaddr=None):
+    """
+    msg_originate_request, the LSA header is filled in the same way as
+    ospf_apiclient_lsa_originate() does, ospfd sets the rest.
+    """
+    if LSA_HDR.size + len(data) > OSPF_MAX_LSA_SIZE:
+        raise ValueError("LSA too large: {} bytes".format(LSA_HDR.size + len(data)))
+    lsid = struct.pack("!I", (opaque_type << 24) | (opaque_id & 0xFFFFFF))
+    header = LSA_HDR.pack(
+        0, 0, lsa_type, lsid, b"\0" * 4, 0, 0, LSA_HDR.size + len(data)
+    )
+    return _ip(ifaddr) + _ip(area) + header + data
+
+
+def encode_delete(lsa_type, opaque_type, opaque_id, area=None):
+    return _ip(area) + struct.pack("!BBxxI", lsa_type, opaque_type, opaque_id)
+
+
+def decode_lsa_header(data, pos=0):
+    age, options, lsa_type, lsid, adv, seqnum, checksum, length = LSA_HDR.unpack_from(
+        data, pos
+    )
+    return {
+        "age": age,
+        "options": options,
+        "type": lsa_type,
+        "id": _str(lsid),
+        "adv_router": _str(adv),
+        "seq": seqnum,
+        "checksum": checksum,
+        "length": length,
+    }
+
+
+def decode_notify(msgtype, body):
+    """
+    Decode an async channel message into a dict with "msg" set to the
+    message name, returns None for unknown messages.
+    """
+    if msgtype == MSG_READY_NOTIFY:
+        lsa_type, opaque_type, addr = struct.unpack_from("!BBxx4s", body)
+        return {
+            "msg": "ready",
+            "lsa_type": lsa_type,
+            "opaque_type": opaque_type,
+            "addr": _str(addr),
+        }
+    if msgtype in (MSG_LSA_UPDATE_NOTIFY, MSG_LSA_DELETE_NOTIFY):
+        ifaddr, area, is_self = struct.unpack_from("!4s4sBxxx", body)
+        lsa = decode_lsa_header(body, 12)
+        lsa["ifaddr"] = _str(ifaddr)
+        lsa["area"] = _str(area)
+        lsa["self"] = bool(is_self)
+        lsa["data"] = body[12 + LSA_HDR.size : 12 + lsa["length"]]
+        lsa["msg"] = "update" if msgtype == MSG_LSA_UPDATE_NOTIFY else "delete"
+        return lsa
+    if msgtype == MSG_NEW_IF:
+        ifaddr, area = struct.unpack_from("!4s4s", body)
+        return {"msg": "new_if", "ifaddr": _str(ifaddr), "area": _str(area)}
+    if msgtype == MSG_DEL_IF:
+        return {"msg": "del_if", "ifaddr": _str(body[:4])}
+    if msgtype == MSG_ISM_CHANGE:
+        ifaddr, area, status = struct.unpack_from("!4s4sB", body)
+        return {
+            "msg": "ism_change",
+            "ifaddr": _str(ifaddr),
+            "area": _str(area),
+            "status": status,
+        }
+    if msgtype == MSG_NSM_CHANGE:
+        ifaddr, nbraddr, router_id, status = struct.unpack_from("!4s4s4sB", body)
+        return {
+            "msg": "nsm_change",
+            "ifaddr": _str(ifaddr),
+            "nbraddr": _str(nbraddr),
+            "router_id": _str(router_id),
+            "status": status,
+        }
+    return None
+
+
+#
+# LSDB mirror
+#
+class Lsdb(object):
+    """
+    In-memory copy of ospfd's LSDB, fed by LSA update/delete notifications.
+
+    LSAs are keyed by (area, type, id, adv_router) and additionally indexed
+    by type, advertising router and (type, opaque type) so find() does not
+    need to walk the whole database.  AS-scoped LSAs have area "0.0.0.0".
+    For every key the time the current instance arrived is kept and, for
+    keys that appeared or disappeared since mark(), the time they did.
+    """
+
+    def __init__(self):
+        self.lsas = {}
+        self.by_type = {}
+        self.by_adv = {}
+        self.by_opaque = {}
+        self.mark()
+
+    def mark(self):
+        self.t_mark = time.time()
+        self.added = {}
+        self.removed = {}
+        self.counters = {"updates": 0, "deletes": 0}
+
+    @staticmethod
+    def key(lsa):
+        area = lsa["area"] if lsa["type"] != OSPF_OPAQUE_AS_LSA else "0.0.0.0"
+        return (area, lsa["type"], lsa["id"], lsa["adv_router"])
+
+    @staticmethod
+    def _opaque_key(lsa_type, lsid):
+        if lsa_type not in (
+            OSPF_OPAQUE_LINK_LSA,
+            OSPF_OPAQUE_AREA_LSA,
+            OSPF_OPAQUE_AS_LSA,
+        ):
+            return None
+        return (lsa_type, int(lsid.split(".")[0]))
+
+    def _index(self, key, add):
+        area, lsa_type, lsid, adv = key
+        indexes = [(self.by_type, lsa_type), (self.by_adv, adv)]
+        opaque = self._opaque_key(lsa_type, lsid)
+        if opaque is not None:
+            indexes.append((self.by_opaque, opaque))
+        for index, ikey in indexes:
+            if add:
+                index.setdefault(ikey, set()).add(key)
+            else:
+                keys = index.get(ikey)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[ikey]
+
+    def update(self, lsa, now):
+        key = self.key(lsa)
+        lsa["time"] = now
+        if key not in self.lsas:
+            self._index(key, True)
+            self.added[key] = now
+            self.removed.pop(key, None)
+        self.lsas[key] = lsa
+        self.counters["updates"] += 1
+        return key
+
+    def delete(self, lsa, now):
+        key = self.key(lsa)
+        if self.lsas.pop(key, None) is not None:
+            self._index(key, False)
+            self.removed[key] = now
+            self.added.pop(key, None)
+        self.counters["deletes"] += 1
+        return key
+
+    def find(self, lsa_type=None, adv_router=None, opaque_type=None, area=None):
+        "Keys of all LSAs matching the given attributes"
+        candidates = []
+        if lsa_type is not None and opaque_type is not None:
+            candidates.append(self.by_opaque.get((lsa_type, opaque_type), set()))
+        elif lsa_type is not None:
+            candidates.append(self.by_type.get(lsa_type, set()))
+        if adv_router is not None:
+            candidates.append(self.by_adv.get(adv_router, set()))
+        if not candidates:
+            keys = set(self.lsas)
+        else:
+            candidates.sort(key=len)
+            keys = set(candidates[0])
+            for other in candidates[1:]:
+                keys &= other
+        if opaque_type is not None and lsa_type is None:
+            keys = set(
+                k for k in keys if self._opaque_key(k[1], k[2]) == (k[1], opaque_type)
+            )
+        if area is not None:
+            keys = set(k for k in keys if k[0] == area)
+        return keys
+
+    def timing(self, keys, table):
+        "first/last arrival (relative to mark()) of `keys` found in `table`"
+        times = [table[k] for k in keys if k in table]
+        if not times:
+            return {"count": 0}
+        return {
+            "count": len(times),
+            "first": min(times) - self.t_mark,
+            "last": max(times) - self.t_mark,
+        }
+
+    def stats(self):
+        result = dict(self.counters)
+        result["lsas"] = len(self.lsas)
+        result["types"] = dict(
+            (str(lsa_type), len(keys)) for lsa_type, keys in self.by_type.items()
+        )
+        result["mark"] = self.t_mark
+        return result
+
+
+#
+# Client
+#
+class OspfApiClient(object):
+    """
+    asyncio OSPF API client.
+
+    * `lsdb`: the LSDB mirror, only populated after register_event() and
+      sync_lsdb()
+    * `callback`: called with every decoded notification (see
+      decode_notify()) after the mirror has been updated
+    """
+
+    def __init__(self, callback=None):
+        self.lsdb = Lsdb()
+        self.callback = callback
+        self.ready = set()
+        self.interfaces = {}
+        self.neighbors = {}
+        self.seq = MIN_SEQ
+        self.pending = {}
+        self.sync_reader = None
+        self.sync_writer = None
+        self.async_writer = None
+        self.tasks = []
+        self.changed = None
+        self.closed = False
+
+    def _notify(self):
+        # wake up waiters, they re-check their condition
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def connect(
+        self, server="127.0.0.1", port=OSPF_API_SYNC_PORT, local_port=None, timeout=10
+    ):
+        """
+        Connect to ospfd.  As with ospf_apiclient_connect(), the sync
+        connection is bound to `local_port` (default: `port`) and ospfd
+        connects back to `local_port` + 1 for notifications.
+        """
+        loop = asyncio.get_event_loop()
+        self.changed = asyncio.Event()
+        local_port = port if local_port is None else local_port
+        accepted = loop.create_future()
+
+        def on_async(reader, writer):
+            if accepted.done():
+                writer.close()
+                return
+            accepted.set_result((reader, writer))
+
+        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            lsock.bind(("0.0.0.0", local_port + 1))
+            server_async = await asyncio.start_server(on_async, sock=lsock)
+        except BaseException:
+            lsock.close()
+            raise
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("0.0.0.0", local_port))
+            sock.setblocking(False)
+            await asyncio.wait_for(loop.sock_connect(sock, (server, port)), timeout)
+            self.sync_reader, self.sync_writer = await asyncio.open_connection(
+                sock=sock
+            )
+            async_reader, self.async_writer = await asyncio.wait_for(
+                accepted, timeout
+            )
+        except BaseException:
+            sock.close()
+            raise
+        finally:
+            server_async.close()
+            await server_async.wait_closed()
+
+        self.tasks = [
+            asyncio.ensure_future(self._read_sync()),
+            asyncio.ensure_future(self._read_async(async_reader)),
+        ]
+
+    async def close(self):
+        self.closed = True
+        for writer in (self.sync_writer, self.async_writer):
+            if writer is not None:
+                writer.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self._fail_pending(ConnectionError("OSPF API connection closed"))
+
+    def _fail_pending(self, error):
+        pending, self.pending = self.pending, {}
+        for future, _ in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    @staticmethod
+    async def _read_msg(reader):
+        hdr = await reader.readexactly(API_HDR.size)
+        version, msgtype, msglen, seq = API_HDR.unpack(hdr)
+        if version != OSPF_API_VERSION:
+            raise ValueError("bad OSPF API version {}".format(version))
+        body = await reader.readexactly(msglen)
+        return msgtype, seq, body
+
+    async def _read_sync(self):
+        try:
+            while True:
+                msgtype, seq, body = await self._read_msg(self.sync_reader)
+                if msgtype != MSG_REPLY:
+                    continue
+                entry = self.pending.pop(seq, None)
+                if entry is None:
+                    continue
+                future, _ = entry
+                if not future.done():
+                    future.set_result(struct.unpack_from("!b", body)[0])
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as error:
+            self._fail_pending(ConnectionError("sync channel: {}".format(error)))
+        finally:
+            self._notify()
+
+    async def _read_async(self, reader):
+        try:
+            while True:
+                msgtype, _, body = await self._read_msg(reader)
+                self.handle_notify(decode_notify(msgtype, body), time.time())
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._notify()
+
+    def handle_notify(self, event, now):
+        if event is None:
+            return
+        msg = event["msg"]
+        if msg == "update":
+            self.lsdb.update(event, now)
+        elif msg == "delete":
+            self.lsdb.delete(event, now)
+        elif msg == "ready":
+            self.ready.add((event["lsa_type"], event["opaque_type"], event["addr"]))
+        elif msg in ("new_if", "ism_change"):
+            self.interfaces[event["ifaddr"]] = event
+        elif msg == "del_if":
+            self.interfaces.pop(event["ifaddr"], None)
+        elif msg == "nsm_change":
+            self.neighbors[event["router_id"]] = event
+        if self.callback is not None:
+            self.callback(event)
+        self._notify()
+
+    def _next_seq(self):
+        seq = self.seq
+        self.seq = MIN_SEQ if seq >= MAX_SEQ else seq + 1
+        return seq
+
+    def send(self, msgtype, body, name=None):
+        """
+        Send a request without waiting, returns a future for its error
+        code.  Call drain() now and then when sending many.
+        """
+        if self.closed or self.sync_writer is None:
+            raise ConnectionError("OSPF API client not connected")
+        seq = self._next_seq()
+        future = asyncio.get_event_loop().create_future()
+        self.pending[seq] = (future, name)
+        self.sync_writer.write(encode_msg(msgtype, seq, body))
+        return future
+
+    async def drain(self):
+        await self.sync_writer.drain()
+
+    async def request(self, msgtype, body, name=None, timeout=30):
+        "Send a request and wait for its reply, raises OspfApiError on errors"
+        future = self.send(msgtype, body, name)
+        await self.drain()
+        errcode = await asyncio.wait_for(future, timeout)
+        if errcode != 0:
+            raise OspfApiError(errcode, name)
+
+    async def register_opaque_type(self, lsa_type, opaque_type):
+        await self.request(
+            MSG_REGISTER_OPAQUETYPE,
+            encode_register_opaque_type(lsa_type, opaque_type),
+            "register opaque type {}/{}".format(lsa_type, opaque_type),
+        )
+
+    async def unregister_opaque_type(self, lsa_type, opaque_type):
+        await self.request(
+            MSG_UNREGISTER_OPAQUETYPE,
+            encode_register_opaque_type(lsa_type, opaque_type),
+            "unregister opaque type {}/{}".format(lsa_type, opaque_type),
+        )
+
+    async def register_event(self, typemask=0xFFFF, origin=ANY_ORIGIN, areas=()):
+        "Subscribe to LSA update/delete notifications"
+        await self.request(
+            MSG_REGISTER_EVENT, encode_filter(typemask, origin, areas), "register event"
+        )
+
+    async def sync_lsdb(self, typemask=0xFFFF, origin=ANY_ORIGIN, areas=()):
+        """
+        Have ospfd send its current LSDB.  The LSAs arrive on the async
+        connection before the reply is sent, but may still be in flight
+        when this returns.
+        """
+        await self.request(
+            MSG_SYNC_LSDB, encode_filter(typemask, origin, areas), "sync LSDB"
+        )
+
+    async def wait(self, predicate, timeout=30):
+        "Wait until predicate() is true, returns False on timeout"
+        deadline = time.time() + timeout
+        while not predicate():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    def is_ready(self, lsa_type, opaque_type, addr=None):
+        return any(
+            r[0] == lsa_type and r[1] == opaque_type and addr in (None, r[2])
+            for r in self.ready
+        )
+
+    async def wait_ready(self, lsa_type, opaque_type, addr=None, timeout=30):
+        """
+        Wait for ospfd to report that `opaque_type` LSAs can be originated
+        (in area/on interface `addr`, any if None), returns True if it did.
+        """
+        return await self.wait(
+            lambda: self.is_ready(lsa_type, opaque_type, addr), timeout
+        )
+
+    def send_originate(
+        self, lsa_type, opaque_type, opaque_id, data, area=None, ifaddr=None
+    ):
+        return self.send(
+            MSG_ORIGINATE_REQUEST,
+            encode_originate(lsa_type, opaque_type, opaque_id, data, area, ifaddr),
+            "originate {}/{}/{}".format(lsa_type, opaque_type, opaque_id),
+        )
+
+    def send_delete(self, lsa_type, opaque_type, opaque_id, area=None):
+        return self.send(
+            MSG_DELETE_REQUEST,
+            encode_delete(lsa_type, opaque_type, opaque_id, area),
+            "delete {}/{}/{}".format(lsa_type, opaque_type, opaque_id),
+        )
+
+    async def originate(
+        self, lsa_type, opaque_type, opaque_id, data, area=None, ifaddr=None
+    ):
+        "Originate (or refresh) an opaque LSA"
+        future = self.send_originate(
+            lsa_type, opaque_type, opaque_id, data, area, ifaddr
+        )
+        await self.drain()
+        errcode = await future
+        if errcode != 0:
+            raise OspfApiError(errcode, "originate")
+
+    async def delete(self, lsa_type, opaque_type, opaque_id, area=None):
+        "Flush an opaque LSA originated by this client"
+        future = self.send_delete(lsa_type, opaque_type, opaque_id, area)
+        await self.drain()
+        errcode = await future
+        if errcode != 0:
+            raise OspfApiError(errcode, "delete")
+
+    async def pipeline(self, requests, depth=32):
+        """
+        Send the requests produced by `requests` (callables returning the
+        future of a send_*() call) with up to `depth` replies outstanding.
+        Returns counts, errors, the request rate and reply latencies.
+        """
+        window = asyncio.Semaphore(depth)
+        latencies = []
+        errors = {}
+        futures = []
+
+        def done(t_sent, future):
+            window.release()
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                errors["connection"] = errors.get("connection", 0) + 1
+                return
+            latencies.append(time.time() - t_sent)
+            errcode = future.result()
+            if errcode != 0:
+                name = API_ERRORS.get(errcode, str(errcode))
+                errors[name] = errors.get(name, 0) + 1
+
+        t_start = time.time()
+        for make_request in requests:
+            await window.acquire()
+            t_sent = time.time()
+            future = make_request()
+            future.add_done_callback(lambda f, t=t_sent: done(t, f))
+            futures.append(future)
+            # only wait for the socket when the kernel buffer is full
+            if self.sync_writer.transport.get_write_buffer_size() > 65536:
+                await self.drain()
+        await self.drain()
+        await asyncio.gather(*futures, return_exceptions=True)
+        elapsed = time.time() - t_start
+
+        return {
+            "requests": len(futures),
+            "depth": depth,
+            "start": t_start,
+            "elapsed": elapsed,
+            "rate": len(futures) / elapsed if elapsed > 0 else None,
+            "errors": errors,
+            "latency": distribution(latencies),
+        }
+
+
+#
+# Service (runs inside the router namespace)
+#
+class OspfApiService(NsService):
+    """
+    Keeps an OSPF API client connected, answers queries on a UNIX socket.
+    Gives ospfd `timeout` seconds to accept the connection.
+    """
+
+    query_errors = (ConnectionError,)
+
+    def __init__(
+        self,
+        sockpath,
+        server="127.0.0.1",
+        port=OSPF_API_SYNC_PORT,
+        local_port=None,
+        timeout=30,
+    ):
+        super(OspfApiService, self).__init__(sockpath)
+        self.server = server
+        self.port = port
+        self.local_port = local_port
+        self.timeout = timeout
+        self.client = OspfApiClient()
+        self.connected = False
+        self.error = None
+
+    async def connect(self, timeout):
+        # ospfd may still be starting up
+        deadline = time.time() + timeout
+        while True:
+            try:
+                await self.client.connect(self.server, self.port, self.local_port)
+                break
+            except (OSError, asyncio.TimeoutError) as error:
+                if time.time() > deadline:
+                    self.error = "connect: {}".format(error)
+                    return
+                await asyncio.sleep(0.5)
+        await self.client.register_event()
+        await self.client.sync_lsdb()
+        self.connected = True
+
+    def _keys(self, req):
+        return self.client.lsdb.find(
+            req.get("lsa_type"),
+            req.get("adv_router"),
+            req.get("opaque_type"),
+            req.get("area"),
+        )
+
+    def _lsdb_result(self, req):
+        lsdb = self.client.lsdb
+        keys = self._keys(req)
+        result = lsdb.stats()
+        result["count"] = len(keys)
+        result["added"] = lsdb.timing(keys, lsdb.added)
+        result["removed"] = lsdb.timing(set(lsdb.removed), lsdb.removed)
+        return result
+
+    async def wait(self, req):
+        "Wait until exactly req['count'] LSAs match the filter"
+        count = req["count"]
+        ok = await self.client.wait(
+            lambda: len(self._keys(req)) == count, req.get("timeout", 30)
+        )
+        result = self._lsdb_result(req)
+        result["timeout"] = not ok
+        return result
+
+    def _requests(self, req, delete):
+        lsa_type = req.get("lsa_type", OSPF_OPAQUE_AREA_LSA)
+        opaque_type = req["opaque_type"]
+        area = req.get("area", "0.0.0.0")
+        ifaddr = req.get("ifaddr")
+        start = req.get("start", 1)
+        size = req.get("size", 8)
+        for opaque_id in range(start, start + req.get("count", 1)):
+            if delete:
+                yield lambda i=opaque_id: self.client.send_delete(
+                    lsa_type, opaque_type, i, area
+                )
+            else:
+                # payload is 4-byte aligned, starting with the opaque id
+                data = struct.pack("!I", opaque_id) + b"\0" * ((size + 3) // 4 * 4 - 4)
+                yield lambda i=opaque_id, d=data: self.client.send_originate(
+                    lsa_type, opaque_type, i, d, area, ifaddr
+                )
+
+    async def query(self, req):
+        op = req.get("op")
+        client = self.client
+        if op == "status":
+            return {"connected": self.connected, "error": self.error}
+        if op == "stats":
+            result = client.lsdb.stats()
+            result["connected"] = self.connected
+            result["ready"] = sorted(client.ready)
+            result["neighbors"] = len(client.neighbors)
+            return result
+        if op == "mark":
+            client.lsdb.mark()
+            return client.lsdb.t_mark
+        if op in ("register", "unregister"):
+            func = getattr(client, op + "_opaque_type")
+            try:
+                await func(req["lsa_type"], req["opaque_type"])
+            except OspfApiError as error:
+                return error.errcode
+            return 0
+        if op == "ready":
+            return await client.wait_ready(
+                req["lsa_type"],
+                req["opaque_type"],
+                req.get("addr"),
+                req.get("timeout", 30),
+            )
+        if op in ("originate", "delete"):
+            return await client.pipeline(
+                self._requests(req, op == "delete"), req.get("depth", 32)
+            )
+        if op == "wait":
+            return await self.wait(req)
+        if op == "lsdb":
+            return self._lsdb_result(req)
+        if op == "lsas":
+            return [
+                dict((k, v) for k, v in client.lsdb.lsas[key].items() if k != "data")
+                for key in sorted(self._keys(req))
+            ]
+        return None
+
+    async def started(self):
+        await self.connect(self.timeout)
+
+    async def teardown(self):
+        # ospfd flushes the LSAs this client originated when it goes away
+        await self.client.close()
+
+
+#
+# Test side API
+#
+class OspfApiAgent(NsServiceClient):
+    """
+    Controls an OSPF API client running in the namespace of `router`.
+
+    * `local_port`: sync port of the client, the async one is +1.  Not
+      ospf_apiclient.c's default (the API port itself) so the client does
+      not depend on sharing ospfd's listening port; change it to run
+      several agents on the same router.
+    """
+
+    description = "OSPF API client"
+
+    def __init__(self, tgen, router, port=OSPF_API_SYNC_PORT, local_port=2707):
+        sockpath = service_sockpath(tgen, router, "ospfapi.sock")
+        super(OspfApiAgent, self).__init__(tgen, router, sockpath)
+        self.port = port
+        self.local_port = local_port
+
+    def start(self, timeout=30):
+        "Start the client, returns True once it is connected to ospfd"
+        args = ["--port", self.port, "--timeout", timeout]
+        if self.local_port is not None:
+            args += ["--local-port", self.local_port]
+        deadline = time.time() + timeout
+        if not self.start_service(__file__, args, timeout):
+            return False
+
+        while time.time() < deadline:
+            status = self._request("status")
+            if status["connected"]:
+                return True
+            if status["error"]:
+                return False
+            time.sleep(0.2)
+        return False
+
+    def stats(self):
+        "LSDB mirror size and counters, ready opaque types, neighbors"
+        return self._request("stats")
+
+    def mark(self):
+        "Reset LSDB counters and arrival times"
+        return self._request("mark")
+
+    def register(self, lsa_type, opaque_type, timeout=30):
+        "Register an opaque type and wait until it is ready, returns True if so"
+        errcode = self._request("register", lsa_type=lsa_type, opaque_type=opaque_type)
+        if errcode != 0:
+            return False
+        return self._request(
+            "ready", lsa_type=lsa_type, opaque_type=opaque_type, timeout=timeout
+        )
+
+    def originate(
+        self,
+        lsa_type,
+        opaque_type,
+        count=1,
+        start=1,
+        depth=32,
+        size=8,
+        area="0.0.0.0",
+        ifaddr=None,
+    ):
+        """
+        Originate opaque ids `start` to `start` + `count` - 1 with up to
+        `depth` requests outstanding.  Returns requests, elapsed, rate,
+        errors (by error name), start (absolute time) and latency.
+        """
+        return self._request(
+            "originate",
+            lsa_type=lsa_type,
+            opaque_type=opaque_type,
+            count=count,
+            start=start,
+            depth=depth,
+            size=size,
+            area=area,
+            ifaddr=ifaddr,
+        )
+
+    def delete(
+        self, lsa_type, opaque_type, count=1, start=1, depth=32, area="0.0.0.0"
+    ):
+        "Flush LSAs originated with originate(), returns the same as it"
+        return self._request(
+            "delete",
+            lsa_type=lsa_type,
+            opaque_type=opaque_type,
+            count=count,
+            start=start,
+            depth=depth,
+            area=area,
+        )
+
+    def wait(self, count, timeout=30, **lsa_filter):
+        """
+        Wait until exactly `count` LSAs match `lsa_filter` (lsa_type,
+        opaque_type, adv_router, area).  Returns lsdb() with "timeout" set
+        if they didn't within `timeout` seconds.
+        """
+        lsa_filter["count"] = count
+        lsa_filter["timeout"] = timeout
+        return self._request("wait", **lsa_filter)
+
+    def lsdb(self, **lsa_filter):
+        """
+        stats() plus "count" of LSAs matching `lsa_filter` and, relative to
+        mark(), the first/last arrival time of the matching LSAs ("added")
+        and of all LSAs removed ("removed")
+        """
+        return self._request("lsdb", **lsa_filter)
+
+    def lsas(self, **lsa_filter):
+        "Headers of the LSAs matching `lsa_filter`"
+        return self._request("lsas", **lsa_filter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OSPF API client service")
+    parser.add_argument("socket", help="UNIX socket to answer queries on")
+    parser.add_argument("--server", default="127.0.0.1", help="ospfd address")
+    parser.add_argument(
+        "--port", type=int, default=OSPF_API_SYNC_PORT, help="ospfd API port"
+    )
+    parser.add_argument("--local-port", type=int, help="local sync port")
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="time to wait for ospfd"
+    )
+    args = parser.parse_args()
+
+    run_service(
+        OspfApiService(
+            args.socket, args.server, args.port, args.local_port, args.timeout
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
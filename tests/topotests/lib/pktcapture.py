@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+In-namespace packet capture service.
+
+This file is both the capture service, which is started inside a router
+namespace and reads packets from an AF_PACKET socket, and the library used
+by tests to talk to it:
+
+    capture = PacketCapture(tgen, "r1", intfs=["r1-eth0"], protocols=["pim"])
+    capture.start()
+    ...
+    assert capture.count("pim", intf="r1-eth0", direction="out") >= 3
+    intervals = capture.intervals("pim", intf="r1-eth0", direction="out")
+    capture.stop()
+
+Protocol filters are names from PROTOCOLS or expressions of the form
+"udp port N", "tcp port N", "ip proto N" and "ether proto N".  The IP
+protocol/ethertype part of the filters is compiled to a classic BPF program
+attached to the socket, so the kernel drops unrelated traffic before it
+reaches the service.  Packets are counted per filter, interface and
+direction; timestamps go into a ring buffer and packets can optionally be
+written to a pcap file.
+"""
+
+import argparse
+import asyncio
+import ctypes
+import os
+import socket
+import struct
+import time
+from collections import deque
+
+try:
+    from lib.nsservice import NsService, NsServiceClient, run_service, service_sockpath
+except ImportError:
+    # started as a script from the router namespace
+    from nsservice import NsService, NsServiceClient, run_service, service_sockpath
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_ARP = 0x0806
+PACKET_OUTGOING = 4
+SO_ATTACH_FILTER = 26
+
+# name: (ethertype, ip protocol, ports)
+PROTOCOLS = {
+    "arp": (ETH_P_ARP, None, None),
+    "icmp": (ETH_P_IP, 1, None),
+    "igmp": (ETH_P_IP, 2, None),
+    "icmp6": (ETH_P_IPV6, 58, None),
+    "ospf": (None, 89, None),
+    "pim": (None, 103, None),
+    "vrrp": (None, 112, None),
+    "bgp": (None, 6, (179,)),
+    "ldp": (None, 17, (646,)),
+    "rip": (ETH_P_IP, 17, (520,)),
+    "ripng": (ETH_P_IPV6, 17, (521,)),
+    "bfd": (None, 17, (3784, 3785, 4784)),
+}
+
+IP_PROTOS = {"tcp": 6, "udp": 17}
+
+
+#
+# Filters
+#
+def parse_filter(expr):
+    """
+    Parse a protocol filter expression, returns a dict with the keys
+    "name", "ethertype", "proto" and "ports" (None meaning any).
+    """
+    words = expr.split()
+    if len(words) == 1 and words[0] in PROTOCOLS:
+        ethertype, proto, ports = PROTOCOLS[words[0]]
+    elif len(words) == 3 and words[0] in IP_PROTOS and words[1] == "port":
+        ethertype, proto, ports = None, IP_PROTOS[words[0]], (int(words[2]),)
+    elif len(words) == 3 and words[:2] == ["ip", "proto"]:
+        ethertype, proto, ports = None, int(words[2]), None
+    elif len(words) == 3 and words[:2] == ["ether", "proto"]:
+        ethertype, proto, ports = int(words[2], 0), None, None
+    else:
+        raise ValueError("invalid capture filter: {}".format(expr))
+
+    return {"name": expr, "ethertype": ethertype, "proto": proto, "ports": ports}
+
+
+def compile_bpf(filters):
+    """
+    Compile the ethertype/IP protocol part of `filters` to a classic BPF
+    program, a list of (code, jt, jf, k) tuples.  Returns None when all
+    traffic must be accepted.
+    """
+    if not filters:
+        return None
+
+    ethertypes = set()
+    v4protos = set()
+    v6protos = set()
+    for filt in filters:
+        if filt["proto"] is None:
+            ethertypes.add(filt["ethertype"])
+            continue
+        if filt["ethertype"] in (None, ETH_P_IP):
+            v4protos.add(filt["proto"])
+        if filt["ethertype"] in (None, ETH_P_IPV6):
+            v6protos.add(filt["proto"])
+    # protocols of an ethertype that is accepted as a whole need no check
+    if ETH_P_IP in ethertypes:
+        v4protos.clear()
+    if ETH_P_IPV6 in ethertypes:
+        v6protos.clear()
+
+    # Symbolic program, jump targets are labels resolved below.
+    prog = [("ldh", 12)]
+    for ethertype in sorted(ethertypes):
+        prog.append(("jeq", ethertype, "accept"))
+    if v4protos:
+        prog.append(("jeq", ETH_P_IP, "v4"))
+    if v6protos:
+        prog.append(("jeq", ETH_P_IPV6, "v6"))
+    prog.append(("ret", 0))
+    for label, offset, protos in [("v4", 23, v4protos), ("v6", 20, v6protos)]:
+        if not protos:
+            continue
+        prog.append(("label", label))
+        prog.append(("ldb", offset))
+        for proto in sorted(protos):
+            prog.append(("jeq", proto, "accept"))
+        prog.append(("ret", 0))
+    prog.append(("label", "accept"))
+    prog.append(("ret", 0x40000))
+
+    labels = {}
+    insns = []
+    for op in prog:
+        if op[0] == "label":
+            labels[op[1]] = len(insns)
+        else:
+            insns.append(op)
+
+    result = []
+    for idx, op in enumerate(insns):
+        if op[0] == "ldh":
+            result.append((0x28, 0, 0, op[1]))
+        elif op[0] == "ldb":
+            result.append((0x30, 0, 0, op[1]))
+        elif op[0] == "jeq":
+            result.append((0x15, labels[op[2]] - idx - 1, 0, op[1]))
+        elif op[0] == "ret":
+            result.append((0x06, 0, 0, op[1]))
+    return result
+
+
+def attach_bpf(sock, program):
+    "Attach a program returned by compile_bpf() to `sock`."
+    insns = b"".join(struct.pack("HBBI", *insn) for insn in program)
+    buf = ctypes.create_string_buffer(insns)
+    fprog = struct.pack("HL", len(program), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    return buf
+
+
+def classify(packet, filters):
+    """
+    Returns the name of the first filter matching the Ethernet frame
+    `packet`, or None.
+    """
+    if len(packet) < 14:
+        return None
+    ethertype = struct.unpack_from("!H", packet, 12)[0]
+    proto = None
+    l4 = None
+    if ethertype == ETH_P_IP and len(packet) >= 34:
+        proto = packet[23]
+        l4 = 14 + (packet[14] & 0x0F) * 4
+    elif ethertype == ETH_P_IPV6 and len(packet) >= 54:
+        proto = packet[20]
+        l4 = 54
+
+    for filt in filters:
+        if filt["ethertype"] is not None and filt["ethertype"] != ethertype:
+            continue
+        if filt["proto"] is None:
+            if filt["ethertype"] == ethertype:
+                return filt["name"]
+            continue
+        if filt["proto"] != proto:
+            continue
+        if filt["ports"] is None:
+            return filt["name"]
+        if len(packet) < l4 + 4:
+            continue
+        sport, dport = struct.unpack_from("!HH", packet, l4)
+        if sport in filt["ports"] or dport in filt["ports"]:
+            return filt["name"]
+    return None
+
+
+#
+# Capture service (runs inside the router namespace)
+#
+class CaptureService(NsService):
+    "Reads packets and answers queries on a UNIX socket."
+
+    def __init__(self, sockpath, intfs, filters, ring=10000, pcap=None, snaplen=256):
+        super(CaptureService, self).__init__(sockpath)
+        self.intfs = set(intfs or [])
+        self.filters = [parse_filter(f) for f in filters or []]
+        self.ring = deque(maxlen=ring)
+        self.counters = {}
+        self.snaplen = snaplen
+        self.pcap = None
+        if pcap:
+            self.pcap = open(pcap, "wb")
+            self.pcap.write(struct.pack("=IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, snaplen, 1))
+
+        self.psock = socket.socket(
+            socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL)
+        )
+        program = compile_bpf(self.filters)
+        if program is not None:
+            self._bpf = attach_bpf(self.psock, program)
+        if len(self.intfs) == 1:
+            self.psock.bind((next(iter(self.intfs)), 0))
+        self.psock.setblocking(False)
+
+    def read_packets(self):
+        # drain everything queued, one wakeup handles a burst
+        while True:
+            try:
+                packet, addr = self.psock.recvfrom(65535)
+            except BlockingIOError:
+                return
+            now = time.time()
+            ifname, pkttype = addr[0], addr[2]
+            if self.intfs and ifname not in self.intfs:
+                continue
+            if self.filters:
+                name = classify(packet, self.filters)
+                if name is None:
+                    continue
+            else:
+                name = "all"
+            direction = "out" if pkttype == PACKET_OUTGOING else "in"
+            key = (name, ifname, direction)
+            self.counters[key] = self.counters.get(key, 0) + 1
+            self.ring.append((now, name, ifname, direction, len(packet)))
+            if self.pcap:
+                data = packet[: self.snaplen]
+                self.pcap.write(
+                    struct.pack(
+                        "=IIII",
+                        int(now),
+                        int((now % 1) * 1000000),
+                        len(data),
+                        len(packet),
+                    )
+                )
+                self.pcap.write(data)
+
+    def _match(self, req, name, ifname, direction):
+        return (
+            req.get("proto") in (None, name)
+            and req.get("intf") in (None, ifname)
+            and req.get("direction") in (None, direction)
+        )
+
+    async def query(self, req):
+        # make sure answers include everything received so far
+        self.read_packets()
+
+        op = req.get("op")
+        if op == "count":
+            return sum(
+                count
+                for key, count in self.counters.items()
+                if self._match(req, *key)
+            )
+        if op == "counters":
+            return [list(key) + [count] for key, count in self.counters.items()]
+        if op == "times":
+            return [
+                entry[0] for entry in self.ring if self._match(req, *entry[1:4])
+            ]
+        if op == "reset":
+            self.counters = {}
+            self.ring.clear()
+            return True
+        return None
+
+    async def setup(self):
+        asyncio.get_event_loop().add_reader(self.psock, self.read_packets)
+
+    async def teardown(self):
+        asyncio.get_event_loop().remove_reader(self.psock)
+        self.psock.close()
+        if self.pcap:
+            self.pcap.close()
+
+
+#
+# Test side API
+#
+class PacketCapture(NsServiceClient):
+    """
+    Controls a capture service running in the namespace of router `router`.
+
+    * `intfs`: interface names to capture on (all when empty)
+    * `protocols`: filters (see PROTOCOLS), all traffic when empty
+    * `pcap`: optional pcap file name, stored in the router log directory
+    * `ring`: number of packet timestamps to keep
+    """
+
+    description = "capture service"
+
+    def __init__(self, tgen, router, intfs=None, protocols=None, pcap=None, ring=10000):
+        sockpath = service_sockpath(tgen, router, "pktcapture.sock")
+        super(PacketCapture, self).__init__(tgen, router, sockpath)
+        self.intfs = intfs or []
+        self.protocols = protocols or []
+        # validate early, in the test process
+        for expr in self.protocols:
+            parse_filter(expr)
+        rdir = os.path.dirname(sockpath)
+        self.pcap = os.path.join(rdir, pcap) if pcap else None
+        self.ring = ring
+
+    def start(self, timeout=10):
+        "Start the service, returns True when it is ready"
+        args = ["--ring", self.ring]
+        for intf in self.intfs:
+            args += ["-i", intf]
+        for expr in self.protocols:
+            args += ["-f", expr]
+        if self.pcap:
+            args += ["-w", self.pcap]
+        return self.start_service(__file__, args, timeout)
+
+    def count(self, proto=None, intf=None, direction=None):
+        "Number of packets matching `proto` on `intf` in `direction` (in/out)"
+        return self._request("count", proto=proto, intf=intf, direction=direction)
+
+    def counters(self):
+        "All counters as a {(proto, intf, direction): count} dict"
+        return dict(((p, i, d), c) for p, i, d, c in self._request("counters"))
+
+    def timestamps(self, proto=None, intf=None, direction=None):
+        "Receive timestamps of the packets still in the ring buffer"
+        return self._request("times", proto=proto, intf=intf, direction=direction)
+
+    def intervals(self, proto=None, intf=None, direction=None):
+        "Inter-arrival times of the packets still in the ring buffer"
+        times = self.timestamps(proto, intf, direction)
+        return [b - a for a, b in zip(times, times[1:])]
+
+    def reset(self):
+        "Clear counters and the ring buffer"
+        return self._request("reset")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packet capture service")
+    parser.add_argument("socket", help="UNIX socket to answer queries on")
+    parser.add_argument(
+        "-i", "--interface", action="append", help="interface to capture on"
+    )
+    parser.add_argument(
+        "-f", "--filter", action="append", help="protocol filter expression"
+    )
+    parser.add_argument("-w", "--write", help="pcap file to write")
+    parser.add_argument(
+        "--ring", type=int, default=10000, help="packet timestamps to keep"
+    )
+    parser.add_argument("--snaplen", type=int, default=256, help="pcap snap length")
+    args = parser.parse_args()
+
+    service = CaptureService(
+        args.socket,
+        args.interface,
+        args.filter,
+        ring=args.ring,
+        pcap=args.write,
+        snaplen=args.snaplen,
+    )
+    run_service(service)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#
+# Copyright (C) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+"""
+sharpd helpers for topotests: bulk route install/removal and the timing
+sharpd keeps for it.
+
+sharpd starts its clock when it sends the first route to zebra and stops
+it when zebra has notified it of the last one being installed (or
+removed), i.e. after zebra's RIB processing and the dataplane:
+
+    sharp_install_routes(r1, "10.0.0.0", 100000, nexthop_group="four")
+    data = sharp_route_data(r1)
+    if data["installed"] == 100000:
+        logger.info("installed in %.3fs", data["time"])
+"""
+
+import re
+import time
+
+from lib.topolog import logger
+
+
+def nexthop_group_config(name, nexthops):
+    """
+    sharpd configuration for nexthop-group `name` with `nexthops`, a list
+    of (gateway, interface) tuples
+    """
+    lines = ["nexthop-group {}".format(name)]
+    for gateway, ifname in nexthops:
+        lines.append(" nexthop {} {}".format(gateway, ifname))
+    lines.append("!")
+    return "\n".join(lines) + "\n"
+
+
+def _route_args(vrf, start):
+    args = ""
+    if vrf is not None:
+        args += " vrf {}".format(vrf)
+    return args + " {}".format(start)
+
+
+def sharp_install_routes(
+    router, start, count, nexthop=None, nexthop_group=None, vrf=None, instance=None
+):
+    """
+    Have sharpd install `count` host routes counting up from `start`, via
+    `nexthop` or `nexthop_group`.  Returns the vtysh output (empty on
+    success).
+    """
+    cmd = "sharp install routes" + _route_args(vrf, start)
+    if nexthop_group is not None:
+        cmd += " nexthop-group {}".format(nexthop_group)
+    else:
+        cmd += " nexthop {}".format(nexthop)
+    cmd += " {}".format(count)
+    if instance is not None:
+        cmd += " instance {}".format(instance)
+    return router.vtysh_cmd(cmd, isjson=False).strip()
+
+
+def sharp_remove_routes(router, start, count, vrf=None, instance=None):
+    "Have sharpd remove `count` routes installed from `start`"
+    cmd = "sharp remove routes" + _route_args(vrf, start) + " {}".format(count)
+    if instance is not None:
+        cmd += " instance {}".format(instance)
+    return router.vtysh_cmd(cmd, isjson=False).strip()
+
+
+def sharp_route_data(router):
+    """
+    sharpd's state of the last install/remove ("sharp data route"): prefix,
+    total, installed, removed and time (seconds from the first route sent
+    until zebra reported the last one done).  None if it can't be parsed.
+    """
+    output = router.vtysh_cmd("sharp data route", isjson=False)
+    m = re.search(
+        r"Prefix: (\S+) Total: (\d+) (\d+) (\d+) Time: (\d+)\.(\d+)", output
+    )
+    if m is None:
+        return None
+    # older sharpd prints the microseconds without zero padding
+    return {
+        "prefix": m.group(1),
+        "total": int(m.group(2)),
+        "installed": int(m.group(3)),
+        "removed": int(m.group(4)),
+        "time": int(m.group(5)) + int(m.group(6)) / 1000000.0,
+    }
+
+
+def sharp_wait(router, installed=None, removed=None, timeout=60, interval=0.5):
+    """
+    Poll "sharp data route" until the number of routes installed or removed
+    is reached, returns the last data with "timeout" set accordingly.
+    """
+    deadline = time.time() + timeout
+    while True:
+        data = sharp_route_data(router) or {}
+        done = bool(data)
+        if installed is not None and data.get("installed") != installed:
+            done = False
+        if removed is not None and data.get("removed") != removed:
+            done = False
+        if done or time.time() > deadline:
+            break
+        time.sleep(interval)
+    data["timeout"] = not done
+    if not done:
+        logger.info("sharp_wait: %s: timed out, sharpd has %s", router.name, data)
+    return data
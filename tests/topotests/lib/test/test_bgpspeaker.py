@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+#
+# test_bgpspeaker.py
+# Tests for library functions: BGP speaker.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the BGP encoding, Adj-RIB-In and sessions of lib/bgpspeaker.py.
+"""
+
+import asyncio
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.bgpspeaker import (
+    AFI_IPV4,
+    AFI_IPV6,
+    BGP_EXTENDED_MAX_SIZE,
+    CAP_EXT_MESSAGE,
+    MSG_KEEPALIVE,
+    MSG_OPEN,
+    MSG_UPDATE,
+    BgpFramer,
+    BgpSession,
+    RibIn,
+    build_updates,
+    decode_open,
+    decode_update,
+    encode_msg,
+    encode_open,
+    encode_path_attrs,
+    encode_prefix,
+    prefix_range,
+    prefix_str,
+)
+
+
+def test_prefixes():
+    "Test prefix encoding and ranges"
+
+    assert encode_prefix("10.1.2.0/24") == b"\x18\x0a\x01\x02"
+    assert encode_prefix("0.0.0.0/0") == b"\x00"
+    assert prefix_str(AFI_IPV4, b"\x11\x0a\x01\x80") == "10.1.128.0/17"
+    assert prefix_str(AFI_IPV6, encode_prefix("2001:db8::/48")) == "2001:db8::/48"
+
+    afi, nlri = prefix_range("10.0.255.0/24", 3)
+    assert afi == AFI_IPV4
+    assert [prefix_str(afi, raw) for raw in nlri] == [
+        "10.0.255.0/24",
+        "10.1.0.0/24",
+        "10.1.1.0/24",
+    ]
+    afi, nlri = prefix_range("2001:db8::/64", 2, step=2)
+    assert afi == AFI_IPV6
+    assert [prefix_str(afi, raw) for raw in nlri] == [
+        "2001:db8::/64",
+        "2001:db8:0:2::/64",
+    ]
+
+
+def test_open():
+    "Test OPEN encoding and decoding"
+
+    msgs = BgpFramer().feed(encode_open(4200000000, "10.0.0.1", 90, (4, 6)))
+    assert len(msgs) == 1 and msgs[0][0] == MSG_OPEN
+    result = decode_open(msgs[0][1])
+    assert result["asn"] == 4200000000
+    assert result["hold"] == 90
+    assert result["router_id"] == "10.0.0.1"
+    assert len(result["capabilities"][1]) == 2
+    assert CAP_EXT_MESSAGE in result["capabilities"]
+
+
+@pytest.mark.parametrize("start", ["10.0.0.0/24", "2001:db8::/64"])
+@pytest.mark.parametrize("max_size", [4096, BGP_EXTENDED_MAX_SIZE])
+def test_updates(start, max_size):
+    "Test UPDATE packing and decoding"
+
+    afi, nlri = prefix_range(start, 20000)
+    nexthop = "192.168.0.1" if afi == AFI_IPV4 else "2001:db8:ffff::1"
+    attrs = encode_path_attrs(
+        [65001, 4200000000],
+        med=10,
+        communities=["65001:1"],
+        large_communities=["1:2:3"],
+    )
+    data = b"".join(build_updates(afi, nlri, attrs, nexthop, max_size))
+    msgs = BgpFramer().feed(data)
+    assert all(len(body) + 19 <= max_size for _, body in msgs)
+    # all but the last message are (nearly) full
+    assert all(len(body) + 19 > max_size - 20 for _, body in msgs[:-1])
+
+    announced = []
+    for msgtype, body in msgs:
+        assert msgtype == MSG_UPDATE
+        withdrawn, added, attrs = decode_update(body)
+        assert not withdrawn
+        announced += added
+    assert announced == [(afi, raw) for raw in nlri]
+    assert attrs == {
+        "origin": 0,
+        "as_path": [65001, 4200000000],
+        "next_hop": nexthop,
+        "med": 10,
+        "communities": ["65001:1"],
+        "large_communities": ["1:2:3"],
+    }
+
+    withdrawn = []
+    data = b"".join(build_updates(afi, nlri, max_size=max_size))
+    for _, body in BgpFramer().feed(data):
+        removed, added, attrs = decode_update(body)
+        assert not added and not attrs
+        withdrawn += removed
+    assert withdrawn == [(afi, raw) for raw in nlri]
+
+
+def test_framer_partial():
+    "Test messages split across reads"
+
+    data = encode_msg(MSG_KEEPALIVE) + encode_open(65001, "10.0.0.1")
+    framer = BgpFramer()
+    msgs = []
+    for pos in range(0, len(data), 7):
+        msgs += framer.feed(data[pos : pos + 7])
+    assert [msgtype for msgtype, _ in msgs] == [MSG_KEEPALIVE, MSG_OPEN]
+    assert framer.buf == b""
+    with pytest.raises(ValueError):
+        BgpFramer().feed(b"\0" * 19)
+
+
+def test_ribin():
+    "Test the Adj-RIB-In, attributes are shared"
+
+    rib = RibIn()
+    _, nlri = prefix_range("10.0.0.0/24", 100)
+    keys = [(AFI_IPV4, raw) for raw in nlri]
+    attrs = {"as_path": [65001], "next_hop": "10.0.1.2"}
+    rib.apply([], keys[:50], dict(attrs), 1.0, 100)
+    rib.apply([], keys[50:], dict(attrs), 2.0, 100)
+    assert len(rib.attrs) == 1
+    assert rib.count() == 100 and rib.count(6) == 0
+    assert rib.route("10.0.99.0/24") == attrs
+    rib.apply(keys[:10], [], {}, 3.0, 50)
+
+    result = rib.stats()
+    assert result["prefixes"] == 90
+    assert result["adds"] == 100 and result["withdraws"] == 10
+    assert result["duration"] == 2.0
+    assert result["rate"] == 55.0
+    assert rib.route("10.0.0.0/24") is None
+
+
+class FakeBgpd(object):
+    "Peer that answers the OPEN, counts prefixes and sends back updates"
+
+    def __init__(self, extended=True):
+        self.extended = extended
+        self.prefixes = {}
+        self.updates = 0
+        self.writer = None
+
+    async def handle(self, reader, writer):
+        self.writer = writer
+        framer = BgpFramer()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for msgtype, body in framer.feed(data):
+                if msgtype == MSG_OPEN:
+                    writer.write(
+                        encode_open(65000, "10.0.0.254", 9, (4, 6), self.extended)
+                    )
+                    writer.write(encode_msg(MSG_KEEPALIVE))
+                elif msgtype == MSG_UPDATE:
+                    self.updates += 1
+                    withdrawn, announced, _ = decode_update(body)
+                    for key in withdrawn:
+                        self.prefixes.pop(key, None)
+                    for key in announced:
+                        self.prefixes[key] = True
+        writer.close()
+
+
+@pytest.mark.parametrize("extended", [True, False])
+def test_session(extended):
+    "Test a session: announce, withdraw, churn and receive"
+
+    async def run():
+        fake = FakeBgpd(extended)
+        server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        session = BgpSession("127.0.0.1", 65001, 65000, port=port)
+        await session.connect(5)
+        assert session.established and session.hold == 9
+        assert session.max_size == (BGP_EXTENDED_MAX_SIZE if extended else 4096)
+
+        afi, nlri = prefix_range("10.0.0.0/24", 50000)
+        result = await session.announce(afi, nlri, med=5)
+        assert result["prefixes"] == 50000
+        afi6, nlri6 = prefix_range("2001:db8::/64", 1000)
+        await session.announce(afi6, nlri6, nexthop="2001:db8:ffff::1")
+        await session.withdraw(afi, nlri[:10000])
+        rounds = await session.churn(afi, nlri[10000:], "flap", 0.1, 3, 0)
+        assert len(rounds) == 3 and rounds[0]["prefixes"] == 8000
+        rounds = await session.churn(afi, nlri[10000:], "community", 0.5, 2, 0)
+        assert [r["prefixes"] for r in rounds] == [20000, 20000]
+        await asyncio.sleep(0.2)
+        assert len(fake.prefixes) == 41000
+        assert fake.updates == session.sent["updates"]
+
+        # updates from the peer end up in the Adj-RIB-In
+        attrs = encode_path_attrs([65000])
+        for msg in build_updates(afi, nlri[:100], attrs, "10.0.0.254"):
+            fake.writer.write(msg)
+        await asyncio.sleep(0.2)
+        assert session.rib.count() == 100
+        assert session.rib.route("10.0.5.0/24")["as_path"] == [65000]
+
+        await session.close()
+        server.close()
+        await server.wait_closed()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+#
+# test_bmp.py
+# Tests for library functions: BMP collector.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the BMP decoding and the per-peer tables of lib/bmp.py.
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import sys
+import time
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.bgpspeaker import (
+    build_updates,
+    encode_open,
+    encode_path_attrs,
+    prefix_range,
+)
+from lib.bmp import (
+    BMP_INITIATION,
+    BMP_PEER_DOWN,
+    BMP_PEER_UP,
+    BMP_ROUTE_MONITORING,
+    BMP_STATISTICS_REPORT,
+    BmpFramer,
+    BmpService,
+    bmp_clients,
+)
+
+PEER = "10.0.1.101"
+
+
+def bmp_msg(msgtype, body):
+    return struct.pack("!BIB", 3, 6 + len(body), msgtype) + body
+
+
+def peer_header(post=False, timestamp=0):
+    flags = 0x40 if post else 0
+    addr = b"\0" * 12 + socket.inet_aton(PEER)
+    return struct.pack(
+        "!BB8s16sI4sII",
+        0,
+        flags,
+        b"\0" * 8,
+        addr,
+        65001,
+        socket.inet_aton("10.0.255.101"),
+        int(timestamp),
+        0,
+    )
+
+
+def initiation():
+    body = b""
+    for itype, value in ((1, b"FRRouting 8.1"), (2, b"r1")):
+        body += struct.pack("!HH", itype, len(value)) + value
+    return bmp_msg(BMP_INITIATION, body)
+
+
+def peer_up():
+    body = peer_header() + b"\0" * 12 + socket.inet_aton("10.0.1.1")
+    body += struct.pack("!HH", 179, 40000)
+    body += encode_open(65000, "10.0.1.1") + encode_open(65001, "10.0.255.101")
+    return bmp_msg(BMP_PEER_UP, body)
+
+
+def route_monitoring(start, count, post, withdraw=False, timestamp=0):
+    "One message per prefix, like bgpd sends them"
+    afi, nlri = prefix_range(start, count)
+    nexthop = "10.0.1.101" if afi == 1 else "2001:db8::101"
+    attrs = encode_path_attrs([65001], med=5)
+    msgs = []
+    for raw in nlri:
+        if withdraw:
+            (update,) = build_updates(afi, [raw])
+        else:
+            (update,) = build_updates(afi, [raw], attrs, nexthop)
+        header = peer_header(post, timestamp)
+        msgs.append(bmp_msg(BMP_ROUTE_MONITORING, header + update))
+    return b"".join(msgs)
+
+
+def eor(post, afi):
+    if afi == 1:
+        update = b"\0\0\0\0"
+    else:
+        update = b"\0\0\0\x06\x80\x0f\x03\0\x02\x01"
+    update = b"\xff" * 16 + struct.pack("!HB", 19 + len(update), 2) + update
+    return bmp_msg(BMP_ROUTE_MONITORING, peer_header(post) + update)
+
+
+def feed(service, data, now):
+    for msgtype, body in BmpFramer().feed(data):
+        service.handle_message(msgtype, body, now)
+
+
+def test_session_state():
+    "Test initiation, peer up/down, tables, EoR and statistics"
+
+    service = BmpService("/nonexistent", "127.0.0.1", 0)
+    now = time.time()
+    data = initiation() + peer_up()
+    data += route_monitoring("10.0.0.0/24", 100, False, timestamp=now - 2)
+    data += route_monitoring("10.0.0.0/24", 100, True, timestamp=now - 2)
+    data += route_monitoring("2001:db8::/64", 10, True)
+    data += eor(False, 1) + eor(True, 1) + eor(True, 2)
+    data += route_monitoring("10.0.0.0/24", 10, True, withdraw=True)
+    data += route_monitoring("2001:db8::/64", 5, True, withdraw=True)
+    stats = peer_header() + struct.pack("!I", 2)
+    stats += struct.pack("!HHI", 0, 4, 7)
+    stats += struct.pack("!HHHBQ", 9, 11, 1, 1, 123456)
+    data += bmp_msg(BMP_STATISTICS_REPORT, stats)
+    feed(service, data, now)
+
+    assert service.info == {"sysDescr": "FRRouting 8.1", "sysName": "r1"}
+    peer = service.peers[PEER]
+    assert peer.up and peer.as4 and peer.asn == 65001
+    assert peer.eor == {"pre/4", "post/4", "post/6"}
+    assert peer.ribs["pre"].count() == 100
+    assert peer.ribs["post"].count(4) == 90
+    assert peer.ribs["post"].count(6) == 5
+    assert peer.ribs["post"].route("10.0.50.0/24")["med"] == 5
+    assert peer.ribs["post"].route("10.0.5.0/24") is None
+    assert peer.ribs["post"].route("2001:db8:0:9::/64")["next_hop"] == "2001:db8::101"
+    # all IPv4 routes share one decoded attribute set
+    assert len(peer.ribs["pre"].attrs) == 1
+    assert peer.stats == {0: 7, 9: 123456}
+
+    result = service.stats()
+    assert result["route_monitoring"] == 100 + 100 + 10 + 3 + 10 + 5
+    assert result["peer_up"] == 1 and result["statistics"] == 1
+    assert result["lag"]["count"] == 200
+    # timestamps are whole seconds
+    assert 2 <= result["lag"]["min"] < 3
+    assert service._satisfied({"peer": PEER, "prefixes": 95, "eor": "post/6"})
+    assert not service._satisfied({"peer": PEER, "policy": "pre", "prefixes": 95})
+
+    down = peer_header() + b"\x02" + struct.pack("!H", 0)
+    feed(service, bmp_msg(BMP_PEER_DOWN, down), now)
+    assert not peer.up and peer.down_reason == 2
+    assert peer.ribs["pre"].count() == 0 and peer.ribs["post"].count() == 0
+
+
+def test_stream():
+    "Test a BMP session over TCP, split across reads"
+
+    async def run():
+        service = BmpService("/nonexistent", "127.0.0.1", 0)
+        service.changed = asyncio.Event()
+        server = await asyncio.start_server(service.handle_bmp, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        data = initiation() + peer_up() + route_monitoring("10.0.0.0/24", 5000, True)
+        for pos in range(0, len(data), 1000):
+            writer.write(data[pos : pos + 1000])
+            await writer.drain()
+        result = await service.wait({"peer": PEER, "prefixes": 5000, "timeout": 5})
+        assert not result["timeout"]
+        assert result["connected"] and result["sessions"] == 1
+        assert result["peer"]["post"]["adds"] == 5000
+        assert result["rate"] is None or result["rate"] > 0
+        assert sum(slot["messages"] for slot in service.rates(1.0)) == 5002
+
+        writer.close()
+        await asyncio.sleep(0.1)
+        assert not service.connected
+        server.close()
+        await server.wait_closed()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def test_bmp_clients():
+    "Test parsing bgpd's BMP session table"
+
+    class Router(object):
+        def vtysh_cmd(self, _cmd):
+            return """BMP state for BGP VRF default:
+
+  Route Mirroring         0 bytes (0 messages) pending
+                          0 bytes maximum buffer used
+
+  Targets "collector":
+    Route Mirroring disabled
+    Route Monitoring IPv4 unicast pre-policy post-policy
+
+    Outbound connections:
+remote          state  timer
+--------------------------------
+127.0.0.1:1790  Up     127.0.0.1:1790  00:01:02
+
+    1 connected clients:
+remote          uptime    MonSent  MirrSent  MirrLost  ByteSent  ByteQ  ByteQKernel
+-----------------------------------------------------------------------------------
+127.0.0.1:1790  00:01:02  200013   0         0         19200481  4096   131072
+
+"""
+
+    assert bmp_clients(Router()) == [
+        {
+            "remote": "127.0.0.1:1790",
+            "uptime": "00:01:02",
+            "MonSent": 200013,
+            "MirrSent": 0,
+            "MirrLost": 0,
+            "ByteSent": 19200481,
+            "ByteQ": 4096,
+            "ByteQKernel": 131072,
+        }
+    ]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
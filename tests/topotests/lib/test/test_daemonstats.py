@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+#
+# test_daemonstats.py
+# Tests for library functions: daemon CPU and memory statistics.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the /proc, "show memory" and counter parsing of
+lib/daemonstats.py.
+"""
+
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.daemonstats import (
+    DaemonSampler,
+    parse_counters,
+    parse_proc,
+    parse_show_memory,
+)
+
+TICKS = os.sysconf("SC_CLK_TCK")
+
+SHOW_MEMORY = """System allocator statistics:
+  Total heap allocated:  {heap}
+  Holding block headers: 0 bytes
+  Used small blocks:     0 bytes
+  Used ordinary blocks:  1234 KiB
+  Free small blocks:     2464 bytes
+  Free ordinary blocks:  42 MiB
+  Ordinary blocks:       21
+  Small blocks:          77
+  Holding blocks:        0
+(see system documentation for 'mallinfo' for meaning)
+--- qmem libfrr ---
+Type                          : Current#   Size       Total     Max#  MaxBytes
+Hash                          :      135     32        4320      137      4384
+Hash Bucket                   :     1024 variable     65536     1024     65536
+--- qmem zebra ---
+Type                          : Current#   Size       Total     Max#  MaxBytes
+Route Entry                   :  {entries}     80    {total}  {entries}  {total}
+"""
+
+
+def stat_line(utime, stime, threads=3):
+    fields = ["S"] + ["0"] * 30
+    fields[11], fields[12], fields[17] = str(utime), str(stime), str(threads)
+    return "1234 (zebra (x)) " + " ".join(fields)
+
+
+def test_parse_proc():
+    "Test /proc/PID/stat and status parsing"
+
+    status = "Name:\tzebra\nVmHWM:\t   20480 kB\nVmRSS:\t   10240 kB\n"
+    result = parse_proc(stat_line(3 * TICKS, TICKS // 2, 5), status)
+    assert result == {
+        "user": 3.0,
+        "system": 0.5,
+        "threads": 5,
+        "rss": 10240 * 1024,
+        "rss_max": 20480 * 1024,
+    }
+
+
+def test_parse_show_memory():
+    "Test 'show memory' parsing, with and without malloc_usable_size()"
+
+    output = SHOW_MEMORY.format(heap="45 MiB", entries=1000, total=96000)
+    result = parse_show_memory(output)
+    assert result["heap"] == 45 << 20
+    assert result["used"] == 1234 << 10
+    assert result["total"] == 4320 + 65536 + 96000
+    assert set(result["mtypes"]) == {"Hash", "Hash Bucket", "Route Entry"}
+    assert result["mtypes"]["Hash Bucket"] == {
+        "count": 1024,
+        "size": None,
+        "total": 65536,
+        "max": 1024,
+        "max_bytes": 65536,
+    }
+    assert result["mtypes"]["Route Entry"]["size"] == 80
+
+    # without malloc_usable_size() there are no totals
+    result = parse_show_memory(
+        "  Total heap allocated:  > 2GB\n"
+        "Hash                          :      135     32      137\n"
+        "Hash Bucket                   :     1024 variable     1024\n"
+        "Nexthop                       :       12        12\n"
+    )
+    assert result["total"] is None and result["heap"] is None
+    assert result["mtypes"]["Hash"] == {"count": 135, "size": 32, "max": 137}
+    assert result["mtypes"]["Hash Bucket"]["size"] is None
+    assert result["mtypes"]["Nexthop"] == {"count": 12, "size": None, "max": 12}
+
+
+def test_parse_counters():
+    "Test 'show zebra dplane' parsing"
+
+    output = """Zebra dataplane:
+Route updates:            200000
+Route update errors:      0
+Other errors       :      1
+Route update queue limit: 200
+Route update queue depth: 17
+Route update queue max:   200
+Dplane update yields:     1234
+"""
+    result = parse_counters(output)
+    assert result["route_updates"] == 200000
+    assert result["other_errors"] == 1
+    assert result["route_update_queue_depth"] == 17
+    assert "zebra_dataplane" not in result
+
+
+class Router(object):
+    "Fake router: zebra's CPU time grows by a second per /proc read"
+
+    routertype = "frr"
+
+    def __init__(self):
+        self.reads = 0
+        self.entries = 0
+
+    def run(self, cmd):
+        if cmd.endswith(".pid"):
+            return "1234\n"
+        self.reads += 1
+        status = "VmRSS:\t{} kB\n".format(10000 + 1000 * self.reads)
+        return stat_line(self.reads * TICKS, 0) + "\n" + status
+
+    def vtysh_cmd(self, cmd, isjson=False, daemon=None):
+        assert cmd == "show memory" and daemon == "zebra"
+        return SHOW_MEMORY.format(
+            heap="45 MiB", entries=self.entries, total=80 * self.entries
+        )
+
+
+def test_sampler():
+    "Test the sampler's CPU, RSS and memory type summary"
+
+    router = Router()
+    sampler = DaemonSampler(router, "zebra", memory_interval=3600)
+    router.entries = 1000
+    assert sampler.sample(dplane_queue=5)["dplane_queue"] == 5
+    assert len(sampler.memory) == 1
+    sampler.sample(memory=True)
+
+    result = sampler.summary()
+    assert result["samples"] == 3
+    assert result["cpu"] == 2.0
+    assert result["rss_start"] == 11000 * 1024
+    assert result["rss_end"] == result["rss_max"] == 13000 * 1024
+    base = 4320 + 65536
+    assert [mem["total"] for mem in result["memory"]] == [base, base + 80000]
+    assert result["mtype_growth"] == {"Route Entry": {"count": 1000, "total": 80000}}
+
+    router.run = lambda cmd: ""
+    assert sampler.sample() is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+#
+# test_fpm.py
+# Tests for library functions: FPM stream decoding.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the FPM framing, netlink and protobuf decoders.
+"""
+
+import os
+import socket
+import struct
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.fpm import (
+    FpmFramer,
+    FpmState,
+    decode_netlink,
+    decode_protobuf,
+    FPM_MSG_TYPE_NETLINK,
+    FPM_MSG_TYPE_PROTOBUF,
+    RTM_NEWROUTE,
+    RTM_DELROUTE,
+)
+
+
+def rtattr(rta_type, payload):
+    data = struct.pack("=HH", 4 + len(payload), rta_type) + payload
+    return data + b"\0" * (-len(data) % 4)
+
+
+def nlroute(nltype, family, prefix, plen, attrs):
+    body = struct.pack("=BBBBBBBBI", family, plen, 0, 0, 254, 196, 0, 1, 0)
+    body += rtattr(1, socket.inet_pton(family, prefix)) + b"".join(attrs)
+    return struct.pack("=IHHII", 16 + len(body), nltype, 0, 0, 0) + body
+
+
+def fpm_frame(msg_type, payload):
+    return struct.pack("!BBH", 1, msg_type, 4 + len(payload)) + payload
+
+
+def pb_varint(value):
+    out = b""
+    while value > 0x7F:
+        out += struct.pack("B", (value & 0x7F) | 0x80)
+        value >>= 7
+    return out + struct.pack("B", value)
+
+
+def pb_field(num, value):
+    if isinstance(value, bytes):
+        return pb_varint(num << 3 | 2) + pb_varint(len(value)) + value
+    return pb_varint(num << 3) + pb_varint(value)
+
+
+def test_netlink_route():
+    "Test decoding of a single path and a multipath route"
+
+    single = nlroute(
+        RTM_NEWROUTE,
+        socket.AF_INET,
+        "10.0.0.0",
+        24,
+        [
+            rtattr(5, socket.inet_pton(socket.AF_INET, "192.168.1.2")),
+            rtattr(4, struct.pack("=I", 3)),
+            rtattr(6, struct.pack("=I", 20)),
+        ],
+    )
+    nexthops = b""
+    for gw, ifindex in (("2001:db8::1", 2), ("2001:db8::2", 3)):
+        nhattr = rtattr(5, socket.inet_pton(socket.AF_INET6, gw))
+        nexthops += struct.pack("=HBBi", 8 + len(nhattr), 0, 0, ifindex) + nhattr
+    multi = nlroute(
+        RTM_DELROUTE, socket.AF_INET6, "2001:db8:1::", 48, [rtattr(9, nexthops)]
+    )
+
+    updates = decode_netlink(single + multi)
+    assert len(updates) == 2
+    assert updates[0]["op"] == "add"
+    assert updates[0]["prefix"] == "10.0.0.0/24"
+    assert updates[0]["vrf"] == 254
+    assert updates[0]["metric"] == 20
+    assert updates[0]["nexthops"] == [{"ifindex": 3, "gateway": "192.168.1.2"}]
+    assert updates[1]["op"] == "del"
+    assert updates[1]["prefix"] == "2001:db8:1::/48"
+    assert updates[1]["nexthops"] == [
+        {"ifindex": 2, "gateway": "2001:db8::1"},
+        {"ifindex": 3, "gateway": "2001:db8::2"},
+    ]
+
+
+def test_protobuf_route():
+    "Test decoding of a fpm.Message AddRoute"
+
+    prefix = pb_field(1, pb_field(1, 16) + pb_field(2, b"\x0a\x01"))
+    nexthop = pb_field(2, pb_field(1, 5)) + pb_field(
+        3, pb_field(1, b"\x0d" + struct.pack("<I", 0xC0A80102))
+    )
+    add = (
+        pb_field(1, 0)
+        + pb_field(2, 1)
+        + pb_field(3, 1)
+        + pb_field(4, prefix)
+        + pb_field(6, 2)
+        + pb_field(8, 0)
+        + pb_field(9, nexthop)
+    )
+    updates = decode_protobuf(pb_field(1, 1) + pb_field(2, add))
+    assert updates == [
+        {
+            "op": "add",
+            "vrf": 0,
+            "prefix": "10.1.0.0/16",
+            "protocol": 2,
+            "metric": 0,
+            "nexthops": [{"ifindex": 5, "gateway": "192.168.1.2"}],
+        }
+    ]
+
+
+def test_framer_partial():
+    "Test that frames split across reads are reassembled"
+
+    routes = [
+        nlroute(RTM_NEWROUTE, socket.AF_INET, "10.0.{}.0".format(i), 24, [])
+        for i in range(50)
+    ]
+    routes.append(nlroute(RTM_DELROUTE, socket.AF_INET, "10.0.7.0", 24, []))
+    stream = b"".join(fpm_frame(FPM_MSG_TYPE_NETLINK, route) for route in routes)
+
+    framer = FpmFramer()
+    state = FpmState()
+    total = 0
+    for pos in range(0, len(stream), 37):
+        total += state.feed(framer, stream[pos : pos + 37], 0.0)
+
+    assert total == 51
+    assert framer.buf == b""
+    assert state.counters["frames"] == 51
+    assert state.counters["adds"] == 50
+    assert state.counters["dels"] == 1
+    assert len(state.routes) == 49
+    assert (254, "10.0.7.0/24") not in state.routes
+
+
+def test_framer_bad_header():
+    "Test that a corrupt stream is reported"
+
+    framer = FpmFramer()
+    with pytest.raises(ValueError):
+        list(framer.feed(struct.pack("!BBH", 7, FPM_MSG_TYPE_PROTOBUF, 8) + b"\0" * 4))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+#
+# test_kernelfib.py
+# Tests for library functions: kernel FIB reader.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the rtnetlink decoding and the FIB state of lib/kernelfib.py.
+"""
+
+import os
+import socket
+import struct
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.kernelfib import (
+    FibState,
+    NLMSG_DONE,
+    RTM_DELROUTE,
+    RTM_NEWLINK,
+    RTM_NEWNEXTHOP,
+    RTM_NEWROUTE,
+    RTM_NEWRULE,
+    proto_number,
+)
+
+
+def rtattr(rta_type, payload):
+    data = struct.pack("=HH", 4 + len(payload), rta_type) + payload
+    return data + b"\0" * (-len(data) % 4)
+
+
+def nlmsg(nltype, body, seq=0):
+    return struct.pack("=IHHII", 16 + len(body), nltype, 0, seq, 0) + body
+
+
+def link(ifindex, name, vrf_table=None):
+    attrs = rtattr(3, name.encode("utf-8") + b"\0")
+    if vrf_table is not None:
+        info = rtattr(1, b"vrf\0") + rtattr(2, rtattr(1, struct.pack("=I", vrf_table)))
+        attrs += rtattr(18, info)
+    return nlmsg(RTM_NEWLINK, struct.pack("=BxHiII", 0, 1, ifindex, 0, 0) + attrs)
+
+
+def route(nltype, family, prefix, plen, attrs, table=254, proto=194):
+    body = struct.pack("=BBBBBBBBI", family, plen, 0, 0, table, proto, 0, 1, 0)
+    body += rtattr(1, socket.inet_pton(family, prefix)) + b"".join(attrs)
+    return nlmsg(nltype, body)
+
+
+def test_routes():
+    "Test route decoding, metrics, counts and deletes"
+
+    gw = rtattr(5, socket.inet_pton(socket.AF_INET, "192.168.1.2"))
+    nexthops = b""
+    for addr, ifindex, hops in (("192.168.1.2", 2, 0), ("192.168.2.2", 3, 1)):
+        nhattr = rtattr(5, socket.inet_pton(socket.AF_INET, addr))
+        nexthops += struct.pack("=HBBi", 8 + len(nhattr), 0, hops, ifindex) + nhattr
+
+    data = link(2, "r1-eth0") + link(3, "r1-eth1") + link(10, "r1-cust1", 10)
+    for i in range(100):
+        attrs = [gw, rtattr(4, struct.pack("=I", 2))]
+        data += route(RTM_NEWROUTE, socket.AF_INET, "10.0.{}.0".format(i), 24, attrs)
+    data += route(
+        RTM_NEWROUTE,
+        socket.AF_INET,
+        "10.0.0.0",
+        24,
+        [rtattr(9, nexthops), rtattr(6, struct.pack("=I", 20))],
+        proto=188,
+    )
+    data += route(
+        RTM_NEWROUTE,
+        socket.AF_INET6,
+        "2001:db8::",
+        64,
+        [rtattr(4, struct.pack("=I", 10)), rtattr(20, b"\1")],
+        table=10,
+    )
+    data += nlmsg(NLMSG_DONE, struct.pack("=i", 0), seq=7)
+
+    state = FibState()
+    assert state.feed(data, 1.0) == [(7, 0)]
+    assert state.links[3] == "r1-eth1"
+    assert state.vrfs == {"r1-cust1": 10}
+    assert state.count() == 102
+    assert state.count(table="main", proto="sharp") == 100
+    assert state.count(proto=188) == 1
+    assert state.count(table="r1-cust1", family=6) == 1
+
+    best = state.route("10.0.0.0/24")
+    assert best["metric"] == 0
+    assert best["dev"] == "r1-eth0"
+    assert best["via"] == "192.168.1.2"
+    assert len(state.routes[(254, "10.0.0.0/24")]) == 2
+
+    v6 = state.route("2001:db8::/64", table="r1-cust1")
+    assert v6["pref"] == "high"
+    assert v6["nexthops"] == [{"ifindex": 10, "dev": "r1-cust1"}]
+
+    # removing the metric 0 route leaves the multipath one
+    state.feed(route(RTM_DELROUTE, socket.AF_INET, "10.0.0.0", 24, [gw]), 2.0)
+    multi = state.route("10.0.0.0/24")
+    assert multi["proto"] == 188
+    assert [(nh["dev"], nh["weight"]) for nh in multi["nexthops"]] == [
+        ("r1-eth0", 1),
+        ("r1-eth1", 2),
+    ]
+    assert state.count(table="main", proto="sharp") == 99
+    assert len(state.dump("main")) == 100
+    assert state.prefixes(table=10) == [[10, "2001:db8::/64"]]
+
+
+def test_nexthop_group():
+    "Test routes using nexthop objects"
+
+    def nexthop(nhid, attrs):
+        body = struct.pack("=BBBBI", socket.AF_INET, 0, 11, 0, 0)
+        return nlmsg(RTM_NEWNEXTHOP, body + rtattr(1, struct.pack("=I", nhid)) + attrs)
+
+    data = link(2, "r1-eth0")
+    for nhid, addr in ((100, "192.168.1.2"), (101, "192.168.1.3")):
+        gw = rtattr(6, socket.inet_pton(socket.AF_INET, addr))
+        data += nexthop(nhid, gw + rtattr(5, struct.pack("=I", 2)))
+    group = struct.pack("=IBBH", 100, 0, 0, 0) + struct.pack("=IBBH", 101, 2, 0, 0)
+    data += nexthop(200, rtattr(2, group))
+    data += nexthop(300, rtattr(4, b""))
+    nhid = rtattr(30, struct.pack("=I", 200))
+    data += route(RTM_NEWROUTE, socket.AF_INET, "10.1.0.0", 16, [nhid])
+
+    state = FibState()
+    state.feed(data, 1.0)
+    assert state.nexthops[300]["blackhole"]
+    assert state.nexthops[200]["group"] == [
+        {"id": 100, "weight": 1},
+        {"id": 101, "weight": 3},
+    ]
+    result = state.route("10.1.0.0/16")
+    assert result["nhid"] == 200
+    assert [(nh["via"], nh["dev"], nh["weight"]) for nh in result["nexthops"]] == [
+        ("192.168.1.2", "r1-eth0", 1),
+        ("192.168.1.3", "r1-eth0", 3),
+    ]
+
+
+def test_rules():
+    "Test rule decoding"
+
+    body = struct.pack("=BBBBBBBBI", socket.AF_INET, 24, 16, 0, 10, 0, 0, 1, 0)
+    body += rtattr(2, socket.inet_pton(socket.AF_INET, "1.2.0.0"))
+    body += rtattr(1, socket.inet_pton(socket.AF_INET, "3.4.5.0"))
+    body += rtattr(3, b"r1-eth2\0")
+    body += rtattr(6, struct.pack("=I", 304))
+    body += rtattr(21, b"\x0b")
+
+    state = FibState()
+    state.feed(nlmsg(RTM_NEWRULE, body) + nlmsg(RTM_NEWRULE, body), 1.0)
+    assert state.rule_list() == [
+        {
+            "family": 4,
+            "pref": 304,
+            "from": "1.2.0.0/16",
+            "to": "3.4.5.0/24",
+            "iif": "r1-eth2",
+            "proto": 11,
+            "action": 1,
+            "table": 10,
+        }
+    ]
+
+
+def test_proto_number():
+    "Test protocol name translation"
+
+    assert proto_number("sharp") == 194
+    assert proto_number("188") == 188
+    assert proto_number(2) == 2
+    assert proto_number(None) is None
+    with pytest.raises(KeyError):
+        proto_number("nonexistent")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
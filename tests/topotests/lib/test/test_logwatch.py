@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+#
+# test_logwatch.py
+# Tests for library class: LogWatcher.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the LogWatcher class.
+"""
+
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.topotest import LogWatcher
+
+
+def test_incremental_scan(tmpdir):
+    "Test that only appended data is scanned"
+
+    path = str(tmpdir.join("zebra.err"))
+    watcher = LogWatcher()
+
+    assert watcher.update(path) == []
+
+    with open(path, "w") as fd:
+        fd.write("starting\nmemstats: leak")
+    assert watcher.update(path, "zebra") == []
+    assert watcher.text(path) == "starting\nmemstats: leak"
+
+    # the partial line is only matched once it is complete
+    with open(path, "a") as fd:
+        fd.write("ed MTYPE\n")
+    events = watcher.update(path, "zebra")
+    assert len(events) == 1
+    assert events[0]["kind"] == "memstats"
+    assert events[0]["daemon"] == "zebra"
+    assert events[0]["line"] == "memstats: leaked MTYPE"
+    assert events[0]["offset"] == len("starting\n")
+
+    # nothing new, nothing reported
+    assert watcher.update(path) == []
+    assert len(watcher.found(path, "memstats")) == 1
+
+    with open(path, "a") as fd:
+        fd.write("==123==ERROR: AddressSanitizer: heap-use-after-free on x\n")
+    events = watcher.update(path)
+    assert [e["kind"] for e in events] == ["asan"]
+    assert events[0]["groups"] == ("==123==", "heap-use-after-free")
+    assert watcher.tail(path).splitlines()[-1].startswith("==123==")
+
+
+def test_truncated_file(tmpdir):
+    "Test that a truncated file is scanned again from the start"
+
+    path = str(tmpdir.join("bgpd.err"))
+    watcher = LogWatcher()
+
+    with open(path, "w") as fd:
+        fd.write("Received signal 11 at 1234567 (si_addr 0x0)\n" * 2)
+    assert len(watcher.update(path)) == 2
+
+    with open(path, "w") as fd:
+        fd.write("fine\n")
+    assert watcher.update(path) == []
+    assert watcher.found(path, "crash") == []
+    assert watcher.text(path) == "fine\n"
+
+
+def test_glob(tmpdir):
+    "Test the cached directory listing"
+
+    watcher = LogWatcher()
+    pattern = os.path.join(str(tmpdir), "zebra_core*.dmp")
+    assert watcher.glob(pattern) == []
+
+    tmpdir.join("zebra_core-sig_11-pid_1.dmp").write("")
+    tmpdir.join("bgpd_core-sig_11-pid_2.dmp").write("")
+    assert watcher.glob(pattern) == [
+        os.path.join(str(tmpdir), "zebra_core-sig_11-pid_1.dmp")
+    ]
+
+    # created right after a listing, possibly within the same mtime tick
+    tmpdir.join("zebra_core-sig_6-pid_3.dmp").write("")
+    assert len(watcher.glob(pattern)) == 2
+
+    # an old directory listing is cached until the directory changes
+    os.utime(str(tmpdir), (1, 1))
+    assert len(watcher.glob(pattern)) == 2
+    assert watcher.dirs[str(tmpdir)][1] == sorted(os.listdir(str(tmpdir)))
+    tmpdir.join("zebra_core-sig_6-pid_4.dmp").write("")
+    assert len(watcher.glob(pattern)) == 3
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+#
+# test_northbound_grpc.py
+# Tests for library functions: northbound gRPC client.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the parts of lib/northbound_grpc.py that do not talk to a
+daemon: JSON tree merging, lazily decoded Get chunks and the reply
+accounting of CommitPipeline.  These don't need grpcio.
+"""
+
+import enum
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.northbound_grpc import (
+    CommitPipeline,
+    DataChunk,
+    NorthboundError,
+    merge_json,
+)
+
+
+class StatusCode(enum.Enum):
+    OK = 0
+    ABORTED = 10
+    INVALID_ARGUMENT = 3
+
+
+class RpcError(Exception):
+    "Stand-in for grpc.RpcError, which also is a grpc.Call"
+
+    def __init__(self, code, details):
+        super(RpcError, self).__init__(details)
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+
+class Grpc(object):
+    "The parts of the grpc module CommitPipeline uses"
+
+    StatusCode = StatusCode
+    RpcError = RpcError
+
+
+class Future(object):
+    "A reply, completed by the test with done()"
+
+    def __init__(self):
+        self.error = None
+        self.callbacks = []
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def exception(self):
+        return self.error
+
+    def done(self, error=None):
+        self.error = error
+        for callback in self.callbacks:
+            callback(self)
+
+
+class Rpc(object):
+    def __init__(self, futures):
+        self.futures = futures
+
+    def future(self, request, timeout=None):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+class Stub(object):
+    def __init__(self):
+        self.futures = []
+        self.EditCandidate = Rpc(self.futures)
+        self.Commit = Rpc(self.futures)
+
+
+class Candidate(object):
+    def __init__(self, final=None):
+        self.final = final
+        self.commits = 0
+
+    def edit_request(self, update, delete):
+        return None
+
+    def commit_request(self, phase, comment):
+        return None
+
+    def commit(self, comment=None):
+        self.commits += 1
+        if self.final is not None:
+            raise self.final
+
+
+class Client(object):
+    grpc = Grpc
+    timeout = 60
+
+    def __init__(self, cand):
+        self.cand = cand
+        self.stub = Stub()
+        self.released = None
+
+    def candidate(self):
+        return self.cand
+
+    def release(self, cand):
+        self.released = cand
+
+
+def test_merge_json():
+    "Test merging Get chunks"
+
+    dst = {"a": {"b": 1, "l": [1]}, "c": [1, 2], "d": 1}
+    src = {"a": {"e": 2, "l": [2]}, "c": [3], "d": {"x": 1}, "f": [4]}
+    assert merge_json(dst, src) is dst
+    assert dst == {
+        "a": {"b": 1, "e": 2, "l": [1, 2]},
+        "c": [1, 2, 3],
+        "d": {"x": 1},
+        "f": [4],
+    }
+
+    # mismatched types are replaced, not merged
+    dst = {"a": [1], "b": {"x": 1}, "c": 1}
+    merge_json(dst, {"a": {"y": 2}, "b": [2], "c": [3]})
+    assert dst == {"a": {"y": 2}, "b": [2], "c": [3]}
+
+    assert merge_json({}, {"l": [1]}) == {"l": [1]}
+    assert merge_json({"a": 1}, {}) == {"a": 1}
+
+
+def test_data_chunk():
+    "Test lazy decoding of the DataTree of a GetResponse"
+
+    chunk = DataChunk("/a", 1, "json", '{"a": {"b": 1}}')
+    assert chunk._tree is None
+    assert chunk.tree == {"a": {"b": 1}}
+    assert chunk.tree is chunk.tree
+    assert len(chunk) == 15
+
+    chunk = DataChunk("/a", 1, "xml", "<a><b>1</b></a>")
+    assert chunk.tree.tag == "a" and chunk.tree.find("b").text == "1"
+
+    chunk = DataChunk("/a", 1, "json", "")
+    assert chunk.tree is None and len(chunk) == 0
+
+    with pytest.raises(AttributeError):
+        chunk.other = 1
+
+
+def test_commit_pipeline():
+    "Test the accounting of edit and commit replies"
+
+    cand = Candidate()
+    client = Client(cand)
+    pipe = CommitPipeline(client, depth=4)
+    for _ in range(4):
+        pipe.submit(update={"/a": ""})
+    assert pipe.pending == 8
+    # all slots are in use until a commit is answered
+    assert not pipe.slots.acquire(blocking=False)
+
+    edit, commit = client.stub.futures[0:2]
+    edit.done()
+    commit.done()
+    # NB_ERR_NO_CHANGES: the edit went into a neighbouring commit
+    edit, commit = client.stub.futures[2:4]
+    edit.done()
+    commit.done(RpcError(StatusCode.ABORTED, "no changes"))
+    edit, commit = client.stub.futures[4:6]
+    edit.done(RpcError(StatusCode.INVALID_ARGUMENT, "bad"))
+    commit.done(RpcError(StatusCode.INVALID_ARGUMENT, "x"))
+    assert pipe.pending == 2
+
+    edit, commit = client.stub.futures[6:8]
+    edit.done()
+    commit.done()
+    pipe.flush()
+    # every commit reply released its slot
+    for _ in range(4):
+        assert pipe.slots.acquire(blocking=False)
+
+    assert (pipe.committed, pipe.coalesced) == (2, 1)
+    assert pipe.errors == [
+        "EditCandidate failed: INVALID_ARGUMENT: bad",
+        "Commit failed: INVALID_ARGUMENT: x",
+    ]
+    assert len(pipe.latencies) == 4
+
+    pipe.close()
+    assert cand.commits == 1 and pipe.committed == 3
+    assert client.released is cand
+    stats = pipe.stats()
+    assert stats["transactions"] == 4 and stats["coalesced"] == 1
+    assert stats["errors"] == 2 and stats["latency"]["max"] > 0
+
+
+def test_commit_pipeline_close():
+    "Test the final commit of close() when nothing is left to commit"
+
+    cand = Candidate(NorthboundError("Commit", "ABORTED", "no changes"))
+    pipe = CommitPipeline(Client(cand))
+    pipe.close()
+    assert pipe.committed == 0 and pipe.errors == []
+
+    cand = Candidate(NorthboundError("Commit", "INTERNAL", "failed"))
+    pipe = CommitPipeline(Client(cand))
+    pipe.close()
+    assert pipe.errors == ["Commit failed: INTERNAL: failed"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+#
+# test_nsservice.py
+# Tests for library functions: namespace helper services.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the request handling shared by the lib/nsservice.py services.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.nsservice import NsService, decode_request, distribution
+
+
+class CounterService(NsService):
+    query_errors = (KeyError,)
+
+    def __init__(self, sockpath):
+        super(CounterService, self).__init__(sockpath)
+        self.count = 0
+        self.torn_down = False
+
+    async def query(self, req):
+        op = req["op"]
+        if op == "add":
+            self.count += req["value"]
+            self._notify()
+            return self.count
+        if op == "wait":
+            return await self.wait_for(
+                lambda: self.count >= req["count"],
+                lambda: {"count": self.count},
+                req["timeout"],
+            )
+        return None
+
+    async def teardown(self):
+        self.torn_down = True
+
+
+def test_distribution():
+    "Test the summary of sample values"
+
+    assert distribution([]) == {"count": 0}
+    result = distribution([5, 1, 3, 2, 4])
+    assert result == {"count": 5, "min": 1, "max": 5, "avg": 3.0, "p50": 3, "p99": 5}
+    assert distribution(range(200))["p99"] == 198
+
+
+def test_decode_request():
+    "Test request line parsing"
+
+    assert decode_request(b'{"op": "count"}\n') == {"op": "count"}
+    for line in [b"", b"{", b"[1, 2]\n", b"42\n", b'"\xff"\n']:
+        with pytest.raises(ValueError):
+            decode_request(line)
+
+
+def test_service(tmpdir):
+    "Test a request round-trip, malformed requests, waiting and stopping"
+
+    service = CounterService(str(tmpdir.join("counter.sock")))
+
+    async def client():
+        for _ in range(50):
+            if os.path.exists(service.sockpath):
+                break
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(service.sockpath)
+
+        async def request(line):
+            writer.write(line + b"\n")
+            return json.loads((await reader.readline()).decode("utf-8"))
+
+        replies = [
+            await request(b"not json"),
+            await request(b"[]"),
+            await request(b'{"value": 1}'),
+            await request(b'{"op": "add", "value": 2}'),
+            await request(b'{"op": "wait", "count": 3, "timeout": 0.05}'),
+        ]
+        waiter = asyncio.ensure_future(
+            request(b'{"op": "wait", "count": 3, "timeout": 5}')
+        )
+        await asyncio.sleep(0.05)
+        _, writer2 = await asyncio.open_unix_connection(service.sockpath)
+        writer2.write(b'{"op": "add", "value": 1}\n')
+        replies.append(await waiter)
+        replies.append(await request(b'{"op": "stop"}'))
+        writer.close()
+        writer2.close()
+        return replies
+
+    async def scenario():
+        return (await asyncio.gather(service.run(), client()))[1]
+
+    loop = asyncio.new_event_loop()
+    try:
+        replies = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+    assert replies[0]["error"].startswith("invalid request: ")
+    assert replies[1] == {"error": "invalid request: request is not an object"}
+    assert replies[2] == {"error": "'op'"}
+    assert replies[3] == 2
+    assert replies[4] == {"count": 2, "timeout": True}
+    assert replies[5] == {"count": 3, "timeout": False}
+    assert replies[6] is True
+    assert service.torn_down
+    assert not os.path.exists(service.sockpath)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
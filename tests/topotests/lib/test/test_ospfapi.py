@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+#
+# test_ospfapi.py
+# Tests for library functions: OSPF API client.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the OSPF API message encoding, the LSDB mirror and pipelined
+requests against a minimal ospfd API server.
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.ospfapi import (
+    API_HDR,
+    LSA_HDR,
+    MSG_DELETE_REQUEST,
+    MSG_LSA_DELETE_NOTIFY,
+    MSG_LSA_UPDATE_NOTIFY,
+    MSG_ORIGINATE_REQUEST,
+    MSG_READY_NOTIFY,
+    MSG_REGISTER_OPAQUETYPE,
+    MSG_REPLY,
+    OSPF_OPAQUE_AREA_LSA,
+    Lsdb,
+    OspfApiClient,
+    OspfApiError,
+    decode_notify,
+    encode_delete,
+    encode_msg,
+    encode_originate,
+    opaque_lsid,
+)
+
+ROUTER_ID = socket.inet_aton("10.0.0.1")
+
+
+def lsa_notify(msgtype, lsa, is_self=1, area="0.0.0.0"):
+    "Turn the LSA of an originate request into an update/delete notification"
+    lsa = lsa[:4] + lsa[4:8] + ROUTER_ID + lsa[12:]
+    body = socket.inet_aton("0.0.0.0") + socket.inet_aton(area)
+    return msgtype, body + struct.pack("!Bxxx", is_self) + lsa
+
+
+class FakeOspfd(object):
+    """
+    Accepts the sync connection, connects back to the client's port + 1
+    and, like ospf_apiserver.c, answers every request and "installs"
+    originated LSAs by sending update notifications.
+    """
+
+    def __init__(self, error_ids=()):
+        self.error_ids = error_ids
+        self.requests = []
+
+    async def handle(self, reader, writer):
+        host, port = writer.get_extra_info("peername")[:2]
+        _, awriter = await asyncio.open_connection(host, port + 1)
+        try:
+            while True:
+                hdr = await reader.readexactly(API_HDR.size)
+                _, msgtype, msglen, seq = API_HDR.unpack(hdr)
+                body = await reader.readexactly(msglen)
+                self.requests.append(msgtype)
+                notify = []
+                errcode = 0
+                if msgtype == MSG_REGISTER_OPAQUETYPE:
+                    ready = struct.pack("!BBxx4s", body[0], body[1], bytes(4))
+                    notify.append((MSG_READY_NOTIFY, ready))
+                elif msgtype == MSG_ORIGINATE_REQUEST:
+                    opaque_id = struct.unpack_from("!I", body, 12)[0] & 0xFFFFFF
+                    if opaque_id in self.error_ids:
+                        errcode = -7
+                    else:
+                        notify.append(lsa_notify(MSG_LSA_UPDATE_NOTIFY, body[8:]))
+                elif msgtype == MSG_DELETE_REQUEST:
+                    lsa_type, opaque_type, opaque_id = struct.unpack_from(
+                        "!BBxxI", body, 4
+                    )
+                    lsid = struct.pack("!I", opaque_type << 24 | opaque_id)
+                    lsa = LSA_HDR.pack(3600, 0, lsa_type, lsid, bytes(4), 0, 0, 20)
+                    notify.append(lsa_notify(MSG_LSA_DELETE_NOTIFY, lsa))
+                for ntype, nbody in notify:
+                    awriter.write(encode_msg(ntype, 0, nbody))
+                writer.write(encode_msg(MSG_REPLY, seq, struct.pack("!bxxx", errcode)))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            awriter.close()
+            writer.close()
+
+
+def free_port_pair():
+    "A port whose successor is free too"
+    while True:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        other = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            other.bind(("127.0.0.1", port + 1))
+            return port
+        except OSError:
+            pass
+        finally:
+            other.close()
+
+
+def test_encoding():
+    "Test request encoding and notification decoding"
+
+    assert opaque_lsid(240, 5) == "240.0.0.5"
+
+    body = encode_originate(OSPF_OPAQUE_AREA_LSA, 240, 5, b"\1\2\3\4", area="0.0.0.1")
+    assert len(body) == 8 + LSA_HDR.size + 4
+    assert body[4:8] == socket.inet_aton("0.0.0.1")
+    assert body[8 + 3] == OSPF_OPAQUE_AREA_LSA
+    assert body[8 + 4 : 8 + 8] == socket.inet_aton("240.0.0.5")
+    assert struct.unpack_from("!H", body, 8 + 18)[0] == 24
+
+    assert encode_delete(OSPF_OPAQUE_AREA_LSA, 240, 5) == bytes(4) + struct.pack(
+        "!BBxxI", 10, 240, 5
+    )
+    with pytest.raises(ValueError):
+        encode_originate(OSPF_OPAQUE_AREA_LSA, 240, 5, bytes(1500))
+
+    msgtype, nbody = lsa_notify(MSG_LSA_UPDATE_NOTIFY, body[8:], area="0.0.0.1")
+    lsa = decode_notify(msgtype, nbody)
+    assert lsa["msg"] == "update"
+    assert lsa["type"] == OSPF_OPAQUE_AREA_LSA
+    assert lsa["id"] == "240.0.0.5"
+    assert lsa["adv_router"] == "10.0.0.1"
+    assert lsa["area"] == "0.0.0.1"
+    assert lsa["self"]
+    assert lsa["data"] == b"\1\2\3\4"
+
+
+def test_lsdb_index():
+    "Test LSDB mirror indexes and arrival timing"
+
+    lsdb = Lsdb()
+    lsdb.mark()
+    for adv in ("10.0.0.1", "10.0.0.2"):
+        for i in range(10):
+            lsa = {"area": "0.0.0.0", "type": 10, "adv_router": adv}
+            lsa["id"] = opaque_lsid(240, i)
+            lsdb.update(lsa, lsdb.t_mark + i)
+        lsdb.update({"area": "0.0.0.0", "type": 1, "id": adv, "adv_router": adv}, 0)
+    # refresh, not a new LSA
+    lsa = {"area": "0.0.0.0", "type": 1, "id": "10.0.0.1", "adv_router": "10.0.0.1"}
+    lsdb.update(lsa, 0)
+
+    assert len(lsdb.lsas) == 22
+    assert lsdb.counters["updates"] == 23
+    assert len(lsdb.find(lsa_type=10, opaque_type=240)) == 20
+    assert len(lsdb.find(opaque_type=240, adv_router="10.0.0.2")) == 10
+    assert len(lsdb.find(lsa_type=1)) == 2
+    assert len(lsdb.find(lsa_type=10, opaque_type=241)) == 0
+
+    keys = lsdb.find(lsa_type=10, adv_router="10.0.0.1")
+    timing = lsdb.timing(keys, lsdb.added)
+    assert timing == {"count": 10, "first": 0, "last": 9}
+
+    for key in keys:
+        lsdb.delete(
+            {"area": key[0], "type": key[1], "id": key[2], "adv_router": key[3]}, 1
+        )
+    assert len(lsdb.find(lsa_type=10)) == 10
+    assert len(lsdb.by_adv["10.0.0.1"]) == 1
+    assert len(lsdb.removed) == 10
+
+
+def test_pipelined_originate():
+    "Test pipelined originate/delete against a fake ospfd"
+
+    async def run():
+        ospfd = FakeOspfd(error_ids=(7,))
+        server = await asyncio.start_server(ospfd.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        client = OspfApiClient()
+        await client.connect("127.0.0.1", port, local_port=free_port_pair())
+        await client.register_opaque_type(OSPF_OPAQUE_AREA_LSA, 240)
+        assert await client.wait_ready(OSPF_OPAQUE_AREA_LSA, 240, timeout=5)
+
+        result = await client.pipeline(
+            (
+                lambda i=i: client.send_originate(
+                    OSPF_OPAQUE_AREA_LSA, 240, i, bytes(4)
+                )
+                for i in range(1, 101)
+            ),
+            depth=16,
+        )
+        assert result["requests"] == 100
+        assert result["errors"] == {"not ready": 1}
+        assert result["latency"]["count"] == 100
+        assert await client.wait(
+            lambda: len(client.lsdb.find(OSPF_OPAQUE_AREA_LSA, opaque_type=240)) == 99,
+            timeout=5,
+        )
+
+        with pytest.raises(OspfApiError):
+            await client.originate(OSPF_OPAQUE_AREA_LSA, 240, 7, bytes(4))
+
+        result = await client.pipeline(
+            (
+                lambda i=i: client.send_delete(OSPF_OPAQUE_AREA_LSA, 240, i)
+                for i in range(1, 101)
+            ),
+            depth=64,
+        )
+        assert result["errors"] == {}
+        assert await client.wait(lambda: not client.lsdb.lsas, timeout=5)
+
+        await client.close()
+        server.close()
+        await server.wait_closed()
+        return ospfd.requests
+
+    loop = asyncio.new_event_loop()
+    try:
+        requests = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert requests.count(MSG_ORIGINATE_REQUEST) == 101
+    assert requests.count(MSG_DELETE_REQUEST) == 100
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
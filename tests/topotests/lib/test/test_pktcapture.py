@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+#
+# test_pktcapture.py
+# Tests for library functions: packet capture filters.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the filter parsing, BPF compilation and packet classification
+of lib/pktcapture.py.
+"""
+
+import os
+import struct
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.pktcapture import (
+    ETH_P_ARP,
+    ETH_P_IP,
+    ETH_P_IPV6,
+    classify,
+    compile_bpf,
+    parse_filter,
+)
+
+
+def frame(ethertype, payload=b""):
+    return b"\x00" * 12 + struct.pack("!H", ethertype) + payload
+
+
+def ipv4(proto, sport=1000, dport=1000):
+    header = struct.pack("!BB6xBB10x", 0x45, 0, 64, proto)
+    return frame(ETH_P_IP, header + struct.pack("!HH4x", sport, dport))
+
+
+def ipv6(proto, sport=1000, dport=1000):
+    header = struct.pack("!6xBB32x", proto, 64)
+    return frame(ETH_P_IPV6, header + struct.pack("!HH4x", sport, dport))
+
+
+def run_bpf(program, packet):
+    "Minimal classic BPF interpreter for the instructions compile_bpf() emits"
+    pc, acc = 0, 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        if code == 0x28:
+            acc = struct.unpack_from("!H", packet, k)[0]
+        elif code == 0x30:
+            acc = packet[k]
+        elif code == 0x15:
+            pc += jt if acc == k else jf
+        elif code == 0x06:
+            return k
+        else:
+            raise ValueError("unknown BPF instruction {:#x}".format(code))
+
+
+def accepts(exprs, packet):
+    return run_bpf(compile_bpf([parse_filter(e) for e in exprs]), packet) != 0
+
+
+def test_parse_filter():
+    "Test filter expressions"
+
+    assert parse_filter("pim") == {
+        "name": "pim",
+        "ethertype": None,
+        "proto": 103,
+        "ports": None,
+    }
+    assert parse_filter("udp port 5000")["ports"] == (5000,)
+    assert parse_filter("tcp port 179")["proto"] == 6
+    assert parse_filter("ip proto 50")["proto"] == 50
+    assert parse_filter("ether proto 0x88cc")["ethertype"] == 0x88CC
+    for expr in ["", "foo", "udp port", "ether proto x", "sctp port 1"]:
+        with pytest.raises(ValueError):
+            parse_filter(expr)
+
+
+def test_compile_bpf():
+    "Test the kernel filter programs"
+
+    assert compile_bpf([]) is None
+
+    exprs = ["pim", "ripng", "arp"]
+    assert accepts(exprs, ipv4(103))
+    assert accepts(exprs, ipv6(103))
+    assert accepts(exprs, ipv6(17, dport=521))
+    assert accepts(exprs, frame(ETH_P_ARP))
+    assert not accepts(exprs, ipv4(6))
+    assert not accepts(exprs, ipv4(17, dport=521))
+    assert not accepts(exprs, frame(0x88CC))
+    # ports are left to classify()
+    assert accepts(exprs, ipv6(17, dport=5000))
+
+    # an ethertype accepted as a whole must not lose its other protocols
+    for exprs in [
+        ["pim", "ether proto 0x0800"],
+        ["ether proto 0x0800", "pim"],
+    ]:
+        assert accepts(exprs, ipv4(103))
+        assert accepts(exprs, ipv4(6))
+        assert accepts(exprs, ipv6(103))
+        assert not accepts(exprs, ipv6(6))
+
+
+def test_classify():
+    "Test matching packets to filters"
+
+    filters = [parse_filter(e) for e in ["pim", "ether proto 0x0800", "bfd"]]
+    assert classify(ipv4(103), filters) == "pim"
+    assert classify(ipv6(103), filters) == "pim"
+    assert classify(ipv4(6), filters) == "ether proto 0x0800"
+    assert classify(ipv6(17, 49152, 3784), filters) == "bfd"
+    assert classify(ipv6(17, 49152, 3000), filters) is None
+    assert classify(frame(ETH_P_ARP), filters) is None
+    assert classify(b"\x00" * 10, filters) is None
+
+    filters = [parse_filter(e) for e in ["rip", "arp"]]
+    assert classify(ipv4(17, 520, 520), filters) == "rip"
+    assert classify(ipv6(17, 520, 520), filters) is None
+    assert classify(frame(ETH_P_ARP), filters) == "arp"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+#
+# test_sharp.py
+# Tests for library functions: sharpd helpers.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the sharpd commands and "sharp data route" parsing of
+lib/sharp.py.
+"""
+
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.sharp import (
+    nexthop_group_config,
+    sharp_install_routes,
+    sharp_remove_routes,
+    sharp_route_data,
+    sharp_wait,
+)
+
+
+class Router(object):
+    "Fake router, sharpd finishes the install after `polls` queries"
+
+    name = "r1"
+
+    def __init__(self, data, polls=0):
+        self.data = data
+        self.polls = polls
+        self.commands = []
+
+    def vtysh_cmd(self, cmd, isjson=False):
+        self.commands.append(cmd)
+        if cmd != "sharp data route":
+            return ""
+        if self.polls:
+            self.polls -= 1
+            return "Prefix: 10.0.0.0/32 Total: 1000 0 0 Time: 0.000000\n"
+        return self.data
+
+
+def test_commands():
+    "Test the sharpd commands"
+
+    router = Router("")
+    sharp_install_routes(router, "10.0.0.0", 1000, nexthop="192.168.0.2")
+    sharp_install_routes(
+        router, "10.0.0.0", 1000, nexthop_group="four", vrf="red", instance=2
+    )
+    sharp_remove_routes(router, "10.0.0.0", 1000, vrf="red", instance=2)
+    assert router.commands == [
+        "sharp install routes 10.0.0.0 nexthop 192.168.0.2 1000",
+        "sharp install routes vrf red 10.0.0.0 nexthop-group four 1000 instance 2",
+        "sharp remove routes vrf red 10.0.0.0 1000 instance 2",
+    ]
+    config = nexthop_group_config("two", [("10.0.0.2", "eth0"), ("10.0.1.2", "eth1")])
+    assert config == (
+        "nexthop-group two\n nexthop 10.0.0.2 eth0\n nexthop 10.0.1.2 eth1\n!\n"
+    )
+
+
+def test_route_data():
+    "Test 'sharp data route' parsing, with and without zero padding"
+
+    router = Router("Prefix: 10.0.0.0/32 Total: 1000 1000 0 Time: 1.005000\n")
+    assert sharp_route_data(router) == {
+        "prefix": "10.0.0.0/32",
+        "total": 1000,
+        "installed": 1000,
+        "removed": 0,
+        "time": 1.005,
+    }
+    router.data = "Prefix: 10.0.0.0/32 Total: 1000 0 1000 Time: 2.5000\n"
+    assert sharp_route_data(router)["time"] == 2.005
+    router.data = "% Unknown command\n"
+    assert sharp_route_data(router) is None
+
+
+def test_wait():
+    "Test waiting for sharpd to finish"
+
+    router = Router("Prefix: 10.0.0.0/32 Total: 1000 1000 0 Time: 0.250000\n", 2)
+    result = sharp_wait(router, installed=1000, timeout=5, interval=0.01)
+    assert not result["timeout"] and result["time"] == 0.25
+    assert router.commands.count("sharp data route") == 3
+
+    result = sharp_wait(router, removed=1000, timeout=0.05, interval=0.01)
+    assert result["timeout"] and result["installed"] == 1000
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+#
+# test_topolog.py
+# Tests for library functions: command log sink.
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the payload truncation and sampling of CommandLog in
+lib/topolog.py.
+"""
+
+import gzip
+import json
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.topolog import CommandLog
+
+
+def read_records(path):
+    with gzip.open(path, "rt") as fd:
+        return [json.loads(line) for line in fd]
+
+
+def test_truncate():
+    "Test truncation of text and JSON payloads"
+
+    cmdlog = CommandLog(max_payload=10)
+    assert cmdlog.truncate("short") == "short"
+    assert cmdlog.truncate("x" * 15) == "xxxxxxxxxx... [5 more characters]"
+    assert cmdlog.truncate("x" * 15, 0) == "x" * 15
+    assert cmdlog.truncate("x" * 15, 12) == "x" * 12 + "... [3 more characters]"
+
+    data = {"routes": list(range(100))}
+    assert cmdlog.truncate({"a": 1}) == '{"a": 1}'
+    assert cmdlog.truncate(data) == '{"routes":... [truncated]'
+    assert json.loads(cmdlog.truncate(data, 0)) == data
+
+
+def test_record(tmpdir):
+    "Test sampled records and dumping the payloads of a failed step"
+
+    path = str(tmpdir.join("r1.cmdlog.gz"))
+    cmdlog = CommandLog(max_payload=4, sample=3)
+    cmdlog.add_router("r1", path)
+    cmdlog.record("r2", "show version", "not logged")
+    cmdlog.new_step("step1")
+    for i in range(1, 7):
+        cmdlog.record("r1", "cmd{}".format(i), "output{}".format(i))
+    cmdlog.dump_step()
+    cmdlog.close()
+
+    records = read_records(path)
+    assert [rec["cmd"] for rec in records[:6]] == [
+        "cmd{}".format(i) for i in range(1, 7)
+    ]
+    for i, rec in enumerate(records[:6], 1):
+        assert rec["step"] == "step1" and rec["size"] == 7
+        if i % 3 == 0:
+            # every third command is logged in full
+            assert rec["full"] and rec["output"] == "output{}".format(i)
+        else:
+            assert "full" not in rec
+            assert rec["output"] == "outp... [3 more characters]"
+
+    # dump_step() writes all of them in full
+    assert len(records) == 12
+    for i, rec in enumerate(records[6:], 1):
+        assert rec["full"] and rec["output"] == "output{}".format(i)
+
+
+def test_dump_after_close(tmpdir):
+    "Test dumping a step after close(), as a failed teardown does"
+
+    path = str(tmpdir.join("r1.cmdlog.gz"))
+    cmdlog = CommandLog(max_payload=4)
+    cmdlog.add_router("r1", path)
+    cmdlog.new_step("teardown")
+    for i in range(1, 7):
+        cmdlog.record("r1", "cmd{}".format(i), "output{}".format(i))
+    cmdlog.close()
+    cmdlog.dump_step()
+
+    # the earlier records are kept and the dump is flushed
+    records = read_records(path)
+    assert len(records) == 12
+    assert [rec.get("full", False) for rec in records] == [False] * 6 + [True] * 6
+    assert records[11]["output"] == "output6"
+
+    cmdlog.record("r1", "cmd7", "output7")
+    cmdlog.close()
+    assert len(read_records(path)) == 13
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -61,7 +61,7 @@ from mininet.log import setLogLevel
 from mininet.cli import CLI
 
 from lib import topotest
-from lib.topolog import logger, logger_config
+from lib.topolog import logger, logger_config, cmdlog
 from lib.topotest import set_sysctl
 
 CWD = os.path.dirname(os.path.realpath(__file__))
@@ -99,6 +99,10 @@ tgen_defaults = {
     "frrdir": "/usr/lib/frr",
     "routertype": "frr",
     "memleak_path": "",
+    "cmdlog_max_payload": "4096",
+    "cmdlog_sample": "0",
+    "clippy": "",
+    "frr_xref": "",
 }
 
 
@@ -167,6 +171,11 @@ class Topogen(object):
         pytestini_path = os.path.join(CWD, "../pytest.ini")
         self.config.read(pytestini_path)
 
+        cmdlog.configure(
+            max_payload=self.config.get(self.CONFIG_SECTION, "cmdlog_max_payload"),
+            sample=self.config.get(self.CONFIG_SECTION, "cmdlog_sample"),
+        )
+
     def add_router(self, name=None, cls=topotest.Router, **params):
         """
         Adds a new router to the topology. This function has the following
@@ -356,6 +365,7 @@ class Topogen(object):
                 "Errors found post shutdown - details follow: {}".format(errors)
             )
 
+        cmdlog.close()
         self.net.stop()
 
     def mininet_cli(self):
@@ -636,6 +646,7 @@ class TopoRouter(TopoGear):
         # Open router log file
         logfile = "{0}/{1}.log".format(self.logdir, name)
         self.logger = logger_config.get_logger(name=name, target=logfile)
+        cmdlog.add_router(name, "{}/{}/commands.jsonl.gz".format(self.logdir, name))
 
         self.tgen.topo.addNode(self.name, cls=self.cls, **params)
 
@@ -799,8 +810,11 @@ class TopoRouter(TopoGear):
         vtysh_command = 'vtysh {} -c "{}" 2>/dev/null'.format(dparam, command)
 
         output = self.run(vtysh_command)
+        cmdlog.record(self.name, command, output)
         self.logger.info(
-            "\nvtysh command => {}\nvtysh output <= {}".format(command, output)
+            "\nvtysh command => {}\nvtysh output <= {}".format(
+                command, cmdlog.truncate(output)
+            )
         )
         if isjson is False:
             return output
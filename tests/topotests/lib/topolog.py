@@ -27,7 +27,17 @@ This file defines our logging abstraction.
 """
 
 import sys
+import gzip
+import json
 import logging
+import threading
+import time
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 # Helper dictionary to convert Topogen logging levels to Python's logging.
 DEBUG_TOPO2LOGGING = {
@@ -110,9 +120,170 @@ class Logger(object):
         return nlogger
 
 
+#
+# Command log sink
+#
+
+
+class CommandLog(object):
+    """
+    Bounded, buffered sink for router command output.
+
+    Every command is written as one JSON record per line to a per-router
+    gzip compressed file by a background writer thread.  Payloads larger
+    than `max_payload` characters are truncated, except for one in every
+    `sample` commands (0 disables sampling).  The untruncated payloads of
+    the current test step are kept in memory and only written out when
+    `dump_step()` is called, i.e. when the step failed.
+    """
+
+    def __init__(self, max_payload=4096, sample=0, queue_size=10000, step_size=256):
+        self.max_payload = max_payload
+        self.sample = sample
+        self.queue_size = queue_size
+        self.paths = {}
+        self.files = {}
+        self.written = set()
+        self.step = None
+        self.step_records = deque(maxlen=step_size)
+        self.count = 0
+        self.dropped = 0
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def configure(self, max_payload=None, sample=None):
+        "Change truncation and sampling settings"
+        if max_payload is not None:
+            self.max_payload = int(max_payload)
+        if sample is not None:
+            self.sample = int(sample)
+
+    def add_router(self, router, path):
+        "Send command records of `router` to the gzip file `path`"
+        self.paths[router] = path
+
+    def new_step(self, name):
+        "Start a new step, forgetting the full payloads of the previous one"
+        self.step = name
+        self.step_records.clear()
+
+    def truncate(self, data, limit=None):
+        """
+        Return a string representation of `data` (command output text or
+        parsed JSON) of at most `limit` characters.  JSON data is encoded
+        incrementally so large replies are never fully serialized.
+        """
+        if limit is None:
+            limit = self.max_payload
+        if is_string(data):
+            if limit <= 0 or len(data) <= limit:
+                return data
+            return "{}... [{} more characters]".format(data[:limit], len(data) - limit)
+
+        chunks = []
+        length = 0
+        for chunk in json.JSONEncoder().iterencode(data):
+            chunks.append(chunk)
+            length += len(chunk)
+            if limit > 0 and length > limit:
+                return "{}... [truncated]".format("".join(chunks)[:limit])
+        return "".join(chunks)
+
+    def record(self, router, cmd, output):
+        "Queue a command record, never blocking the caller"
+        if router not in self.paths:
+            return
+
+        self.count += 1
+        full = self.sample > 0 and self.count % self.sample == 0
+        rec = {
+            "ts": time.time(),
+            "router": router,
+            "step": self.step,
+            "cmd": cmd,
+        }
+        if is_string(output):
+            rec["size"] = len(output)
+        self.step_records.append((rec, output))
+        if full:
+            rec = dict(rec, full=True)
+        self._put(router, rec, output, 0 if full else self.max_payload)
+
+    def dump_step(self):
+        """
+        Write the full payloads of all commands of the current step.  If the
+        log was already closed (failed teardown), the records are appended
+        and the files closed again.
+        """
+        closed = self.thread is None
+        for rec, output in list(self.step_records):
+            rec = dict(rec, full=True)
+            self._put(rec["router"], rec, output, 0)
+        self.step_records.clear()
+        if closed:
+            self.close()
+
+    def _put(self, router, rec, output, limit):
+        with self.lock:
+            if self.thread is None:
+                self.queue = queue.Queue(maxsize=self.queue_size)
+                self.thread = threading.Thread(target=self._writer, name="cmdlog")
+                self.thread.daemon = True
+                self.thread.start()
+        try:
+            self.queue.put_nowait((self.paths[router], rec, output, limit))
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, rec, output, limit = item
+            rec = dict(rec, output=self.truncate(output, limit))
+            try:
+                fd = self.files.get(path)
+                if fd is None:
+                    # never truncate what was written before a close()
+                    mode = "at" if path in self.written else "wt"
+                    fd = gzip.open(path, mode)
+                    self.files[path] = fd
+                    self.written.add(path)
+                fd.write(json.dumps(rec) + "\n")
+            except (IOError, OSError) as error:
+                logger.warning("cmdlog: failed to write %s: %s", path, str(error))
+
+        for fd in self.files.values():
+            fd.close()
+        self.files = {}
+
+    def close(self):
+        "Flush all queued records and close the log files"
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is None:
+            return
+        self.queue.put(None)
+        thread.join()
+        if self.dropped:
+            logger.warning("cmdlog: dropped %d command records", self.dropped)
+            self.dropped = 0
+
+
+def is_string(value):
+    try:
+        return isinstance(value, basestring)
+    except NameError:
+        return isinstance(value, str)
+
+
 #
 # Global variables
 #
 
 logger_config = Logger()
 logger = logger_config.logger
+cmdlog = CommandLog()
@@ -35,9 +35,11 @@ import platform
 import difflib
 import time
 import signal
+import fnmatch
 
 from lib.topolog import logger
 from copy import deepcopy
+from collections import deque
 
 if sys.version_info[0] > 2:
     import configparser
@@ -952,7 +954,159 @@ def sleep(amount, reason=None):
     time.sleep(amount)
 
 
-def checkAddressSanitizerError(output, router, component, logdir=""):
+class LogWatcher(object):
+    """
+    Incremental scanner for daemon log files.
+
+    For every watched file the read offset is saved, so each update() only
+    reads and scans the bytes appended since the previous one.  Matches of
+    the known patterns (memory statistics, sanitizer reports, crashes,
+    valgrind summaries) are recorded as structured events:
+
+        {"path": ..., "daemon": ..., "kind": ..., "line": ...,
+         "groups": (...), "offset": ..., "time": ...}
+    """
+
+    PATTERNS = [
+        ("memstats", re.compile(r"memstats")),
+        ("asan", re.compile(r"(==[0-9]+==)ERROR: AddressSanitizer: ([^\s]*) ")),
+        ("crash", re.compile(r"Received signal (\d+) at")),
+        ("valgrind", re.compile(r"ERROR SUMMARY: (\d+) errors")),
+    ]
+
+    # coarsest file timestamp granularity to expect, in seconds
+    MTIME_TICK = 1.0
+
+    def __init__(self, tail_lines=20):
+        self.tail_lines = tail_lines
+        self.files = {}
+        self.dirs = {}
+        self.events = []
+
+    def _state(self, path, daemon, keep_text=True):
+        state = self.files.get(path)
+        if state is None:
+            state = {
+                "daemon": daemon,
+                "offset": 0,
+                "inode": None,
+                "partial": b"",
+                "chunks": [],
+                "tail": deque(maxlen=self.tail_lines),
+                "kinds": {},
+                "keep_text": keep_text,
+            }
+            self.files[path] = state
+        return state
+
+    def update(self, path, daemon=None, keep_text=True):
+        """
+        Scan data appended to `path` since the last call, return new events.
+        With `keep_text` False only the last lines of the file are kept.
+        """
+        state = self._state(path, daemon, keep_text)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return []
+
+        if st.st_ino != state["inode"] or st.st_size < state["offset"]:
+            # new or truncated file, start over
+            del self.files[path]
+            state = self._state(path, daemon, keep_text)
+            state["inode"] = st.st_ino
+        if st.st_size == state["offset"]:
+            return []
+
+        with open(path, "rb") as fd:
+            fd.seek(state["offset"])
+            data = fd.read(st.st_size - state["offset"])
+
+        offset = state["offset"] - len(state["partial"])
+        state["offset"] += len(data)
+        if state["keep_text"]:
+            state["chunks"].append(data)
+        data = state["partial"] + data
+        lines = data.split(b"\n")
+        state["partial"] = lines.pop()
+
+        events = []
+        for line in lines:
+            text = line.decode("utf-8", "replace")
+            state["tail"].append(text)
+            for kind, regexp in self.PATTERNS:
+                match = regexp.search(text)
+                if match is None:
+                    continue
+                event = {
+                    "path": path,
+                    "daemon": state["daemon"],
+                    "kind": kind,
+                    "line": text,
+                    "groups": match.groups(),
+                    "offset": offset,
+                    "time": time.time(),
+                }
+                state["kinds"].setdefault(kind, []).append(event)
+                events.append(event)
+            offset += len(line) + 1
+
+        self.events.extend(events)
+        return events
+
+    def found(self, path, kind):
+        "Return the events of `kind` seen so far in `path`"
+        state = self.files.get(path)
+        if state is None:
+            return []
+        return state["kinds"].get(kind, [])
+
+    def text(self, path):
+        "Return all data read so far from `path`"
+        state = self.files.get(path)
+        if state is None:
+            return ""
+        if len(state["chunks"]) > 1:
+            state["chunks"] = [b"".join(state["chunks"])]
+        if not state["chunks"]:
+            return ""
+        return state["chunks"][0].decode("utf-8", "replace")
+
+    def tail(self, path):
+        "Return the last lines of `path` (complete lines only)"
+        state = self.files.get(path)
+        if state is None:
+            return ""
+        return "\n".join(state["tail"])
+
+    def glob(self, pattern):
+        """
+        Like glob.glob() for a pattern without wildcards in the directory
+        part, but the directory is only listed again when it changed.
+        """
+        dirname, basename = os.path.split(pattern)
+        try:
+            st = os.stat(dirname)
+        except OSError:
+            return []
+        key = (st.st_mtime_ns, st.st_nlink, st.st_size)
+        cached = self.dirs.get(dirname)
+        if cached is None or cached[0] != key:
+            names = sorted(os.listdir(dirname))
+            # a file created within the same timestamp tick would not
+            # change the key, so don't trust a listing that recent
+            if time.time() - st.st_mtime > self.MTIME_TICK:
+                self.dirs[dirname] = (key, names)
+            else:
+                self.dirs.pop(dirname, None)
+            cached = (key, names)
+        return [
+            os.path.join(dirname, name)
+            for name in fnmatch.filter(cached[1], basename)
+        ]
+
+
+def checkAddressSanitizerError(output, router, component, logdir="", watcher=None):
     "Checks for AddressSanitizer in output. If found, then logs it and returns true, false otherwise"
 
     def processAddressSanitizerError(asanErrorRe, output, router, component):
@@ -1025,9 +1179,8 @@ def checkAddressSanitizerError(output, router, component, logdir=""):
                 addrSanFile.write("\n---------------\n")
         return
 
-    addressSanitizerError = re.search(
-        "(==[0-9]+==)ERROR: AddressSanitizer: ([^\s]*) ", output
-    )
+    asanErrorRe = dict(LogWatcher.PATTERNS)["asan"]
+    addressSanitizerError = asanErrorRe.search(output)
     if addressSanitizerError:
         processAddressSanitizerError(addressSanitizerError, output, router, component)
         return True
@@ -1038,12 +1191,22 @@ def checkAddressSanitizerError(output, router, component, logdir=""):
         logger.debug(
             "Log check for %s on %s, pattern %s\n" % (component, router, filepattern)
         )
+        if watcher is not None:
+            for file in watcher.glob(filepattern):
+                watcher.update(file, component)
+                if watcher.found(file, "asan"):
+                    asanError = watcher.text(file)
+                    addressSanitizerError = asanErrorRe.search(asanError)
+                    processAddressSanitizerError(
+                        addressSanitizerError, asanError, router, component
+                    )
+                    return True
+            return False
+
         for file in glob.glob(filepattern):
             with open(file, "r") as asanErrorFile:
                 asanError = asanErrorFile.read()
-            addressSanitizerError = re.search(
-                "(==[0-9]+==)ERROR: AddressSanitizer: ([^\s]*) ", asanError
-            )
+            addressSanitizerError = asanErrorRe.search(asanError)
             if addressSanitizerError:
                 processAddressSanitizerError(
                     addressSanitizerError, asanError, router, component
@@ -1128,6 +1291,7 @@ class Router(Node):
         self.daemondir = None
         self.hasmpls = False
         self.routertype = "frr"
+        self.logwatch = LogWatcher()
         self.daemons = {
             "zebra": 0,
             "ripd": 0,
@@ -1463,6 +1627,20 @@ class Router(Node):
     def getLog(self, log, daemon):
         return self.cmd("cat {}/{}/{}.{}".format(self.logdir, self.name, daemon, log))
 
+    def watchLog(self, log, daemon):
+        """
+        Scan the new part of a daemon log file, returns the file path to use
+        with the self.logwatch accessors.
+        """
+        path = "{}/{}/{}.{}".format(self.logdir, self.name, daemon, log)
+        # daemon logs can be large, only keep stdout/stderr in memory
+        self.logwatch.update(path, daemon, keep_text=(log != "log"))
+        return path
+
+    def logEvents(self, kind=None):
+        "Return the structured events found so far in this router's logs"
+        return [e for e in self.logwatch.events if kind is None or e["kind"] == kind]
+
     def startRouterDaemons(self, daemons=None, tgen=None):
         "Starts all FRR daemons for this router."
 
@@ -1681,9 +1859,10 @@ class Router(Node):
         for daemon in self.daemons:
             if self.daemons[daemon] == 1:
                 # Look for core file
-                corefiles = glob.glob(
+                corefiles = self.logwatch.glob(
                     "{}/{}/{}_core*.dmp".format(self.logdir, self.name, daemon)
                 )
+                errlog = self.watchLog("err", daemon)
                 if len(corefiles) > 0:
                     backtrace = gdb_core(self, daemon, corefiles)
                     traces = (
@@ -1693,8 +1872,8 @@ class Router(Node):
                     )
                     reportMade = True
                 elif reportLeaks:
-                    log = self.getStdErr(daemon)
-                    if "memstats" in log:
+                    if self.logwatch.found(errlog, "memstats"):
+                        log = self.logwatch.text(errlog)
                         sys.stderr.write(
                             "%s: %s has memory leaks:\n" % (self.name, daemon)
                         )
@@ -1712,8 +1891,11 @@ class Router(Node):
                         sys.stderr.write(log)
                         reportMade = True
                 # Look for AddressSanitizer Errors and append to /tmp/AddressSanitzer.txt if found
+                asanlog = ""
+                if self.logwatch.found(errlog, "asan"):
+                    asanlog = self.logwatch.text(errlog)
                 if checkAddressSanitizerError(
-                    self.getStdErr(daemon), self.name, daemon, self.logdir
+                    asanlog, self.name, daemon, self.logdir, self.logwatch
                 ):
                     sys.stderr.write(
                         "%s: Daemon %s killed by AddressSanitizer" % (self.name, daemon)
@@ -1753,7 +1935,7 @@ class Router(Node):
                     )
 
                 # Look for core file
-                corefiles = glob.glob(
+                corefiles = self.logwatch.glob(
                     "{}/{}/{}_core*.dmp".format(self.logdir, self.name, daemon)
                 )
                 if len(corefiles) > 0:
@@ -1763,14 +1945,7 @@ class Router(Node):
                     if os.path.isfile(
                         "{}/{}/{}.log".format(self.logdir, self.name, daemon)
                     ):
-                        log_tail = subprocess.check_output(
-                            [
-                                "tail -n20 {}/{}/{}.log 2> /dev/null".format(
-                                    self.logdir, self.name, daemon
-                                )
-                            ],
-                            shell=True,
-                        )
+                        log_tail = self.logwatch.tail(self.watchLog("log", daemon))
                         sys.stderr.write(
                             "\nFrom %s %s %s log file:\n"
                             % (self.routertype, self.name, daemon)
@@ -1778,8 +1953,12 @@ class Router(Node):
                         sys.stderr.write("%s\n" % log_tail)
 
                 # Look for AddressSanitizer Errors and append to /tmp/AddressSanitzer.txt if found
+                errlog = self.watchLog("err", daemon)
+                asanlog = ""
+                if self.logwatch.found(errlog, "asan"):
+                    asanlog = self.logwatch.text(errlog)
                 if checkAddressSanitizerError(
-                    self.getStdErr(daemon), self.name, daemon, self.logdir
+                    asanlog, self.name, daemon, self.logdir, self.logwatch
                 ):
                     return "%s: Daemon %s not running - killed by AddressSanitizer" % (
                         self.name,
@@ -1882,8 +2061,9 @@ class Router(Node):
         filename = filename_prefix + re.sub(r"\.py", "", testscript) + ".txt"
         for daemon in self.daemons:
             if self.daemons[daemon] == 1:
-                log = self.getStdErr(daemon)
-                if "memstats" in log:
+                errlog = self.watchLog("err", daemon)
+                if self.logwatch.found(errlog, "memstats"):
+                    log = self.logwatch.text(errlog)
                     # Found memory leak
                     logger.info(
                         "\nRouter {} {} StdErr Log:\n{}".format(self.name, daemon, log)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+#
+# test_ospf_apiclient_perf.py
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+test_ospf_apiclient_perf.py: opaque LSA injection through the OSPF API.
+
+    r1 ---- r2 ---- r3
+
+ospfd runs with the API server enabled on all routers.  lib/ospfapi.py
+originates type 10 opaque LSAs on r1, pipelined with increasing depth,
+while the clients on r2 and r3 mirror their router's LSDB.  For every step
+the LSAs/sec accepted by r1's ospfd and the delay until the LSAs show up
+in r1's own and its neighbors' databases (one and two hops away) are
+logged, then the same for deleting them.  Results are written to
+ospf_apiclient_perf.json in r1's log directory.
+"""
+
+import json
+import os
+import sys
+import pytest
+from functools import partial
+
+# Save the Current Working Directory to find configuration files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../"))
+
+# pylint: disable=C0413
+# Import topogen and topotest helpers
+from lib import topotest
+from lib.topogen import Topogen, TopoRouter, get_topogen
+from lib.topolog import logger
+from lib.ospfapi import OspfApiAgent, OSPF_OPAQUE_AREA_LSA
+
+# Required to instantiate the topology builder class.
+from mininet.topo import Topo
+
+pytestmark = [pytest.mark.ospfd]
+
+OPAQUE_TYPE = 240
+ORIGINATOR = "10.0.255.1"
+
+# LSAs originated per step, requests in flight and the time allowed for
+# the LSAs to reach r3
+STEPS = [(1000, 1, 60), (1000, 32, 60), (10000, 64, 180)]
+
+agents = {}
+results = []
+
+
+class NetworkTopo(Topo):
+    "OSPF API Performance Topology"
+
+    def build(self, **_opts):
+        "Build function"
+
+        tgen = get_topogen(self)
+
+        for routern in range(1, 4):
+            tgen.add_router("r{}".format(routern))
+
+        switch = tgen.add_switch("s1")
+        switch.add_link(tgen.gears["r1"])
+        switch.add_link(tgen.gears["r2"])
+
+        switch = tgen.add_switch("s2")
+        switch.add_link(tgen.gears["r2"])
+        switch.add_link(tgen.gears["r3"])
+
+
+def setup_module(module):
+    "Setup topology"
+    tgen = Topogen(NetworkTopo, module.__name__)
+    tgen.start_topology()
+
+    for rname, router in tgen.routers().items():
+        router.load_config(
+            TopoRouter.RD_ZEBRA, os.path.join(CWD, "{}/zebra.conf".format(rname))
+        )
+        router.load_config(
+            TopoRouter.RD_OSPF, os.path.join(CWD, "{}/ospfd.conf".format(rname)), "-a"
+        )
+
+    tgen.start_router()
+
+    for rname in sorted(tgen.routers()):
+        agent = OspfApiAgent(tgen, rname)
+        if not agent.start():
+            tgen.set_error("OSPF API client on {} failed to start".format(rname))
+            break
+        agents[rname] = agent
+
+
+def teardown_module(_mod):
+    "Teardown the pytest environment"
+    tgen = get_topogen()
+
+    for agent in agents.values():
+        agent.stop()
+    if results:
+        rdir = os.path.join(tgen.gears["r1"].logdir, "r1")
+        with open(os.path.join(rdir, "ospf_apiclient_perf.json"), "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    tgen.stop_topology()
+
+
+def test_ospf_convergence():
+    "Wait for the adjacencies and the LSDB mirrors to be in sync"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    neighbors = {"r1": ["r2"], "r2": ["r1", "r3"], "r3": ["r2"]}
+    for rname, nbrs in neighbors.items():
+        expected = {
+            "neighbors": dict(
+                ("10.0.255.{}".format(nbr[1:]), [{"state": "Full/DROther"}])
+                for nbr in nbrs
+            )
+        }
+        test_func = partial(
+            topotest.router_json_cmp,
+            tgen.gears[rname],
+            "show ip ospf neighbor json",
+            expected,
+        )
+        _, result = topotest.run_and_expect(test_func, None, count=60, wait=1)
+        assert result is None, "OSPF did not converge on {}".format(rname)
+
+    # every client sees the router LSAs of all routers
+    for rname, agent in agents.items():
+        result = agent.wait(3, timeout=30, lsa_type=1)
+        assert not result["timeout"], "{} LSDB mirror has {} router LSAs".format(
+            rname, result["count"]
+        )
+
+
+def test_register_opaque_type():
+    "Register the opaque type on r1 and wait until it can be originated"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    assert agents["r1"].register(
+        OSPF_OPAQUE_AREA_LSA, OPAQUE_TYPE
+    ), "opaque type {} not ready on r1".format(OPAQUE_TYPE)
+
+
+def arrival(result, mark, origin, key):
+    "first/last arrival in `result` as seconds after `origin`"
+    timing = result[key]
+    if not timing["count"]:
+        return None
+    return {
+        "first": mark + timing["first"] - origin,
+        "last": mark + timing["last"] - origin,
+    }
+
+
+def run_step(index, count, depth, timeout):
+    start = index * 100000 + 1
+    lsa_filter = {
+        "lsa_type": OSPF_OPAQUE_AREA_LSA,
+        "opaque_type": OPAQUE_TYPE,
+        "adv_router": ORIGINATOR,
+    }
+    step = {"count": count, "depth": depth}
+
+    for op, expect, key in (("originate", count, "added"), ("delete", 0, "removed")):
+        marks = dict((rname, agent.mark()) for rname, agent in agents.items())
+        func = getattr(agents["r1"], op)
+        sent = func(OSPF_OPAQUE_AREA_LSA, OPAQUE_TYPE, count, start, depth)
+        logger.info(
+            "%s %d LSAs depth %d: %.0f LSAs/s, reply latency %s",
+            op,
+            count,
+            depth,
+            sent["rate"] or 0,
+            sent["latency"],
+        )
+        assert not sent["errors"], "{} errors: {}".format(op, sent["errors"])
+
+        step[op] = {"api": sent}
+        for rname in ("r1", "r2", "r3"):
+            result = agents[rname].wait(expect, timeout=timeout, **lsa_filter)
+            assert not result["timeout"], "{}: {} of {} LSAs after {}".format(
+                rname, result["count"], expect, op
+            )
+            delay = arrival(result, marks[rname], sent["start"], key)
+            step[op][rname] = delay
+            logger.info("  %s: %s", rname, delay)
+
+    results.append(step)
+
+
+def test_originate_rate():
+    "Originate and delete opaque LSAs, measure rate and flooding delay"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    for index, (count, depth, timeout) in enumerate(STEPS):
+        run_step(index, count, depth, timeout)
+
+
+# Mem leak testcase
+def test_memory_leak():
+    "Run the memory leak test and report results."
+    tgen = get_topogen()
+    if not tgen.is_memleak_enabled():
+        pytest.skip("Memory leak test/report is disabled")
+    tgen.report_memory_leaks()
+
+
+if __name__ == "__main__":
+    args = ["-s"] + sys.argv[1:]
+    sys.exit(pytest.main(args))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+
+#
+# test_zebra_route_scale_perf.py
+#
+# Copyright (c) 2021 by
+# Network Device Education Foundation, Inc. ("NetDEF")
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND NETDEF DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL NETDEF BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+test_zebra_route_scale_perf.py: zebra route install/removal rate.
+
+sharpd installs and removes 10k to 1M routes through nexthop groups of 1
+to 16 nexthops.  For every step the following is recorded:
+
+* kernel: time from the sharp command to the first/last route in the
+  kernel FIB and the update rate, from lib/kernelfib.py
+* sharpd: time until zebra notified sharpd of the last route installed
+  (or removed), i.e. RIB processing plus the dataplane
+* zebra: CPU time and load, RSS, "show memory" totals and the memory types
+  that changed the most, from lib/daemonstats.py
+* dplane: "show zebra dplane" counter deltas and the queue depth over time
+
+Results, along with the zebra version and its dataplane/netlink settings,
+are written to zebra_route_scale_perf.json in r1's log directory to
+compare builds and settings.
+"""
+
+import json
+import os
+import sys
+import time
+import pytest
+from functools import partial
+
+# Save the Current Working Directory to find configuration files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../"))
+
+# pylint: disable=C0413
+# Import topogen and topotest helpers
+from lib import topotest
+from lib.topogen import Topogen, TopoRouter, get_topogen
+from lib.topolog import logger
+from lib.kernelfib import FibMonitor
+from lib.daemonstats import DaemonSampler, zebra_dplane
+from lib.sharp import sharp_install_routes, sharp_remove_routes, sharp_wait
+
+# Required to instantiate the topology builder class.
+from mininet.topo import Topo
+
+pytestmark = [pytest.mark.sharpd]
+
+START = "10.0.0.0"
+FANOUTS = [1, 2, 4, 8, 16]
+
+# routes, nexthops per route (nexthop-group "fanoutN"), timeout per phase
+STEPS = [
+    (10000, 1, 60),
+    (10000, 16, 60),
+    (100000, 1, 120),
+    (100000, 4, 120),
+    (100000, 16, 180),
+    (1000000, 1, 600),
+    (1000000, 16, 900),
+]
+
+# zebra settings applied before the steps, e.g. "zebra dplane limit 1000"
+# or "zebra kernel netlink batch-tx-buf 131072 65536"; the effective
+# settings are recorded with the results either way
+ZEBRA_SETTINGS = []
+
+fib = None
+results = {"zebra": {}, "steps": []}
+
+
+class NetworkTopo(Topo):
+    "Zebra Route Scale Performance Topology"
+
+    def build(self, **_opts):
+        "Build function"
+
+        tgen = get_topogen(self)
+
+        tgen.add_router("r1")
+
+        # one link per nexthop of the largest group
+        for switchn in range(0, max(FANOUTS)):
+            switch = tgen.add_switch("sw{}".format(switchn))
+            switch.add_link(tgen.gears["r1"])
+
+
+def setup_module(module):
+    "Setup topology"
+    global fib
+
+    tgen = Topogen(NetworkTopo, module.__name__)
+    tgen.start_topology()
+
+    r1 = tgen.gears["r1"]
+    r1.load_config(TopoRouter.RD_ZEBRA, os.path.join(CWD, "r1/zebra.conf"))
+    r1.load_config(TopoRouter.RD_SHARP, os.path.join(CWD, "r1/sharpd.conf"))
+    tgen.start_router()
+
+    fib = FibMonitor(tgen, "r1")
+    if not fib.start():
+        tgen.set_error("kernel FIB monitor failed to start")
+
+
+def teardown_module(_mod):
+    "Teardown the pytest environment"
+    tgen = get_topogen()
+
+    if fib is not None:
+        fib.stop()
+    if results["steps"]:
+        rdir = os.path.join(tgen.gears["r1"].logdir, "r1")
+        with open(os.path.join(rdir, "zebra_route_scale_perf.json"), "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    tgen.stop_topology()
+
+
+def test_zebra_settings():
+    "Apply ZEBRA_SETTINGS, record version and settings"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    r1 = tgen.gears["r1"]
+    if ZEBRA_SETTINGS:
+        r1.vtysh_cmd("configure terminal\n" + "\n".join(ZEBRA_SETTINGS))
+
+    config = r1.vtysh_cmd("show running-config", daemon="zebra")
+    results["zebra"] = {
+        "version": r1.vtysh_cmd("show version", daemon="zebra").strip(),
+        "settings": [
+            line.strip()
+            for line in config.splitlines()
+            if line.startswith(("zebra ", "no zebra "))
+        ],
+        "dplane_providers": r1.vtysh_cmd("show zebra dplane providers").strip(),
+    }
+    logger.info("zebra settings: %s", results["zebra"]["settings"])
+
+    # all nexthops of the largest group must be usable
+    expected = {
+        "routes": [{"type": "connected", "rib": max(FANOUTS), "fib": max(FANOUTS)}]
+    }
+    test_func = partial(
+        topotest.router_json_cmp, r1, "show ip route summary json", expected
+    )
+    _, result = topotest.run_and_expect(test_func, None, count=30, wait=1)
+    assert result is None, "connected routes missing:\n{}".format(result)
+
+
+def delta(before, after):
+    "Difference of two counter dicts"
+    return dict((key, after[key] - before.get(key, 0)) for key in after)
+
+
+def run_phase(r1, op, count, fanout, timeout):
+    "Install or remove `count` routes, follow them into the kernel"
+    expect = count if op == "install" else 0
+    sampler = DaemonSampler(r1, "zebra")
+    dplane = zebra_dplane(r1)
+
+    fib.mark()
+    sampler.mark()
+    if op == "install":
+        output = sharp_install_routes(
+            r1, START, count, nexthop_group="fanout{}".format(fanout)
+        )
+    else:
+        output = sharp_remove_routes(r1, START, count)
+    assert not output, "sharp {} failed: {}".format(op, output)
+
+    # poll once a second to sample zebra on the way
+    conditions = {"table": "main", "proto": "sharp", "routes": expect}
+    if op == "install":
+        conditions.update({"prefix": START + "/32", "nexthops": fanout})
+    deadline = time.time() + timeout
+    while True:
+        kernel = fib.wait(timeout=1, **conditions)
+        queue = zebra_dplane(r1).get("route_update_queue_depth")
+        sampler.sample(dplane_queue=queue)
+        if not kernel["timeout"] or time.time() > deadline:
+            break
+    assert not kernel["timeout"], "kernel has {} of {} sharp routes after {}".format(
+        fib.count(table="main", proto="sharp"), expect, op
+    )
+
+    if op == "install":
+        sharpd = sharp_wait(r1, installed=count, timeout=60)
+    else:
+        sharpd = sharp_wait(r1, removed=count, timeout=60)
+    assert not sharpd["timeout"], "sharpd not notified of all routes: {}".format(
+        sharpd
+    )
+    sampler.sample(memory=True)
+
+    phase = {
+        "kernel": kernel,
+        "sharpd": sharpd["time"],
+        "zebra": sampler.summary(),
+        "samples": sampler.samples,
+        "dplane": delta(dplane, zebra_dplane(r1)),
+    }
+    logger.info(
+        "%s %d routes x %d nexthops: kernel %.0f routes/s, last after %.2fs, "
+        "sharpd %.2fs, zebra %.1fs CPU, RSS %s -> %s",
+        op,
+        count,
+        fanout,
+        kernel.get("rate") or 0,
+        kernel.get("last", -1),
+        sharpd["time"],
+        phase["zebra"]["cpu"],
+        phase["zebra"]["rss_start"],
+        phase["zebra"]["rss_end"],
+    )
+    return phase
+
+
+def test_route_scale():
+    "Install and remove increasing numbers of routes with growing fan-out"
+
+    tgen = get_topogen()
+    if tgen.routers_have_failure():
+        pytest.skip(tgen.errors)
+
+    r1 = tgen.gears["r1"]
+
+    # like route_scale, leave out the big steps on small machines
+    steps = STEPS
+    with open("/proc/meminfo") as fd:
+        mem = int(fd.readline().split()[1])
+    if mem < 4000000:
+        logger.info("Limited memory available: %d kB, skipping 1M routes", mem)
+        steps = [step for step in STEPS if step[0] < 1000000]
+
+    for count, fanout, timeout in steps:
+        step = {"routes": count, "fanout": fanout}
+        for op in ("install", "remove"):
+            step[op] = run_phase(r1, op, count, fanout, timeout)
+        results["steps"].append(step)
+
+
+# Mem leak testcase
+def test_memory_leak():
+    "Run the memory leak test and report results."
+    tgen = get_topogen()
+    if not tgen.is_memleak_enabled():
+        pytest.skip("Memory leak test/report is disabled")
+    tgen.report_memory_leaks()
+
+
+if __name__ == "__main__":
+    args = ["-s"] + sys.argv[1:]
+    sys.exit(pytest.main(args))
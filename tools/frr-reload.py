@@ -31,6 +31,7 @@ This program
 from __future__ import print_function, unicode_literals
 import argparse
 import copy
+import json
 import logging
 import os, os.path
 import random
@@ -68,8 +69,12 @@ class VtyshException(Exception):
 
 
 class Vtysh(object):
-    def __init__(self, bindir=None, confdir=None, sockdir=None, pathspace=None):
+    def __init__(
+        self, bindir=None, confdir=None, sockdir=None, pathspace=None, marker=None
+    ):
         self.bindir = bindir
+        self.marker = marker
+        self.marker_error = getattr(marker, "error", Exception)
         self.confdir = confdir
         self.pathspace = pathspace
         self.common_args = [os.path.join(bindir or "", "vtysh")]
@@ -136,7 +141,17 @@ class Vtysh(object):
                 "vtysh (exec file) exited with status %d" % (child.returncode)
             )
 
+    def _mark_text(self, text):
+        try:
+            return self.marker.mark_text(text)
+        except self.marker_error as e:
+            raise VtyshException("config marking failed: %s" % e)
+
     def mark_file(self, filename, stdin=None):
+        if self.marker is not None:
+            with open(filename, "r") as fh:
+                return self._mark_text(fh.read())
+
         child = self._call(
             ["-m", "-f", filename],
             stdout=subprocess.PIPE,
@@ -163,6 +178,9 @@ class Vtysh(object):
         if daemon:
             cmd += " %s" % daemon
         cmd += " no-header"
+        if self.marker is not None:
+            return self._mark_text(self(cmd))
+
         show_run = self._call_cmd(cmd, stdout=subprocess.PIPE)
         mark = self._call(
             ["-m", "-f", "-"], stdin=show_run.stdout, stdout=subprocess.PIPE
@@ -1705,6 +1723,28 @@ def compare_context_objects(newconf, running):
     return (lines_to_add, lines_to_del)
 
 
+def load_xref_marker(filename):
+    """
+    Build the CLI command tree from frr.xref so configs can be marked without
+    running "vtysh -m" for each of them.  Returns None (i.e. use vtysh) if
+    the clippy module is not available or the xref data can't be loaded.
+    """
+    try:
+        from clippy.clitree import CliTree
+    except ImportError as e:
+        log.warning("cannot use --xref, falling back to vtysh: %s", e)
+        return None
+
+    try:
+        with open(filename, "r") as fh:
+            tree = CliTree.from_xref(json.load(fh))
+    except (OSError, ValueError, KeyError) as e:
+        log.warning("cannot load %s, falling back to vtysh: %s", filename, e)
+        return None
+
+    return tree
+
+
 if __name__ == "__main__":
     # Command line options
     parser = argparse.ArgumentParser(
@@ -1767,6 +1807,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--daemon", help="daemon for which want to replace the config", default=""
     )
+    parser.add_argument(
+        "--xref",
+        metavar="FILE",
+        help="mark configs in-process using frr.xref CLI data (needs to run under clippy)",
+        default=None,
+    )
     parser.add_argument(
         "--test-reset",
         action="store_true",
@@ -1867,7 +1913,13 @@ if __name__ == "__main__":
         log.error(msg)
         sys.exit(1)
 
-    vtysh = Vtysh(args.bindir, args.confdir, args.vty_socket, args.pathspace)
+    marker = None
+    if args.xref:
+        marker = load_xref_marker(args.xref)
+
+    vtysh = Vtysh(
+        args.bindir, args.confdir, args.vty_socket, args.pathspace, marker=marker
+    )
 
     # Verify that 'service integrated-vtysh-config' is configured
     if args.pathspace:
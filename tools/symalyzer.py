@@ -15,11 +15,20 @@
 # (as opposed to BSD `nm`).  Could use pyelftools instead but that's a lot of
 # extra work.
 #
+# nm runs once per object in a worker pool (-j), and its results are cached
+# in .symalyzer-cache/ by object content hash, so only changed objects are
+# re-scanned on subsequent runs.
+#
 # This is a developer tool, please don't put it in any packages :)
 
 import sys, os, subprocess
 import re
+import json
+import hashlib
+import argparse
+import threading
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.insert(
     0,
@@ -83,9 +92,6 @@ class Symbols(dict):
     dict of all symbols in all libs & executables
     """
 
-    from_re = re.compile(r"^Symbols from (.*?):$")
-    lt_re = re.compile(r"^(.*/)([^/]+)\.l[oa]$")
-
     def __init__(self):
         super().__init__()
 
@@ -214,82 +220,155 @@ class Symbols(dict):
         for sym in self.values():
             sym.evaluate(self)
 
-    def load(self, target, files):
-        def libtoolmustdie(fn):
-            m = self.lt_re.match(fn)
-            if m is None:
-                return fn
-            return m.group(1) + ".libs/" + m.group(2) + ".o"
+    def load(self, target, files, nmdata):
+        """
+        add symbols for one target.  nmdata holds the pre-extracted rows,
+        see NmExtractor.
+        """
+        files = sorted(set([libtoolmustdie(fn) for fn in files]))
 
-        def libtooltargetmustdie(fn):
-            m = self.lt_re.match(fn)
-            if m is None:
-                a, b = fn.rsplit("/", 1)
-                return "%s/.libs/%s" % (a, b)
-            return m.group(1) + ".libs/" + m.group(2) + ".so"
+        # the actual symbol report uses output from the individual object files
+        # (e.g. lib/.libs/foo.o), but we also read the linked binary (e.g.
+        # lib/.libs/libfrr.so) to determine which symbols are actually visible
+        # in the linked result (this covers ELF "hidden"/"internal" linkage)
 
-        files = list(set([libtoolmustdie(fn) for fn in files]))
+        libfile = libtooltargetmustdie(target)
+        visible_syms = set(row[1] for row in nmdata[libfile, NM_TARGET])
 
-        def parse_nm_output(text):
-            filename = None
-            path_rel_to = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for fn in files:
+            for items in nmdata[fn, NM_OBJECT]:
+                row = SymRow(target, *items)
+                row.visible = row.name in visible_syms
+                sym = self.setdefault(row.name, self.Symbol(row.name))
+                sym.process(row)
 
-            for line in text.split("\n"):
-                if line.strip() == "":
-                    continue
-                m = self.from_re.match(line)
-                if m is not None:
-                    filename = m.group(1)
-                    continue
-                if line.startswith("Name"):
-                    continue
 
-                items = [i.strip() for i in line.split("|")]
-                loc = None
-                if "\t" in items[-1]:
-                    items[-1], loc = items[-1].split("\t", 1)
-                    fn, lno = loc.rsplit(":", 1)
-                    fn = os.path.relpath(fn, path_rel_to)
-                    loc = "%s:%s" % (fn, lno)
+lt_re = re.compile(r"^(.*/)([^/]+)\.l[oa]$")
+from_re = re.compile(r"^Symbols from (.*?):$")
 
-                items[1] = int(items[1] if items[1] != "" else "0", 16)
-                items[4] = int(items[4] if items[4] != "" else "0", 16)
-                items.append(loc)
-                row = SymRow(target, filename, *items)
 
-                if row.section == ".group" or row.name == "_GLOBAL_OFFSET_TABLE_":
-                    continue
-                if not row.is_global():
-                    continue
+def libtoolmustdie(fn):
+    m = lt_re.match(fn)
+    if m is None:
+        return fn
+    return m.group(1) + ".libs/" + m.group(2) + ".o"
 
-                yield row
 
-        visible_syms = set()
+def libtooltargetmustdie(fn):
+    m = lt_re.match(fn)
+    if m is None:
+        a, b = fn.rsplit("/", 1)
+        return "%s/.libs/%s" % (a, b)
+    return m.group(1) + ".libs/" + m.group(2) + ".so"
 
-        # the actual symbol report uses output from the individual object files
-        # (e.g. lib/.libs/foo.o), but we also read the linked binary (e.g.
-        # lib/.libs/libfrr.so) to determine which symbols are actually visible
-        # in the linked result (this covers ELF "hidden"/"internal" linkage)
 
-        libfile = libtooltargetmustdie(target)
-        nmlib = subprocess.Popen(
-            ["nm", "-l", "-g", "--defined-only", "-f", "sysv", libfile],
-            stdout=subprocess.PIPE,
-        )
-        out = nmlib.communicate()[0].decode("US-ASCII")
+# line numbers (-l) are only needed for the per-object report, not for the
+# visibility check on the linked target; -l is what makes nm slow.
+NM_OBJECT = ("-l", "-f", "sysv")
+NM_TARGET = ("-g", "--defined-only", "-f", "sysv")
+
 
-        for row in parse_nm_output(out):
-            visible_syms.add(row.name)
+def parse_nm_output(text, filename):
+    """
+    yields (object, name, address, klass, typ, size, line, section, loc)
+    for all global symbols in `nm -f sysv` output
+    """
+    path_rel_to = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    for line in text.split("\n"):
+        if line.strip() == "":
+            continue
+        m = from_re.match(line)
+        if m is not None:
+            filename = m.group(1)
+            continue
+        if line.startswith("Name"):
+            continue
+
+        items = [i.strip() for i in line.split("|")]
+        loc = None
+        if "\t" in items[-1]:
+            items[-1], loc = items[-1].split("\t", 1)
+            fn, lno = loc.rsplit(":", 1)
+            fn = os.path.relpath(fn, path_rel_to)
+            loc = "%s:%s" % (fn, lno)
+
+        items[1] = int(items[1] if items[1] != "" else "0", 16)
+        items[4] = int(items[4] if items[4] != "" else "0", 16)
+        items.append(loc)
+        row = SymRow(None, filename, *items)
+
+        if row.section == ".group" or row.name == "_GLOBAL_OFFSET_TABLE_":
+            continue
+        if not row.is_global():
+            continue
+
+        yield row[1:]
+
+
+class NmExtractor(object):
+    """
+    runs nm once per (file, options) in a worker pool.  results are cached
+    on disk keyed by the file's content hash, so re-running after a small
+    change only re-scans the objects that actually changed.
+    """
 
-        nm = subprocess.Popen(
-            ["nm", "-l", "-f", "sysv"] + files, stdout=subprocess.PIPE
+    def __init__(self, cachedir=".symalyzer-cache", jobs=None):
+        self.cachedir = cachedir
+        self.jobs = jobs or os.cpu_count() or 1
+        self.hits = 0
+        self.misses = 0
+
+        nmver = subprocess.run(
+            ["nm", "--version"], stdout=subprocess.PIPE, check=False
+        ).stdout
+        self.salt = hashlib.sha256(
+            nmver + os.path.abspath(__file__).encode("UTF-8")
+        ).hexdigest()
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok=True)
+
+    def key(self, filename, opts):
+        hashobj = hashlib.sha256()
+        hashobj.update(("%s %s %s\n" % (self.salt, filename, opts)).encode("UTF-8"))
+        with open(filename, "rb") as fd:
+            for block in iter(lambda: fd.read(1 << 20), b""):
+                hashobj.update(block)
+        return hashobj.hexdigest()
+
+    def extract(self, job):
+        filename, opts = job
+        cachefile = None
+        if self.cachedir is not None:
+            cachefile = os.path.join(self.cachedir, self.key(filename, opts) + ".json")
+            try:
+                with open(cachefile, "r") as fd:
+                    return [tuple(row) for row in json.load(fd)], True
+            except (OSError, ValueError):
+                pass
+
+        nm = subprocess.run(
+            ["nm"] + list(opts) + [filename], stdout=subprocess.PIPE, check=False
         )
-        out = nm.communicate()[0].decode("US-ASCII")
+        rows = list(parse_nm_output(nm.stdout.decode("US-ASCII"), filename))
 
-        for row in parse_nm_output(out):
-            row.visible = row.name in visible_syms
-            sym = self.setdefault(row.name, self.Symbol(row.name))
-            sym.process(row)
+        if cachefile is not None:
+            tmpname = "%s.tmp-%d-%d" % (cachefile, os.getpid(), threading.get_ident())
+            with open(tmpname, "w") as fd:
+                json.dump(rows, fd)
+            os.rename(tmpname, cachefile)
+        return rows, False
+
+    def run(self, jobs):
+        """returns {(filename, opts): rows}"""
+        jobs = sorted(set(jobs))
+        with ThreadPoolExecutor(self.jobs) as pool:
+            results = list(pool.map(self.extract, jobs))
+
+        hits = sum(1 for _, hit in results if hit)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return dict(zip(jobs, [rows for rows, _ in results]))
 
 
 def write_html_report(syms):
@@ -316,8 +395,10 @@ def write_html_report(syms):
         "R": "global variable, read-only (Rodata)",
     }
 
+    # streamed out as the template is rendered, rather than building the
+    # whole document in memory first
     with open("symalyzer_report.html.tmp", "w") as fd:
-        fd.write(template.render(dirgroups=dirgroups, klasses=klasses))
+        template.stream(dirgroups=dirgroups, klasses=klasses).dump(fd)
     os.rename("symalyzer_report.html.tmp", "symalyzer_report.html")
 
     if not os.path.exists("jquery-3.4.1.min.js"):
@@ -345,6 +426,21 @@ def automake_escape(s):
 
 
 if __name__ == "__main__":
+    argp = argparse.ArgumentParser(description="FRR unused symbol analyzer")
+    argp.add_argument(
+        "-j", "--jobs", type=int, help="parallel nm processes (default: CPU count)"
+    )
+    argp.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".symalyzer-cache",
+        help="nm result cache directory (default: .symalyzer-cache)",
+    )
+    argp.add_argument(
+        "--no-cache", action="store_const", const=True, help="don't use nm cache"
+    )
+    args = argp.parse_args()
+
     mv = MakeVars()
 
     if not (os.path.exists("config.version") and os.path.exists("lib/.libs/libfrr.so")):
@@ -381,6 +477,8 @@ if __name__ == "__main__":
     mv.getvars(["%s_OBJECTS" % automake_escape(o) for o in ldobjs])
 
     syms = Symbols()
+    target_objs = []
+    nmjobs = []
 
     for t in targets:
         objs = mv["%s_OBJECTS" % automake_escape(t)].strip().split()
@@ -391,10 +489,23 @@ if __name__ == "__main__":
             if item.endswith(".a"):
                 objs.extend(mv["%s_OBJECTS" % automake_escape(item)].strip().split())
 
-        sys.stderr.write("processing %s...\n" % t)
-        sys.stderr.flush()
-        # print(t, '\n\t', objs)
-        syms.load(t, objs)
+        target_objs.append((t, objs))
+        nmjobs.append((libtooltargetmustdie(t), NM_TARGET))
+        nmjobs.extend([(libtoolmustdie(fn), NM_OBJECT) for fn in objs])
+
+    extractor = NmExtractor(None if args.no_cache else args.cache_dir, args.jobs)
+    sys.stderr.write(
+        "running nm on %d files with %d workers...\n"
+        % (len(set(nmjobs)), extractor.jobs)
+    )
+    sys.stderr.flush()
+    nmdata = extractor.run(nmjobs)
+    sys.stderr.write(
+        "nm cache: %d hits, %d misses\n" % (extractor.hits, extractor.misses)
+    )
+
+    for t, objs in target_objs:
+        syms.load(t, objs, nmdata)
 
     syms.evaluate()
 
@@ -51,21 +51,22 @@ static void embed_register(void)
 
 passchars = set(string.printable) - set("\\'\"%\r\n\t\x0b\x0c")
 
+# str.translate() table covering all of latin-1;  anything outside that is
+# handled by the default case in escape()
+escapetab = dict((i, "\\x%02x" % i) for i in range(256))
+escapetab.update((ord(char), char) for char in passchars)
+escapetab.update((ord(char), "\\" + char) for char in "\"\\'")
+escapetab[ord("\n")] = "\\n"
+escapetab[ord("\t")] = "\\t"
 
-def escapech(char):
-    if char in passchars:
-        return char
-    if char == "\n":
-        return "\\n"
-    if char == "\t":
-        return "\\t"
-    if char in "\"\\'":
-        return "\\" + char
-    return "\\x%02x" % (ord(char))
+re_nonlatin1 = re.compile(r"[^\x00-\xff]")
 
 
 def escape(line):
-    return "".join([escapech(i) for i in line])
+    line = line.translate(escapetab)
+    if re_nonlatin1.search(line):
+        line = re_nonlatin1.sub(lambda m: "\\x%02x" % ord(m.group(0)), line)
+    return line
 
 
 with open(inname, "r") as fd: